@@ -10,14 +10,181 @@ POSTGRES_SERVER = os.getenv("POSTGRES_SERVER")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 
+# shared HTTP client used to talk to other services
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", 100))
+HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+HTTP_CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", 30))
+HTTP_CLIENT_TIMEOUT = float(os.getenv("HTTP_CLIENT_TIMEOUT", 10))
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "true").lower() == "true"
+
+# origin serving the audio files of the remote streams
+REMOTE_AUDIO_URL = os.getenv("REMOTE_AUDIO_URL", "http://127.0.0.1:8080/public/audio")
+
+# local disk cache of the remote audio files, 0 disables it
+REMOTE_CACHE_DIRECTORY = os.getenv("REMOTE_CACHE_DIRECTORY", "data/remote_cache")
+REMOTE_CACHE_MAX_BYTES = int(os.getenv("REMOTE_CACHE_MAX_BYTES", 10 * 1024**3))
+REMOTE_CACHE_CHUNK_SIZE = 256 * 1024
+
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # uploads are written to disk 1MB at a time
+
+MEDIA_ASSET_CACHE_SIZE = 100_000  # media asset rows kept in memory by each worker
+
 AUDIO_DIRECTORY = "public/audio"
 
 IMAGE_DIRECTORY = "public/image"
 
 VIDEO_DIRECTORY = "public/video"
 
+# resized copies of the song and album images, made at upload
+IMAGE_VARIANT_DIRECTORY = "public/image/variants"
+
+IMAGE_VARIANT_WIDTHS = (64, 300, 640)  # pixels, the height keeps the aspect ratio
+
+# in order of preference when the client accepts them, formats Pillow can't encode are skipped
+IMAGE_VARIANT_FORMATS = tuple(os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp,jpeg").split(","))
+
+# widths the images are resized to on demand, others are rounded up to one of them
+IMAGE_RESIZE_WIDTHS = (
+    32, 48, 64, 96, 128, 160, 192, 256, 300, 384, 480, 512, 640, 768, 960, 1024, 1280, 1600, 2048
+)
+
+# disk cache of the images resized on demand
+IMAGE_CACHE_DIRECTORY = os.getenv("IMAGE_CACHE_DIRECTORY", "data/image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 2 * 1024**3))
+
+IMAGE_CACHE_MAX_AGE = 86400  # seconds clients keep a resized image
+
+# placeholders shown while the images load
+BLURHASH_COMPONENTS = (4, 3)  # horizontal and vertical, more is more detailed and longer
+
+IMAGE_PALETTE_SIZE = 5  # dominant colors of every image
+
+# size of the chunks read from disk when streaming files
+AUDIO_CHUNK_SIZE = int(os.getenv("AUDIO_CHUNK_SIZE", 64 * 1024))
+VIDEO_CHUNK_SIZE = int(os.getenv("VIDEO_CHUNK_SIZE", 1024 * 1024))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 1024 * 1024))
+
+# derived data, not served as static files
+SEEK_INDEX_DIRECTORY = "data/seek_index"
+
+SEEK_INDEX_CACHE_SIZE = 4096  # seek indexes kept in memory by each worker
+
+HLS_SEGMENT_DURATION = 6  # seconds
+
+HLS_PLAYLIST_CACHE_SIZE = 4096  # playlists kept in memory by each worker
+
+HLS_PLAYLIST_MAX_AGE = 300  # seconds
+
+# key of the signed stream URLs, shared by every worker, to get a string like this run:
+# openssl rand -hex 32
+# required outside of "local", see app/utils/signed_urls.py
+STREAM_URL_SECRET = os.getenv("STREAM_URL_SECRET")
+
+STREAM_URL_TTL = int(os.getenv("STREAM_URL_TTL", 6 * 3600))  # seconds a signed stream URL is valid
+
+# expirations are rounded up to a multiple of this, so the URLs signed for a user
+# in the meantime are the same and a CDN caches them once
+STREAM_URL_EXPIRY_STEP = 900  # seconds
+
+# bandwidth shaping of the streams and downloads, in bytes per second, 0 is unlimited
+STREAM_CONNECTION_RATE = int(os.getenv("STREAM_CONNECTION_RATE", 0))
+STREAM_USER_RATE = int(os.getenv("STREAM_USER_RATE", 0))
+# egress of a worker process, split fairly between its streams
+STREAM_TOTAL_RATE = int(os.getenv("STREAM_TOTAL_RATE", 0))
+# bytes sent at full speed when a stream starts, to fill the player buffer
+STREAM_BURST = int(os.getenv("STREAM_BURST", 2 * 1024 * 1024))
+
+# bitrates of the MP3 renditions made of every uploaded song, in kbit/s
+TRANSCODE_BITRATES = tuple(
+    int(kbps) for kbps in os.getenv("TRANSCODE_BITRATES", "96,160,320").split(",")
+)
+
+TRANSCODE_SAMPLE_RATE = 44100  # every rendition has the same
+
+# share of the bandwidth declared by a client a rendition can use, the rest is headroom
+TRANSCODE_BANDWIDTH_SHARE = 0.8
+
+WAVEFORM_DIRECTORY = "data/waveform"
+
+WAVEFORM_SAMPLE_RATE = 8000  # audio is decoded to mono at this rate for the peaks
+
+WAVEFORM_SAMPLES_PER_PEAK = 80  # most detailed zoom level, 100 peaks per second
+
+WAVEFORM_LEVELS = 4  # every zoom level has 4 times fewer peaks than the previous one
+
+WAVEFORM_BITS = int(os.getenv("WAVEFORM_BITS", 8))  # 8 or 16 bits per peak
+
+LOUDNESS_DIRECTORY = "data/loudness"
+
+REPLAYGAIN_REFERENCE_LOUDNESS = -18.0  # LUFS, ReplayGain 2.0
+
+FINGERPRINT_DIRECTORY = "data/fingerprint"
+
+FINGERPRINT_INDEX_DIRECTORY = "data/fingerprint_index"  # built by scripts/build_fingerprint_index.py
+
+# hashes a song must share with the upload, at the same time shift, to be a duplicate
+FINGERPRINT_MIN_MATCHES = int(os.getenv("FINGERPRINT_MIN_MATCHES", 20))
+
+# CPU bound work (decoding, DSP...) runs in a process pool
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", os.cpu_count() or 1))
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", PROCESS_POOL_WORKERS))  # jobs run at once by every process
+
+JOB_POLL_INTERVAL = 5  # seconds, how soon a job queued by another process is picked up
+
+JOB_TIMEOUT = 600  # seconds a job can run before it's failed, or opened again if its worker died
+
+JOB_RETRY_DELAY = 10  # seconds before the first retry of a failed job, doubled every attempt
+
+JOB_MAX_ATTEMPTS = 5  # a job failing this many times is rejected
+
+# play events are queued in memory and written in batches, the queue drops what doesn't fit
+PLAY_EVENT_QUEUE_SIZE = int(os.getenv("PLAY_EVENT_QUEUE_SIZE", 200_000))
+# about a second of events at full rate: the fewer batches, the fewer index pages rewritten
+PLAY_EVENT_BATCH_SIZE = int(os.getenv("PLAY_EVENT_BATCH_SIZE", 50_000))
+PLAY_EVENT_FLUSH_INTERVAL = 1.0  # seconds an event waits at most before being written
+
+# play events are partitioned by day on Postgres (by month on SQLite), old partitions dropped
+PLAY_HISTORY_RETENTION_DAYS = int(os.getenv("PLAY_HISTORY_RETENTION_DAYS", 400))  # 0 keeps everything
+PLAY_HISTORY_PARTITIONS_AHEAD = 7  # days of partitions created in advance
+PLAY_HISTORY_MAINTENANCE_INTERVAL = 3600  # seconds
+# dropped partitions are saved there as gzipped CSV first, not saved if empty
+PLAY_HISTORY_ARCHIVE_DIRECTORY = os.getenv("PLAY_HISTORY_ARCHIVE_DIRECTORY", "")
+PLAY_HISTORY_DEFAULT_DAYS = 30  # days of history returned when no range is asked
+
+# hourly, daily and weekly charts counted from the play events, merged among the workers
+CHART_DIRECTORY = "data/charts"  # one file of counters per worker
+CHART_TOP = 100  # songs kept per chart
+CHART_CAPACITY = int(os.getenv("CHART_CAPACITY", 500))  # songs counted per time bucket and genre
+CHART_REFRESH_INTERVAL = 60  # seconds between two merges of the counters of the workers
+
+# last songs and resume positions of the users, in memory and written behind
+RECENT_PLAYS_SIZE = 20  # songs kept per user, 16 bytes each
+RECENT_PLAYS_MAX_USERS = int(os.getenv("RECENT_PLAYS_MAX_USERS", 500_000))  # per worker, ~0.85 KB each
+RECENT_PLAYS_FLUSH_INTERVAL = 2.0  # seconds between two writes, and syncs with the other workers
+
+# songs found in the same playlists, built offline and memory mapped by every worker
+SIMILAR_SONGS_DIRECTORY = "data/similar_songs"  # built by scripts/build_similar_songs.py
+SIMILAR_SONGS_TOP_K = 50  # neighbours kept per song
+
+# song embeddings and their inverted file index, built offline and memory mapped by every worker
+EMBEDDINGS_DIRECTORY = "data/embeddings"  # built by scripts/build_song_embeddings.py
+EMBEDDING_DIMENSIONS = 64  # float32 values per song
+EMBEDDING_NPROBE = int(os.getenv("EMBEDDING_NPROBE", 16))  # cells searched per query, recall vs latency
+RECOMMENDATIONS_MAX_LIMIT = 100  # songs recommended per query, at most
+RECOMMENDATIONS_MAX_BATCH = 100  # songs queried in one request, at most
+
+# adaptive concurrency limit of every worker process, a max of 0 disables the load shedding
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", 100))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", 10))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", 1000))
+# recent latency over baseline latency considered as an overload
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", 2.0))
+
 ALLOWED_AUDIO_MIME_TYPES = {
     "audio/mpeg",  # .mp3
     "audio/wav",  # .wav
@@ -72,3 +72,47 @@ class Status(str, Enum):
             self.CLOSED,
             self.REJECTED,
         ]
+
+
+class JobKind(str, Enum):
+    """
+    Kinds of background job, each one is run by its own handler.
+
+    Using str as a base class ensures that the enum members are instances of str.
+    """
+
+    WAVEFORM = "waveform"
+    LOUDNESS = "loudness"
+    FINGERPRINT = "fingerprint"
+    IMAGE_VARIANTS = "image_variants"
+    TRANSCODE = "transcode"
+
+    @classmethod
+    def to_list(self) -> list[str]:
+        return [
+            self.WAVEFORM,
+            self.LOUDNESS,
+            self.FINGERPRINT,
+            self.IMAGE_VARIANTS,
+            self.TRANSCODE,
+        ]
+
+
+class ChartWindow(str, Enum):
+    """
+    Time windows of the charts, see CHART_WINDOWS.
+
+    Using str as a base class ensures that the enum members are instances of str.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+
+    @classmethod
+    def to_list(self) -> list[str]:
+        return [
+            self.HOUR,
+            self.DAY,
+            self.WEEK,
+        ]
@@ -0,0 +1,203 @@
+import time
+
+from collections.abc import Callable
+
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..commons.enums import Priority
+
+# share of the concurrency limit every priority can use, lower ones are shed first
+_PRIORITY_SHARES = {Priority.HIGH: 1.0, Priority.MEDIUM: 0.8, Priority.LOW: 0.5}
+
+# seconds clients are told to wait before retrying a shed request
+_RETRY_AFTER = {Priority.HIGH: 1, Priority.MEDIUM: 2, Priority.LOW: 10}
+
+_SHORT_ALPHA = 0.1  # weight of a sample in the recent latency
+_LONG_ALPHA = 0.01  # weight of a sample in the baseline latency
+_CONGESTED_LONG_ALPHA = 0.001  # the baseline barely moves while we are congested
+
+
+def request_priority(method: str, path: str, headers: dict[str, str]) -> Priority:
+    """
+    Classify a request: in-progress streams first, then catalog reads, then bulk work.
+
+    A stream is in progress once the player asks for a byte range past the start
+    or for an HLS segment: shedding it would stop a song in the middle.
+    Starting a new one is worth as much as a catalog read.
+    Downloads and every write are bulk work, they can wait.
+
+    \f
+
+    :param method: HTTP method
+    :type method: str
+    :param path: URL path
+    :type path: str
+    :param headers: Request headers, lowercase names
+    :type headers: dict[str, str]
+    :return: The priority
+    :rtype: Priority
+    """
+    if method not in ("GET", "HEAD"):
+        return Priority.LOW
+    if path.startswith("/downloads/"):
+        return Priority.LOW
+    if path.startswith("/streams/"):
+        range_header = headers.get("range", "")
+        if "/hls/" in path and not path.endswith(".m3u8"):
+            return Priority.HIGH
+        if range_header and not range_header.replace(" ", "").startswith("bytes=0-"):
+            return Priority.HIGH
+    return Priority.MEDIUM
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit adapted to the observed latency, additive increase multiplicative decrease.
+
+    The latency of every request is folded into a recent average and a slow baseline.
+    When the recent latency gets "tolerance" times above the baseline the server is queuing
+    work it can't keep up with, and the limit is multiplied by "backoff", at most once
+    per round trip. Otherwise it grows by one every "limit" requests, as long as it's used.
+    Every worker process adapts its own limit.
+
+    \f
+
+    :param initial_limit: Starting concurrency limit
+    :type initial_limit: int
+    :param min_limit: The limit never goes below
+    :type min_limit: int
+    :param max_limit: The limit never goes above
+    :type max_limit: int
+    :param tolerance: Ratio of the recent latency to the baseline seen as congestion
+    :type tolerance: float
+    :param backoff: Factor applied to the limit on congestion
+    :type backoff: float
+    :param clock: Monotonic clock, in seconds
+    :type clock: Callable[[], float]
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+        self.recent_latency: float | None = None
+        self.baseline_latency: float | None = None
+        self._last_decrease = float("-inf")
+
+        # statistics
+        self.admitted = {priority: 0 for priority in Priority}
+        self.shed = {priority: 0 for priority in Priority}
+
+    def try_acquire(self, priority: Priority) -> bool:
+        """
+        Admit a request if its priority still has room under the limit.
+        """
+        if self.in_flight >= max(1.0, self.limit * _PRIORITY_SHARES[priority]):
+            self.shed[priority] += 1
+            return False
+        self.in_flight += 1
+        self.admitted[priority] += 1
+        return True
+
+    def release(self, started: float | None = None) -> None:
+        """
+        A request is done with the server, "started" is when it was admitted.
+        Without it, e.g. for a failure, the latency isn't sampled.
+        """
+        self.in_flight -= 1
+        if started is not None:
+            self._sample(started, self.clock() - started)
+
+    def _sample(self, started: float, latency: float) -> None:
+        if self.recent_latency is None:
+            self.recent_latency = self.baseline_latency = latency
+            return
+
+        self.recent_latency += (latency - self.recent_latency) * _SHORT_ALPHA
+        congested = self.recent_latency > self.baseline_latency * self.tolerance
+        alpha = _CONGESTED_LONG_ALPHA if congested else _LONG_ALPHA
+        self.baseline_latency += (latency - self.baseline_latency) * alpha
+
+        if congested:
+            # requests admitted before the last decrease don't reflect it yet
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = self.clock()
+        elif self.in_flight + 1 >= self.limit / 2:
+            # only grow a limit that's actually used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def retry_after(self, priority: Priority) -> int:
+        return _RETRY_AFTER[priority]
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "recent_latency": self.recent_latency,
+            "baseline_latency": self.baseline_latency,
+            "admitted": {priority.name: count for priority, count in self.admitted.items()},
+            "shed": {priority.name: count for priority, count in self.shed.items()},
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds the requests the limiter created in the lifespan doesn't admit, with a 503.
+
+    A request holds its slot until its response starts: a long stream is then paced
+    by the bandwidth scheduler, not by the admission control.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = getattr(scope["app"].state, "admission", None) if "app" in scope else None
+        if scope["type"] != "http" or limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in (b"range",)
+        }
+        priority = request_priority(scope["method"], scope["path"], headers)
+        if not limiter.try_acquire(priority):
+            response = ORJSONResponse(
+                {"detail": "Server overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after(priority))},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = limiter.clock()
+        released = False
+
+        async def send_and_release(message: Message) -> None:
+            nonlocal released
+            if message["type"] == "http.response.start" and not released:
+                released = True
+                limiter.release(started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            if not released:
+                limiter.release()
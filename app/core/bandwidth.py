@@ -0,0 +1,270 @@
+import asyncio
+import itertools
+import math
+import time
+
+from collections.abc import AsyncIterator, Callable
+
+from fastapi import Request
+
+
+class TokenBucket:
+    """
+    Token bucket in bytes: "rate" bytes are added every second, up to "burst".
+
+    Sending never waits for tokens, it takes them even when it leaves the bucket in debt,
+    and the caller sleeps until the debt is paid back. Chunks larger than the burst are fine.
+
+    \f
+
+    :param rate: Bytes per second
+    :type rate: float
+    :param burst: Capacity of the bucket, it starts full
+    :type burst: float
+    :param now: Current time, in seconds
+    :type now: float
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate: float, now: float) -> None:
+        self._refill(now)  # the tokens earned so far are at the old rate
+        self.rate = rate
+
+    def reserve(self, amount: int, now: float) -> float:
+        """
+        Take "amount" tokens and return how many seconds to wait before sending them.
+        """
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate if self.rate > 0 else math.inf
+
+
+class ShapedStream:
+    """
+    A response being sent: its own bucket and what it sent so far.
+
+    \f
+
+    :param id: ID of the stream, unique in the process
+    :type id: int
+    :param user: Who the stream belongs to, e.g. "user:1" or "ip:10.0.0.1"
+    :type user: str
+    :param started: When the stream started, in seconds
+    :type started: float
+    """
+
+    __slots__ = ("id", "user", "started", "rate", "bucket", "sent")
+
+    def __init__(self, id: int, user: str, started: float):
+        self.id = id
+        self.user = user
+        self.started = started
+        self.rate = math.inf  # current allocation, bytes per second
+        self.bucket: TokenBucket | None = None
+        self.sent = 0
+
+
+class BandwidthScheduler:
+    """
+    Token bucket bandwidth shaping of the stream and download responses.
+
+    Every connection is capped at "connection_rate" and every user at "user_rate",
+    both start with "burst" bytes sent at full speed to fill the player buffer.
+    When "total_rate" is set the egress is also split between the active streams,
+    max-min fair: streams capped lower than their share leave the rest to the others.
+    Rates are in bytes per second, 0 means unlimited.
+    The bookkeeping lives in memory, so every worker process shapes its own share.
+
+    \f
+
+    :param connection_rate: Maximum rate of a connection
+    :type connection_rate: int
+    :param user_rate: Maximum rate of all the connections of a user
+    :type user_rate: int
+    :param total_rate: Egress split between the streams, 0 disables the fair share
+    :type total_rate: int
+    :param burst: Bytes sent before the rates apply
+    :type burst: int
+    :param clock: Monotonic clock, in seconds
+    :type clock: Callable[[], float]
+    """
+
+    def __init__(
+        self,
+        connection_rate: int,
+        user_rate: int,
+        total_rate: int,
+        burst: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.connection_rate = connection_rate
+        self.user_rate = user_rate
+        self.total_rate = total_rate
+        self.burst = burst
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self._streams: dict[int, ShapedStream] = {}
+        self._users: dict[str, set[int]] = {}  # user -> IDs of its streams
+        self._user_buckets: dict[str, TokenBucket] = {}
+
+        # statistics
+        self.throttled = 0  # times a stream had to wait for tokens
+        self.sent = 0  # bytes sent by the streams that are over
+
+    def open(self, user: str) -> ShapedStream:
+        """
+        Register a new stream of "user" and update the allocations.
+        """
+        now = self._clock()
+        stream = ShapedStream(next(self._ids), user, now)
+        self._streams[stream.id] = stream
+        self._users.setdefault(user, set()).add(stream.id)
+        if self.user_rate and user not in self._user_buckets:
+            self._user_buckets[user] = TokenBucket(self.user_rate, self.burst, now)
+        self._allocate(now)
+        return stream
+
+    def close(self, stream: ShapedStream) -> None:
+        """
+        Unregister a stream and give its bandwidth back to the others.
+        """
+        if self._streams.pop(stream.id, None) is None:
+            return
+        self.sent += stream.sent
+        streams = self._users[stream.user]
+        streams.discard(stream.id)
+        if not streams:
+            del self._users[stream.user]
+            self._user_buckets.pop(stream.user, None)
+        self._allocate(self._clock())
+
+    def reserve(self, stream: ShapedStream, amount: int) -> float:
+        """
+        Seconds "stream" has to wait before sending "amount" bytes.
+        """
+        now = self._clock()
+        stream.sent += amount
+        delay = stream.bucket.reserve(amount, now) if stream.bucket else 0.0
+        user_bucket = self._user_buckets.get(stream.user)
+        if user_bucket:
+            delay = max(delay, user_bucket.reserve(amount, now))
+        if delay > 0:
+            self.throttled += 1
+        return delay
+
+    async def shape(self, chunks: AsyncIterator[bytes], user: str) -> AsyncIterator[bytes]:
+        """
+        Relay "chunks", sleeping between them as much as the buckets say.
+
+        \f
+
+        :param chunks: The body of the response
+        :type chunks: AsyncIterator[bytes]
+        :param user: Who the response is for, e.g. "user:1" or "ip:10.0.0.1"
+        :type user: str
+        """
+        stream = self.open(user)
+        try:
+            async for chunk in chunks:
+                delay = self.reserve(stream, len(chunk))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk
+        finally:
+            self.close(stream)
+
+    def _cap(self, stream: ShapedStream) -> float:
+        # the most a stream can get, whatever the other users do
+        cap = self.connection_rate or math.inf
+        if self.user_rate:
+            cap = min(cap, self.user_rate / len(self._users[stream.user]))
+        return cap
+
+    def _allocate(self, now: float) -> None:
+        """
+        Compute the rate of every stream.
+        With a total rate, water filling: the streams are served from the lowest cap up,
+        each one gets the smallest of its cap and an even share of what's left.
+        """
+        streams = list(self._streams.values())
+        if self.total_rate:
+            rates = {}
+            remaining = float(self.total_rate)
+            streams.sort(key=self._cap)
+            for position, stream in enumerate(streams):
+                rates[stream.id] = min(self._cap(stream), remaining / (len(streams) - position))
+                remaining -= rates[stream.id]
+        else:
+            rates = {stream.id: self.connection_rate or math.inf for stream in streams}
+
+        for stream in streams:
+            rate = rates[stream.id]
+            if rate == stream.rate:
+                continue
+            stream.rate = rate
+            if math.isinf(rate):
+                stream.bucket = None
+            elif stream.bucket is None:
+                # the burst is for the start of a stream only, not for every reallocation
+                burst = self.burst if now == stream.started else 0
+                stream.bucket = TokenBucket(rate, max(burst, rate), now)
+                stream.bucket.tokens = burst
+            else:
+                stream.bucket.set_rate(rate, now)
+                stream.bucket.burst = max(self.burst, rate)
+
+    def stats(self) -> dict:
+        now = self._clock()
+        allocations = []
+        for stream in self._streams.values():
+            elapsed = now - stream.started
+            allocations.append(
+                {
+                    "id": stream.id,
+                    "user": stream.user,
+                    "rate": None if math.isinf(stream.rate) else round(stream.rate),
+                    "sent": stream.sent,
+                    "seconds": round(elapsed, 3),
+                    "throughput": round(stream.sent / elapsed) if elapsed > 0 else None,
+                }
+            )
+        return {
+            "connection_rate": self.connection_rate,
+            "user_rate": self.user_rate,
+            "total_rate": self.total_rate,
+            "burst": self.burst,
+            "streams": len(self._streams),
+            "users": len(self._users),
+            "throttled": self.throttled,
+            "sent": self.sent + sum(stream.sent for stream in self._streams.values()),
+            "allocations": allocations,
+        }
+
+
+def get_bandwidth_scheduler(request: Request) -> BandwidthScheduler:
+    """
+    Returns the scheduler created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.bandwidth_scheduler
+
+
+def client_key(request: Request, user_id: int | None = None) -> str:
+    """
+    Who a response is shaped for: the user if we know them, otherwise the client address.
+    """
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
@@ -0,0 +1,360 @@
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import time
+
+import anyio
+import numpy as np
+
+from fastapi import Request
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from ..models.relationship_song_genre import SongGenreLink
+
+logger = logging.getLogger(__name__)
+
+# every chart sums a ring of buckets: (seconds per bucket, number of buckets)
+CHART_WINDOWS = {
+    "hour": (300, 12),
+    "day": (3600, 24),
+    "week": (86400, 7),
+}
+
+ALL_GENRES = 0  # the chart of every genre, genre IDs start at 1
+
+# columns of a snapshot, one row per counter
+_SNAPSHOT_COLUMNS = ("window", "bucket", "genre", "song", "count")
+
+
+class SpaceSaving:
+    """
+    Heavy hitters of a stream in bounded memory, the Space-Saving algorithm.
+
+    At most "capacity" items are counted. A new item takes the place of the least counted
+    one and inherits its count: counts are overestimated by at most the smallest of them,
+    and every item played more than total / capacity times is kept.
+
+    \f
+
+    :param capacity: Items counted at most
+    :type capacity: int
+    """
+
+    __slots__ = ("capacity", "counts", "_heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[int, int] = {}
+        # (count, item) of every counted item, once full, the counts lag behind until popped
+        self._heap: list[tuple[int, int]] | None = None
+
+    def add(self, item: int, count: int = 1) -> None:
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        if len(counts) < self.capacity:
+            counts[item] = count
+            return
+
+        heap = self._heap
+        if heap is None:
+            heap = self._heap = [(value, key) for key, value in counts.items()]
+            heapq.heapify(heap)
+        while True:  # the top of the heap is the minimum once its count is up to date
+            minimum, evicted = heap[0]
+            if counts[evicted] == minimum:
+                break
+            heapq.heapreplace(heap, (counts[evicted], evicted))
+        del counts[evicted]
+        counts[item] = minimum + count
+        heapq.heapreplace(heap, (minimum + count, item))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+def song_genre_ids(engine: Engine) -> dict[int, tuple[int, ...]]:
+    """
+    The genres of every song, by song ID.
+    """
+    genres: dict[int, tuple[int, ...]] = {}
+    with engine.connect() as connection:
+        for song_id, genre_id in connection.execute(
+            select(SongGenreLink.song_id, SongGenreLink.genre_id)
+        ):
+            genres[song_id] = genres.get(song_id, ()) + (genre_id,)
+    return genres
+
+
+def merge_chart_rows(
+    rows: np.ndarray, now: float, top: int
+) -> dict[tuple[str, int], list[tuple[int, int]]]:
+    """
+    Sum the counters of snapshot rows into the top songs of every window and genre.
+    Only the buckets still inside their window at "now" are counted.
+
+    \f
+
+    :param rows: Counters, one row of _SNAPSHOT_COLUMNS each
+    :type rows: np.ndarray
+    :param now: Current time, as a timestamp
+    :type now: float
+    :param top: Songs kept per chart
+    :type top: int
+    :return: (song_id, plays) of every chart, most played first, by (window, genre_id)
+    :rtype: dict[tuple[str, int], list[tuple[int, int]]]
+    """
+    charts: dict[tuple[str, int], list[tuple[int, int]]] = {}
+    for window_index, (window, (width, buckets)) in enumerate(CHART_WINDOWS.items()):
+        current = int(now // width)
+        selected = rows[
+            (rows[:, 0] == window_index)
+            & (rows[:, 1] > current - buckets)
+            & (rows[:, 1] <= current)
+        ]
+        if not len(selected):
+            continue
+
+        # one sum per (genre, song), the same song comes from many buckets and processes
+        keys, inverse = np.unique(selected[:, 2:4], axis=0, return_inverse=True)
+        plays = np.bincount(inverse.ravel(), weights=selected[:, 4]).astype(np.int64)
+
+        # most played first in every genre, ties broken by song ID for stable charts
+        order = np.lexsort((keys[:, 1], -plays, keys[:, 0]))
+        keys, plays = keys[order], plays[order]
+        genres, starts = np.unique(keys[:, 0], return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        for genre_id, start, end in zip(genres.tolist(), starts.tolist(), ends.tolist()):
+            end = min(end, start + top)
+            charts[window, genre_id] = list(
+                zip(keys[start:end, 1].tolist(), plays[start:end].tolist())
+            )
+    return charts
+
+
+class ChartEngine:
+    """
+    Hourly, daily and weekly top songs of every genre, counted as the plays are written.
+
+    Every window is a ring of time buckets (see CHART_WINDOWS) and every bucket keeps a
+    Space-Saving counter per genre, so the memory is bounded by the buckets, the genres
+    and "capacity", whatever the number of plays. A bucket is reused once it falls out of
+    its window, expiring its plays in one go.
+
+    Each worker counts the plays it wrote, and every "interval" seconds saves its counters
+    in "directory" and merges them with the ones saved by the other workers into the
+    charts, so they are global and survive restarts: the files of the previous processes
+    are merged too, until all their buckets expire. Reading a chart is a slice of the last
+    merge, O(K).
+
+    \f
+
+    :param engine: Database engine, the genres of the songs are read from it
+    :type engine: Engine
+    :param directory: Where the counters of every worker are saved
+    :type directory: str
+    :param capacity: Songs counted per bucket and genre
+    :type capacity: int
+    :param top: Songs kept per chart
+    :type top: int
+    :param interval: Seconds between two merges
+    :type interval: float
+    :param genres_interval: Seconds between two reads of the genres of the songs
+    :type genres_interval: float
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        directory: str,
+        capacity: int,
+        top: int,
+        interval: float = 60.0,
+        genres_interval: float = 600.0,
+        clock=time.time,
+    ):
+        self.engine = engine
+        self.directory = directory
+        self.capacity = capacity
+        self.top = top
+        self.interval = interval
+        self.genres_interval = genres_interval
+        self.clock = clock
+        self.path = os.path.join(
+            directory, f"{socket.gethostname()}-{os.getpid()}-{int(clock())}.npy"
+        )
+
+        # ring of (bucket, {genre_id: counter}) per window
+        self._rings: list[list[tuple[int, dict[int, SpaceSaving]] | None]] = [
+            [None] * buckets for _, buckets in CHART_WINDOWS.values()
+        ]
+        self._genres: dict[int, tuple[int, ...]] = {}
+        self._genres_loaded_at = 0.0
+        self._peers: dict[str, tuple[float, np.ndarray]] = {}  # path -> (mtime, rows)
+        self._charts: dict[tuple[str, int], list[tuple[int, int]]] = {}
+        self._task: asyncio.Task | None = None
+
+        # statistics
+        self.counted = 0
+        self.late = 0
+        self.merged_at: float | None = None
+        self.merge_seconds = 0.0
+
+    def add(self, song_id: int, timestamp: float) -> None:
+        """
+        Count a play of a song in every window, for all the genres and each of its own.
+        """
+        keys = (ALL_GENRES,) + self._genres.get(song_id, ())
+        for ring, (width, buckets) in zip(self._rings, CHART_WINDOWS.values()):
+            bucket = int(timestamp // width)
+            slot = bucket % buckets
+            entry = ring[slot]
+            if entry is None or entry[0] < bucket:
+                entry = ring[slot] = (bucket, {})  # the previous one left the window
+            elif entry[0] > bucket:
+                self.late += 1  # older than the window, nothing to count it in
+                continue
+
+            counters = entry[1]
+            for key in keys:
+                counter = counters.get(key)
+                if counter is None:
+                    counter = counters[key] = SpaceSaving(self.capacity)
+                counter.add(song_id)
+        self.counted += 1
+
+    def add_batch(self, batch: list[tuple]) -> None:
+        """
+        Count a batch of play events, the tuples written by the PlayEventRecorder.
+        """
+        for song_id, _, played_at, *_ in batch:
+            self.add(song_id, played_at.timestamp())
+
+    def rows(self) -> np.ndarray:
+        """
+        The counters of this worker, one row of _SNAPSHOT_COLUMNS each.
+        """
+        rows = [
+            (window_index, bucket, genre_id, song_id, count)
+            for window_index, ring in enumerate(self._rings)
+            for bucket, counters in filter(None, ring)
+            for genre_id, counter in counters.items()
+            for song_id, count in counter.counts.items()
+        ]
+        return np.array(rows, dtype=np.int64).reshape(-1, len(_SNAPSHOT_COLUMNS))
+
+    def snapshot(self, rows: np.ndarray | None = None) -> None:
+        """
+        Save the counters of this worker, where the other workers and the next run find them.
+        """
+        rows = self.rows() if rows is None else rows
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self.path}.tmp", "wb") as file:
+            np.save(file, rows)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def refresh(self, rows: np.ndarray | None = None) -> None:
+        """
+        Merge the counters of this worker with the saved ones of the others into the charts.
+        The files whose buckets all expired are deleted.
+        """
+        started = time.perf_counter()
+        now = self.clock()
+        rows = self.rows() if rows is None else rows
+        merged = [rows] + [peer for _, peer in self._load_peers(now).values()]
+        self._charts = merge_chart_rows(np.concatenate(merged), now, self.top)
+        self.merged_at = now
+        self.merge_seconds = time.perf_counter() - started
+
+    def chart(
+        self, window: str, genre_id: int = ALL_GENRES, limit: int | None = None
+    ) -> list[tuple[int, int]]:
+        """
+        The (song_id, plays) most played in a window, as of the last merge.
+        """
+        return self._charts.get((window, genre_id), [])[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "counted": self.counted,
+            "late": self.late,
+            "counters": sum(
+                len(counter)
+                for ring in self._rings
+                for _, counters in filter(None, ring)
+                for counter in counters.values()
+            ),
+            "peers": len(self._peers),
+            "charts": len(self._charts),
+            "merged_at": self.merged_at,
+            "merge_seconds": self.merge_seconds,
+        }
+
+    async def start(self) -> None:
+        await anyio.to_thread.run_sync(self._load_genres)
+        await anyio.to_thread.run_sync(self.refresh)  # the charts left by the previous runs
+        self._task = asyncio.create_task(self._loop(), name="chart-engine")
+
+    async def stop(self) -> None:
+        """
+        Stop merging and save the counters, the next run merges them back.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await anyio.to_thread.run_sync(self.snapshot)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.clock() - self._genres_loaded_at >= self.genres_interval:
+                    await anyio.to_thread.run_sync(self._load_genres)
+                # collected in the event loop, where the plays are counted, saved in a thread
+                rows = self.rows()
+                await anyio.to_thread.run_sync(self.snapshot, rows)
+                await anyio.to_thread.run_sync(self.refresh, rows)
+            except Exception:
+                logger.exception("Refreshing the charts failed")
+
+    def _load_genres(self) -> None:
+        self._genres = song_genre_ids(self.engine)
+        self._genres_loaded_at = self.clock()
+
+    def _load_peers(self, now: float) -> dict[str, tuple[float, np.ndarray]]:
+        # the files of the other workers, read again only when they changed
+        oldest = max(width * buckets for width, buckets in CHART_WINDOWS.values())
+        peers = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".npy") or path == self.path:
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime < now - oldest:
+                    os.remove(path)  # every bucket it holds left its window
+                    continue
+                cached = self._peers.get(path)
+                if cached is None or cached[0] != mtime:
+                    cached = (mtime, np.load(path))
+                peers[path] = cached
+            except (OSError, ValueError):
+                continue  # removed meanwhile, or being replaced
+        self._peers = peers
+        return peers
+
+
+def get_chart_engine(request: Request) -> ChartEngine:
+    """
+    Returns the chart engine created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.charts
@@ -9,6 +9,7 @@ from ..commons.constants import (
     POSTGRES_SERVER,
     POSTGRES_USER,
 )
+from .migrations import add_missing_columns
 
 
 # SQLite database URL
@@ -24,8 +25,9 @@ engine = create_engine(postgresql_url)
 
 
 def init_db():
-    """Create the database and tables."""
+    """Create the database and tables, and the columns added since."""
     SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine)
 
 
 def get_session():
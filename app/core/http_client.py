@@ -0,0 +1,48 @@
+import importlib.util
+
+import httpx
+
+from fastapi import Request
+
+from ..commons.constants import (
+    HTTP_CLIENT_HTTP2,
+    HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    HTTP_CLIENT_MAX_CONNECTIONS,
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_CLIENT_TIMEOUT,
+)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create the HTTP client shared by the whole app.
+    A single pooled client keeps connections alive between requests instead of
+    paying a new TCP (and TLS) handshake every time we talk to another service.
+
+    \f
+
+    :return: The pooled client, it must be closed on shutdown
+    :rtype: httpx.AsyncClient
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+
+    # HTTP/2 needs the optional "h2" package (pip install "httpx[http2]")
+    http2 = HTTP_CLIENT_HTTP2 and importlib.util.find_spec("h2") is not None
+
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2,
+        # audio streams can be long, so only connecting and stalls are bounded
+        timeout=httpx.Timeout(HTTP_CLIENT_TIMEOUT, pool=None),
+    )
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """
+    Returns the pooled client created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.http_client
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import Request
+
+from ..utils.image_variants import resize_image
+from .process_pool import run_in_process
+
+logger = logging.getLogger(__name__)
+
+
+class ImageResizeCache:
+    """
+    Size bounded disk cache of the images resized on demand.
+
+    Files are evicted in LRU order once the total size exceeds "max_bytes".
+    Concurrent requests for a resize that isn't cached yet wait for the same one,
+    so a burst of clients loading the same page costs a single resize.
+    The bookkeeping lives in memory, so every worker process enforces its own budget.
+
+    \f
+
+    :param directory: Where resized images are stored
+    :type directory: str
+    :param max_bytes: Maximum size of the cache
+    :type max_bytes: int
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()  # name -> size, LRU first
+        self._size = 0
+        self._resizes: dict[str, asyncio.Task] = {}
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # misses that joined a resize already in progress
+
+    def load(self) -> None:
+        """
+        Index the files already in the cache directory, least recently used first.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".tmp"):
+                # other workers may be writing it, unless it's a stale leftover of a crash
+                if time.time() - stat.st_mtime > 3600:
+                    os.remove(entry.path)
+                continue
+            entries.append((stat.st_atime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._add_entry(name, size)
+        self._evict()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "size": self._size,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._entries),
+            "resizes_in_progress": len(self._resizes),
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _add_entry(self, name: str, size: int) -> None:
+        self._size += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+
+    def _evict(self) -> None:
+        # the most recent entry stays, it's about to be served
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                # responses that already opened the file keep reading it just fine
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    async def resize(
+        self,
+        name: str,
+        pool: ProcessPoolExecutor,
+        image_path: str,
+        width: int,
+        format: str,
+    ) -> str | None:
+        """
+        Path of an image resized to "width" and encoded as "format", resized on a miss.
+
+        \f
+
+        :param name: File name, unique for the original image, the width and the format
+        :type name: str
+        :param pool: Process pool the resize runs in
+        :type pool: ProcessPoolExecutor
+        :param image_path: Path of the original image
+        :type image_path: str
+        :param width: Width in pixels, the original one if it's smaller
+        :type width: int
+        :param format: "avif", "webp" or "jpeg"
+        :type format: str
+        :return: Path of the resized image, None if the original can't be decoded
+        :rtype: str | None
+        """
+        path = self._path(name)
+        if name not in self._entries and name not in self._resizes:
+            # another worker may have resized it already
+            try:
+                self._add_entry(name, os.path.getsize(path))
+            except FileNotFoundError:
+                pass
+
+        if name in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(name)
+            return path
+
+        self.misses += 1
+        task = self._resizes.get(name)
+        if task is None:
+            # not tied to the first request: it goes on if that client leaves
+            task = asyncio.create_task(self._resize(name, pool, image_path, width, format))
+            self._resizes[name] = task
+        else:
+            self.coalesced += 1
+
+        return path if await asyncio.shield(task) else None
+
+    async def _resize(
+        self,
+        name: str,
+        pool: ProcessPoolExecutor,
+        image_path: str,
+        width: int,
+        format: str,
+    ) -> bool:
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            size = await run_in_process(
+                pool, resize_image, image_path, self._path(name), width, format
+            )
+        except Exception:
+            logger.exception(f"Resize of {image_path} to {width}px {format} failed")
+            return False
+        finally:
+            self._resizes.pop(name, None)
+
+        if size is None:
+            return False
+        self._add_entry(name, size)
+        self._evict()
+        return True
+
+
+def get_image_cache(request: Request) -> ImageResizeCache:
+    """
+    Returns the cache created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.image_cache
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi import Request
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from ..commons.constants import JOB_MAX_ATTEMPTS
+from ..commons.enums import Priority
+from ..crud.jobs import claim_jobs, close_job, create_job, fail_job, requeue_jobs
+from ..models.job_model import JobCreate, JobPublic
+
+logger = logging.getLogger(__name__)
+
+# a handler gets the process pool and the payload of the job as keyword arguments
+JobHandler = Callable[..., Awaitable[None]]
+
+
+class JobRejected(Exception):
+    """
+    Raised by a handler when retrying can't help (e.g. a file no decoder can read):
+    the job is rejected at once, with this error.
+    """
+
+
+class JobQueue:
+    """
+    In-process workers running the jobs queued in the database.
+
+    Every API process runs "concurrency" workers. They claim the due jobs, highest
+    priority first, and run their handler: CPU bound handlers hand their work over
+    to the process pool, so the event loop keeps serving requests.
+    A failed job is retried after an exponential backoff, then rejected, at once if
+    its handler raises JobRejected.
+    A job queued here wakes the workers at once, one queued by another process is
+    picked up within "poll_interval" seconds.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param pool: Process pool handed to the handlers
+    :type pool: ProcessPoolExecutor
+    :param handlers: Handler of every kind of job
+    :type handlers: dict[str, JobHandler]
+    :param concurrency: Number of jobs run at the same time
+    :type concurrency: int
+    :param poll_interval: Seconds between two polls when there is nothing to do
+    :type poll_interval: float
+    :param timeout: Seconds a job can run, a job in progress for longer is open again
+    :type timeout: float
+    :param retry_delay: Backoff before the first retry, in seconds, doubled every attempt
+    :type retry_delay: float
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        pool: ProcessPoolExecutor,
+        handlers: dict[str, JobHandler],
+        concurrency: int,
+        poll_interval: float = 5.0,
+        timeout: float = 600.0,
+        retry_delay: float = 10.0,
+    ):
+        self.engine = engine
+        self.pool = pool
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        # unique among the processes of every host, the jobs it claims carry it
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake_up = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[int, str] = {}  # job ID -> kind
+
+        # statistics
+        self.done = 0
+        self.failed = 0
+
+    async def enqueue(
+        self,
+        session: Session,
+        kind: str,
+        payload: dict,
+        priority: Priority = Priority.MEDIUM,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ) -> JobPublic:
+        """
+        Queue a job, it's run as soon as a worker is free.
+
+        \f
+
+        :param session: SQLModel session
+        :type session: Session
+        :param kind: Which handler runs the job
+        :type kind: str
+        :param payload: Arguments of the handler, JSON serializable
+        :type payload: dict
+        :param priority: Priority of the job
+        :type priority: Priority
+        :param max_attempts: The job is rejected after failing this many times
+        :type max_attempts: int
+        :return: The queued job
+        :rtype: JobPublic
+        """
+        job = await create_job(
+            session=session,
+            job=JobCreate(
+                kind=kind, payload=payload, priority=priority, max_attempts=max_attempts
+            ),
+        )
+        self.notify()
+        return job
+
+    def notify(self) -> None:
+        """
+        Wake the workers of this process up, a job is waiting.
+        """
+        self._wake_up.set()
+
+    async def start(self) -> None:
+        """
+        Start the workers, after opening again the jobs a crash may have left in progress.
+        """
+        with Session(self.engine) as session:
+            requeued = await requeue_jobs(
+                session=session,
+                locked_before=datetime.now() - timedelta(seconds=self.timeout),
+            )
+        if requeued:
+            logger.warning(f"{requeued} stale jobs opened again")
+
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"job-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Stop the workers, the jobs they were running are open again for the next start.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        with Session(self.engine) as session:
+            await requeue_jobs(session=session, worker_prefix=f"{self.name}:")
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.name,
+            "concurrency": self.concurrency,
+            "running": dict(self._running),
+            "done": self.done,
+            "failed": self.failed,
+        }
+
+    async def _work(self) -> None:
+        worker = f"{self.name}:{asyncio.current_task().get_name()}"
+        last_sweep = datetime.now()
+        while True:
+            self._wake_up.clear()  # before the claim, so a job queued meanwhile isn't missed
+            try:
+                with Session(self.engine) as session:
+                    jobs = await claim_jobs(
+                        session=session, worker=worker, kinds=list(self.handlers)
+                    )
+                    if datetime.now() - last_sweep > timedelta(seconds=self.timeout):
+                        # workers of other processes may have died with their jobs
+                        last_sweep = datetime.now()
+                        await requeue_jobs(
+                            session=session,
+                            locked_before=last_sweep - timedelta(seconds=self.timeout),
+                        )
+            except Exception:
+                logger.exception("Claiming jobs failed")
+                jobs = []
+
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wake_up.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+
+            for job in jobs:
+                await self._run(job)
+
+    async def _run(self, job: JobPublic) -> None:
+        self._running[job.id] = job.kind
+        try:
+            await asyncio.wait_for(
+                self.handlers[job.kind](self.pool, **job.payload), self.timeout
+            )
+        except asyncio.CancelledError:
+            raise
+        except JobRejected as exc:
+            self.failed += 1
+            logger.warning(f"Job {job.id} ({job.kind}) rejected: {exc}")
+            with Session(self.engine) as session:
+                await fail_job(session=session, id=job.id, error=str(exc), retry_in=None)
+        except Exception as exc:
+            self.failed += 1
+            retry_in = None
+            if job.attempts < job.max_attempts:
+                # exponential backoff, with jitter so failed jobs don't come back together
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                retry_in = timedelta(seconds=delay * random.uniform(0.75, 1.25))
+            logger.exception(
+                f"Job {job.id} ({job.kind}) failed, attempt {job.attempts}/{job.max_attempts}"
+            )
+            with Session(self.engine) as session:
+                await fail_job(
+                    session=session,
+                    id=job.id,
+                    error=f"{type(exc).__name__}: {exc}",
+                    retry_in=retry_in,
+                )
+        else:
+            self.done += 1
+            with Session(self.engine) as session:
+                await close_job(session=session, id=job.id)
+        finally:
+            self._running.pop(job.id, None)
+
+
+def get_job_queue(request: Request) -> JobQueue:
+    """
+    Returns the job queue created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.job_queue
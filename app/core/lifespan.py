@@ -1,7 +1,63 @@
 from contextlib import asynccontextmanager
+from functools import partial
+
 from fastapi import FastAPI
 
-from .database import init_db
+from ..commons.constants import (
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_LATENCY_TOLERANCE,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_MIN_LIMIT,
+    CHART_CAPACITY,
+    CHART_DIRECTORY,
+    CHART_REFRESH_INTERVAL,
+    CHART_TOP,
+    EMBEDDINGS_DIRECTORY,
+    FINGERPRINT_INDEX_DIRECTORY,
+    IMAGE_CACHE_DIRECTORY,
+    IMAGE_CACHE_MAX_BYTES,
+    JOB_POLL_INTERVAL,
+    JOB_RETRY_DELAY,
+    JOB_TIMEOUT,
+    JOB_WORKERS,
+    PLAY_EVENT_BATCH_SIZE,
+    PLAY_EVENT_FLUSH_INTERVAL,
+    PLAY_EVENT_QUEUE_SIZE,
+    PLAY_HISTORY_ARCHIVE_DIRECTORY,
+    PLAY_HISTORY_MAINTENANCE_INTERVAL,
+    PLAY_HISTORY_PARTITIONS_AHEAD,
+    PLAY_HISTORY_RETENTION_DAYS,
+    RECENT_PLAYS_FLUSH_INTERVAL,
+    RECENT_PLAYS_MAX_USERS,
+    RECENT_PLAYS_SIZE,
+    REMOTE_CACHE_DIRECTORY,
+    REMOTE_CACHE_MAX_BYTES,
+    SIMILAR_SONGS_DIRECTORY,
+    STREAM_BURST,
+    STREAM_CONNECTION_RATE,
+    STREAM_TOTAL_RATE,
+    STREAM_USER_RATE,
+)
+from ..commons.enums import JobKind
+from ..utils.embeddings import SongEmbeddings
+from ..utils.fingerprint import FingerprintIndex, detect_duplicate
+from ..utils.image_variants import generate_image_variants
+from ..utils.loudness import measure_song_loudness
+from ..utils.similar_songs import SimilarSongs
+from ..utils.transcode import transcode_song
+from ..utils.waveform import generate_waveform
+from .admission import AdaptiveConcurrencyLimiter
+from .bandwidth import BandwidthScheduler
+from .charts import ChartEngine
+from .database import engine, init_db
+from .http_client import create_http_client
+from .image_cache import ImageResizeCache
+from .jobs import JobQueue
+from .play_events import PlayEventRecorder
+from .play_history import PlayHistoryMaintainer
+from .process_pool import create_process_pool
+from .recent_plays import RecentPlayStore
+from .remote_cache import RemoteAudioCache
 
 
 @asynccontextmanager
@@ -9,5 +65,84 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for FastAPI app."""
     # Code to run at startup
     init_db()  # Initialize the database
+    app.state.http_client = create_http_client()  # one pooled client for the whole app
+    app.state.process_pool = create_process_pool()  # CPU bound work, off the event loop
+    app.state.remote_cache = None
+    if REMOTE_CACHE_MAX_BYTES > 0:
+        app.state.remote_cache = RemoteAudioCache(
+            REMOTE_CACHE_DIRECTORY, REMOTE_CACHE_MAX_BYTES
+        )
+        app.state.remote_cache.load()  # index what previous runs already cached
+    app.state.image_cache = ImageResizeCache(IMAGE_CACHE_DIRECTORY, IMAGE_CACHE_MAX_BYTES)
+    app.state.image_cache.load()
+    app.state.fingerprint_index = FingerprintIndex(FINGERPRINT_INDEX_DIRECTORY)
+    app.state.fingerprint_index.load()  # memory mapped, shared by every worker
+    app.state.similar_songs = SimilarSongs(SIMILAR_SONGS_DIRECTORY)
+    app.state.similar_songs.load()  # memory mapped too
+    app.state.song_embeddings = SongEmbeddings(EMBEDDINGS_DIRECTORY)
+    app.state.song_embeddings.load()  # memory mapped too
+    app.state.bandwidth_scheduler = BandwidthScheduler(
+        STREAM_CONNECTION_RATE, STREAM_USER_RATE, STREAM_TOTAL_RATE, STREAM_BURST
+    )
+    app.state.admission = None
+    if ADMISSION_MAX_LIMIT > 0:
+        # read by the admission control middleware, for every request
+        app.state.admission = AdaptiveConcurrencyLimiter(
+            ADMISSION_INITIAL_LIMIT,
+            ADMISSION_MIN_LIMIT,
+            ADMISSION_MAX_LIMIT,
+            ADMISSION_LATENCY_TOLERANCE,
+        )
+    app.state.job_queue = JobQueue(
+        engine,
+        app.state.process_pool,
+        {
+            JobKind.WAVEFORM: generate_waveform,
+            JobKind.LOUDNESS: measure_song_loudness,
+            JobKind.FINGERPRINT: partial(
+                detect_duplicate, index=app.state.fingerprint_index
+            ),
+            JobKind.IMAGE_VARIANTS: generate_image_variants,
+            JobKind.TRANSCODE: transcode_song,
+        },
+        JOB_WORKERS,
+        JOB_POLL_INTERVAL,
+        JOB_TIMEOUT,
+        JOB_RETRY_DELAY,
+    )
+    await app.state.job_queue.start()  # work left by the previous runs is picked up too
+    app.state.play_history = PlayHistoryMaintainer(
+        engine,
+        PLAY_HISTORY_RETENTION_DAYS,
+        PLAY_HISTORY_PARTITIONS_AHEAD,
+        PLAY_HISTORY_MAINTENANCE_INTERVAL,
+        PLAY_HISTORY_ARCHIVE_DIRECTORY or None,
+    )
+    await app.state.play_history.start()  # the partitions exist before the first write
+    app.state.charts = ChartEngine(
+        engine, CHART_DIRECTORY, CHART_CAPACITY, CHART_TOP, CHART_REFRESH_INTERVAL
+    )
+    await app.state.charts.start()  # merges the counters saved by the previous runs
+    app.state.play_events = PlayEventRecorder(
+        engine,
+        PLAY_EVENT_QUEUE_SIZE,
+        PLAY_EVENT_BATCH_SIZE,
+        PLAY_EVENT_FLUSH_INTERVAL,
+        on_written=app.state.charts.add_batch,  # the charts count what is written
+    )
+    await app.state.play_events.start()
+    app.state.recent_plays = RecentPlayStore(
+        engine, RECENT_PLAYS_SIZE, RECENT_PLAYS_MAX_USERS, RECENT_PLAYS_FLUSH_INTERVAL
+    )
+    await app.state.recent_plays.start()
     yield
-    # Code to run at shutdown
\ No newline at end of file
+    # Code to run at shutdown
+    await app.state.recent_plays.stop()  # the last positions are written before leaving
+    await app.state.play_events.stop()  # the queued events are written before leaving
+    await app.state.charts.stop()  # after the last events are counted
+    await app.state.play_history.stop()
+    await app.state.job_queue.stop()  # before the pool the jobs are running in
+    if app.state.remote_cache:
+        await app.state.remote_cache.close()
+    await app.state.http_client.aclose()
+    app.state.process_pool.shutdown(cancel_futures=True)
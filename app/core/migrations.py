@@ -0,0 +1,78 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+# columns added to tables that already existed: "create_all" only creates the missing tables,
+# so a database created before them gets them here, (table, column) in the order they came
+ADDED_COLUMNS = (
+    # loudness and ReplayGain, measured at upload
+    ("song", "loudness"),
+    ("song", "true_peak"),
+    ("song", "replaygain_track_gain"),
+    ("song", "replaygain_track_peak"),
+    ("album", "loudness"),
+    ("album", "replaygain_album_gain"),
+    ("album", "replaygain_album_peak"),
+    # duplicates found by acoustic fingerprinting
+    ("song", "duplicate_of_id"),
+    # placeholders of the artwork, computed at upload
+    ("song", "image_blurhash"),
+    ("song", "image_palette"),
+    ("album", "image_blurhash"),
+    ("album", "image_palette"),
+    ("playlist", "image_blurhash"),
+    ("playlist", "image_palette"),
+)
+
+
+def add_missing_columns(engine: Engine) -> list[str]:
+    """
+    Add to the existing tables the columns of "ADDED_COLUMNS" they don't have yet,
+    with their foreign keys and indexes. The columns are nullable, the rows get NULL.
+    Run after "create_all", the tables it just created already have them.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :return: The added columns, as "table.column"
+    :rtype: list[str]
+    """
+    inspector = inspect(engine)
+    existing = {}
+    added = []
+    with engine.begin() as connection:
+        for table_name, column_name in ADDED_COLUMNS:
+            table = SQLModel.metadata.tables.get(table_name)
+            if table is None or not inspector.has_table(table_name):
+                continue
+            if table_name not in existing:
+                existing[table_name] = {
+                    column["name"] for column in inspector.get_columns(table_name)
+                }
+            if column_name in existing[table_name]:
+                continue
+
+            column = table.c[column_name]
+            preparer = engine.dialect.identifier_preparer
+            definition = f"{preparer.quote(column.name)} {column.type.compile(engine.dialect)}"
+            for foreign_key in column.foreign_keys:
+                definition += (
+                    f" REFERENCES {preparer.quote(foreign_key.column.table.name)}"
+                    f" ({preparer.quote(foreign_key.column.name)})"
+                )
+            connection.execute(
+                text(f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {definition}")
+            )
+            for index in table.indexes:
+                if column_name in index.columns:
+                    index.create(connection, checkfirst=True)
+
+            existing[table_name].add(column_name)
+            added.append(f"{table_name}.{column_name}")
+            logger.info(f"Column {table_name}.{column_name} added")
+    return added
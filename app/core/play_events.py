@@ -0,0 +1,182 @@
+import asyncio
+import logging
+
+from collections import deque
+from collections.abc import Callable
+from datetime import datetime
+
+import anyio
+
+from fastapi import Request
+from sqlalchemy.engine import Engine
+
+from .play_history import write_play_events
+
+logger = logging.getLogger(__name__)
+
+
+class PlayEventRecorder:
+    """
+    Records the play events off the request path, in batches.
+
+    Recording an event only appends it to a bounded in-memory queue: no query, no await.
+    A background task writes the queue to the database "batch_size" events at a time,
+    as soon as a batch is full or every "flush_interval" seconds, with COPY on Postgres
+    and a multi-row insert elsewhere (see write_play_events), in a thread so the event
+    loop keeps serving. Every batch written is then handed to "on_written", if any.
+    When the database can't keep up (or is down) the queue fills up: a batch that failed
+    is put back and retried, and the events that don't fit anymore are dropped and counted,
+    streams never wait for the statistics.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param max_queue: Events kept in memory at most, the next ones are dropped
+    :type max_queue: int
+    :param batch_size: Events written at once
+    :type batch_size: int
+    :param flush_interval: Seconds an event waits at most for its batch to fill up
+    :type flush_interval: float
+    :param retry_delay: Seconds before writing again after a failure
+    :type retry_delay: float
+    :param on_written: Called with every batch written, in the event loop
+    :type on_written: Callable[[list[tuple]], None] | None
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float = 1.0,
+        retry_delay: float = 5.0,
+        on_written: Callable[[list[tuple]], None] | None = None,
+    ):
+        self.engine = engine
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.on_written = on_written
+        self._events: deque[tuple] = deque()
+        self._batch_ready = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+        # statistics
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(
+        self,
+        song_id: int,
+        user_id: int,
+        source: str = "stream",
+        quality: str = "original",
+        played_at: datetime | None = None,
+    ) -> bool:
+        """
+        Queue a play event, False if it was dropped because the queue is full.
+        """
+        if len(self._events) >= self.max_queue:
+            self.dropped += 1
+            return False
+
+        self._events.append(
+            (song_id, user_id, played_at or datetime.now(), source, quality)
+        )
+        self.recorded += 1
+        if len(self._events) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._flush_loop(), name="play-event-flusher")
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and write every queued event, nothing is lost on shutdown.
+        """
+        self._stopping = True
+        self._batch_ready.set()
+        if self._task is not None:
+            await self._task  # it ends after the batch it's writing, if any
+            self._task = None
+
+        try:
+            while await self.flush():
+                pass
+        except Exception:
+            logger.exception(f"{len(self._events)} play events lost on shutdown")
+            self.dropped += len(self._events)
+            self._events.clear()
+
+    async def flush(self) -> int:
+        """
+        Write the next batch of events, they're put back in the queue if it fails.
+
+        \f
+
+        :return: Number of events written
+        :rtype: int
+        """
+        batch = [
+            self._events.popleft()
+            for _ in range(min(self.batch_size, len(self._events)))
+        ]
+        if not batch:
+            return 0
+
+        try:
+            await anyio.to_thread.run_sync(self._write, batch)
+        except BaseException:
+            self._events.extendleft(reversed(batch))
+            raise
+        self.written += len(batch)
+        if self.on_written is not None:
+            try:
+                self.on_written(batch)
+            except Exception:  # written anyway, not to be put back
+                logger.exception("Handling the play events written failed")
+        return len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._events),
+            "max_queue": self.max_queue,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    async def _flush_loop(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            try:
+                # a full batch means there may be more waiting, catch up
+                while await self.flush() == self.batch_size and not self._stopping:
+                    pass
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception(f"Writing play events failed, {len(self._events)} queued")
+                await asyncio.sleep(self.retry_delay)
+
+    def _write(self, batch: list[tuple]) -> None:
+        write_play_events(self.engine, batch)
+
+
+def get_play_event_recorder(request: Request) -> PlayEventRecorder:
+    """
+    Returns the play event recorder created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.play_events
@@ -0,0 +1,375 @@
+import asyncio
+import csv
+import gzip
+import logging
+import os
+
+from datetime import date, datetime, time, timedelta
+
+import anyio
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from ..models.play_event_model import PlayEvent
+
+logger = logging.getLogger(__name__)
+
+_TABLE = PlayEvent.__tablename__
+
+# columns of the queued events, in the order of their tuples
+PLAY_EVENT_COLUMNS = ("song_id", "user_id", "played_at", "source", "quality")
+
+# one maintenance at a time among the processes, the key is any constant bigint
+_MAINTENANCE_LOCK = 0x706C6179  # "play"
+
+
+def day_partition(day: date) -> str:
+    # Postgres partition of the events of a day
+    return f"{_TABLE}_p{day:%Y%m%d}"
+
+
+def month_table(day: date) -> str:
+    # SQLite table of the events of a month
+    return f"{_TABLE}_m{day:%Y%m}"
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _partition_bounds(name: str) -> tuple[date, date] | None:
+    # the bounds of a partition, or of a month table, are in its name
+    suffix = name.removeprefix(f"{_TABLE}_")
+    try:
+        if suffix.startswith("p") and len(suffix) == 9:
+            start = datetime.strptime(suffix[1:], "%Y%m%d").date()
+            return start, start + timedelta(days=1)
+        if suffix.startswith("m") and len(suffix) == 7:
+            start = datetime.strptime(suffix[1:], "%Y%m").date()
+            return start, _next_month(start)
+    except ValueError:
+        pass
+    return None
+
+
+def _month_table(name: str) -> Table:
+    # the same columns as the parent, but SQLite only numbers a single column primary key
+    return Table(
+        name,
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("song_id", Integer, nullable=False),
+        Column("user_id", Integer, nullable=False),
+        Column("played_at", DateTime, nullable=False),
+        Column("source", String, nullable=False),
+        Column("quality", String, nullable=False),
+        Index(f"ix_{name}_user_played_at", "user_id", "played_at"),
+    )
+
+
+def play_event_partitions(engine: Engine) -> dict[str, tuple[date, date]]:
+    """
+    The partitions of the play events and the days they hold, the end excluded.
+    On Postgres they're the partitions of the "playevent" table, elsewhere the monthly tables.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :return: Bounds of every partition, by name
+    :rtype: dict[str, tuple[date, date]]
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            names = connection.execute(
+                text(
+                    "SELECT child.relname FROM pg_inherits"
+                    " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+                    " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+                    " WHERE parent.relname = :parent"
+                ),
+                {"parent": _TABLE},
+            ).scalars()
+            names = list(names)
+    else:
+        names = inspect(engine).get_table_names()
+
+    partitions = {}
+    for name in names:
+        bounds = _partition_bounds(name)
+        if bounds is not None:
+            partitions[name] = bounds
+    return dict(sorted(partitions.items(), key=lambda item: item[1]))
+
+
+def history_tables(engine: Engine, since: datetime, until: datetime) -> list[Table]:
+    """
+    The monthly tables holding the events between "since" and "until", on SQLite.
+    Postgres prunes its partitions itself, from the bounds of the query.
+    """
+    return [
+        _month_table(name)
+        for name, (start, end) in play_event_partitions(engine).items()
+        if name.startswith(f"{_TABLE}_m")
+        and datetime.combine(start, time()) < until
+        and since < datetime.combine(end, time())
+    ]
+
+
+def write_play_events(engine: Engine, batch: list[tuple]) -> None:
+    """
+    Write a batch of play events, tuples of PLAY_EVENT_COLUMNS.
+
+    On Postgres the rows go through COPY into the partitioned table, which routes
+    every row to the partition of its day: it must exist, see create_play_event_partitions.
+    On SQLite they're inserted in the table of their month, created on the way.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param batch: The events
+    :type batch: list[tuple]
+    """
+    if engine.dialect.name == "postgresql":
+        # COPY streams the rows, no statement to parse nor parameters to bind per row
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                with cursor.copy(
+                    f"COPY {_TABLE} ({', '.join(PLAY_EVENT_COLUMNS)}) FROM STDIN"
+                ) as copy:
+                    for event in batch:
+                        copy.write_row(event)
+            connection.commit()
+        finally:
+            connection.close()
+        return
+
+    months: dict[tuple[int, int], list[tuple]] = {}
+    for song_id, user_id, played_at, source, quality in batch:
+        months.setdefault((played_at.year, played_at.month), []).append(
+            # the text SQLAlchemy stores a DateTime as on SQLite, so the reads compare alike
+            (song_id, user_id, played_at.isoformat(" ", "microseconds"), source, quality)
+        )
+    with engine.begin() as connection:
+        for (year, month), rows in months.items():
+            table = _month_table(month_table(date(year, month, 1)))
+            table.create(connection, checkfirst=True)
+            # a plain executemany of tuples: insert() costs more per row than SQLite itself
+            connection.exec_driver_sql(
+                f"INSERT INTO {table.name} ({', '.join(PLAY_EVENT_COLUMNS)})"
+                f" VALUES ({', '.join('?' for _ in PLAY_EVENT_COLUMNS)})",
+                rows,
+            )
+
+
+def create_play_event_partitions(engine: Engine, today: date, ahead: int) -> list[str]:
+    """
+    Create the partitions of the days from "today" to "ahead" days later, if missing.
+    On SQLite it's the tables of the months of these days.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param today: First day
+    :type today: date
+    :param ahead: Number of days after it
+    :type ahead: int
+    :return: Names of the partitions created
+    :rtype: list[str]
+    """
+    existing = play_event_partitions(engine)
+    days = [today + timedelta(days=offset) for offset in range(ahead + 1)]
+    created = []
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            for day in days:
+                name = day_partition(day)
+                if name in existing:
+                    continue
+                connection.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {_TABLE}"
+                        f" FOR VALUES FROM ('{day.isoformat()}')"
+                        f" TO ('{(day + timedelta(days=1)).isoformat()}')"
+                    )
+                )
+                created.append(name)
+        else:
+            for name in dict.fromkeys(month_table(day) for day in days):
+                if name in existing:
+                    continue
+                _month_table(name).create(connection, checkfirst=True)
+                created.append(name)
+    return created
+
+
+def _archive(connection: Connection, name: str, path: str) -> None:
+    # gzipped CSV with a header, written next to its final path and moved in place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(f"{path}.tmp", "wt", newline="") as file:
+        if connection.dialect.name == "postgresql":
+            cursor = connection.connection.cursor()
+            with cursor.copy(f"COPY {name} TO STDOUT (FORMAT csv, HEADER)") as copy:
+                for data in copy:
+                    file.write(bytes(data).decode())
+        else:
+            writer = csv.writer(file)
+            result = connection.execute(select(_month_table(name)))
+            writer.writerow(result.keys())
+            for rows in iter(lambda: result.fetchmany(10000), []):
+                writer.writerows(rows)
+    os.replace(f"{path}.tmp", path)
+
+
+def expire_play_event_partitions(
+    engine: Engine,
+    today: date,
+    retention_days: int,
+    archive_directory: str | None = None,
+) -> list[str]:
+    """
+    Drop the partitions whose days are all older than the retention.
+    With an archive directory, every partition is saved there as a gzipped CSV first.
+    Dropping a partition is instant, unlike deleting its rows.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param today: Current day
+    :type today: date
+    :param retention_days: Days of events kept, today included
+    :type retention_days: int
+    :param archive_directory: Where the partitions are archived, None to drop them only
+    :type archive_directory: str | None
+    :return: Names of the partitions dropped
+    :rtype: list[str]
+    """
+    oldest_kept = today - timedelta(days=retention_days - 1)
+    dropped = []
+    for name, (_, end) in play_event_partitions(engine).items():
+        if end > oldest_kept:
+            continue
+
+        with engine.begin() as connection:
+            if engine.dialect.name == "postgresql":
+                # detached first, so the writes and the reads don't wait for the archive
+                connection.execute(text(f"ALTER TABLE {_TABLE} DETACH PARTITION {name}"))
+            if archive_directory:
+                _archive(connection, name, os.path.join(archive_directory, f"{name}.csv.gz"))
+            connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+class PlayHistoryMaintainer:
+    """
+    Keeps the partitions of the play events ahead of the writes and within the retention.
+
+    Every "interval" seconds, and once when started, the partitions of the next "ahead" days
+    are created and the ones past "retention_days" are archived and dropped.
+    Every process runs it, on Postgres an advisory lock lets only one of them work at a time.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param retention_days: Days of events kept, 0 keeps everything
+    :type retention_days: int
+    :param ahead: Days of partitions created ahead
+    :type ahead: int
+    :param interval: Seconds between two maintenances
+    :type interval: float
+    :param archive_directory: Where the dropped partitions are archived, None to only drop them
+    :type archive_directory: str | None
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        retention_days: int,
+        ahead: int,
+        interval: float = 3600.0,
+        archive_directory: str | None = None,
+    ):
+        self.engine = engine
+        self.retention_days = retention_days
+        self.ahead = ahead
+        self.interval = interval
+        self.archive_directory = archive_directory
+        self._task: asyncio.Task | None = None
+
+    def run(self, today: date | None = None) -> dict[str, list[str]]:
+        """
+        Run a maintenance now.
+
+        \f
+
+        :param today: Current day
+        :type today: date | None
+        :return: Names of the partitions "created" and "dropped"
+        :rtype: dict[str, list[str]]
+        """
+        today = today or date.today()
+        if self.engine.dialect.name != "postgresql":
+            return self._run(today)
+
+        with self.engine.connect() as connection:
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": _MAINTENANCE_LOCK}
+            ).scalar()
+            if not locked:
+                return {"created": [], "dropped": []}  # another process is at it
+            try:
+                return self._run(today)
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": _MAINTENANCE_LOCK}
+                )
+
+    def _run(self, today: date) -> dict[str, list[str]]:
+        created = create_play_event_partitions(self.engine, today, self.ahead)
+        dropped = []
+        if self.retention_days > 0:
+            dropped = expire_play_event_partitions(
+                self.engine, today, self.retention_days, self.archive_directory
+            )
+        if created or dropped:
+            logger.info(f"Play event partitions created: {created}, dropped: {dropped}")
+        return {"created": created, "dropped": dropped}
+
+    async def start(self) -> None:
+        """
+        Run a maintenance, so today's partition exists before the first write, then schedule them.
+        """
+        await anyio.to_thread.run_sync(self.run)
+        self._task = asyncio.create_task(self._loop(), name="play-history-maintainer")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await anyio.to_thread.run_sync(self.run)
+            except Exception:
+                logger.exception("Play history maintenance failed")
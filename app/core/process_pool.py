@@ -0,0 +1,48 @@
+import asyncio
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from fastapi import Request
+
+from ..commons.constants import PROCESS_POOL_WORKERS
+
+
+def create_process_pool() -> ProcessPoolExecutor:
+    """
+    Create the process pool used for CPU bound work (decoding, DSP, image processing...).
+    Work done there never holds the GIL of the API workers, so requests keep being served.
+
+    \f
+
+    :return: The process pool, it must be shut down on shutdown
+    :rtype: ProcessPoolExecutor
+    """
+    # "spawn" doesn't inherit the event loop nor the open connections of the API worker
+    return ProcessPoolExecutor(
+        max_workers=PROCESS_POOL_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def get_process_pool(request: Request) -> ProcessPoolExecutor:
+    """
+    Returns the process pool created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.process_pool
+
+
+async def run_in_process(
+    pool: ProcessPoolExecutor,
+    function: Callable[..., Any],
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """
+    Run "function" in the process pool and wait for its result without blocking the event loop.
+    "function" and its arguments must be picklable: module level functions and plain values.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(function, *args, **kwargs))
@@ -0,0 +1,434 @@
+import asyncio
+import logging
+import time
+
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+import anyio
+
+from fastapi import Request
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from ..models.recent_play_model import RecentPlay
+
+logger = logging.getLogger(__name__)
+
+# rows written by the other workers are read again this long after, committed late or not
+_SYNC_OVERLAP = 5.0
+
+
+class RecentPlays:
+    """
+    The last songs played by a user and where they stopped, in at most "capacity" slots.
+
+    Three flat arrays, not an object per song: 16 bytes a slot. A song played again
+    keeps its slot, a new one takes the slot of the least recently played once full.
+
+    \f
+
+    :param capacity: Songs kept at most
+    :type capacity: int
+    """
+
+    __slots__ = ("capacity", "songs", "positions", "played", "loaded")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.songs = array("i")
+        self.positions = array("f")  # seconds
+        self.played = array("d")  # timestamps
+        self.loaded = False  # whether the rows of the database were merged in
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def put(
+        self, song_id: int, position: float | None, played_at: float
+    ) -> int | None:
+        """
+        Put a song in, None keeps its position. Returns the song left out, if any:
+        the least recently played one, or this one if it's older than all the others.
+        """
+        songs = self.songs
+        try:
+            slot = songs.index(song_id)
+        except ValueError:
+            slot = None
+
+        if slot is not None:
+            if played_at >= self.played[slot]:
+                self.played[slot] = played_at
+                if position is not None:
+                    self.positions[slot] = position
+            return None
+
+        if len(songs) < self.capacity:
+            songs.append(song_id)
+            self.positions.append(position or 0.0)
+            self.played.append(played_at)
+            return None
+
+        oldest = min(range(len(songs)), key=self.played.__getitem__)
+        if played_at < self.played[oldest]:
+            return song_id
+        evicted = songs[oldest]
+        songs[oldest] = song_id
+        self.positions[oldest] = position or 0.0
+        self.played[oldest] = played_at
+        return evicted
+
+    def get(self, song_id: int) -> tuple[float, float] | None:
+        """
+        The (position, played_at) of a song, None if it's not one of the last ones.
+        """
+        try:
+            slot = self.songs.index(song_id)
+        except ValueError:
+            return None
+        return self.positions[slot], self.played[slot]
+
+    def items(self) -> list[tuple[int, float, float]]:
+        """
+        The (song_id, position, played_at) of every song, most recently played first.
+        """
+        return sorted(
+            zip(self.songs, self.positions, self.played),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+
+
+def read_recent_plays(engine: Engine, user_id: int, limit: int) -> list[RecentPlay]:
+    """
+    The last songs of a user saved in the database, most recently played first.
+    """
+    with engine.connect() as connection:
+        return list(
+            connection.execute(
+                select(RecentPlay)
+                .where(RecentPlay.user_id == user_id)
+                .order_by(RecentPlay.played_at.desc())
+                .limit(limit)
+            )
+        )
+
+
+def read_recent_plays_since(engine: Engine, since: datetime) -> list[RecentPlay]:
+    """
+    The rows written since a date, by any worker.
+    """
+    with engine.connect() as connection:
+        return list(
+            connection.execute(
+                select(RecentPlay).where(RecentPlay.updated_at >= since)
+            )
+        )
+
+
+def write_recent_plays(
+    engine: Engine, rows: list[dict], deleted: list[tuple[int, int]]
+) -> None:
+    """
+    Insert or update the rows of the recent plays and delete the (user_id, song_id) ones.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param rows: Values of the rows, by column
+    :type rows: list[dict]
+    :param deleted: The songs left out of the last ones of their users
+    :type deleted: list[tuple[int, int]]
+    """
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    with engine.begin() as connection:
+        if deleted:
+            connection.execute(
+                delete(RecentPlay).where(
+                    RecentPlay.user_id == bindparam("u"),
+                    RecentPlay.song_id == bindparam("s"),
+                ),
+                [{"u": user_id, "s": song_id} for user_id, song_id in deleted],
+            )
+        if rows:
+            statement = dialect.insert(RecentPlay)
+            statement = statement.on_conflict_do_update(
+                index_elements=["user_id", "song_id"],
+                set_={
+                    column: statement.excluded[column]
+                    for column in ("position", "played_at", "updated_at")
+                },
+            )
+            connection.execute(statement, rows)
+
+
+class RecentPlayStore:
+    """
+    The recently played songs of the users and their resume positions, read from memory.
+
+    Every user has a RecentPlays of "capacity" slots, kept in an LRU of "max_users" users:
+    recording a play or a position is a write in memory, and so is reading them, except
+    the first read of a user by a worker, which loads the rows saved in the database.
+    A background task writes the changes behind, every "flush_interval" seconds, in one
+    transaction, then reads back the rows the other workers wrote meanwhile, so a user
+    going from a worker to another sees the same songs a few seconds later at most.
+
+    A user with changes not yet written is not evicted from the LRU, nothing is lost but
+    the changes of the last interval if the process dies.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param capacity: Songs kept per user
+    :type capacity: int
+    :param max_users: Users kept in memory
+    :type max_users: int
+    :param flush_interval: Seconds between two writes to the database
+    :type flush_interval: float
+    :param retry_delay: Seconds before writing again after a failure
+    :type retry_delay: float
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        capacity: int,
+        max_users: int,
+        flush_interval: float = 2.0,
+        retry_delay: float = 5.0,
+    ):
+        self.engine = engine
+        self.capacity = capacity
+        self.max_users = max_users
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._users: OrderedDict[int, RecentPlays] = OrderedDict()  # LRU first
+        self._dirty: dict[int, set[int]] = {}  # user_id -> songs to write
+        self._deleted: set[tuple[int, int]] = set()  # (user_id, song_id) to delete
+        self._synced_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+        # statistics
+        self.hits = 0
+        self.loads = 0
+        self.written = 0
+        self.synced = 0
+        self.failed_flushes = 0
+
+    def record(
+        self,
+        user_id: int,
+        song_id: int,
+        position: float | None = None,
+        played_at: float | None = None,
+    ) -> None:
+        """
+        Record that a user played a song, and where they are in it. No query, no await.
+        Without a position, the one already recorded is kept.
+        """
+        plays = self._user(user_id)
+        self._put(user_id, plays, song_id, position, played_at or time.time())
+        self._dirty.setdefault(user_id, set()).add(song_id)
+        self._shrink()
+
+    async def recent(self, user_id: int, limit: int | None = None) -> list[dict]:
+        """
+        The last songs of a user, most recently played first.
+        """
+        plays = await self._loaded(user_id)
+        return [
+            {
+                "song_id": song_id,
+                "position": position,
+                "played_at": datetime.fromtimestamp(played_at),
+            }
+            for song_id, position, played_at in plays.items()[:limit]
+        ]
+
+    async def resume(self, user_id: int, song_id: int) -> dict | None:
+        """
+        Where a user stopped in a song, None if it's not one of their last songs.
+        """
+        entry = (await self._loaded(user_id)).get(song_id)
+        if entry is None:
+            return None
+        position, played_at = entry
+        return {
+            "song_id": song_id,
+            "position": position,
+            "played_at": datetime.fromtimestamp(played_at),
+        }
+
+    async def start(self) -> None:
+        self._synced_at = time.time()
+        self._task = asyncio.create_task(self._flush_loop(), name="recent-plays-flusher")
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and write the last changes.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Recent plays lost on shutdown")
+
+    async def flush(self) -> int:
+        """
+        Write the changes made since the last flush, they're kept for the next one if it fails.
+
+        \f
+
+        :return: Number of rows written
+        :rtype: int
+        """
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        now = datetime.now()
+        rows = []
+        for user_id, song_ids in dirty.items():
+            plays = self._users.get(user_id)
+            for song_id in song_ids:
+                entry = plays.get(song_id) if plays is not None else None
+                if entry is not None:
+                    rows.append(
+                        {
+                            "user_id": user_id,
+                            "song_id": song_id,
+                            "position": entry[0],
+                            "played_at": datetime.fromtimestamp(entry[1]),
+                            "updated_at": now,
+                        }
+                    )
+        if not rows and not deleted:
+            return 0
+
+        try:
+            await anyio.to_thread.run_sync(
+                write_recent_plays, self.engine, rows, list(deleted)
+            )
+        except BaseException:
+            for user_id, song_ids in dirty.items():  # merged with the newer changes
+                self._dirty.setdefault(user_id, set()).update(song_ids)
+            self._deleted |= deleted - {
+                (user_id, song_id)
+                for user_id, song_ids in self._dirty.items()
+                for song_id in song_ids
+            }
+            raise
+        self.written += len(rows)
+        self._shrink()
+        return len(rows)
+
+    async def sync(self) -> int:
+        """
+        Read the rows written by the other workers since the last sync into the users in memory.
+
+        \f
+
+        :return: Number of rows merged
+        :rtype: int
+        """
+        started = time.time()
+        since = datetime.fromtimestamp(self._synced_at - _SYNC_OVERLAP)
+        rows = await anyio.to_thread.run_sync(read_recent_plays_since, self.engine, since)
+        merged = 0
+        for row in rows:
+            plays = self._users.get(row.user_id)
+            if plays is None or row.song_id in self._dirty.get(row.user_id, ()):
+                continue  # loaded from the database when needed, or changed here since
+            self._put(row.user_id, plays, row.song_id, row.position, row.played_at.timestamp())
+            merged += 1
+        self._synced_at = started
+        self.synced += merged
+        return merged
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "max_users": self.max_users,
+            "capacity": self.capacity,
+            "pending": sum(len(song_ids) for song_ids in self._dirty.values()),
+            "hits": self.hits,
+            "loads": self.loads,
+            "written": self.written,
+            "synced": self.synced,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                await self.sync()
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Writing the recent plays failed")
+                await asyncio.sleep(self.retry_delay)
+
+    def _user(self, user_id: int) -> RecentPlays:
+        plays = self._users.get(user_id)
+        if plays is None:
+            plays = self._users[user_id] = RecentPlays(self.capacity)
+        else:
+            self._users.move_to_end(user_id)
+        return plays
+
+    def _put(
+        self,
+        user_id: int,
+        plays: RecentPlays,
+        song_id: int,
+        position: float | None,
+        played_at: float,
+    ) -> None:
+        evicted = plays.put(song_id, position, played_at)
+        self._deleted.discard((user_id, song_id))
+        if evicted is not None:
+            self._deleted.add((user_id, evicted))
+            self._dirty.get(user_id, set()).discard(evicted)
+
+    async def _loaded(self, user_id: int) -> RecentPlays:
+        # the user's songs, with the ones saved by the previous runs and the other workers
+        plays = self._user(user_id)
+        if plays.loaded:
+            self.hits += 1
+            return plays
+
+        rows = await anyio.to_thread.run_sync(
+            read_recent_plays, self.engine, user_id, self.capacity
+        )
+        plays = self._user(user_id)  # evicted meanwhile, maybe
+        if not plays.loaded:
+            for row in rows:  # what was recorded meanwhile is newer
+                if row.song_id not in plays.songs:
+                    self._put(user_id, plays, row.song_id, row.position, row.played_at.timestamp())
+            plays.loaded = True
+            self.loads += 1
+        self._shrink()
+        return plays
+
+    def _shrink(self) -> None:
+        while len(self._users) > self.max_users:
+            for user_id in self._users:
+                if user_id not in self._dirty:
+                    break
+            else:
+                return  # every user has changes to write, evicted after the flush
+            del self._users[user_id]
+
+
+def get_recent_play_store(request: Request) -> RecentPlayStore:
+    """
+    Returns the recent play store created in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.recent_plays
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import time
+
+from collections import OrderedDict
+
+import aiofiles
+import anyio
+import httpx
+
+from fastapi import Request
+
+from ..commons.constants import REMOTE_CACHE_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteFetchError(Exception):
+    """
+    The origin couldn't provide the file, "status_code" is the upstream status (None on network errors).
+    """
+
+    def __init__(self, status_code: int | None, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+class CacheFill:
+    """
+    An upstream download in progress.
+    Every listener of the same file tails the partially written file instead of opening
+    its own upstream request.
+
+    \f
+
+    :param part_path: Where the download is written while in progress
+    :type part_path: str
+    """
+
+    def __init__(self, part_path: str):
+        self.part_path = part_path
+        self.size: int | None = None  # from the upstream Content-Length
+        self.content_type: str | None = None
+        self.written = 0
+        self.done = False
+        self.error: RemoteFetchError | None = None
+        self.ready = asyncio.Event()  # set once the upstream headers are known
+        self.task: asyncio.Task | None = None
+        self._progress = asyncio.Event()
+
+    def notify(self) -> None:
+        # wake up every waiter, then arm a new event for the next chunk
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def wait_for(self, position: int) -> None:
+        """
+        Wait until the byte at "position" has been written (or the download is over).
+        """
+        while not self.done and self.written <= position and self.error is None:
+            await self._progress.wait()
+
+        if self.error is not None:
+            raise self.error
+
+
+class CachedAudio:
+    """
+    A file opened through the cache, either complete on disk or still being downloaded.
+
+    \f
+
+    :param path: Path of the complete file
+    :type path: str
+    :param size: File size, None if the origin didn't tell us
+    :type size: int | None
+    :param content_type: MIME type of the file
+    :type content_type: str
+    :param fill: The download in progress, None on a cache hit
+    :type fill: CacheFill | None
+    :param saved: Whether serving this file doesn't cost an upstream transfer
+    :type saved: bool
+    """
+
+    __slots__ = ("path", "size", "content_type", "fill", "saved")
+
+    def __init__(
+        self,
+        path: str,
+        size: int | None,
+        content_type: str,
+        fill: CacheFill | None,
+        saved: bool,
+    ):
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        self.fill = fill
+        self.saved = saved
+
+
+class RemoteAudioCache:
+    """
+    Size bounded, read-through disk cache of the files served by the remote origin.
+
+    Files are evicted in LRU order once the total size exceeds "max_bytes".
+    Concurrent requests for a file that isn't cached yet share a single upstream fetch,
+    which fills the cache in the background while the first listeners are served.
+    The bookkeeping lives in memory, so every worker process enforces its own budget.
+
+    \f
+
+    :param directory: Where cached files are stored
+    :type directory: str
+    :param max_bytes: Maximum size of the cache
+    :type max_bytes: int
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()  # name -> size, LRU first
+        self._size = 0
+        self._fills: dict[str, CacheFill] = {}
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # misses that joined a fetch already in progress
+        self.bytes_saved = 0  # bytes served without fetching them from the origin
+        self.bytes_fetched = 0
+
+    def load(self) -> None:
+        """
+        Index the files already in the cache directory, least recently used first.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".part"):
+                # other workers may be filling it, unless it's a stale leftover of a crash
+                if time.time() - stat.st_mtime > 3600:
+                    os.remove(entry.path)
+                continue
+            entries.append((stat.st_atime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._add_entry(name, size)
+        self._evict()
+
+    async def close(self) -> None:
+        """
+        Abort the downloads still in progress.
+        """
+        for fill in list(self._fills.values()):
+            if fill.task:
+                fill.task.cancel()
+        await asyncio.gather(
+            *(fill.task for fill in self._fills.values() if fill.task),
+            return_exceptions=True,
+        )
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "bytes_fetched": self.bytes_fetched,
+            "size": self._size,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._entries),
+            "fills_in_progress": len(self._fills),
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _add_entry(self, name: str, size: int) -> None:
+        self._size += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                # readers that already opened the file keep reading it just fine
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    async def open(self, name: str, url: str, client: httpx.AsyncClient) -> CachedAudio:
+        """
+        Open a file through the cache, starting the upstream fetch on a miss.
+
+        \f
+
+        :param name: File name, unique for the remote file
+        :type name: str
+        :param url: Remote URL of the file
+        :type url: str
+        :param client: HTTP client used for the upstream fetch
+        :type client: httpx.AsyncClient
+        :return: The cached file
+        :rtype: CachedAudio
+        """
+        path = self._path(name)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        size = self._entries.get(name)
+        if size is None and name not in self._fills:
+            # another worker may have filled it already
+            try:
+                size = os.path.getsize(path)
+                self._add_entry(name, size)
+            except FileNotFoundError:
+                pass
+
+        if size is not None:
+            self.hits += 1
+            self._entries.move_to_end(name)
+            return CachedAudio(path, size, content_type, None, True)
+
+        self.misses += 1
+        fill = self._fills.get(name)
+        saved = fill is not None
+        if fill is None:
+            fill = CacheFill(f"{path}.{os.getpid()}.part")
+            self._fills[name] = fill
+            # the fetch isn't tied to the first request: it goes on if that listener leaves
+            fill.task = asyncio.create_task(self._fill(name, url, client, fill))
+        else:
+            self.coalesced += 1
+
+        await fill.ready.wait()
+        if fill.error is not None:
+            raise fill.error
+
+        return CachedAudio(
+            path, fill.size, fill.content_type or content_type, fill, saved
+        )
+
+    async def _fill(
+        self,
+        name: str,
+        url: str,
+        client: httpx.AsyncClient,
+        fill: CacheFill,
+    ) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            async with client.stream("GET", url) as upstream:
+                if upstream.status_code != 200:
+                    raise RemoteFetchError(
+                        upstream.status_code,
+                        f"Error fetching the file: {upstream.status_code}",
+                    )
+
+                length = upstream.headers.get("Content-Length")
+                fill.size = int(length) if length else None
+                fill.content_type = upstream.headers.get("Content-Type")
+
+                async with aiofiles.open(fill.part_path, "wb") as part_file:
+                    fill.ready.set()
+                    async for chunk in upstream.aiter_bytes(REMOTE_CACHE_CHUNK_SIZE):
+                        await part_file.write(chunk)
+                        await part_file.flush()  # readers tail the file from disk
+                        fill.written += len(chunk)
+                        self.bytes_fetched += len(chunk)
+                        fill.notify()
+
+            if fill.size is not None and fill.written != fill.size:
+                raise RemoteFetchError(None, "Error fetching the file: truncated")
+
+            os.replace(fill.part_path, self._path(name))
+            fill.size = fill.written
+            self._add_entry(name, fill.written)
+            self._evict()
+        except (httpx.HTTPError, RemoteFetchError, OSError) as exc:
+            logger.warning(f"Remote cache fill of {name} failed: {exc}")
+            fill.error = (
+                exc
+                if isinstance(exc, RemoteFetchError)
+                else RemoteFetchError(None, f"Error fetching the file: {exc}")
+            )
+            try:
+                os.remove(fill.part_path)
+            except FileNotFoundError:
+                pass
+        finally:
+            fill.done = True
+            fill.ready.set()
+            fill.notify()
+            self._fills.pop(name, None)
+
+    async def iter_range(
+        self,
+        audio: CachedAudio,
+        start: int = 0,
+        end: int | None = None,
+    ):
+        """
+        Yield the bytes between "start" and "end" (included, None means up to the end).
+        While the file is being downloaded it waits for the bytes to land on disk.
+
+        \f
+
+        :param audio: File opened with "open"
+        :type audio: CachedAudio
+        :param start: First byte
+        :type start: int
+        :param end: Last byte
+        :type end: int | None
+        """
+        fill = audio.fill
+        path = fill.part_path if fill is not None and not fill.done else audio.path
+        try:
+            file = await aiofiles.open(path, "rb")
+        except FileNotFoundError:
+            file = await aiofiles.open(audio.path, "rb")  # the fill just completed
+
+        position = start
+        try:
+            await file.seek(start)
+            while end is None or position <= end:
+                if fill is not None:
+                    await fill.wait_for(position)
+                    available = fill.written - position
+                    if available <= 0:
+                        break  # the download is over, nothing more to read
+                else:
+                    available = REMOTE_CACHE_CHUNK_SIZE
+
+                if end is not None:
+                    available = min(available, end + 1 - position)
+                chunk = await file.read(min(available, REMOTE_CACHE_CHUNK_SIZE))
+                if not chunk:
+                    break
+
+                position += len(chunk)
+                if audio.saved:
+                    self.bytes_saved += len(chunk)
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await file.close()
+
+
+def get_remote_cache(request: Request) -> RemoteAudioCache | None:
+    """
+    Returns the cache created in the lifespan (None if disabled), usefull for dependencies in a route.
+    """
+    return getattr(request.app.state, "remote_cache", None)
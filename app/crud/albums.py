@@ -1,11 +1,22 @@
 from typing import Annotated
 
+import numpy as np
+
 from fastapi import Body, Depends, HTTPException
 from sqlmodel import Session, or_, select
 
+from fastapi.concurrency import run_in_threadpool
+
 from ..commons.common_query_params import CommonQueryParams
+from ..commons.constants import REPLAYGAIN_REFERENCE_LOUDNESS
 from ..models.album_model import Album, AlbumCreate, AlbumPublic, AlbumUpdate
 from ..models.song_model import Song, SongPublic
+from ..utils.loudness import (
+    histogram_loudness,
+    loudness_histogram_path,
+    read_loudness_histogram,
+)
+from .media_assets import read_media_assets
 
 
 async def create_album(
@@ -128,6 +139,65 @@ async def update_album(
     return db_album
 
 
+async def update_album_loudness(
+    session: Session,
+    id: int,
+) -> AlbumPublic | None:
+    """
+    Recompute the loudness and ReplayGain album values of an album.
+
+    Every song keeps the histogram of its blocks loudness, so the album is measured by
+    adding up the histograms of its songs: no audio is decoded again when a song is
+    added, removed or replaced.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: Album's ID
+    :type id: int
+    :return: Album instance, None if it doesn't exist
+    :rtype: AlbumPublic | None
+    """
+    db_album = session.get(Album, id)
+    if not db_album:
+        return None
+
+    songs = session.exec(
+        select(Song).where(Song.album_id == id, Song.loudness.is_not(None))
+    ).all()
+    assets = await read_media_assets(session=session, song_ids=[song.id for song in songs])
+    paths = [
+        loudness_histogram_path(song.id, assets[song.id].content_hash[:16])
+        for song in songs
+        if song.id in assets
+    ]
+
+    def sum_histograms() -> np.ndarray | None:
+        histograms = [read_loudness_histogram(path) for path in paths]
+        histograms = [histogram for histogram in histograms if histogram is not None]
+        return np.sum(histograms, axis=0) if histograms else None
+
+    histogram = await run_in_threadpool(sum_histograms)
+    loudness = histogram_loudness(histogram) if histogram is not None else None
+
+    db_album.loudness = round(loudness, 2) if loudness is not None else None
+    db_album.replaygain_album_gain = (
+        round(REPLAYGAIN_REFERENCE_LOUDNESS - loudness, 2)
+        if loudness is not None
+        else None
+    )
+    db_album.replaygain_album_peak = max(
+        (song.replaygain_track_peak for song in songs if song.replaygain_track_peak),
+        default=None,
+    )
+
+    session.add(db_album)
+    session.commit()
+    session.refresh(db_album)
+    return db_album
+
+
 async def delete_album(
     session: Session,
     id: int,
@@ -0,0 +1,140 @@
+from sqlmodel import Session, select
+
+from ..models.album_model import Album, AlbumPublic
+from ..models.image_variant_model import (
+    ImageVariant,
+    ImageVariantCreate,
+    ImageVariantPublic,
+)
+from ..models.playlist_model import Playlist, PlaylistPublic
+from ..models.song_model import Song, SongPublic
+
+# table of every kind of image owner
+_OWNER_MODELS = {"song": Song, "album": Album, "playlist": Playlist}
+
+PLACEHOLDER_FIELDS = ("image_blurhash", "image_palette")
+
+
+async def read_image_owner(
+    session: Session,
+    owner_kind: str,
+    owner_id: int,
+) -> SongPublic | AlbumPublic | PlaylistPublic | None:
+    """
+    Get the song, album or playlist an image belongs to.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :return: The owner or None
+    :rtype: SongPublic | AlbumPublic | PlaylistPublic | None
+    """
+    return session.get(_OWNER_MODELS[owner_kind], owner_id)
+
+
+async def update_image_placeholders(
+    session: Session,
+    owner_kind: str,
+    owner_id: int,
+    placeholders: dict,
+) -> SongPublic | AlbumPublic | PlaylistPublic | None:
+    """
+    Store the placeholders computed from the image of a song, an album or a playlist.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :param placeholders: Blurhash and palette, missing ones are reset
+    :type placeholders: dict
+    :return: The owner, None if it was deleted in the meantime
+    :rtype: SongPublic | AlbumPublic | PlaylistPublic | None
+    """
+    db_owner = session.get(_OWNER_MODELS[owner_kind], owner_id)
+    if not db_owner:
+        return None
+
+    for field in PLACEHOLDER_FIELDS:
+        setattr(db_owner, field, placeholders.get(field))
+    session.add(db_owner)
+    session.commit()
+    session.refresh(db_owner)
+    return db_owner
+
+
+async def replace_image_variants(
+    session: Session,
+    owner_kind: str,
+    owner_id: int,
+    variants: list[ImageVariantCreate],
+) -> list[ImageVariantPublic]:
+    """
+    Replace every variant of the image of a song, an album or a playlist with the ones of a new image.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :param variants: Variants of the new image
+    :type variants: list[ImageVariantCreate]
+    :return: Stored variants
+    :rtype: list[ImageVariantPublic]
+    """
+    db_variants = session.exec(
+        select(ImageVariant).where(
+            ImageVariant.owner_kind == owner_kind,
+            ImageVariant.owner_id == owner_id,
+        )
+    ).all()
+    for db_variant in db_variants:
+        session.delete(db_variant)
+    session.flush()  # the unique constraint is checked on insert
+
+    db_variants = [ImageVariant.model_validate(variant) for variant in variants]
+    session.add_all(db_variants)
+    session.commit()
+    for db_variant in db_variants:
+        session.refresh(db_variant)
+    return db_variants
+
+
+async def read_image_variants(
+    session: Session,
+    owner_kind: str,
+    owner_id: int,
+) -> list[ImageVariantPublic]:
+    """
+    Get the variants of the image of a song, an album or a playlist, smallest first.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :return: List of variants
+    :rtype: list[ImageVariantPublic]
+    """
+    return session.exec(
+        select(ImageVariant)
+        .where(
+            ImageVariant.owner_kind == owner_kind,
+            ImageVariant.owner_id == owner_id,
+        )
+        .order_by(ImageVariant.width, ImageVariant.format)
+    ).all()
@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from ..commons.common_query_params import CommonQueryParams
+from ..commons.enums import Status
+from ..models.job_model import Job, JobCreate, JobPublic
+
+
+async def create_job(session: Session, job: JobCreate) -> JobPublic:
+    """
+    Queue a new job.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param job: Job to queue
+    :type job: JobCreate
+    :return: The queued job
+    :rtype: JobPublic
+    """
+    db_job = Job.model_validate(job)
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+
+async def claim_jobs(
+    session: Session,
+    worker: str,
+    limit: int = 1,
+    kinds: list[str] | None = None,
+) -> list[JobPublic]:
+    """
+    Claim the open jobs that are due, highest priority and oldest first.
+
+    On Postgres the rows are locked with "FOR UPDATE SKIP LOCKED", so concurrent workers
+    never wait for each other nor claim the same job. SQLite has no row locks,
+    there the update only succeeds if the job is still open.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param worker: Name of the claiming worker
+    :type worker: str
+    :param limit: Maximum number of jobs
+    :type limit: int
+    :param kinds: Only claim these kinds, every kind if None
+    :type kinds: list[str] | None
+    :return: The claimed jobs
+    :rtype: list[JobPublic]
+    """
+    now = datetime.now()
+    query = select(Job.id).where(Job.status == Status.OPEN, Job.run_at <= now)
+    if kinds is not None:
+        query = query.where(Job.kind.in_(kinds))
+    query = (
+        query.order_by(Job.priority, Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+    claimed = []
+    for job_id in session.exec(query).all():
+        result = session.exec(
+            update(Job)
+            .where(Job.id == job_id, Job.status == Status.OPEN)
+            .values(
+                status=Status.WORK_IN_PROGRESS,
+                locked_by=worker,
+                locked_at=now,
+                attempts=Job.attempts + 1,
+            )
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    session.commit()
+
+    if not claimed:
+        return []
+    return session.exec(select(Job).where(Job.id.in_(claimed))).all()
+
+
+async def close_job(session: Session, id: int) -> JobPublic | None:
+    """
+    Mark a job as done.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: ID of the job
+    :type id: int
+    :return: The job or None
+    :rtype: JobPublic | None
+    """
+    db_job = session.get(Job, id)
+    if not db_job:
+        return None
+
+    db_job.status = Status.CLOSED
+    db_job.error = None
+    db_job.locked_by = None
+    db_job.finished_at = datetime.now()
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+
+async def fail_job(
+    session: Session,
+    id: int,
+    error: str,
+    retry_in: timedelta | None,
+) -> JobPublic | None:
+    """
+    Record the failure of a job, it's open again after "retry_in" or rejected for good.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: ID of the job
+    :type id: int
+    :param error: What went wrong
+    :type error: str
+    :param retry_in: Backoff before the next attempt, None to reject the job
+    :type retry_in: timedelta | None
+    :return: The job or None
+    :rtype: JobPublic | None
+    """
+    db_job = session.get(Job, id)
+    if not db_job:
+        return None
+
+    db_job.error = error
+    db_job.locked_by = None
+    if retry_in is None:
+        db_job.status = Status.REJECTED
+        db_job.finished_at = datetime.now()
+    else:
+        db_job.status = Status.OPEN
+        db_job.run_at = datetime.now() + retry_in
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+
+async def requeue_jobs(
+    session: Session,
+    locked_before: datetime | None = None,
+    worker_prefix: str | None = None,
+) -> int:
+    """
+    Open again the jobs left in progress by workers that stopped or died.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param locked_before: Only the jobs claimed before this date
+    :type locked_before: datetime | None
+    :param worker_prefix: Only the jobs claimed by workers whose name starts with it
+    :type worker_prefix: str | None
+    :return: Number of jobs opened again
+    :rtype: int
+    """
+    query = update(Job).where(Job.status == Status.WORK_IN_PROGRESS)
+    if locked_before is not None:
+        query = query.where(Job.locked_at < locked_before)
+    if worker_prefix is not None:
+        query = query.where(Job.locked_by.startswith(worker_prefix))
+    result = session.exec(
+        query.values(status=Status.OPEN, locked_by=None, run_at=datetime.now())
+    )
+    session.commit()
+    return result.rowcount
+
+
+async def retry_job(session: Session, id: int) -> JobPublic | None:
+    """
+    Give a rejected job a new round of attempts.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: ID of the job
+    :type id: int
+    :return: The job or None
+    :rtype: JobPublic | None
+    """
+    db_job = session.get(Job, id)
+    if not db_job:
+        return None
+
+    db_job.status = Status.OPEN
+    db_job.attempts = 0
+    db_job.run_at = datetime.now()
+    db_job.finished_at = None
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+
+async def read_jobs(
+    session: Session,
+    params: CommonQueryParams,
+    status: str | None = None,
+    kind: str | None = None,
+) -> list[JobPublic]:
+    """
+    Get the jobs with pagination, newest first.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param params: Common parameters for pagination
+    :type params: CommonQueryParams
+    :param status: Only the jobs with this status
+    :type status: str | None
+    :param kind: Only the jobs of this kind
+    :type kind: str | None
+    :return: List of jobs
+    :rtype: list[JobPublic]
+    """
+    query = select(Job)
+    if status is not None:
+        query = query.where(Job.status == status)
+    if kind is not None:
+        query = query.where(Job.kind == kind)
+    return session.exec(
+        query.order_by(Job.id.desc()).offset(params.offset).limit(params.limit)
+    ).all()
+
+
+async def read_job(session: Session, id: int) -> JobPublic | None:
+    """
+    Get specific job.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: ID of the job
+    :type id: int
+    :return: Job or None
+    :rtype: JobPublic | None
+    """
+    return session.get(Job, id)
+
+
+async def count_jobs(session: Session) -> dict[str, dict[str, int]]:
+    """
+    Count the jobs of every kind by status.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :return: kind -> status -> count
+    :rtype: dict[str, dict[str, int]]
+    """
+    counts: dict[str, dict[str, int]] = {}
+    rows = session.exec(
+        select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status)
+    ).all()
+    for kind, status, count in rows:
+        counts.setdefault(kind, {})[status] = count
+    return counts
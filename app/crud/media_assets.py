@@ -0,0 +1,302 @@
+import os
+
+from collections import OrderedDict
+from typing import BinaryIO
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from ..commons.constants import AUDIO_DIRECTORY, MEDIA_ASSET_CACHE_SIZE
+from ..utils.file_utils import open_sharded
+from ..models.media_asset_model import (
+    MediaAsset,
+    MediaAssetBase,
+    MediaAssetCreate,
+    MediaAssetPublic,
+)
+
+# (song_id, kind) -> asset, so serving a file doesn't need a query nor a stat
+_media_asset_cache: OrderedDict[tuple[int, str], MediaAssetPublic] = OrderedDict()
+
+
+def _cache_media_asset(asset: MediaAssetPublic) -> None:
+    key = (asset.song_id, asset.kind)
+    _media_asset_cache[key] = asset
+    _media_asset_cache.move_to_end(key)
+    if len(_media_asset_cache) > MEDIA_ASSET_CACHE_SIZE:
+        _media_asset_cache.popitem(last=False)
+
+
+def invalidate_media_asset(song_id: int, kind: str = "original") -> None:
+    _media_asset_cache.pop((song_id, kind), None)
+
+
+async def upsert_media_asset(
+    session: Session,
+    asset: MediaAssetCreate,
+) -> MediaAssetPublic:
+    """
+    Create the media asset of a song, or replace the existing one of the same kind.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param asset: Media asset to store
+    :type asset: MediaAssetCreate
+    :return: Stored media asset
+    :rtype: MediaAssetPublic
+    """
+    db_asset = session.exec(
+        select(MediaAsset).where(
+            MediaAsset.song_id == asset.song_id,
+            MediaAsset.kind == asset.kind,
+        )
+    ).first()
+
+    if db_asset:
+        asset_data = asset.model_dump()  # a new file replaces every value
+        for key, value in asset_data.items():
+            setattr(db_asset, key, value)
+    else:
+        db_asset = MediaAsset.model_validate(asset)
+
+    session.add(db_asset)
+    session.commit()
+    session.refresh(db_asset)
+
+    public_asset = MediaAssetPublic.model_validate(db_asset)
+    _cache_media_asset(public_asset)
+    return public_asset
+
+
+async def read_media_asset(
+    session: Session,
+    song_id: int,
+    kind: str = "original",
+) -> MediaAssetPublic | None:
+    """
+    Get the media asset of a song, from memory if we already met it.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param kind: Which file of the song
+    :type kind: str
+    :return: Media asset or None
+    :rtype: MediaAssetPublic | None
+    """
+    asset = _media_asset_cache.get((song_id, kind))
+    if asset is not None:
+        _media_asset_cache.move_to_end((song_id, kind))
+        return asset
+
+    db_asset = session.exec(
+        select(MediaAsset).where(
+            MediaAsset.song_id == song_id,
+            MediaAsset.kind == kind,
+        )
+    ).first()
+    if not db_asset:
+        return None
+
+    asset = MediaAssetPublic.model_validate(db_asset)
+    _cache_media_asset(asset)
+    return asset
+
+
+async def read_fresh_media_asset(
+    session: Session,
+    song_id: int,
+    kind: str = "original",
+) -> MediaAssetPublic | None:
+    """
+    Get the media asset of a song from the database, never from memory:
+    another worker may have replaced the file since we cached it.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param kind: Which file of the song
+    :type kind: str
+    :return: Media asset or None
+    :rtype: MediaAssetPublic | None
+    """
+    invalidate_media_asset(song_id, kind)
+    return await read_media_asset(session=session, song_id=song_id, kind=kind)
+
+
+async def read_media_assets(
+    session: Session,
+    song_ids: list[int],
+    kind: str = "original",
+) -> dict[int, MediaAssetPublic]:
+    """
+    Get the media assets of many songs at once, with a single query for the ones not in memory.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_ids: Songs' IDs
+    :type song_ids: list[int]
+    :param kind: Which file of the songs
+    :type kind: str
+    :return: Media assets by song ID, songs without one are missing
+    :rtype: dict[int, MediaAssetPublic]
+    """
+    assets = {}
+    missing = []
+    for song_id in song_ids:
+        asset = _media_asset_cache.get((song_id, kind))
+        if asset is not None:
+            assets[song_id] = asset
+        else:
+            missing.append(song_id)
+
+    if missing:
+        db_assets = session.exec(
+            select(MediaAsset).where(
+                MediaAsset.song_id.in_(missing),
+                MediaAsset.kind == kind,
+            )
+        ).all()
+        for db_asset in db_assets:
+            asset = MediaAssetPublic.model_validate(db_asset)
+            _cache_media_asset(asset)
+            assets[asset.song_id] = asset
+
+    return assets
+
+
+async def read_media_assets_since(
+    session: Session,
+    mtime: float,
+    kind: str = "original",
+) -> list[MediaAssetPublic]:
+    """
+    Get the media assets of the files uploaded since a time, from the database.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param mtime: UNIX timestamp
+    :type mtime: float
+    :param kind: Which file of the songs
+    :type kind: str
+    :return: Media assets, oldest first
+    :rtype: list[MediaAssetPublic]
+    """
+    db_assets = session.exec(
+        select(MediaAsset)
+        .where(MediaAsset.kind == kind, MediaAsset.mtime >= mtime)
+        .order_by(MediaAsset.mtime)
+    ).all()
+    return [MediaAssetPublic.model_validate(db_asset) for db_asset in db_assets]
+
+
+async def delete_media_assets(
+    session: Session,
+    song_id: int,
+    keep: list[str],
+) -> None:
+    """
+    Delete the media assets of a song but the kinds to keep, e.g. renditions gone out of date.
+    Only the rows are deleted, the files are up to the caller.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param keep: Kinds of file to keep
+    :type keep: list[str]
+    """
+    db_assets = session.exec(
+        select(MediaAsset).where(
+            MediaAsset.song_id == song_id,
+            MediaAsset.kind.not_in(keep),
+        )
+    ).all()
+    for db_asset in db_assets:
+        invalidate_media_asset(song_id, db_asset.kind)
+        session.delete(db_asset)
+    session.commit()
+
+
+def _legacy_media_asset(song_id: int) -> tuple[MediaAssetBase, BinaryIO]:
+    """
+    Songs uploaded before media assets existed are stored as "<song_id>.mp3".
+    """
+    try:
+        file = open_sharded(AUDIO_DIRECTORY, song_id, f"{song_id}.mp3")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    stat = os.fstat(file.fileno())
+    asset = MediaAssetBase(
+        song_id=song_id,
+        path=file.name,
+        extension=".mp3",
+        mime_type="audio/mpeg",
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        content_hash="",
+    )
+    return asset, file
+
+
+async def open_media_asset(
+    session: Session,
+    song_id: int,
+    kind: str = "original",
+) -> tuple[MediaAssetBase, BinaryIO]:
+    """
+    Resolve and open the file of a song.
+
+    Everything about the file comes from the (cached) asset row, the only syscall is the open.
+    Uploads never overwrite a file in place, so a cached row can only be stale if its
+    file is gone: in that case we look for it in both the flat and the sharded layout,
+    then read the row again from the database.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param kind: Which file of the song
+    :type kind: str
+    :return: The media asset and its file opened in binary mode
+    :rtype: tuple[MediaAssetBase, BinaryIO]
+    """
+    for _ in range(2):
+        asset = await read_media_asset(session=session, song_id=song_id, kind=kind)
+        if asset is None:
+            break
+
+        try:
+            return asset, open(asset.path, "rb")
+        except FileNotFoundError:
+            pass
+
+        try:
+            # moved by the sharding migration, the row is updated right after
+            return asset, open_sharded(
+                AUDIO_DIRECTORY, song_id, os.path.basename(asset.path)
+            )
+        except FileNotFoundError:
+            invalidate_media_asset(song_id, kind)  # replaced by another worker
+
+    if kind != "original":
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    return _legacy_media_asset(song_id)
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from sqlalchemy import union_all
+from sqlmodel import Session, select
+
+from ..commons.common_query_params import CommonQueryParams
+from ..core.play_history import history_tables
+from ..models.play_event_model import PlayEvent, PlayEventPublic
+
+
+async def read_play_history(
+    session: Session,
+    user_id: int,
+    since: datetime,
+    until: datetime,
+    params: CommonQueryParams,
+) -> list[PlayEventPublic]:
+    """
+    Get the plays of a user between two dates, newest first, with pagination.
+
+    The bounds are what keeps the query on the partitions of these days: Postgres prunes
+    the other ones from the plan, on SQLite only the tables of these months are read.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param user_id: User's ID
+    :type user_id: int
+    :param since: Oldest play, included
+    :type since: datetime
+    :param until: Newest play, excluded
+    :type until: datetime
+    :param params: Common parameters for pagination
+    :type params: CommonQueryParams
+    :return: List of plays
+    :rtype: list[PlayEventPublic]
+    """
+    engine = session.get_bind()
+    if engine.dialect.name == "postgresql":
+        return session.exec(
+            select(PlayEvent)
+            .where(
+                PlayEvent.user_id == user_id,
+                PlayEvent.played_at >= since,
+                PlayEvent.played_at < until,
+            )
+            .order_by(PlayEvent.played_at.desc())
+            .offset(params.offset)
+            .limit(params.limit)
+        ).all()
+
+    tables = history_tables(engine, since, until)
+    if not tables:
+        return []
+
+    plays = union_all(
+        *(
+            select(table).where(
+                table.c.user_id == user_id,
+                table.c.played_at >= since,
+                table.c.played_at < until,
+            )
+            for table in tables
+        )
+    ).subquery()
+    rows = session.exec(
+        select(*plays.c)
+        .order_by(plays.c.played_at.desc())
+        .offset(params.offset)
+        .limit(params.limit)
+    ).all()
+    return [PlayEventPublic.model_validate(row._mapping) for row in rows]
@@ -169,7 +169,12 @@ async def read_playlist_songs(
         raise HTTPException(status_code=404, detail="Playlist not found")
 
     # Query songs associated with the playlist
-    statement = select(Song).join(SongPlaylistLink)
+    statement = (
+        select(Song)
+        .join(SongPlaylistLink)
+        .where(SongPlaylistLink.playlist_id == id)
+        .order_by(SongPlaylistLink.created_at, Song.id)
+    )
     return session.exec(statement).all()
 
 
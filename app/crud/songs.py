@@ -5,6 +5,15 @@ from sqlmodel import Session, or_, select
 
 from ..commons.common_query_params import CommonQueryParams
 from ..models.song_model import Song, SongCreate, SongPublic, SongUpdate
+from .albums import update_album_loudness
+
+# what the loudness analysis stores on a song
+LOUDNESS_FIELDS = (
+    "loudness",
+    "true_peak",
+    "replaygain_track_gain",
+    "replaygain_track_peak",
+)
 
 
 async def create_song(
@@ -27,6 +36,9 @@ async def create_song(
     session.add(db_song)
     session.commit()
     session.refresh(db_song)
+
+    if db_song.album_id is not None:
+        await update_album_loudness(session=session, id=db_song.album_id)
     return db_song
 
 
@@ -94,6 +106,8 @@ async def update_song(
     if not db_song:  # check if the song exists
         raise HTTPException(status_code=404, detail="Song not found")
 
+    old_album_id = db_song.album_id
+
     song_data = song.model_dump(exclude_unset=True)  # get only updated values
     for key, value in song_data.items():  # iterate through song's data
         # map key and value from user's data to its db instance
@@ -102,6 +116,77 @@ async def update_song(
     session.add(db_song)  # add the updated version to the DB
     session.commit()  # commit the cheanges to the DB
     session.refresh(db_song)  # refresh the db_song instance
+
+    if db_song.album_id != old_album_id:
+        # the song moved, both albums have a new loudness
+        for album_id in (old_album_id, db_song.album_id):
+            if album_id is not None:
+                await update_album_loudness(session=session, id=album_id)
+    return db_song
+
+
+async def update_song_loudness(
+    session: Session,
+    id: int,
+    measures: dict,
+) -> SongPublic | None:
+    """
+    Store the loudness analysis of a song.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: Song's ID
+    :type id: int
+    :param measures: The analysis results, missing ones are reset
+    :type measures: dict
+    :return: Song instance, None if it was deleted in the meantime
+    :rtype: SongPublic | None
+    """
+    db_song = session.get(Song, id)  # get the existing song instance
+    if not db_song:
+        return None
+
+    for key in LOUDNESS_FIELDS:
+        setattr(db_song, key, measures.get(key))
+
+    session.add(db_song)
+    session.commit()
+    session.refresh(db_song)
+    return db_song
+
+
+async def update_song_duplicate(
+    session: Session,
+    id: int,
+    duplicate_of_id: int | None,
+) -> SongPublic | None:
+    """
+    Flag a song as a probable duplicate of another one, or clear the flag.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param id: Song's ID
+    :type id: int
+    :param duplicate_of_id: ID of the song with the same recording, None if there's none
+    :type duplicate_of_id: int | None
+    :return: Song instance, None if it was deleted in the meantime
+    :rtype: SongPublic | None
+    """
+    db_song = session.get(Song, id)
+    if not db_song:
+        return None
+
+    if duplicate_of_id is not None and not session.get(Song, duplicate_of_id):
+        duplicate_of_id = None  # the match was deleted since the index was built
+
+    db_song.duplicate_of_id = duplicate_of_id
+    session.add(db_song)
+    session.commit()
+    session.refresh(db_song)
     return db_song
 
 
@@ -125,5 +210,16 @@ async def delete_song(
     if not db_song:  # check if the song exists
         raise HTTPException(status_code=404, detail="Song not found")
 
+    album_id = db_song.album_id
+
+    # the songs flagged as its duplicates aren't anymore
+    duplicates = session.exec(select(Song).where(Song.duplicate_of_id == id)).all()
+    for duplicate in duplicates:
+        duplicate.duplicate_of_id = None
+        session.add(duplicate)
+
     session.delete(db_song)  # delete the instance of the song
     session.commit()  # commit the changes to the DB
+
+    if album_id is not None:
+        await update_album_loudness(session=session, id=album_id)
@@ -22,6 +22,7 @@ from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from .core.admission import AdmissionControlMiddleware
 from .core.lifespan import lifespan
 from .routers import (
     auth,
@@ -32,6 +33,10 @@ from .routers import (
     uploads,
     streams,
     downloads,
+    images,
+    jobs,
+    charts,
+    recommendations,
 )
 
 # load environment variables from the .env file (if present)
@@ -46,6 +51,9 @@ app = FastAPI(
     default_response_class=ORJSONResponse,  # it's faster than JSONResponse
 )
 
+# shed low priority requests with a 503 when the latency says we are overloaded
+app.add_middleware(AdmissionControlMiddleware)
+
 # create the public directory if it doesn't exists
 os.makedirs("public", exist_ok=True)
 
@@ -67,6 +75,10 @@ app.include_router(playlists.router)
 app.include_router(uploads.router)
 app.include_router(downloads.router)
 app.include_router(streams.router)
+app.include_router(images.router)
+app.include_router(jobs.router)
+app.include_router(charts.router)
+app.include_router(recommendations.router)
 
 
 @app.get("/", status_code=200)
@@ -74,6 +86,13 @@ async def main():
     return {"message": "up and running!"}
 
 
+@app.get("/admission/stats", status_code=200)
+async def admission_stats(request: Request):
+    # concurrency limit and shed requests of the worker answering
+    limiter = request.app.state.admission
+    return limiter.stats() if limiter else {"limit": None}
+
+
 @app.get("/home", status_code=200)
 async def main(request: Request):
     return templates.TemplateResponse(
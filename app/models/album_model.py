@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, SQLModel
 
 
@@ -51,12 +52,31 @@ class Album(AlbumBase, table=True):
     :type released_at: datetime | None
     :param created_at: Creation date of the album
     :type created_at: datetime | None
+    :param loudness: Integrated loudness (EBU R128) of all the songs together, in LUFS
+    :type loudness: float | None
+    :param replaygain_album_gain: ReplayGain 2.0 album gain, in dB
+    :type replaygain_album_gain: float | None
+    :param replaygain_album_peak: ReplayGain 2.0 album peak, linear (1.0 is full scale)
+    :type replaygain_album_peak: float | None
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int | None = Field(default=None, primary_key=True, index=True)
     released_at: datetime | None = Field(default=datetime.now(), index=True)
     created_at: datetime | None = Field(default=datetime.now(), index=True)
 
+    # updated every time a song is measured, added or removed
+    loudness: float | None = Field(default=None)
+    replaygain_album_gain: float | None = Field(default=None)
+    replaygain_album_peak: float | None = Field(default=None)
+
+    # computed from the image at upload, None until then
+    image_blurhash: str | None = Field(default=None)
+    image_palette: list[str] | None = Field(default=None, sa_column=Column(JSON))
+
 
 class AlbumCreate(AlbumBase):
     """
@@ -78,9 +98,24 @@ class AlbumPublic(AlbumBase):
 
     :param id: ID of the album
     :type id: int
+    :param loudness: Integrated loudness (EBU R128) of all the songs together, in LUFS
+    :type loudness: float | None
+    :param replaygain_album_gain: ReplayGain 2.0 album gain, in dB
+    :type replaygain_album_gain: float | None
+    :param replaygain_album_peak: ReplayGain 2.0 album peak, linear (1.0 is full scale)
+    :type replaygain_album_peak: float | None
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int
+    loudness: float | None = None
+    replaygain_album_gain: float | None = None
+    replaygain_album_peak: float | None = None
+    image_blurhash: str | None = None
+    image_palette: list[str] | None = None
 
 
 class AlbumUpdate(AlbumBase):
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+
+class ImageVariantBase(SQLModel):
+    """
+    Base model for ImageVariant. This model is used to define the common fields.
+    An image variant is a resized and re-encoded copy of the image of a song, an album or a playlist.
+
+    \f
+
+    :param owner_kind: What the image belongs to, "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :param width: Width in pixels
+    :type width: int
+    :param height: Height in pixels
+    :type height: int
+    :param format: Image format, "avif", "webp" or "jpeg"
+    :type format: str
+    :param mime_type: MIME type of the file
+    :type mime_type: str
+    :param path: Path of the file on disk
+    :type path: str
+    :param url: Public URL of the file
+    :type url: str
+    :param size: Size in bytes
+    :type size: int
+    :param version: First 16 hex digits of the SHA-256 of the original image
+    :type version: str
+    """
+
+    owner_kind: str = Field(index=True)
+    owner_id: int = Field(index=True)
+    width: int
+    height: int
+    format: str
+    mime_type: str
+    path: str
+    url: str
+    size: int
+    version: str
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "owner_kind": "album",
+                    "owner_id": 1,
+                    "width": 300,
+                    "height": 300,
+                    "format": "webp",
+                    "mime_type": "image/webp",
+                    "path": "public/image/variants/c4/ca/album-1-0123456789abcdef-300.webp",
+                    "url": "http://localhost:8000/public/image/variants/c4/ca/album-1-0123456789abcdef-300.webp",
+                    "size": 14230,
+                    "version": "0123456789abcdef",
+                }
+            ]
+        },
+    }
+
+
+class ImageVariant(ImageVariantBase, table=True):
+    """
+    Model for ImageVariant. This model is used to define the table structure.
+    Inherits from ImageVariantBase.
+
+    \f
+
+    :param id: ID of the image variant
+    :type id: int | None
+    :param created_at: Creation date of the image variant
+    :type created_at: datetime | None
+    """
+
+    __table_args__ = (UniqueConstraint("owner_kind", "owner_id", "width", "format"),)
+
+    id: int | None = Field(default=None, primary_key=True, index=True)
+    created_at: datetime | None = Field(default_factory=datetime.now, index=True)
+
+
+class ImageVariantCreate(ImageVariantBase):
+    """
+    Model for creating a new image variant. This model is used to define the fields required for creating a new image variant.
+    Inherits from ImageVariantBase.
+
+    \f
+    """
+
+    pass
+
+
+class ImageVariantPublic(ImageVariantBase):
+    """
+    Model for reading an image variant. This model is used to define the fields returned when reading an image variant.
+    Inherits from ImageVariantBase.
+
+    \f
+
+    :param id: ID of the image variant
+    :type id: int
+    """
+
+    id: int
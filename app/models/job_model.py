@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, Index
+from sqlmodel import Field, SQLModel
+
+from ..commons.constants import JOB_MAX_ATTEMPTS
+from ..commons.enums import Priority, Status
+
+
+class JobBase(SQLModel):
+    """
+    Base model for Job. This model is used to define the common fields.
+    A job is work done after a request, e.g. the analysis of an uploaded song.
+
+    \f
+
+    :param kind: Which handler runs the job, see JobKind
+    :type kind: str
+    :param payload: Arguments of the handler
+    :type payload: dict
+    :param priority: Higher priority jobs are claimed first, see Priority
+    :type priority: int
+    :param max_attempts: The job is rejected after failing this many times
+    :type max_attempts: int
+    """
+
+    kind: str = Field(index=True)
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    priority: int = Field(default=Priority.MEDIUM)
+    max_attempts: int = Field(default=JOB_MAX_ATTEMPTS)
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "kind": "waveform",
+                    "payload": {
+                        "song_id": 1,
+                        "audio_path": "public/audio/00/01/1-0123456789abcdef.mp3",
+                        "version": "0123456789abcdef",
+                    },
+                    "priority": 1,
+                    "max_attempts": 5,
+                }
+            ]
+        },
+    }
+
+
+class Job(JobBase, table=True):
+    """
+    Model for Job. This model is used to define the table structure.
+    Inherits from JobBase.
+
+    \f
+
+    :param id: ID of the job
+    :type id: int | None
+    :param status: "open" while waiting, "work_in_progress" while running,
+        "closed" once done, "rejected" once out of attempts
+    :type status: str
+    :param attempts: How many times the job was run
+    :type attempts: int
+    :param run_at: The job isn't run before, retries are pushed back by the backoff
+    :type run_at: datetime
+    :param locked_by: Worker running the job
+    :type locked_by: str | None
+    :param locked_at: When the worker claimed the job
+    :type locked_at: datetime | None
+    :param error: Last error
+    :type error: str | None
+    :param created_at: Creation date of the job
+    :type created_at: datetime
+    :param finished_at: When the job was closed or rejected
+    :type finished_at: datetime | None
+    """
+
+    # what the workers poll: the open jobs that are due, by priority
+    __table_args__ = (Index("ix_job_claim", "status", "priority", "run_at"),)
+
+    id: int | None = Field(default=None, primary_key=True, index=True)
+    status: str = Field(default=Status.OPEN)
+    attempts: int = Field(default=0)
+    run_at: datetime = Field(default_factory=datetime.now)
+    locked_by: str | None = Field(default=None)
+    locked_at: datetime | None = Field(default=None)
+    error: str | None = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.now)
+    finished_at: datetime | None = Field(default=None)
+
+
+class JobCreate(JobBase):
+    """
+    Model for creating a new job. This model is used to define the fields required for creating a new job.
+    Inherits from JobBase.
+
+    \f
+    """
+
+    pass
+
+
+class JobPublic(JobBase):
+    """
+    Model for reading a job. This model is used to define the fields returned when reading a job.
+    Inherits from JobBase.
+
+    \f
+
+    :param id: ID of the job
+    :type id: int
+    """
+
+    id: int
+    status: str
+    attempts: int
+    run_at: datetime
+    locked_by: str | None
+    locked_at: datetime | None
+    error: str | None
+    created_at: datetime
+    finished_at: datetime | None
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+# Needed for the foreing key?
+from .song_model import Song
+
+
+class MediaAssetBase(SQLModel):
+    """
+    Base model for MediaAsset. This model is used to define the common fields.
+    A media asset is a file stored on disk for a song, with everything needed to serve it.
+
+    \f
+
+    :param song_id: ID of the song the file belongs to
+    :type song_id: int
+    :param kind: Which file of the song this is, "original" for the uploaded one
+    :type kind: str
+    :param path: Path of the file on disk
+    :type path: str
+    :param extension: File extension, with the "."
+    :type extension: str
+    :param mime_type: MIME type of the file
+    :type mime_type: str
+    :param size: Size in bytes
+    :type size: int
+    :param mtime: Last modification time, as a UNIX timestamp
+    :type mtime: float
+    :param content_hash: SHA-256 of the content, hex encoded
+    :type content_hash: str
+    :param crc32: CRC-32 of the content, what ZIP archives need, None if not computed yet
+    :type crc32: int | None
+    :param duration: Duration in seconds, None if unknown
+    :type duration: float | None
+    :param bitrate: Average bitrate in bits per second, None if unknown
+    :type bitrate: int | None
+    """
+
+    song_id: int = Field(foreign_key="song.id", index=True)
+    kind: str = Field(default="original", index=True)
+    path: str
+    extension: str
+    mime_type: str
+    size: int
+    mtime: float
+    content_hash: str
+    crc32: int | None = Field(default=None)
+    duration: float | None = Field(default=None)
+    bitrate: int | None = Field(default=None)
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "song_id": 1,
+                    "kind": "original",
+                    "path": "public/audio/1-0123456789abcdef.mp3",
+                    "extension": ".mp3",
+                    "mime_type": "audio/mpeg",
+                    "size": 4194304,
+                    "mtime": 1746000000.0,
+                    "content_hash": "0123456789abcdef...",
+                    "crc32": 2309737967,
+                    "duration": 215.3,
+                    "bitrate": 160000,
+                }
+            ]
+        },
+    }
+
+
+class MediaAsset(MediaAssetBase, table=True):
+    """
+    Model for MediaAsset. This model is used to define the table structure.
+    Inherits from MediaAssetBase.
+
+    \f
+
+    :param id: ID of the media asset
+    :type id: int | None
+    :param created_at: Creation date of the media asset
+    :type created_at: datetime | None
+    """
+
+    __table_args__ = (UniqueConstraint("song_id", "kind"),)
+
+    id: int | None = Field(default=None, primary_key=True, index=True)
+    created_at: datetime | None = Field(default_factory=datetime.now, index=True)
+
+
+class MediaAssetCreate(MediaAssetBase):
+    """
+    Model for creating a new media asset. This model is used to define the fields required for creating a new media asset.
+    Inherits from MediaAssetBase.
+
+    \f
+    """
+
+    pass
+
+
+class MediaAssetPublic(MediaAssetBase):
+    """
+    Model for reading a media asset. This model is used to define the fields returned when reading a media asset.
+    Inherits from MediaAssetBase.
+
+    \f
+
+    :param id: ID of the media asset
+    :type id: int
+    """
+
+    id: int
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, Identity, Index
+from sqlmodel import Field, SQLModel
+
+
+class PlayEventBase(SQLModel):
+    """
+    Base model for PlayEvent. This model is used to define the common fields.
+    A play event is recorded every time a user starts streaming a song.
+
+    \f
+
+    :param song_id: ID of the played song
+    :type song_id: int
+    :param user_id: ID of the user who played it
+    :type user_id: int
+    :param played_at: When the stream started
+    :type played_at: datetime
+    :param source: How the song is streamed, "stream" or "hls"
+    :type source: str
+    :param quality: Which file of the song is streamed, "original" or a rendition like "160k"
+    :type quality: str
+    """
+
+    # no foreign keys: events are written in bulk, and outlive the songs and the users
+    song_id: int
+    user_id: int
+    played_at: datetime = Field(default_factory=datetime.now)
+    source: str = Field(default="stream")
+    quality: str = Field(default="original")
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "song_id": 1,
+                    "user_id": 1,
+                    "played_at": "2025-05-01T12:00:00",
+                    "source": "stream",
+                    "quality": "original",
+                }
+            ]
+        },
+    }
+
+
+class PlayEvent(PlayEventBase, table=True):
+    """
+    Model for PlayEvent. This model is used to define the table structure.
+    Inherits from PlayEventBase.
+
+    \f
+
+    :param id: ID of the play event, unique together with "played_at"
+    :type id: int | None
+    """
+
+    # what the history of a user and the counts of a song are read from
+    __table_args__ = (
+        Index("ix_playevent_user_played_at", "user_id", "played_at"),
+        Index("ix_playevent_song_played_at", "song_id", "played_at"),
+        # one partition per day on Postgres, created ahead and dropped by core/play_history.py
+        {"postgresql_partition_by": "RANGE (played_at)"},
+    )
+
+    # the partition key has to be part of the primary key,
+    # and the identity of a partitioned table needs Postgres 17
+    id: int | None = Field(
+        default=None,
+        sa_column=Column(BigInteger, Identity(), primary_key=True),
+    )
+    played_at: datetime = Field(default_factory=datetime.now, primary_key=True)
+
+
+class PlayEventCreate(PlayEventBase):
+    """
+    Model for creating a new play event. This model is used to define the fields required for creating a new play event.
+    Inherits from PlayEventBase.
+
+    \f
+    """
+
+    pass
+
+
+class PlayEventPublic(PlayEventBase):
+    """
+    Model for reading a play event. This model is used to define the fields returned when reading a play event.
+    Inherits from PlayEventBase.
+
+    \f
+
+    :param id: ID of the play event
+    :type id: int
+    """
+
+    id: int
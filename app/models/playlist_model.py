@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, SQLModel
 
 
@@ -53,11 +54,19 @@ class Playlist(PlaylistBase, table=True):
     :type id: int | None
     :param created_at: Creation date of the playlist
     :type created_at: datetime | None
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int | None = Field(default=None, primary_key=True, index=True)
     created_at: datetime | None = Field(default=datetime.now(), index=True)
 
+    # computed from the image at upload, None until then
+    image_blurhash: str | None = Field(default=None)
+    image_palette: list[str] | None = Field(default=None, sa_column=Column(JSON))
+
 
 class PlaylistCreate(PlaylistBase):
     """
@@ -79,9 +88,15 @@ class PlaylistPublic(PlaylistBase):
 
     :param id: ID of the playlist
     :type id: int
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int
+    image_blurhash: str | None = None
+    image_palette: list[str] | None = None
 
 
 class PlaylistUpdate(PlaylistBase):
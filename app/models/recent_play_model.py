@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class RecentPlayBase(SQLModel):
+    """
+    Base model for RecentPlay. This model is used to define the common fields.
+    A recent play is one of the last songs a user played, and where they stopped.
+
+    \f
+
+    :param song_id: ID of the song
+    :type song_id: int
+    :param position: Where the user stopped, in seconds
+    :type position: float
+    :param played_at: When the user last played it
+    :type played_at: datetime
+    """
+
+    song_id: int = Field(primary_key=True)
+    position: float = Field(default=0.0, ge=0)
+    played_at: datetime = Field(default_factory=datetime.now)
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "song_id": 1,
+                    "position": 42.5,
+                    "played_at": "2025-05-01T12:00:00",
+                }
+            ]
+        },
+    }
+
+
+class RecentPlay(RecentPlayBase, table=True):
+    """
+    Model for RecentPlay. This model is used to define the table structure.
+    Inherits from RecentPlayBase.
+    Written behind the in-memory store of core/recent_plays.py, it holds the last songs
+    of every user, to load them back and to share them among the workers.
+
+    \f
+
+    :param user_id: ID of the user
+    :type user_id: int
+    :param updated_at: When the row was last written, what the workers sync from
+    :type updated_at: datetime
+    """
+
+    __table_args__ = (
+        Index("ix_recentplay_user_played_at", "user_id", "played_at"),
+        Index("ix_recentplay_updated_at", "updated_at"),
+    )
+
+    # no foreign keys, like the play events: written in bulk, in the background
+    user_id: int = Field(primary_key=True)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class RecentPlayUpdate(SQLModel):
+    """
+    Model for updating a recent play. This model is used to define the fields that can be updated.
+
+    \f
+
+    :param position: Where the user stopped, in seconds
+    :type position: float
+    """
+
+    position: float = Field(ge=0)
+
+    model_config = {
+        "extra": "forbid",
+        "json_schema_extra": {"examples": [{"position": 42.5}]},
+    }
+
+
+class RecentPlayPublic(RecentPlayBase):
+    """
+    Model for reading a recent play. This model is used to define the fields returned when reading a recent play.
+    Inherits from RecentPlayBase.
+
+    \f
+    """
+
+    pass
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from pydantic import BaseModel
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, SQLModel
 
 # Needed for the foreing key?
@@ -61,11 +62,38 @@ class Song(SongBase, table=True):
     :type id: int | None
     :param created_at: Creation date of the song
     :type created_at: datetime | None
+    :param loudness: Integrated loudness (EBU R128), in LUFS
+    :type loudness: float | None
+    :param true_peak: True peak, in dBTP
+    :type true_peak: float | None
+    :param replaygain_track_gain: ReplayGain 2.0 track gain, in dB
+    :type replaygain_track_gain: float | None
+    :param replaygain_track_peak: ReplayGain 2.0 track peak, linear (1.0 is full scale)
+    :type replaygain_track_peak: float | None
+    :param duplicate_of_id: Song with the same recording, found by acoustic fingerprinting
+    :type duplicate_of_id: int | None
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int | None = Field(default=None, primary_key=True, index=True)
     created_at: datetime | None = Field(default=datetime.now(), index=True)
 
+    # measured at upload, None until the analysis is done
+    loudness: float | None = Field(default=None)
+    true_peak: float | None = Field(default=None)
+    replaygain_track_gain: float | None = Field(default=None)
+    replaygain_track_peak: float | None = Field(default=None)
+
+    # probable duplicate, flagged at upload
+    duplicate_of_id: int | None = Field(default=None, foreign_key="song.id", index=True)
+
+    # computed from the image at upload, None until then
+    image_blurhash: str | None = Field(default=None)
+    image_palette: list[str] | None = Field(default=None, sa_column=Column(JSON))
+
 
 class SongCreate(SongBase):
     """
@@ -87,9 +115,30 @@ class SongPublic(SongBase):
 
     :param id: ID of the song
     :type id: int
+    :param loudness: Integrated loudness (EBU R128), in LUFS
+    :type loudness: float | None
+    :param true_peak: True peak, in dBTP
+    :type true_peak: float | None
+    :param replaygain_track_gain: ReplayGain 2.0 track gain, in dB
+    :type replaygain_track_gain: float | None
+    :param replaygain_track_peak: ReplayGain 2.0 track peak, linear (1.0 is full scale)
+    :type replaygain_track_peak: float | None
+    :param duplicate_of_id: Song with the same recording, found by acoustic fingerprinting
+    :type duplicate_of_id: int | None
+    :param image_blurhash: Blurhash of the image, a placeholder to show while it loads
+    :type image_blurhash: str | None
+    :param image_palette: Dominant colors of the image, as "#rrggbb", most present first
+    :type image_palette: list[str] | None
     """
 
     id: int
+    loudness: float | None = None
+    true_peak: float | None = None
+    replaygain_track_gain: float | None = None
+    replaygain_track_peak: float | None = None
+    duplicate_of_id: int | None = None
+    image_blurhash: str | None = None
+    image_palette: list[str] | None = None
 
 
 class SongUpdate(SongBase):
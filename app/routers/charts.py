@@ -0,0 +1,89 @@
+from typing import Annotated, Any
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Path,
+    Query,
+    Security,
+)
+
+from ..commons.constants import CHART_TOP
+from ..commons.enums import ChartWindow, Scope
+from ..core.auth_utils import get_current_active_user
+from ..core.charts import ALL_GENRES, ChartEngine, get_chart_engine
+
+# dependency injection to get the chart engine
+ChartsDep = Annotated[ChartEngine, Depends(get_chart_engine)]
+
+# create router for charts
+router = APIRouter(
+    prefix="/charts",  # router prefix url
+    tags=["charts"],  # router tag
+)
+
+
+@router.get(
+    "/stats",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_charts_stats(
+    charts: ChartsDep,  # the chart engine
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the plays counted by the worker answering, its counters and the last merge.
+
+    \f
+
+    :param charts: The chart engine
+    :type charts: ChartEngine
+    :return: The statistics
+    :rtype: dict
+    """
+    return charts.stats()
+
+
+@router.get(
+    "/{window}",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_chart(
+    charts: ChartsDep,  # the chart engine
+    window: Annotated[ChartWindow, Path()],  # hour, day or week
+    genre_id: Annotated[int, Query(ge=0)] = ALL_GENRES,  # 0 for every genre
+    limit: Annotated[int, Query(ge=1, le=CHART_TOP)] = CHART_TOP,
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the most played songs of the last hour, day or week, of a genre or of all of them.
+    The charts are merged from the counters of every worker once a minute, nothing is queried.
+
+    \f
+
+    :param charts: The chart engine
+    :type charts: ChartEngine
+    :param window: Time window of the chart
+    :type window: ChartWindow
+    :param genre_id: Genre's ID, 0 for every genre
+    :type genre_id: int
+    :param limit: Number of songs
+    :type limit: int
+    :return: The chart, most played first
+    :rtype: dict
+    """
+    return {
+        "window": window,
+        "genre_id": genre_id,
+        "updated_at": charts.merged_at,
+        "songs": [
+            {"song_id": song_id, "plays": plays}
+            for song_id, plays in charts.chart(window.value, genre_id, limit)
+        ],
+    }
@@ -1,25 +1,42 @@
 import os
+import re
 
-from typing import Annotated, Any
+from email.utils import formatdate
+from typing import Annotated, Any, BinaryIO
 
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
     Path,
+    Request,
     Security,
 )
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from ..commons.constants import AUDIO_DIRECTORY
+from ..commons.constants import ARCHIVE_CHUNK_SIZE, AUDIO_CHUNK_SIZE, AUDIO_DIRECTORY
 from ..commons.enums import Scope
 from ..core.auth_utils import get_current_active_user
+from ..core.bandwidth import BandwidthScheduler, client_key, get_bandwidth_scheduler
 from ..core.database import get_session
+from ..crud.albums import read_album, read_album_songs
+from ..crud.media_assets import open_media_asset, read_media_assets, upsert_media_asset
+from ..crud.playlists import read_playlist_songs
+from ..models.media_asset_model import MediaAssetCreate
+from ..models.song_model import SongPublic
+from ..models.user_model import UserPublic
+from ..utils.file_utils import file_crc32, open_sharded
+from ..utils.stream_utils import iter_file_range, parse_range_header, range_headers
+from ..utils.zip_stream import ZipMember, ZipStream
 
 # dependency injection to get the current user session
 SessionDep = Annotated[Session, Depends(get_session)]
 
+# dependency injection to get the bandwidth scheduler of the responses
+BandwidthDep = Annotated[BandwidthScheduler, Depends(get_bandwidth_scheduler)]
+
 # create router for downloads
 router = APIRouter(
     prefix="/downloads",  # router prefix url
@@ -29,18 +46,20 @@ router = APIRouter(
 
 @router.get(
     "/audio/{song_id}",  # endpoint url after the prefix specified earlier
-    dependencies=[
-        Security(get_current_active_user, scopes=[Scope.ITEMS_CREATE])
-    ],  # security check, user needs to have permissions to interact with this endpoint
     response_model=None,  # the model used to format the response
     status_code=201,  # HTTP status code returned if no errors occur
 )
 async def download_audio(
     session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
     song_id: Annotated[int, Path()],  # the song ID
+    request: Request,  # the request, for its Range header
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_CREATE])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    bandwidth: BandwidthDep,  # shapes the response rate
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
-    Upload a new song file.
+    Download a song file, with the extension and MIME type it was uploaded with.
 
     \f
 
@@ -48,31 +67,278 @@ async def download_audio(
     :type session: Session
     :param song_id: Song's ID
     :type song_id: int
-    :param file: Song file
-    :type file: UploadFile
-    :return: The new created Song
-    :rtype: SongPublic
+    :param request: The request
+    :type request: Request
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The song file
+    :rtype: StreamingResponse
     """
-    # TODO: get file extension from db
+    asset, audio_file = await open_media_asset(session=session, song_id=song_id)
 
-    file_path = os.path.join(AUDIO_DIRECTORY, f"{song_id}.mp3")
-    if not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    headers = {
+        "Content-Disposition": f'attachment; filename="song_{song_id}{asset.extension}"',
+        "Last-Modified": formatdate(asset.mtime, usegmt=True),
+    }
+
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), asset.size)
+    except HTTPException:
+        audio_file.close()
+        raise
 
-    # for small files this load the whole file in memory
-    return FileResponse(
-        path=file_path,
-        filename=f"song_{song_id}",
-        media_type="application/octet-stream",
+    if byte_range:
+        # resumed downloads
+        range_start, range_end = byte_range
+        headers.update(
+            range_headers(range_start, range_end, asset.size, asset.mime_type)
+        )
+        return StreamingResponse(
+            bandwidth.shape(
+                iter_file_range(audio_file, range_start, range_end, AUDIO_CHUNK_SIZE),
+                client_key(request, current_user.id),
+            ),
+            status_code=206,
+            headers=headers,
+        )
+
+    # the file is streamed in chunks, it's never loaded in memory as a whole
+    headers.update(
+        {
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(asset.size),
+            "Content-Type": asset.mime_type,
+        }
+    )
+    return StreamingResponse(
+        bandwidth.shape(
+            iter_file_range(audio_file, 0, asset.size - 1, AUDIO_CHUNK_SIZE),
+            client_key(request, current_user.id),
+        ),
+        headers=headers,
     )
 
-    # for large files its better to stream the file in chunks
-    # def iterfile():
-    #     with open(file_path, mode="rb") as file_like:
-    #         yield from file_like
-    #
-    # headers = {
-    #     "Content-Disposition": f'attachment; filename="mamma_{song_id}"'
-    # }
-    #
-    # return StreamingResponse(iterfile(), headers=headers, media_type="application/octet-stream")
+
+@router.get(
+    "/album/{album_id}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def download_album(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    album_id: Annotated[int, Path()],  # the album ID
+    request: Request,  # the request, for its Range header
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    bandwidth: BandwidthDep,  # shapes the response rate
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Download every song of an album as a single ZIP archive.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param album_id: Album's ID
+    :type album_id: int
+    :param request: The request
+    :type request: Request
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The ZIP archive
+    :rtype: StreamingResponse
+    """
+    db_album = await read_album(session=session, id=album_id)
+    if not db_album:
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    songs = await read_album_songs(session=session, id=album_id)
+    return await _zip_response(
+        session,
+        songs,
+        db_album.title,
+        request,
+        bandwidth,
+        client_key(request, current_user.id),
+    )
+
+
+@router.get(
+    "/playlist/{playlist_id}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def download_playlist(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    playlist_id: Annotated[int, Path()],  # the playlist ID
+    request: Request,  # the request, for its Range header
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    bandwidth: BandwidthDep,  # shapes the response rate
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Download every song of a playlist as a single ZIP archive, in the playlist order.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param playlist_id: Playlist's ID
+    :type playlist_id: int
+    :param request: The request
+    :type request: Request
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The ZIP archive
+    :rtype: StreamingResponse
+    """
+    songs = await read_playlist_songs(session=session, id=playlist_id)
+    return await _zip_response(
+        session,
+        songs,
+        f"playlist_{playlist_id}",
+        request,
+        bandwidth,
+        client_key(request, current_user.id),
+    )
+
+
+def _safe_name(name: str) -> str:
+    # no path separators nor control characters inside archives and headers
+    return re.sub(r'[\x00-\x1f\x7f/\\"]+', "_", name).strip(" .") or "untitled"
+
+
+async def _zip_member(
+    session: Session,
+    song: SongPublic,
+    name: str,
+) -> ZipMember | None:
+    """
+    Everything the archive needs to know about a song file, None if the song has no file.
+    """
+    try:
+        asset, audio_file = await open_media_asset(session=session, song_id=song.id)
+    except HTTPException:
+        return None
+
+    with audio_file:
+        crc32 = asset.crc32
+        if crc32 is None:
+            # files uploaded before CRCs were recorded: compute it once, then keep it
+            crc32 = await run_in_threadpool(file_crc32, audio_file)
+            if getattr(asset, "id", None) is not None:
+                await upsert_media_asset(
+                    session=session,
+                    asset=MediaAssetCreate.model_validate(
+                        asset.model_dump(exclude={"id"}) | {"crc32": crc32}
+                    ),
+                )
+
+    return ZipMember(
+        name=f"{name}{asset.extension}",
+        path=audio_file.name,
+        size=asset.size,
+        crc32=crc32,
+        mtime=asset.mtime,
+    )
+
+
+def _open_zip_member(member: ZipMember) -> BinaryIO:
+    try:
+        return open(member.path, "rb")
+    except FileNotFoundError:
+        # moved to its shard since the archive was laid out
+        file_name = os.path.basename(member.path)
+        return open_sharded(AUDIO_DIRECTORY, re.match(r"\d*", file_name).group(), file_name)
+
+
+async def _zip_response(
+    session: Session,
+    songs: list[SongPublic],
+    archive_name: str,
+    request: Request,
+    bandwidth: BandwidthScheduler,
+    user: str,
+) -> StreamingResponse:
+    """
+    Stream the files of "songs" as an uncompressed ZIP archive.
+
+    Sizes and CRCs come from the media assets, so the archive layout is known upfront:
+    the response has a Content-Length and interrupted downloads can resume with a Range.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param songs: Songs to put in the archive, in order
+    :type songs: list[SongPublic]
+    :param archive_name: Name of the archive, without extension
+    :type archive_name: str
+    :param request: The request
+    :type request: Request
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :param user: Who the archive is shaped for
+    :type user: str
+    :return: The ZIP archive
+    :rtype: StreamingResponse
+    """
+    # a single query for every asset, the files are then resolved from memory
+    await read_media_assets(session=session, song_ids=[song.id for song in songs])
+
+    members = []
+    for position, song in enumerate(songs, start=1):
+        member = await _zip_member(
+            session, song, f"{position:02d} - {_safe_name(song.title)}"
+        )
+        if member is not None:
+            members.append(member)
+
+    if not members:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    archive = ZipStream(members, opener=_open_zip_member)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{_safe_name(archive_name)}.zip"',
+        "ETag": f'"{archive.etag}"',
+    }
+
+    # resume only if the archive didn't change in the meantime
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers["ETag"]:
+        range_header = None
+
+    byte_range = parse_range_header(range_header, archive.size)
+    if byte_range:
+        range_start, range_end = byte_range
+        headers.update(
+            range_headers(range_start, range_end, archive.size, "application/zip")
+        )
+        return StreamingResponse(
+            bandwidth.shape(
+                archive.iter_range(range_start, range_end, ARCHIVE_CHUNK_SIZE), user
+            ),
+            status_code=206,
+            headers=headers,
+        )
+
+    headers.update(
+        {
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(archive.size),
+            "Content-Type": "application/zip",
+        }
+    )
+    return StreamingResponse(
+        bandwidth.shape(archive.iter_range(0, archive.size - 1, ARCHIVE_CHUNK_SIZE), user),
+        headers=headers,
+    )
@@ -0,0 +1,149 @@
+from typing import Annotated, Any, Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlmodel import Session
+
+from ..commons.constants import IMAGE_CACHE_MAX_AGE, IMAGE_VARIANT_WIDTHS
+from ..core.database import get_session
+from ..core.image_cache import ImageResizeCache, get_image_cache
+from ..crud.image_variants import read_image_owner, read_image_variants
+from ..models.image_variant_model import ImageVariantPublic
+from ..utils.image_variants import (
+    negotiate_format,
+    original_image_path,
+    resized_name,
+    select_variant,
+    snap_width,
+    supported_formats,
+)
+
+# dependency injection to get the current user session
+SessionDep = Annotated[Session, Depends(get_session)]
+
+# create router for images
+router = APIRouter(
+    prefix="/images",  # router prefix url
+    tags=["images"],  # router tag
+)
+
+# what an image belongs to
+ImageKind = Literal["song", "album", "playlist"]
+
+ImageFormat = Literal["avif", "webp", "jpeg"]
+
+
+@router.get(
+    "/{kind}/{owner_id}/variants",  # endpoint url after the prefix specified earlier
+    response_model=list[ImageVariantPublic],  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_image_variants(
+    session: SessionDep,  # the database session
+    kind: Annotated[ImageKind, Path()],  # song, album or playlist
+    owner_id: Annotated[int, Path()],  # the song, album or playlist ID
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get every variant of the image of a song, an album or a playlist, to build a "srcset".
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param kind: "song", "album" or "playlist"
+    :type kind: str
+    :param owner_id: Song's, album's or playlist's ID
+    :type owner_id: int
+    :return: List of variants, smallest first
+    :rtype: list[ImageVariantPublic]
+    """
+    return await read_image_variants(session=session, owner_kind=kind, owner_id=owner_id)
+
+
+@router.get(
+    "/{kind}/{owner_id}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_image(
+    session: SessionDep,  # the database session
+    kind: Annotated[ImageKind, Path()],  # song, album or playlist
+    owner_id: Annotated[int, Path()],  # the song, album or playlist ID
+    request: Request,  # the request, to reach the process pool
+    image_cache: Annotated[ImageResizeCache, Depends(get_image_cache)],  # resized images
+    w: Annotated[int | None, Query(gt=0)] = None,  # width the client displays
+    fmt: Annotated[ImageFormat | None, Query()] = None,  # negotiated if not given
+    accept: Annotated[str | None, Header()] = None,  # formats the client decodes
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the image of a song, an album or a playlist at a width and in a format.
+
+    The width is rounded up to one of IMAGE_RESIZE_WIDTHS. When a variant made at upload
+    has that width, it redirects to it, otherwise the original is resized on demand and
+    kept in a disk cache. Without a width it redirects to the biggest variant.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param kind: "song", "album" or "playlist"
+    :type kind: str
+    :param owner_id: Song's, album's or playlist's ID
+    :type owner_id: int
+    :param request: The request
+    :type request: Request
+    :param image_cache: Disk cache of the resized images
+    :type image_cache: ImageResizeCache
+    :param w: Width in pixels the image is displayed at, None for the biggest variant
+    :type w: int | None
+    :param fmt: "avif", "webp" or "jpeg", None to pick it from the Accept header
+    :type fmt: str | None
+    :param accept: Accept header
+    :type accept: str | None
+    :return: The image, or a redirect to it
+    :rtype: FileResponse | RedirectResponse
+    """
+    formats = supported_formats()
+    if fmt is not None and fmt not in formats:
+        raise HTTPException(status_code=404, detail="Image format not available")
+    format = fmt or negotiate_format(accept, set(formats))
+    width = snap_width(w) if w is not None else None
+
+    # the response depends on the Accept header, caches must keep one per value
+    headers = {"Vary": "Accept"} if fmt is None else {}
+
+    variants = await read_image_variants(session=session, owner_kind=kind, owner_id=owner_id)
+    variant = select_variant(variants, width, format)
+    if variant is not None:
+        # the original is at most as wide as the variants if they're smaller than asked
+        complete = variant.width < max(IMAGE_VARIANT_WIDTHS)
+        if width is None or variant.width == width or (complete and variant.width < width):
+            return RedirectResponse(
+                variant.url, status_code=307, headers={"Cache-Control": "no-cache", **headers}
+            )
+
+    db_owner = await read_image_owner(session=session, owner_kind=kind, owner_id=owner_id)
+    image_path = None
+    if db_owner and db_owner.image_url:
+        image_path = original_image_path(db_owner.image_url)
+    if image_path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    if width is None:
+        # uploaded before variants existed, or not decodable
+        return RedirectResponse(
+            db_owner.image_url, status_code=307, headers={"Cache-Control": "no-cache"}
+        )
+
+    name = resized_name(kind, owner_id, image_path, width, format)
+    path = name and await image_cache.resize(
+        name, request.app.state.process_pool, image_path, width, format
+    )
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    return FileResponse(
+        path,
+        media_type=f"image/{format}",
+        headers={"Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}", **headers},
+    )
@@ -0,0 +1,161 @@
+from typing import Annotated, Any
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Security,
+)
+from sqlmodel import Session
+
+from ..commons.common_query_params import CommonQueryParams
+from ..commons.enums import JobKind, Scope, Status
+from ..core.auth_utils import get_current_active_user
+from ..core.database import get_session
+from ..core.jobs import JobQueue, get_job_queue
+from ..crud.jobs import count_jobs, read_job, read_jobs, retry_job
+from ..models.job_model import JobPublic
+
+# dependency injection to get the current user session
+SessionDep = Annotated[Session, Depends(get_session)]
+
+# dependency injection to get the queue of the background jobs
+JobQueueDep = Annotated[JobQueue, Depends(get_job_queue)]
+
+# create router for jobs
+router = APIRouter(
+    prefix="/jobs",  # router prefix url
+    tags=["jobs"],  # router tag
+)
+
+
+@router.get(
+    "/",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=list[JobPublic],  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_jobs(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    params: CommonQueryParams = Depends(),
+    status: Annotated[Status | None, Query()] = None,  # only the jobs with this status
+    kind: Annotated[JobKind | None, Query()] = None,  # only the jobs of this kind
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the background jobs with pagination, newest first.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param params: Common parameters for pagination
+    :type params: CommonParams
+    :param status: Only the jobs with this status
+    :type status: Status | None
+    :param kind: Only the jobs of this kind
+    :type kind: JobKind | None
+    :return: List of jobs
+    :rtype: list[JobPublic]
+    """
+    return await read_jobs(session=session, params=params, status=status, kind=kind)
+
+
+@router.get(
+    "/stats",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_jobs_stats(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    jobs: JobQueueDep,  # the queue of the background jobs
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Count the jobs of every kind by status, and show what the workers of this process are running.
+    The declaration order matters: this route must come before "/{job_id}".
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
+    :return: The counts and the workers statistics
+    :rtype: dict
+    """
+    return {"counts": await count_jobs(session=session), "workers": jobs.stats()}
+
+
+@router.get(
+    "/{job_id}",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=JobPublic,  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_job(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    job_id: Annotated[int, Path()],  # the job ID
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get specific job, with its status, its attempts and its last error.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param job_id: Job's ID
+    :type job_id: int
+    :return: The job
+    :rtype: JobPublic
+    """
+    db_job = await read_job(session=session, id=job_id)
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return db_job
+
+
+@router.post(
+    "/{job_id}/retry",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_UPDATE])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=JobPublic,  # the model used to format the response
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def post_job_retry(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    job_id: Annotated[int, Path()],  # the job ID
+    jobs: JobQueueDep,  # the queue of the background jobs
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Give a rejected job a new round of attempts.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param job_id: Job's ID
+    :type job_id: int
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
+    :return: The job, open again
+    :rtype: JobPublic
+    """
+    db_job = await read_job(session=session, id=job_id)
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status != Status.REJECTED:
+        raise HTTPException(status_code=409, detail="Only rejected jobs can be retried")
+
+    db_job = await retry_job(session=session, id=job_id)
+    jobs.notify()
+    return db_job
@@ -0,0 +1,119 @@
+from typing import Annotated, Any
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Path,
+    Query,
+    Security,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+from ..commons.constants import (
+    EMBEDDING_NPROBE,
+    RECOMMENDATIONS_MAX_BATCH,
+    RECOMMENDATIONS_MAX_LIMIT,
+)
+from ..commons.enums import Scope
+from ..core.auth_utils import get_current_active_user
+from ..core.database import get_session
+from ..crud.playlists import read_playlist_songs
+from ..utils.embeddings import SongEmbeddings, get_song_embeddings
+
+# dependency injection to get the current user session
+SessionDep = Annotated[Session, Depends(get_session)]
+
+# dependency injection to get the index of the song embeddings
+SongEmbeddingsDep = Annotated[SongEmbeddings, Depends(get_song_embeddings)]
+
+# create router for recommendations
+router = APIRouter(
+    prefix="/recommendations",  # router prefix url
+    tags=["recommendations"],  # router tag
+)
+
+
+@router.get(
+    "/songs",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_song_recommendations(
+    embeddings: SongEmbeddingsDep,  # the index of the song embeddings
+    song_id: Annotated[
+        list[int], Query(min_length=1, max_length=RECOMMENDATIONS_MAX_BATCH)
+    ],  # one or more, ?song_id=1&song_id=2
+    limit: Annotated[int, Query(ge=1, le=RECOMMENDATIONS_MAX_LIMIT)] = 20,
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the songs nearest to each of the songs in the embedding space, nearest first.
+    All the songs are searched in one batch. Served from the index built offline by
+    "scripts/build_song_embeddings.py": a song without an embedding has no recommendations.
+
+    \f
+
+    :param embeddings: The index of the song embeddings
+    :type embeddings: SongEmbeddings
+    :param song_id: Songs' IDs
+    :type song_id: list[int]
+    :param limit: Number of songs per song
+    :type limit: int
+    :return: The recommended songs of every song and their similarity
+    :rtype: list[dict]
+    """
+    # matrix products release the GIL, they're searched in a thread
+    results = await run_in_threadpool(
+        embeddings.similar, song_id, limit, EMBEDDING_NPROBE
+    )
+    return [
+        {
+            "song_id": query,
+            "songs": [
+                {"song_id": similar_id, "score": score}
+                for similar_id, score in results.get(query, [])
+            ],
+        }
+        for query in song_id
+    ]
+
+
+@router.get(
+    "/playlists/{playlist_id}",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_playlist_recommendations(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    embeddings: SongEmbeddingsDep,  # the index of the song embeddings
+    playlist_id: Annotated[int, Path()],  # get path parameter
+    limit: Annotated[int, Query(ge=1, le=RECOMMENDATIONS_MAX_LIMIT)] = 20,
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get songs to add to a playlist: the nearest to the average of its songs' embeddings,
+    the songs already in it left out.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param embeddings: The index of the song embeddings
+    :type embeddings: SongEmbeddings
+    :param playlist_id: Playlist's ID
+    :type playlist_id: int
+    :param limit: Number of songs
+    :type limit: int
+    :return: The recommended songs and their similarity
+    :rtype: list[dict]
+    """
+    songs = await read_playlist_songs(session=session, id=playlist_id)
+    results = await run_in_threadpool(
+        embeddings.recommend, [song.id for song in songs], limit, EMBEDDING_NPROBE
+    )
+    return [{"song_id": song_id, "score": score} for song_id, score in results]
@@ -1,24 +1,37 @@
+import os
+
 from typing import Annotated, Any
 
 from fastapi import (
     APIRouter,
     Form,
     Depends,
+    HTTPException,
     Path,
+    Query,
+    Request,
     Security,
 )
+from fastapi.responses import FileResponse, RedirectResponse
 from sqlmodel import Session
 
 from ..commons.common_query_params import CommonQueryParams
+from ..commons.constants import SIMILAR_SONGS_TOP_K
 from ..commons.enums import Scope
 from ..core.auth_utils import get_current_active_user
 from ..core.database import get_session
+from ..crud.media_assets import read_media_asset
 from ..crud.songs import create_song, delete_song, read_song, read_songs, update_song
 from ..models.song_model import SongCreate, SongPublic, SongUpdate
+from ..utils.similar_songs import SimilarSongs, get_similar_songs
+from ..utils.waveform import waveform_path
 
 # dependency injection to get the current user session
 SessionDep = Annotated[Session, Depends(get_session)]
 
+# dependency injection to get the model of the similar songs
+SimilarSongsDep = Annotated[SimilarSongs, Depends(get_similar_songs)]
+
 # create router for songs
 router = APIRouter(
     prefix="/songs",  # router prefix url
@@ -166,3 +179,112 @@ async def del_song(
     :rtype: None
     """
     return await delete_song(session=session, id=song_id)
+
+
+@router.get(
+    "/{song_id}/waveform",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=307,  # HTTP status code returned if no errors occur
+)
+async def get_song_waveform(
+    session: SessionDep,  # the database session
+    song_id: Annotated[int, Path()],  # get path parameter
+    request: Request,  # the request, to build the redirect url
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Redirect to the waveform of the current file of a song.
+    The target URL changes with the file, so the waveform itself can be cached forever.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param request: The request
+    :type request: Request
+    :return: Redirect to the versioned waveform
+    :rtype: RedirectResponse
+    """
+    asset = await read_media_asset(session=session, song_id=song_id)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Waveform not found")
+
+    version = asset.content_hash[:16]
+    if not os.path.isfile(waveform_path(song_id, version)):
+        # still being computed right after an upload, or not decodable
+        raise HTTPException(status_code=404, detail="Waveform not found")
+
+    return RedirectResponse(
+        request.url_for("get_song_waveform_version", song_id=song_id, version=version),
+        status_code=307,
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get(
+    "/{song_id}/waveform/{version}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_song_waveform_version(
+    song_id: Annotated[int, Path()],  # get path parameter
+    version: Annotated[str, Path(pattern="^[0-9a-f]{16}$")],  # the audio content version
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the waveform peaks of a song file, see "encode_waveform" for the binary format.
+
+    \f
+
+    :param song_id: Song's ID
+    :type song_id: int
+    :param version: Version of the song file
+    :type version: str
+    :return: The waveform
+    :rtype: FileResponse
+    """
+    path = waveform_path(song_id, version)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Waveform not found")
+
+    headers = {
+        # a new file means a new version, so a new url
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{version}"',
+    }
+    return FileResponse(path, headers=headers, media_type="application/octet-stream")
+
+
+@router.get(
+    "/{song_id}/similar",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_similar_song_ids(
+    similar_songs: SimilarSongsDep,  # the co-occurrence model
+    song_id: Annotated[int, Path()],  # get path parameter
+    limit: Annotated[int, Query(ge=1, le=SIMILAR_SONGS_TOP_K)] = 20,
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the songs most often found in the same playlists as a song, most similar first.
+    Served from the model built offline by "scripts/build_similar_songs.py", nothing is queried:
+    a song in no playlist, or added since the last build, has no similar songs.
+
+    \f
+
+    :param similar_songs: The model of the similar songs
+    :type similar_songs: SimilarSongs
+    :param song_id: Song's ID
+    :type song_id: int
+    :param limit: Number of songs
+    :type limit: int
+    :return: The IDs of the similar songs and their similarity
+    :rtype: list[dict]
+    """
+    return [
+        {"song_id": similar_id, "score": score}
+        for similar_id, score in similar_songs.similar(song_id, limit)
+    ]
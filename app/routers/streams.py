@@ -1,6 +1,12 @@
+import mimetypes
 import os
+import time
+import anyio
 import httpx
 
+from collections.abc import AsyncIterator
+from email.utils import formatdate
+from urllib.parse import urlencode
 from typing import Annotated, Any
 
 from fastapi import (
@@ -8,6 +14,7 @@ from fastapi import (
     Depends,
     HTTPException,
     Path,
+    Query,
     Security,
     Request,
 )
@@ -15,17 +22,114 @@ from fastapi.responses import Response, StreamingResponse
 from pydantic import ValidationError
 from sqlmodel import Session, select
 
-from ..commons.constants import AUDIO_DIRECTORY
+from ..commons.constants import (
+    ALLOWED_VIDEO_EXTENSIONS,
+    AUDIO_CHUNK_SIZE,
+    AUDIO_DIRECTORY,
+    HLS_PLAYLIST_MAX_AGE,
+    REMOTE_AUDIO_URL,
+    VIDEO_CHUNK_SIZE,
+    VIDEO_DIRECTORY,
+)
 from ..commons.common_query_params import CommonQueryParams
 from ..commons.enums import Scope
 from ..core.auth_utils import get_current_active_user
+from ..core.bandwidth import BandwidthScheduler, client_key, get_bandwidth_scheduler
 from ..core.database import get_session
+from ..core.http_client import get_http_client
+from ..core.play_events import PlayEventRecorder, get_play_event_recorder
+from ..core.recent_plays import RecentPlayStore, get_recent_play_store
+from ..core.remote_cache import RemoteAudioCache, RemoteFetchError, get_remote_cache
+from ..crud.media_assets import open_media_asset, read_media_asset
 from ..crud.songs import read_song, update_song
+from ..models.media_asset_model import MediaAssetBase
 from ..models.song_model import Song, SongCreate, SongPublic, SongUpdate
+from ..models.user_model import UserPublic
+from ..utils.hls import get_hls_playlist
+from ..utils.seek_index import get_file_seek_index, get_seek_index
+from ..utils.stream_utils import (
+    is_safe_filename,
+    iter_file_range,
+    parse_range_header,
+    range_headers,
+)
+from ..utils.signed_urls import sign_stream, verify_stream
+from ..utils.transcode import select_rendition
 
 # dependency injection to get the current user session
 SessionDep = Annotated[Session, Depends(get_session)]
 
+# dependency injection to get the pooled HTTP client
+HttpClientDep = Annotated[httpx.AsyncClient, Depends(get_http_client)]
+
+# dependency injection to get the local disk cache of the remote files
+RemoteCacheDep = Annotated[RemoteAudioCache | None, Depends(get_remote_cache)]
+
+# dependency injection to get the bandwidth scheduler of the responses
+BandwidthDep = Annotated[BandwidthScheduler, Depends(get_bandwidth_scheduler)]
+
+# dependency injection to get the recorder of the play events
+PlayEventsDep = Annotated[PlayEventRecorder, Depends(get_play_event_recorder)]
+
+# dependency injection to get the recently played songs of the users
+RecentPlaysDep = Annotated[RecentPlayStore, Depends(get_recent_play_store)]
+
+# headers relayed between the client and the remote origin
+_FORWARDED_REQUEST_HEADERS = ("range", "if-range")
+_FORWARDED_RESPONSE_HEADERS = (
+    "content-length",
+    "content-range",
+    "content-encoding",
+    "accept-ranges",
+    "etag",
+    "last-modified",
+)
+
+# formats whose frames can be cut at any boundary, mapped to the segment extension
+_HLS_SEGMENT_TYPES = {".mp3": "mp3", ".aac": "aac"}
+
+# client hints "quality=auto" picks the rendition from
+_QUALITY_HINTS = "Downlink, ECT, Save-Data"
+
+
+async def verify_stream_url(
+    song_id: Annotated[int, Path()],  # the song ID
+    user: Annotated[int | None, Query()] = None,  # the user the URL was signed for
+    expires: Annotated[int | None, Query()] = None,  # expiration, in seconds since the epoch
+    signature: Annotated[str | None, Query()] = None,  # the signature
+) -> dict:
+    """
+    Check the signature of a stream URL made by "/streams/{song_id}/sign".
+    It's an HMAC, there is no JWT to decode and no user to query for every byte range request.
+
+    \f
+
+    :return: The verified "user", "expires" and "signature"
+    :rtype: dict
+    """
+    if (
+        user is None
+        or expires is None
+        or signature is None
+        or not verify_stream(song_id, user, expires, signature)
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired stream URL")
+
+    return {"user": user, "expires": expires, "signature": signature}
+
+
+# dependency injection to check the signature of a stream URL
+SignedStreamDep = Annotated[dict, Depends(verify_stream_url)]
+
+
+def _cache_control(expires: int, max_age: int = 31536000) -> str:
+    """
+    Lets a CDN or a reverse proxy cache a signed response, but not past the expiration of its URL.
+    """
+    max_age = max(0, min(max_age, expires - int(time.time())))
+    return f"public, max-age={max_age}"
+
+
 # create router for streams
 router = APIRouter(
     prefix="/streams",  # router prefix url
@@ -33,21 +137,119 @@ router = APIRouter(
 )
 
 
+@router.get(
+    "/video/{video_name}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_video(
+    video_name: Annotated[str, Path()],  # the video file name
+    request: Request,  # the request, for its Range header
+    bandwidth: BandwidthDep,  # shapes the response rate
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Stream a video file in chunks, supporting byte ranges.
+    The declaration order matters: these routes must come before "/{song_id}".
+
+    \f
+
+    :param video_name: Video's file name, inside the video directory
+    :type video_name: str
+    :param request: The request
+    :type request: Request
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The video
+    :rtype: StreamingResponse
+    """
+    _, ext = os.path.splitext(video_name)
+    if not is_safe_filename(video_name) or ext.lower() not in ALLOWED_VIDEO_EXTENSIONS:
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+    video_path = os.path.join(VIDEO_DIRECTORY, video_name)
+    try:
+        file_size = os.path.getsize(video_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+    media_type = mimetypes.guess_type(video_name)[0] or "application/octet-stream"
+
+    byte_range = parse_range_header(request.headers.get("range"), file_size)
+    if byte_range:
+        range_start, range_end = byte_range
+        return StreamingResponse(
+            bandwidth.shape(
+                iter_file_range(video_path, range_start, range_end, VIDEO_CHUNK_SIZE),
+                client_key(request),
+            ),
+            status_code=206,
+            headers=range_headers(range_start, range_end, file_size, media_type),
+        )
+
+    # If no Range header, return the entire file
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(file_size),
+        "Content-Type": media_type,
+    }
+    return StreamingResponse(
+        bandwidth.shape(
+            iter_file_range(video_path, 0, file_size - 1, VIDEO_CHUNK_SIZE),
+            client_key(request),
+        ),
+        headers=headers,
+    )
+
+
+@router.get(
+    "/video",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def video2(request: Request, bandwidth: BandwidthDep) -> Any:
+    """
+    Stream the default video file.
+
+    \f
+
+    :param request: The request
+    :type request: Request
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The video
+    :rtype: StreamingResponse
+    """
+    return await get_video(
+        video_name="large_video.mp4", request=request, bandwidth=bandwidth
+    )
+
+
 @router.get(
     "/{song_id}",  # endpoint url after the prefix specified earlier
-    # dependencies=[
-    #     Security(get_current_active_user, scopes=[Scope.ITEMS_CREATE])
-    # ],  # security check, user needs to have permissions to interact with this endpoint
     response_model=None,  # "None" if you use a default Response from fastapi.responses
     status_code=201,  # HTTP status code returned if no errors occur
 )
-async def post_song(
-    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+async def get_song_stream(
+    session: SessionDep,  # the database session
     song_id: Annotated[int, Path()],  # the song ID
     request: Request,  # the song in a file-like object
+    signed: SignedStreamDep,  # the URL must be signed, see "/{song_id}/sign"
+    bandwidth: BandwidthDep,  # shapes the response rate
+    play_events: PlayEventsDep,  # records the plays
+    recent_plays: RecentPlaysDep,  # the last songs of the users
+    t: Annotated[float | None, Query(ge=0)] = None,  # start position in seconds
+    quality: Annotated[
+        str | None, Query(pattern=r"^(auto|original|\d+k)$")
+    ] = None,  # "original", a rendition like "160k", or "auto"
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
     Stream a song file.
+    Supports byte ranges through the Range header and time based seeking through the "t" query parameter.
+    The URL must be signed by "/streams/{song_id}/sign".
+    The "quality" query parameter streams one of the lower bitrate renditions made after the upload,
+    "auto" picks it from the bandwidth declared by the client hints.
+    The original is streamed until the renditions are ready.
+    A request from the first byte is recorded as a play, without waiting for the database.
 
     \f
 
@@ -57,56 +259,385 @@ async def post_song(
     :type song_id: int
     :param request: The request
     :type request: Request
+    :param signed: The verified query parameters of the signed URL
+    :type signed: dict
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :param play_events: The play event recorder
+    :type play_events: PlayEventRecorder
+    :param recent_plays: The recent plays of the users
+    :type recent_plays: RecentPlayStore
+    :param t: Position to start from, in seconds
+    :type t: float | None
+    :param quality: Quality of the streamed file
+    :type quality: str | None
     :return: The new created Song
     :rtype: SongPublic
     """
-    base_dir = os.path.dirname(
-        os.path.abspath(__file__)
-    )  # Get the directory of this file
-    audio_path = os.path.join(
-        # base_dir, "..", "..", f"public/audio/{song_id}.mp3"
-        f"{AUDIO_DIRECTORY}/{song_id}.mp3"
-    )  # Construct the absolute path
+    audio_file = None
+    if quality is not None and quality != "original":
+        original = await read_media_asset(session=session, song_id=song_id)
+        kind = "original"
+        if original is not None:
+            kind = select_rendition(
+                quality, original.extension, original.bitrate, request.headers
+            )
+        if kind != "original":
+            try:
+                asset, audio_file = await open_media_asset(
+                    session=session, song_id=song_id, kind=kind
+                )
+            except HTTPException:
+                pass  # not transcoded yet, the original is streamed meanwhile
+
+    if audio_file is None:
+        # size and type come from the asset recorded at upload, the only syscall is the open
+        asset, audio_file = await open_media_asset(session=session, song_id=song_id)
 
     try:
-        file_size = os.path.getsize(audio_path)
         range_header = request.headers.get("range")
-        if range_header:
-            # Parse the Range header
-            range_start, range_end = range_header.replace("bytes=", "").split("-")
-            range_start = int(range_start)
-            range_end = int(range_end) if range_end else file_size - 1
+        if t is not None:
+            # time based seek, the index built at upload maps "t" to the frame containing it,
+            # a rendition's is stored next to it when transcoding
+            if asset.kind == "original":
+                seek_index = get_seek_index(song_id)
+            else:
+                seek_index = get_file_seek_index(asset.path)
+            if seek_index is None:
+                raise HTTPException(status_code=404, detail="Seek index not found")
 
-            if range_start >= file_size or range_end >= file_size:
+            try:
+                range_header = f"bytes={seek_index.byte_offset(t)}-"
+            except ValueError:
                 raise HTTPException(
                     status_code=416, detail="Requested Range Not Satisfiable"
                 )
 
-            chunk_size = range_end - range_start + 1
-            with open(audio_path, "rb") as audio_file:
-                audio_file.seek(range_start)
-                data = audio_file.read(chunk_size)
-
-            headers = {
-                "Content-Range": f"bytes {range_start}-{range_end}/{file_size}",
-                "Accept-Ranges": "bytes",
-                "Content-Length": str(chunk_size),
-                "Content-Type": "audio/mpeg",
-            }
-            return Response(data, status_code=206, headers=headers)
-
-        # If no Range header, return the entire file
-        with open(audio_path, "rb") as audio_file:
-            data = audio_file.read()
-
-        headers = {
-            "Content-Length": str(file_size),
-            "Content-Type": "audio/mpeg",
+        byte_range = parse_range_header(range_header, asset.size)
+    except HTTPException:
+        audio_file.close()
+        raise
+
+    # the next ranges and the seeks belong to the same play, a probe of the first bytes to none
+    if t is None and (not byte_range or (byte_range[0] == 0 and byte_range[1] > 1)):
+        play_events.record(song_id, signed["user"], "stream", asset.kind)
+        recent_plays.record(signed["user"], song_id)  # the position is the client's to send
+
+    headers = {
+        "Cache-Control": _cache_control(signed["expires"]),
+        "Last-Modified": formatdate(asset.mtime, usegmt=True),
+    }
+    if asset.content_hash:
+        headers["ETag"] = f'"{asset.content_hash[:32]}"'
+    if quality == "auto":
+        # the same URL gets another file with other hints, and browsers send them if asked
+        headers["Vary"] = _QUALITY_HINTS
+        headers["Accept-CH"] = _QUALITY_HINTS
+
+    if byte_range:
+        range_start, range_end = byte_range
+        headers.update(
+            range_headers(range_start, range_end, asset.size, asset.mime_type)
+        )
+        return StreamingResponse(
+            bandwidth.shape(
+                iter_file_range(audio_file, range_start, range_end, AUDIO_CHUNK_SIZE),
+                client_key(request, signed["user"]),
+            ),
+            status_code=206,
+            headers=headers,
+        )
+
+    # If no Range header, return the entire file
+    headers.update(
+        {
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(asset.size),
+            "Content-Type": asset.mime_type,
         }
-        return Response(data, headers=headers)
+    )
+    return StreamingResponse(
+        bandwidth.shape(
+            iter_file_range(audio_file, 0, asset.size - 1, AUDIO_CHUNK_SIZE),
+            client_key(request, signed["user"]),
+        ),
+        headers=headers,
+    )
 
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Audio file not found")
+
+@router.get(
+    "/{song_id}/sign",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def sign_song_stream(
+    session: SessionDep,  # the database session
+    song_id: Annotated[int, Path()],  # the song ID
+    request: Request,  # the request, to build the URLs
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get short-lived signed URLs to stream a song, bound to the song and to the current user.
+    The user is authenticated once here, the stream routes only check the signature.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param request: The request
+    :type request: Request
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :return: The stream and HLS playlist URLs, with their expiration
+    :rtype: dict
+    """
+    song = await read_song(session=session, id=song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+
+    signed = sign_stream(song_id, current_user.id)
+    return {
+        "url": str(
+            request.url_for("get_song_stream", song_id=song_id).include_query_params(
+                **signed
+            )
+        ),
+        "hls_url": str(
+            request.url_for(
+                "get_hls_playlist_file", song_id=song_id
+            ).include_query_params(**signed)
+        ),
+        "expires": signed["expires"],
+    }
+
+
+@router.get(
+    "/{song_id}/hls/playlist.m3u8",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_hls_playlist_file(
+    session: SessionDep,  # the database session
+    song_id: Annotated[int, Path()],  # the song ID
+    signed: SignedStreamDep,  # the URL must be signed, see "/{song_id}/sign"
+    play_events: PlayEventsDep,  # records the plays
+    recent_plays: RecentPlaysDep,  # the last songs of the users
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the HLS media playlist of a song.
+    The playlist is generated on the first request and then served from memory.
+    The URL must be signed, its signature is carried over to the segment URLs.
+    Players fetch it once per play, so it's where the play is recorded.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param signed: The verified query parameters of the signed URL
+    :type signed: dict
+    :param play_events: The play event recorder
+    :type play_events: PlayEventRecorder
+    :param recent_plays: The recent plays of the users
+    :type recent_plays: RecentPlayStore
+    :return: The m3u8 playlist
+    :rtype: Response
+    """
+    asset = await _read_hls_asset(session, song_id)
+    playlist = get_hls_playlist(song_id, _HLS_SEGMENT_TYPES[asset.extension])
+    if playlist is None:
+        raise HTTPException(status_code=404, detail="Seek index not found")
+
+    play_events.record(song_id, signed["user"], "hls")
+    recent_plays.record(signed["user"], song_id)
+
+    headers = {
+        # the playlist points to versioned segments, it only has to be revalidated now and then
+        "Cache-Control": _cache_control(signed["expires"], HLS_PLAYLIST_MAX_AGE),
+        "ETag": f'"{playlist.version}"',
+    }
+    return Response(
+        playlist.signed_body(urlencode(signed)),
+        headers=headers,
+        media_type="application/vnd.apple.mpegurl",
+    )
+
+
+@router.get(
+    "/{song_id}/hls/{version}/{segment}.{extension}",  # endpoint url after the prefix specified earlier
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_hls_segment(
+    session: SessionDep,  # the database session
+    song_id: Annotated[int, Path()],  # the song ID
+    version: Annotated[str, Path()],  # the playlist version
+    segment: Annotated[int, Path(ge=0)],  # the segment number
+    extension: Annotated[str, Path()],  # the segment extension
+    signed: SignedStreamDep,  # the URL must be signed, see "/{song_id}/sign"
+    request: Request,  # the request, to know who the response is for
+    bandwidth: BandwidthDep,  # shares the outgoing bandwidth between the users
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get a segment of the HLS playlist of a song.
+    Segments are byte ranges of the original file and never change, so they are cacheable forever.
+    Each one starts with the ID3 tag giving its timestamp, as packed audio segments must.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param song_id: Song's ID
+    :type song_id: int
+    :param version: Playlist's version
+    :type version: str
+    :param segment: Segment's number
+    :type segment: int
+    :param extension: Segment's extension, the one of the original file
+    :type extension: str
+    :param signed: The verified query parameters of the signed URL
+    :type signed: dict
+    :param request: The request
+    :type request: Request
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The audio segment
+    :rtype: StreamingResponse
+    """
+    asset, audio_file = await open_media_asset(session=session, song_id=song_id)
+    segment_type = _HLS_SEGMENT_TYPES.get(asset.extension)
+    playlist = get_hls_playlist(song_id, segment_type) if segment_type else None
+    if (
+        playlist is None
+        or extension != segment_type
+        or playlist.version != version
+        or segment >= len(playlist.ranges)
+    ):
+        audio_file.close()
+        raise HTTPException(status_code=404, detail="Segment not found")
+
+    range_start, range_end = playlist.ranges[segment]
+    tag = playlist.segment_tag(segment)
+    headers = {
+        # a CDN or a reverse proxy in front of us can absorb repeated plays
+        "Cache-Control": f"{_cache_control(signed['expires'])}, immutable",
+        "ETag": f'"{version}-{segment}"',
+        "Content-Length": str(len(tag) + range_end - range_start),
+    }
+    return StreamingResponse(
+        bandwidth.shape(
+            _prepend(
+                tag,
+                iter_file_range(
+                    audio_file, range_start, range_end - 1, AUDIO_CHUNK_SIZE
+                ),
+            ),
+            client_key(request, signed["user"]),
+        ),
+        headers=headers,
+        media_type=asset.mime_type,
+    )
+
+
+async def _prepend(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Yield "head", then the chunks.
+    """
+    yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def _read_hls_asset(session: Session, song_id: int) -> MediaAssetBase:
+    """
+    The original file of a song, as long as its format can be cut into HLS segments.
+    """
+    asset, audio_file = await open_media_asset(session=session, song_id=song_id)
+    audio_file.close()
+    if asset.extension not in _HLS_SEGMENT_TYPES:
+        raise HTTPException(status_code=404, detail="HLS not available for this song")
+    return asset
+
+
+@router.get(
+    "/remote/cache/stats",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_remote_cache_stats(
+    cache: RemoteCacheDep,  # the local disk cache, None if disabled
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the statistics of the local disk cache of the remote audio files: hit rate, bytes saved...
+
+    \f
+
+    :param cache: The local disk cache of the remote files
+    :type cache: RemoteAudioCache | None
+    :return: The cache statistics
+    :rtype: dict
+    """
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Remote cache disabled")
+
+    return cache.stats()
+
+
+@router.get(
+    "/bandwidth/stats",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_bandwidth_stats(
+    bandwidth: BandwidthDep,  # the bandwidth scheduler
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the bandwidth limits and the current rate allocated to every stream and download.
+    The scheduler lives in memory, these are the streams of the worker answering.
+
+    \f
+
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
+    :return: The limits, the allocations and the statistics
+    :rtype: dict
+    """
+    return bandwidth.stats()
+
+
+@router.get(
+    "/plays/stats",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=None,  # "None" if you use a default Response from fastapi.responses
+    status_code=200,  # HTTP status code returned if no errors occur
+)
+async def get_play_events_stats(
+    play_events: PlayEventsDep,  # the play event recorder
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Get the play events queued, written and dropped by the worker answering.
+
+    \f
+
+    :param play_events: The play event recorder
+    :type play_events: PlayEventRecorder
+    :return: The statistics
+    :rtype: dict
+    """
+    return play_events.stats()
 
 
 @router.get(
@@ -121,9 +652,13 @@ async def post_song(
     session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
     song_id: Annotated[int, Path()],  # the song ID
     request: Request,  # the song in a file-like object
+    client: HttpClientDep,  # the pooled HTTP client
+    cache: RemoteCacheDep,  # the local disk cache, None if disabled
+    bandwidth: BandwidthDep,  # shapes the response rate
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
-    Stream a song file.
+    Stream a song file from the remote origin.
+    The body is relayed chunk by chunk as it arrives, it's never buffered.
 
     \f
 
@@ -133,73 +668,118 @@ async def post_song(
     :type song_id: int
     :param request: The request
     :type request: Request
+    :param client: The pooled HTTP client
+    :type client: httpx.AsyncClient
+    :param cache: The local disk cache of the remote files
+    :type cache: RemoteAudioCache | None
+    :param bandwidth: The bandwidth scheduler
+    :type bandwidth: BandwidthScheduler
     :return: The new created Song
     :rtype: SongPublic
     """
     # compose remote url
-    remote_url = f"http://127.0.0.1:8080/public/audio/{song_id}.mp3"
+    remote_url = f"{REMOTE_AUDIO_URL}/{song_id}.mp3"
 
-    try:
-        # Initiate a streaming GET request to the external URL
-        async with httpx.AsyncClient() as client:
-            response = await client.get(remote_url, timeout=None)
-            response.raise_for_status()
+    if cache is not None:
+        # serve from the local disk, the origin is only hit the first time
+        return await _stream_from_cache(
+            cache, client, f"{song_id}.mp3", remote_url, request, bandwidth
+        )
 
-            # Determine the content type from the response headers
-            content_type = response.headers.get("Content-Type", "application/octet-stream")
+    # forward the range headers, so seeking and resuming are handled by the origin
+    headers = {
+        name: request.headers[name]
+        for name in _FORWARDED_REQUEST_HEADERS
+        if name in request.headers
+    }
 
-            # Stream the content to the client
-            return StreamingResponse(response.aiter_bytes(), media_type=content_type)
+    try:
+        # send the request through the pooled client without reading the body yet
+        upstream = await client.send(
+            client.build_request("GET", remote_url, headers=headers), stream=True
+        )
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"Error fetching the file: {exc}")
-    
-    
-@router.get("/video")
-async def video2(request: Request):
-    base_dir = os.path.dirname(
-        os.path.abspath(__file__)
-    )  # Get the directory of this file
-    video_path = os.path.join(
-        # base_dir, "..", "public/video/large_video.mp4"
-        "public/video/large_video.mp4"
-    )  # Construct the absolute path
 
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        if upstream.status_code == 404:
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        if upstream.status_code == 416:
+            raise HTTPException(
+                status_code=416, detail="Requested Range Not Satisfiable"
+            )
+        raise HTTPException(
+            status_code=502,
+            detail=f"Error fetching the file: {upstream.status_code}",
+        )
+
+    # propagate 200/206 with their Content-Range/Content-Length untouched
+    response_headers = {
+        name: upstream.headers[name]
+        for name in _FORWARDED_RESPONSE_HEADERS
+        if name in upstream.headers
+    }
+    return StreamingResponse(
+        bandwidth.shape(_relay_upstream(upstream), client_key(request)),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        media_type=upstream.headers.get("Content-Type", "application/octet-stream"),
+    )
+
+
+async def _stream_from_cache(
+    cache: RemoteAudioCache,
+    client: httpx.AsyncClient,
+    name: str,
+    remote_url: str,
+    request: Request,
+    bandwidth: BandwidthScheduler,
+) -> StreamingResponse:
+    """
+    Stream a remote file through the local disk cache, handling the Range header locally.
+    """
     try:
-        file_size = os.path.getsize(video_path)
-        range_header = request.headers.get("range")
-        if range_header:
-            # Parse the Range header
-            range_start, range_end = range_header.replace("bytes=", "").split("-")
-            range_start = int(range_start)
-            range_end = int(range_end) if range_end else file_size - 1
+        audio = await cache.open(name, remote_url, client)
+    except RemoteFetchError as exc:
+        if exc.status_code == 404:
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        raise HTTPException(status_code=502, detail=str(exc))
 
-            if range_start >= file_size or range_end >= file_size:
-                raise HTTPException(
-                    status_code=416, detail="Requested Range Not Satisfiable"
-                )
+    byte_range = None
+    if audio.size is not None:
+        byte_range = parse_range_header(request.headers.get("range"), audio.size)
+    if byte_range:
+        range_start, range_end = byte_range
+        return StreamingResponse(
+            bandwidth.shape(
+                cache.iter_range(audio, range_start, range_end), client_key(request)
+            ),
+            status_code=206,
+            headers=range_headers(
+                range_start, range_end, audio.size, audio.content_type
+            ),
+        )
 
-            chunk_size = range_end - range_start + 1
-            with open(video_path, "rb") as video_file:
-                video_file.seek(range_start)
-                data = video_file.read(chunk_size)
-
-            headers = {
-                "Content-Range": f"bytes {range_start}-{range_end}/{file_size}",
-                "Accept-Ranges": "bytes",
-                "Content-Length": str(chunk_size),
-                "Content-Type": "video/mp4",
-            }
-            return StreamingResponse(data, status_code=206, headers=headers)
-
-        # If no Range header, return the entire file
-        with open(video_path, "rb") as video_file:
-            data = video_file.read()
-
-        headers = {
-            "Content-Length": str(file_size),
-            "Content-Type": "video/mp4",
-        }
-        return StreamingResponse(data, headers=headers)
+    headers = {"Accept-Ranges": "bytes"}
+    if audio.size is not None:
+        headers["Content-Length"] = str(audio.size)
+    return StreamingResponse(
+        bandwidth.shape(cache.iter_range(audio), client_key(request)),
+        headers=headers,
+        media_type=audio.content_type,
+    )
 
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Video file not found")
+
+async def _relay_upstream(upstream: httpx.Response):
+    """
+    Relay the raw upstream body, closing the upstream request when we are done.
+    If the client disconnects the generator is cancelled, and so is the upstream transfer.
+    """
+    try:
+        async for chunk in upstream.aiter_raw():
+            yield chunk
+    finally:
+        # shielded, otherwise the cancellation would interrupt the close too
+        with anyio.CancelScope(shield=True):
+            await upstream.aclose()
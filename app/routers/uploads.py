@@ -1,4 +1,8 @@
+import hashlib
+import mimetypes
 import os
+import uuid
+import zlib
 import aiofiles
 
 from typing import Annotated, Any
@@ -13,21 +17,49 @@ from fastapi import (
     File,
     UploadFile,
 )
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
 
-from ..commons.constants import AUDIO_DIRECTORY, IMAGE_DIRECTORY
-from ..commons.enums import Scope
-from ..utils.file_utils import validate_audio_file, validate_image_file
+from ..commons.constants import (
+    AUDIO_DIRECTORY,
+    IMAGE_DIRECTORY,
+    MAX_FILE_SIZE,
+    UPLOAD_CHUNK_SIZE,
+)
+from ..commons.enums import JobKind, Priority, Scope
+from ..utils.file_utils import (
+    shard_directory,
+    shard_path,
+    validate_audio_file,
+    validate_image_file,
+)
+from ..utils.seek_index import build_seek_index, delete_seek_index, save_seek_index
+from ..utils.image_variants import variant_key
+from ..utils.transcode import delete_renditions
 from ..core.auth_utils import get_current_active_user
 from ..core.database import get_session
+from ..core.jobs import JobQueue, get_job_queue
 from ..crud.songs import read_song, update_song
 from ..crud.albums import read_album, update_album
+from ..crud.image_variants import read_image_owner
+from ..crud.playlists import update_playlist
+from ..crud.media_assets import (
+    delete_media_assets,
+    invalidate_media_asset,
+    read_media_asset,
+    upsert_media_asset,
+)
+from ..models.media_asset_model import MediaAssetCreate
 from ..models.song_model import SongPublic
 from ..models.album_model import AlbumPublic
+from ..models.playlist_model import PlaylistPublic, PlaylistUpdate
 
 # dependency injection to get the current user session
 SessionDep = Annotated[Session, Depends(get_session)]
 
+# dependency injection to get the queue of the background jobs
+JobQueueDep = Annotated[JobQueue, Depends(get_job_queue)]
+
 # create router for uploads
 router = APIRouter(
     prefix="/uploads",  # router prefix url
@@ -48,9 +80,13 @@ async def post_audio_song(
     song_id: Annotated[int, Path()],  # the song ID
     request: Request,  # http request
     file: Annotated[UploadFile, File()],  # the song in a file-like object
+    jobs: JobQueueDep,  # work done after the response is sent
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
     Upload a new song file.
+    The waveform, the loudness and the fingerprint are computed by background jobs,
+    after the response is sent: a song already in the catalog gets flagged as a duplicate.
+    Another job transcodes the lower bitrate renditions, the original is streamed until they're ready.
 
     \f
 
@@ -60,6 +96,8 @@ async def post_audio_song(
     :type song_id: int
     :param file: Song file
     :type file: UploadFile
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
     :return: The new created Song
     :rtype: SongPublic
     """
@@ -71,8 +109,9 @@ async def post_audio_song(
     if not db_song:
         raise HTTPException(404, detail="Song not found")
 
-    # create directory if it doesn't exists
-    os.makedirs(AUDIO_DIRECTORY, exist_ok=True)
+    # create directory if it doesn't exists, files are spread over sub directories
+    song_directory = os.path.dirname(shard_path(AUDIO_DIRECTORY, song_id, ""))
+    os.makedirs(song_directory, exist_ok=True)
 
     # we get current path
     base_dir = os.path.dirname(
@@ -81,26 +120,81 @@ async def post_audio_song(
 
     # get file extension, it contains the "."
     _, ext = os.path.splitext(file.filename)
-
-    song_path = os.path.join(
-        # base_dir, "..", "..", f"public/audio/{song_id}{ext}"
-        f"{AUDIO_DIRECTORY}/{song_id}{ext}"
-    )  # Construct the absolute path
-
-    # we save the song on disk
-    async with aiofiles.open(song_path, "wb") as out_file:
-        # the whole song is saved in memory first
-        content = await file.read()  # async read
-        await out_file.write(content)  # async write
-
-        # alternative way, save in chunks
-        # this way is better for videos or large files
-        # while content := await file.read(1024):  # async read chunk
-        #     await out_file.write(content)  # async write chunk
+    ext = ext.lower()
+
+    # we save the song on disk in chunks, hashing it on the way
+    part_path = os.path.join(song_directory, f"{song_id}.{uuid.uuid4().hex}.part")
+    content_hash = hashlib.sha256()
+    crc32 = 0
+    size = 0
+    try:
+        async with aiofiles.open(part_path, "wb") as out_file:
+            while content := await file.read(UPLOAD_CHUNK_SIZE):  # async read chunk
+                size += len(content)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(413, detail="File too large")
+                content_hash.update(content)
+                crc32 = zlib.crc32(content, crc32)  # for ZIP downloads
+                await out_file.write(content)  # async write chunk
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    # the name changes with the content: a file is never overwritten in place,
+    # so whoever cached the old asset finds it gone instead of reading a mix of both
+    content_hash = content_hash.hexdigest()
+    file_name = f"{song_id}-{content_hash[:16]}{ext}"
+    song_path = os.path.join(song_directory, file_name)
+    os.replace(part_path, song_path)
+
+    # build the seek index once here, so streams can map a time to a byte offset for free
+    seek_index = await run_in_threadpool(build_seek_index, song_path)
+    if seek_index:
+        await run_in_threadpool(save_seek_index, song_id, seek_index)
+    else:
+        delete_seek_index(song_id)
+
+    # record everything the stream and download routes need to know about the file
+    invalidate_media_asset(song_id)  # the cached row may be stale, ask the database
+    old_asset = await read_media_asset(session=session, song_id=song_id)
+    await upsert_media_asset(
+        session=session,
+        asset=MediaAssetCreate(
+            song_id=song_id,
+            path=song_path,
+            extension=ext,
+            mime_type=mimetypes.guess_type(file_name)[0] or file.content_type,
+            size=size,
+            mtime=os.path.getmtime(song_path),
+            content_hash=content_hash,
+            crc32=crc32,
+            duration=seek_index.duration if seek_index else None,
+            bitrate=seek_index.bitrate if seek_index else None,
+        ),
+    )
+    if old_asset and old_asset.path != song_path:
+        try:
+            os.remove(old_asset.path)
+        except FileNotFoundError:
+            pass
+
+    # the renditions of the old file are gone too, workers that cached them fall back to the original
+    await delete_media_assets(session=session, song_id=song_id, keep=["original"])
+    await run_in_threadpool(delete_renditions, song_id)
+
+    # decoding is CPU bound, the jobs run it in the process pool
+    # the waveform is on screen as soon as the song is, the rest can wait
+    analysis = {"song_id": song_id, "audio_path": song_path, "version": content_hash[:16]}
+    await jobs.enqueue(session, JobKind.WAVEFORM, analysis, Priority.MEDIUM)
+    await jobs.enqueue(session, JobKind.LOUDNESS, analysis, Priority.LOW)
+    await jobs.enqueue(session, JobKind.FINGERPRINT, analysis, Priority.LOW)
+    await jobs.enqueue(session, JobKind.TRANSCODE, analysis, Priority.MEDIUM)
 
     # we save the path to the song_url field
-    # db_song: SongPublic = await read_song(session=session, id=song_id)
-    file_url = request.url_for("public", path=f"audio/{song_id}{ext}")
+    file_url = request.url_for(
+        "public", path=f"audio/{shard_directory(song_id)}/{file_name}"
+    )
     db_song.song_url = str(file_url)
 
     return await update_song(session=session, id=song_id, song=db_song)
@@ -119,9 +213,11 @@ async def post_image_song(
     song_id: Annotated[int, Path()],  # the song ID
     request: Request,  # http request
     file: Annotated[UploadFile, File()],  # the song image in a file-like object
+    jobs: JobQueueDep,  # work done after the response is sent
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
     Upload a new song file.
+    Its resized variants and placeholders are made by a background job, after the response is sent.
 
     \f
 
@@ -131,6 +227,8 @@ async def post_image_song(
     :type song_id: int
     :param file: Song file
     :type file: UploadFile
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
     :return: The new created Song
     :rtype: SongPublic
     """
@@ -142,8 +240,11 @@ async def post_image_song(
     if not db_song:
         raise HTTPException(404, detail="Song not found")
 
-    # create directory if it doesn't exists
-    os.makedirs(IMAGE_DIRECTORY, exist_ok=True)
+    # song IDs overlap with album and playlist ones, the file name keeps them apart
+    file_key = variant_key("song", song_id)
+
+    # create directory if it doesn't exists, files are spread over sub directories
+    os.makedirs(os.path.dirname(shard_path(IMAGE_DIRECTORY, file_key, "")), exist_ok=True)
 
     # we get current path
     base_dir = os.path.dirname(
@@ -153,9 +254,9 @@ async def post_image_song(
     # get file extension, it contains the "."
     _, ext = os.path.splitext(file.filename)
 
-    image_path = os.path.join(
+    image_path = shard_path(
         # base_dir, "..", "..", f"public/audio/{song_id}{ext}"
-        f"{IMAGE_DIRECTORY}/{song_id}{ext}"
+        IMAGE_DIRECTORY, file_key, f"{file_key}{ext}"
     )  # Construct the absolute path
 
     # we save the song on disk
@@ -166,14 +267,33 @@ async def post_image_song(
 
         # alternative way, save in chunks
         # this way is better for videos or large files
+        content_hash = hashlib.sha256()  # versions the variants
         while content := await file.read(1024):  # async read chunk
+            content_hash.update(content)
             await out_file.write(content)  # async write chunk
 
-    # we save the path to the image_url field
-    file_url = request.url_for("public", path=f"image/{song_id}{ext}")
+    # we save the path to the image_url field, before the job checks it's still the image
+    file_url = request.url_for(
+        "public", path=f"image/{shard_directory(file_key)}/{file_key}{ext}"
+    )
     db_song.image_url = str(file_url)
+    db_song = await update_song(session=session, id=song_id, song=db_song)
 
-    return await update_song(session=session, id=song_id, song=db_song)
+    # phones get a 64px WebP instead of the 4000px PNG, the job resizes in the process pool
+    await jobs.enqueue(
+        session,
+        JobKind.IMAGE_VARIANTS,
+        {
+            "owner_kind": "song",
+            "owner_id": song_id,
+            "image_path": image_path,
+            "version": content_hash.hexdigest()[:16],
+            "public_url": str(request.url_for("public", path="")),
+        },
+        Priority.MEDIUM,
+    )
+
+    return db_song
 
 
 @router.post(
@@ -189,9 +309,11 @@ async def post_image_album(
     album_id: Annotated[int, Path()],  # the album ID
     request: Request,  # http request
     file: Annotated[UploadFile, File()],  # the album image in a file-like object
+    jobs: JobQueueDep,  # work done after the response is sent
 ) -> Any:  # returns Any because it gets overrided by the response_model
     """
     Upload a new album file.
+    Its resized variants and placeholders are made by a background job, after the response is sent.
 
     \f
 
@@ -201,6 +323,8 @@ async def post_image_album(
     :type album_id: int
     :param file: Album image
     :type file: UploadFile
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
     :return: The new created album
     :rtype: AlbumPublic
     """
@@ -212,8 +336,11 @@ async def post_image_album(
     if not db_album:
         raise HTTPException(404, detail="Album not found")
 
-    # create directory if it doesn't exists
-    os.makedirs(IMAGE_DIRECTORY, exist_ok=True)
+    # album IDs overlap with song and playlist ones, the file name keeps them apart
+    file_key = variant_key("album", album_id)
+
+    # create directory if it doesn't exists, files are spread over sub directories
+    os.makedirs(os.path.dirname(shard_path(IMAGE_DIRECTORY, file_key, "")), exist_ok=True)
 
     # we get current path
     base_dir = os.path.dirname(
@@ -223,8 +350,8 @@ async def post_image_album(
     # get file extension, it contains the "."
     _, ext = os.path.splitext(file.filename)
 
-    image_path = os.path.join(
-        f"{IMAGE_DIRECTORY}/{album_id}{ext}"
+    image_path = shard_path(
+        IMAGE_DIRECTORY, file_key, f"{file_key}{ext}"
     )  # Construct the absolute path
 
     # we save the song on disk
@@ -233,8 +360,110 @@ async def post_image_album(
         content = await file.read()  # async read
         await out_file.write(content)  # async write
 
-    # we save the path to the image_url field
-    file_url = request.url_for("public", path=f"image/{album_id}{ext}")
+    # we save the path to the image_url field, before the job checks it's still the image
+    file_url = request.url_for(
+        "public", path=f"image/{shard_directory(file_key)}/{file_key}{ext}"
+    )
     db_album.image_url = str(file_url)
+    db_album = await update_album(session=session, id=album_id, album=db_album)
+
+    # phones get a 64px WebP instead of the 4000px PNG, the job resizes in the process pool
+    await jobs.enqueue(
+        session,
+        JobKind.IMAGE_VARIANTS,
+        {
+            "owner_kind": "album",
+            "owner_id": album_id,
+            "image_path": image_path,
+            "version": hashlib.sha256(content).hexdigest()[:16],
+            "public_url": str(request.url_for("public", path="")),
+        },
+        Priority.MEDIUM,
+    )
+
+    return db_album
+
+
+@router.post(
+    "/image/playlist/{playlist_id}",  # endpoint url after the prefix specified earlier
+    dependencies=[
+        Security(get_current_active_user, scopes=[Scope.ITEMS_CREATE])
+    ],  # security check, user needs to have permissions to interact with this endpoint
+    response_model=PlaylistPublic,  # the model used to format the response
+    status_code=201,  # HTTP status code returned if no errors occur
+)
+async def post_image_playlist(
+    session: SessionDep,  # request must pass a JWT, with this dependency we extract its data to verify the user
+    playlist_id: Annotated[int, Path()],  # the playlist ID
+    request: Request,  # http request
+    file: Annotated[UploadFile, File()],  # the playlist image in a file-like object
+    jobs: JobQueueDep,  # work done after the response is sent
+) -> Any:  # returns Any because it gets overrided by the response_model
+    """
+    Upload a new playlist image.
+    Its resized variants and placeholders are made by a background job, after the response is sent.
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param playlist_id: Playlist's ID
+    :type playlist_id: int
+    :param file: Playlist image
+    :type file: UploadFile
+    :param jobs: Queue of the background jobs
+    :type jobs: JobQueue
+    :return: The updated playlist
+    :rtype: PlaylistPublic
+    """
+    # validate file
+    validate_image_file(file)
+
+    # check if playlist record exists in db
+    db_playlist = await read_image_owner(
+        session=session, owner_kind="playlist", owner_id=playlist_id
+    )
+    if not db_playlist:
+        raise HTTPException(404, detail="Playlist not found")
+
+    # playlist IDs overlap with song and album ones, the file name keeps them apart
+    file_key = variant_key("playlist", playlist_id)
+    os.makedirs(os.path.dirname(shard_path(IMAGE_DIRECTORY, file_key, "")), exist_ok=True)
+
+    # get file extension, it contains the "."
+    _, ext = os.path.splitext(file.filename)
+
+    image_path = shard_path(IMAGE_DIRECTORY, file_key, f"{file_key}{ext}")
+
+    # we save the image on disk in chunks, hashing it on the way
+    content_hash = hashlib.sha256()  # versions the variants
+    async with aiofiles.open(image_path, "wb") as out_file:
+        while content := await file.read(UPLOAD_CHUNK_SIZE):  # async read chunk
+            content_hash.update(content)
+            await out_file.write(content)  # async write chunk
 
-    return await update_album(session=session, id=album_id, album=db_album)
+    # we save the path to the image_url field, before the job checks it's still the image
+    file_url = request.url_for(
+        "public", path=f"image/{shard_directory(file_key)}/{file_key}{ext}"
+    )
+    db_playlist = await update_playlist(
+        session=session,
+        id=playlist_id,
+        playlist=PlaylistUpdate(image_url=str(file_url)),
+    )
+
+    # phones get a 64px WebP instead of the 4000px PNG, the job resizes in the process pool
+    await jobs.enqueue(
+        session,
+        JobKind.IMAGE_VARIANTS,
+        {
+            "owner_kind": "playlist",
+            "owner_id": playlist_id,
+            "image_path": image_path,
+            "version": content_hash.hexdigest()[:16],
+            "public_url": str(request.url_for("public", path="")),
+        },
+        Priority.MEDIUM,
+    )
+
+    return db_playlist
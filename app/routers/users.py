@@ -1,16 +1,23 @@
+from datetime import datetime, timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Security
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, Security
 from sqlmodel import Session, select
 
 from ..commons.common_query_params import CommonQueryParams
+from ..commons.constants import PLAY_HISTORY_DEFAULT_DAYS, RECENT_PLAYS_SIZE
 from ..commons.enums import Scope
 from ..core.auth_utils import get_current_active_user
 from ..core.database import get_session
+from ..core.recent_plays import RecentPlayStore, get_recent_play_store
+from ..crud.play_events import read_play_history
 from ..crud.users import create_user, delete_user, read_user, read_users, update_user
+from ..models.play_event_model import PlayEventPublic
+from ..models.recent_play_model import RecentPlayPublic, RecentPlayUpdate
 from ..models.user_model import User, UserCreate, UserPublic, UserUpdate
 
 SessionDep = Annotated[Session, Depends(get_session)]
+RecentPlaysDep = Annotated[RecentPlayStore, Depends(get_recent_play_store)]
 
 router = APIRouter(
     prefix="/users",
@@ -68,6 +75,147 @@ async def get_users(
     return await read_users(session=session, params=params)
 
 
+@router.get(
+    "/me/plays",
+    response_model=list[PlayEventPublic],
+    status_code=200,
+)
+async def get_my_plays(
+    session: SessionDep,
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],
+    params: CommonQueryParams = Depends(),
+    since: Annotated[datetime | None, Query()] = None,
+    until: Annotated[datetime | None, Query()] = None,
+) -> Any:
+    """
+    Get the play history of the current user, newest first.
+    Without "since", the last days only: a bounded range only reads the partitions it covers.
+    The declaration order matters: this route must come before "/{user_id}".
+
+    \f
+
+    :param session: SQLModel session
+    :type session: Session
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param params: Common parameters for pagination
+    :type params: CommonParams
+    :param since: Oldest play, included
+    :type since: datetime | None
+    :param until: Newest play, excluded, now by default
+    :type until: datetime | None
+    :return: List of plays
+    :rtype: list[PlayEventPublic]
+    """
+    until = until or datetime.now()
+    since = since or until - timedelta(days=PLAY_HISTORY_DEFAULT_DAYS)
+    if since >= until:
+        raise HTTPException(status_code=422, detail="since must be before until")
+
+    return await read_play_history(
+        session=session, user_id=current_user.id, since=since, until=until, params=params
+    )
+
+
+@router.get(
+    "/me/recent",
+    response_model=list[RecentPlayPublic],
+    status_code=200,
+)
+async def get_my_recent_plays(
+    recent_plays: RecentPlaysDep,
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],
+    limit: Annotated[int, Query(ge=1, le=RECENT_PLAYS_SIZE)] = RECENT_PLAYS_SIZE,
+) -> Any:
+    """
+    Get the songs the current user played last and where they stopped, most recent first.
+    Read from memory, the database is only read the first time a worker serves the user.
+    The declaration order matters: this route must come before "/{user_id}".
+
+    \f
+
+    :param recent_plays: The recent plays of the users
+    :type recent_plays: RecentPlayStore
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param limit: Number of songs
+    :type limit: int
+    :return: List of recent plays
+    :rtype: list[RecentPlayPublic]
+    """
+    return await recent_plays.recent(current_user.id, limit)
+
+
+@router.get(
+    "/me/recent/{song_id}",
+    response_model=RecentPlayPublic,
+    status_code=200,
+)
+async def get_my_resume_position(
+    recent_plays: RecentPlaysDep,
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_READ])
+    ],
+    song_id: Annotated[int, Path()],
+) -> Any:
+    """
+    Get where the current user stopped in a song, to resume it.
+
+    \f
+
+    :param recent_plays: The recent plays of the users
+    :type recent_plays: RecentPlayStore
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param song_id: Song's ID
+    :type song_id: int
+    :return: The recent play of the song
+    :rtype: RecentPlayPublic
+    """
+    recent_play = await recent_plays.resume(current_user.id, song_id)
+    if recent_play is None:
+        raise HTTPException(status_code=404, detail="Song not recently played")
+    return recent_play
+
+
+@router.put(
+    "/me/recent/{song_id}",
+    response_model=RecentPlayPublic,
+    status_code=200,
+)
+async def put_my_resume_position(
+    recent_plays: RecentPlaysDep,
+    current_user: Annotated[
+        UserPublic, Security(get_current_active_user, scopes=[Scope.ITEMS_UPDATE])
+    ],
+    song_id: Annotated[int, Path()],
+    recent_play: Annotated[RecentPlayUpdate, Body()],
+) -> Any:
+    """
+    Save where the current user is in a song, players send it every few seconds.
+    It's written to the database in the background, the request doesn't wait for it.
+
+    \f
+
+    :param recent_plays: The recent plays of the users
+    :type recent_plays: RecentPlayStore
+    :param current_user: The authenticated user
+    :type current_user: UserPublic
+    :param song_id: Song's ID
+    :type song_id: int
+    :param recent_play: The position in the song
+    :type recent_play: RecentPlayUpdate
+    :return: The recent play of the song
+    :rtype: RecentPlayPublic
+    """
+    recent_plays.record(current_user.id, song_id, recent_play.position)
+    return await recent_plays.resume(current_user.id, song_id)
+
+
 @router.get(
     "/{user_id}",
     dependencies=[Security(get_current_active_user, scopes=[Scope.USERS_READ])],
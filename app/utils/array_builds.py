@@ -0,0 +1,68 @@
+import os
+import shutil
+import time
+
+import numpy as np
+
+# builds kept besides the current one, workers that mapped them keep their pages anyway
+_PREVIOUS_BUILDS = 1
+
+
+def save_build(directory: str, arrays: dict[str, np.ndarray]) -> str:
+    """
+    Write a set of arrays built together as a new build of "directory".
+
+    Every build gets its own sub directory and "directory/current" is a symlink to the
+    last one, switched by a single rename: a worker loading the arrays sees the previous
+    build or the new one, never the files of one mixed with the files of the other.
+
+    \f
+
+    :param directory: Where the builds are stored
+    :type directory: str
+    :param arrays: The arrays, by name
+    :type arrays: dict[str, np.ndarray]
+    :return: The build's ID, a timestamp in nanoseconds
+    :rtype: str
+    """
+    builds = os.path.join(directory, "builds")
+    build_id = str(time.time_ns())
+    build = os.path.join(builds, build_id)
+    os.makedirs(build)
+    for name, array in arrays.items():
+        np.save(os.path.join(build, f"{name}.npy"), array)
+
+    current = os.path.join(directory, "current")
+    os.symlink(os.path.join("builds", build_id), f"{current}.{build_id}.tmp")
+    os.replace(f"{current}.{build_id}.tmp", current)
+
+    for old_id in sorted(os.listdir(builds), key=int)[: -1 - _PREVIOUS_BUILDS]:
+        shutil.rmtree(os.path.join(builds, old_id), ignore_errors=True)
+    return build_id
+
+
+def load_build(
+    directory: str, names: tuple[str, ...]
+) -> tuple[str, list[np.ndarray]] | None:
+    """
+    Memory map the arrays of the current build of "directory", see save_build.
+
+    \f
+
+    :param directory: Where the builds are stored
+    :type directory: str
+    :param names: The arrays to map
+    :type names: tuple[str, ...]
+    :return: The build's ID and the arrays, None if nothing was built yet
+    :rtype: tuple[str, list[np.ndarray]] | None
+    """
+    try:
+        # resolved once, the link may be switched while we map the files
+        build_id = os.path.basename(os.readlink(os.path.join(directory, "current")))
+        build = os.path.join(directory, "builds", build_id)
+        arrays = [
+            np.load(os.path.join(build, f"{name}.npy"), mmap_mode="r") for name in names
+        ]
+    except FileNotFoundError:
+        return None
+    return build_id, arrays
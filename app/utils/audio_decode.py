@@ -0,0 +1,120 @@
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+
+class AudioDecodeError(Exception):
+    """
+    The file couldn't be decoded: unsupported format without ffmpeg, or a corrupted file.
+    """
+
+
+def _decode_with_ffmpeg(
+    path: str,
+    sample_rate: int | None,
+    channels: int | None,
+) -> tuple[np.ndarray, int]:
+    probe = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=sample_rate,channels", "-of", "csv=p=0", path,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if probe.returncode != 0 or not probe.stdout.strip():
+        raise AudioDecodeError(f"Can't probe {path}: {probe.stderr.strip()}")
+    native_rate, native_channels = (int(value) for value in probe.stdout.split(",")[:2])
+
+    sample_rate = sample_rate or native_rate
+    channels = channels or native_channels
+    decoded = subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-i", path, "-vn",
+            "-ac", str(channels), "-ar", str(sample_rate), "-f", "s16le", "-",
+        ],
+        capture_output=True,
+    )
+    if decoded.returncode != 0:
+        raise AudioDecodeError(f"Can't decode {path}: {decoded.stderr.decode().strip()}")
+
+    samples = np.frombuffer(decoded.stdout, dtype="<i2").astype(np.float32) / 32768
+    return samples.reshape(-1, channels), sample_rate
+
+
+def _decode_wav(path: str) -> tuple[np.ndarray, int]:
+    try:
+        with wave.open(path, "rb") as wav_file:
+            channels = wav_file.getnchannels()
+            width = wav_file.getsampwidth()
+            sample_rate = wav_file.getframerate()
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError) as exc:
+        raise AudioDecodeError(f"Can't decode {path}: {exc}")
+
+    if width == 1:  # 8 bits PCM is unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:  # 24 bits, widened to 32 bits
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view("<i4").ravel().astype(np.float32) / 2**31
+    elif width in (2, 4):
+        samples = np.frombuffer(frames, dtype=f"<i{width}").astype(np.float32)
+        samples /= 2 ** (8 * width - 1)
+    else:
+        raise AudioDecodeError(f"Can't decode {path}: {width * 8} bits samples")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def _resample(samples: np.ndarray, rate: int, new_rate: int) -> np.ndarray:
+    # linear interpolation, good enough for analysis (it's never played back)
+    length = int(len(samples) * new_rate / rate)
+    positions = np.arange(length) * (rate / new_rate)
+    return np.stack(
+        [
+            np.interp(positions, np.arange(len(samples)), channel)
+            for channel in samples.T
+        ],
+        axis=1,
+    ).astype(np.float32)
+
+
+def decode_audio(
+    path: str,
+    sample_rate: int | None = None,
+    channels: int | None = None,
+) -> tuple[np.ndarray, int]:
+    """
+    Decode an audio file to float samples in [-1, 1].
+
+    Every format goes through ffmpeg when it's installed, otherwise only PCM WAV files
+    can be decoded. It's CPU bound: run it in the process pool.
+
+    \f
+
+    :param path: Path of the audio file
+    :type path: str
+    :param sample_rate: Sample rate to convert to, None to keep the file's one
+    :type sample_rate: int | None
+    :param channels: Number of channels to mix to, None to keep the file's ones
+    :type channels: int | None
+    :return: The samples, shaped (frames, channels), and their sample rate
+    :rtype: tuple[np.ndarray, int]
+    :raises AudioDecodeError: If the file can't be decoded
+    """
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        return _decode_with_ffmpeg(path, sample_rate, channels)
+
+    samples, native_rate = _decode_wav(path)
+    if channels == 1 and samples.shape[1] > 1:
+        samples = samples.mean(axis=1, keepdims=True)
+    elif channels is not None and channels != samples.shape[1]:
+        raise AudioDecodeError(f"Can't mix {path} to {channels} channels without ffmpeg")
+
+    if sample_rate and sample_rate != native_rate:
+        return _resample(samples, native_rate, sample_rate), sample_rate
+    return samples, native_rate
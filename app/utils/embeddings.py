@@ -0,0 +1,334 @@
+import numpy as np
+
+from fastapi import Request
+
+from .array_builds import load_build, save_build
+
+_INDEX_FILES = ("song_ids", "vectors", "offsets", "centroids", "keys", "positions")
+
+_CHUNK_ROWS = 65536  # vectors scored at once when training and when searching exhaustively
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    The vectors scaled to a norm of 1, as float32: their dot products are cosine similarities.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    The index of the most similar centroid of every vector, a chunk of vectors at a time.
+    """
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _CHUNK_ROWS):
+        chunk = vectors[start : start + _CHUNK_ROWS]
+        labels[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    lists: int,
+    iterations: int = 10,
+    sample: int | None = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical k-means: "lists" unit centroids splitting normalized vectors into cells.
+
+    Trained on a random "sample" of the vectors (64 per list by default), which is plenty
+    for the cells of an inverted file: they only have to be balanced, not exact.
+
+    \f
+
+    :param vectors: Normalized vectors
+    :type vectors: np.ndarray
+    :param lists: Number of centroids
+    :type lists: int
+    :param iterations: Lloyd iterations
+    :type iterations: int
+    :param sample: Vectors trained on, at most
+    :type sample: int | None
+    :param seed: Seed of the sampling and of the initial centroids
+    :type seed: int
+    :return: The centroids, one per row
+    :rtype: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    sample = min(len(vectors), sample or lists * 64)
+    training = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+    centroids = training[rng.choice(len(training), lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = nearest_centroids(training, centroids)
+        order = np.argsort(labels, kind="stable")
+        members, starts = np.unique(labels[order], return_index=True)
+        sums = np.add.reduceat(training[order], starts, axis=0)
+        centroids[members] = normalize(sums)
+
+        # a cell nobody falls in is moved onto a random vector
+        empty = np.setdiff1d(np.arange(lists), members)
+        centroids[empty] = training[rng.choice(len(training), len(empty), replace=False)]
+    return centroids
+
+
+def _top_k(
+    query_indexes: np.ndarray, rows: np.ndarray, scores: np.ndarray, queries: int, k: int
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    # the best k (row, score) of every query among candidates, best first: one sort on the
+    # query plus a decreasing function of the score in [0, 0.5], like cooccurrence_neighbors
+    keys = query_indexes + (1.0 - scores.astype(np.float64)) / 4.0
+    order = np.argsort(keys, kind="stable")
+    query_indexes = query_indexes[order]
+    counts = np.bincount(query_indexes, minlength=queries)
+    starts = np.cumsum(counts) - counts
+    return [
+        (rows[order[start : start + min(count, k)]], scores[order[start : start + min(count, k)]])
+        for start, count in zip(starts.tolist(), counts.tolist())
+    ]
+
+
+class SongEmbeddings:
+    """
+    Song vectors and an inverted file (IVF) index to find the nearest ones, in NumPy only.
+
+    The vectors are normalized float32 rows, so similarity is a dot product. They're
+    grouped in cells around "lists" centroids trained by spherical k-means and stored
+    contiguously cell by cell: a search scores the query against the centroids, then
+    only against the vectors of the "nprobe" nearest cells, a few matrix products instead
+    of one over the whole catalog. More cells probed, better recall, slower search.
+
+    It's built offline by "scripts/build_song_embeddings.py" and memory mapped, so every
+    worker shares the same pages. Workers pick a new index up at their next start.
+
+    \f
+
+    :param directory: Where the index is stored
+    :type directory: str
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._song_ids = np.empty(0, np.int64)  # in the order of the vectors
+        self._vectors = np.empty((0, 0), np.float32)
+        self._offsets = np.zeros(1, np.int64)  # the vectors of cell i are offsets[i]:offsets[i + 1]
+        self._centroids = np.empty((0, 0), np.float32)
+        self._keys = np.empty(0, np.int64)  # the song IDs sorted
+        self._positions = np.empty(0, np.int64)  # the row of the vector of every key
+
+    def load(self) -> None:
+        build = load_build(self.directory, _INDEX_FILES)
+        if build is None:
+            return
+        _, arrays = build
+        # plain arrays over the same mapping, a memmap costs microseconds per operation
+        (
+            self._song_ids,
+            self._vectors,
+            self._offsets,
+            self._centroids,
+            self._keys,
+            self._positions,
+        ) = (array.view(np.ndarray) for array in arrays)
+
+    def __len__(self) -> int:
+        return len(self._song_ids)
+
+    @property
+    def lists(self) -> int:
+        return len(self._centroids)
+
+    @staticmethod
+    def build(
+        directory: str,
+        song_ids: np.ndarray,
+        vectors: np.ndarray,
+        lists: int | None = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> dict:
+        """
+        Write the index of the vectors of the songs, about sqrt(songs) cells by default.
+        """
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        vectors = normalize(vectors)
+        lists = max(1, min(len(vectors), lists or int(np.sqrt(len(vectors)))))
+
+        centroids = train_centroids(vectors, lists, iterations, seed=seed)
+        labels = nearest_centroids(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=lists))))
+        song_ids = song_ids[order]
+        keys_order = np.argsort(song_ids, kind="stable")
+
+        arrays = (
+            song_ids,
+            np.ascontiguousarray(vectors[order]),
+            offsets.astype(np.int64),
+            centroids,
+            song_ids[keys_order],
+            keys_order.astype(np.int64),
+        )
+        save_build(directory, dict(zip(_INDEX_FILES, arrays)))
+        return {
+            "songs": len(song_ids),
+            "lists": lists,
+            "dimensions": vectors.shape[1],
+            "largest_list": int(np.diff(offsets).max()),
+            "bytes": sum(array.nbytes for array in arrays),
+        }
+
+    def vectors_of(self, song_ids: list[int]) -> tuple[list[int], np.ndarray]:
+        """
+        The vectors of the songs in the index, and their IDs: the others are left out.
+        """
+        ids = np.asarray(song_ids, dtype=np.int64)
+        indexes = np.minimum(self._keys.searchsorted(ids), max(len(self._keys) - 1, 0))
+        found = self._keys[indexes] == ids if len(self._keys) else np.zeros(len(ids), bool)
+        rows = self._positions[indexes[found]]
+        return ids[found].tolist(), self._vectors[rows]
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        nprobe: int = 16,
+        exclude: list[set[int]] | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        The (song_id, similarity) of the k nearest songs of every query vector, best first.
+
+        The queries probing the same cell are scored against it together, one matrix product
+        per cell, and only the best candidates of every cell are kept for the final sort.
+
+        \f
+
+        :param queries: Query vectors, one per row, normalized
+        :type queries: np.ndarray
+        :param k: Songs per query
+        :type k: int
+        :param nprobe: Cells searched per query
+        :type nprobe: int
+        :param exclude: Songs left out of the results, per query
+        :type exclude: list[set[int]] | None
+        :return: The nearest songs of every query
+        :rtype: list[list[tuple[int, float]]]
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not len(self) or not len(queries):
+            return [[] for _ in queries]
+
+        # a bit more than k, the excluded songs may be among them
+        wanted = k + max((len(songs) for songs in exclude or ()), default=0)
+        nprobe = min(nprobe, self.lists)
+        centroid_scores = queries @ self._centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        cells = probes.ravel()
+        order = np.argsort(cells, kind="stable")
+        cells, probing = cells[order], np.repeat(np.arange(len(queries)), nprobe)[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+
+        candidates = ([], [], [])
+        for start, end in zip(
+            np.concatenate(([0], bounds)).tolist(), np.concatenate((bounds, [len(cells)])).tolist()
+        ):
+            cell = cells[start]
+            low, high = int(self._offsets[cell]), int(self._offsets[cell + 1])
+            if low == high:
+                continue
+            query_indexes = probing[start:end]
+            scores = queries[query_indexes] @ self._vectors[low:high].T
+            if high - low > wanted:
+                best = np.argpartition(-scores, wanted - 1, axis=1)[:, :wanted]
+                scores = np.take_along_axis(scores, best, axis=1)
+            else:
+                best = np.broadcast_to(np.arange(high - low), scores.shape)
+            candidates[0].append(np.repeat(query_indexes, best.shape[1]))
+            candidates[1].append((best + low).ravel())
+            candidates[2].append(scores.ravel())
+
+        if not candidates[0]:
+            return [[] for _ in queries]
+        return self._results(
+            _top_k(*(np.concatenate(parts) for parts in candidates), len(queries), wanted),
+            k,
+            exclude,
+        )
+
+    def brute_force(
+        self, queries: np.ndarray, k: int, exclude: list[set[int]] | None = None
+    ) -> list[list[tuple[int, float]]]:
+        """
+        The exact k nearest songs of every query, scored against every vector: the reference
+        the recall of "search" is measured against.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not len(self) or not len(queries):
+            return [[] for _ in queries]
+
+        wanted = k + max((len(songs) for songs in exclude or ()), default=0)
+        candidates = ([], [], [])
+        for low in range(0, len(self), _CHUNK_ROWS):
+            scores = queries @ self._vectors[low : low + _CHUNK_ROWS].T
+            count = min(wanted, scores.shape[1])
+            best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            candidates[0].append(np.repeat(np.arange(len(queries)), count))
+            candidates[1].append((best + low).ravel())
+            candidates[2].append(np.take_along_axis(scores, best, axis=1).ravel())
+        return self._results(
+            _top_k(*(np.concatenate(parts) for parts in candidates), len(queries), wanted),
+            k,
+            exclude,
+        )
+
+    def similar(
+        self, song_ids: list[int], k: int, nprobe: int = 16
+    ) -> dict[int, list[tuple[int, float]]]:
+        """
+        The k songs nearest to each of the songs, in one batch. Songs without a vector are left out.
+        """
+        found, queries = self.vectors_of(song_ids)
+        results = self.search(queries, k, nprobe, exclude=[{song_id} for song_id in found])
+        return dict(zip(found, results))
+
+    def recommend(
+        self, song_ids: list[int], k: int, nprobe: int = 16
+    ) -> list[tuple[int, float]]:
+        """
+        The k songs nearest to the average of the songs, of a playlist for example,
+        the songs themselves left out.
+        """
+        found, vectors = self.vectors_of(song_ids)
+        if not found:
+            return []
+        query = normalize(vectors.mean(axis=0))
+        return self.search(query, k, nprobe, exclude=[set(song_ids)])[0]
+
+    def _results(
+        self,
+        best: list[tuple[np.ndarray, np.ndarray]],
+        k: int,
+        exclude: list[set[int]] | None,
+    ) -> list[list[tuple[int, float]]]:
+        results = []
+        for index, (rows, scores) in enumerate(best):
+            excluded = exclude[index] if exclude else ()
+            results.append(
+                [
+                    (song_id, score)
+                    for song_id, score in zip(self._song_ids[rows].tolist(), scores.tolist())
+                    if song_id not in excluded
+                ][:k]
+            )
+        return results
+
+
+def get_song_embeddings(request: Request) -> SongEmbeddings:
+    """
+    Returns the index loaded in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.song_embeddings
@@ -1,7 +1,9 @@
+import hashlib
 import os
+import zlib
 
 from fastapi import UploadFile, File, HTTPException
-from typing import Annotated
+from typing import Annotated, BinaryIO
 
 from ..commons.constants import (
     ALLOWED_AUDIO_MIME_TYPES,
@@ -31,3 +33,61 @@ def validate_image_file(file: UploadFile):
     _, ext = os.path.splitext(file.filename)
     if ext.lower() not in ALLOWED_IMAGE_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Unsupported file extension.")
+
+
+def shard_directory(key: int | str) -> str:
+    """
+    Two levels of sub directories for the files of "key", e.g. "3c/59".
+
+    The levels come from a hash of the key, so files spread evenly over 65536 directories
+    whatever the IDs look like, and every file of the same entity ends up together.
+
+    \f
+
+    :param key: What the file belongs to, usually the ID of a song or an album
+    :type key: int | str
+    :return: Relative directory, with "/" as separator so it's usable in URLs too
+    :rtype: str
+    """
+    digest = hashlib.md5(str(key).encode(), usedforsecurity=False).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def shard_path(directory: str, key: int | str, file_name: str) -> str:
+    """
+    Path of "file_name" in the sharded layout of "directory".
+    """
+    return os.path.join(directory, shard_directory(key), file_name)
+
+
+def open_sharded(directory: str, key: int | str, file_name: str) -> BinaryIO:
+    """
+    Open a file stored either in the sharded layout or, if not migrated yet, directly in "directory".
+
+    \f
+
+    :param directory: Base directory, e.g. AUDIO_DIRECTORY
+    :type directory: str
+    :param key: What the file belongs to
+    :type key: int | str
+    :param file_name: Name of the file
+    :type file_name: str
+    :return: The file opened in binary mode
+    :rtype: BinaryIO
+    :raises FileNotFoundError: If the file is in neither layout
+    """
+    try:
+        return open(shard_path(directory, key, file_name), "rb")
+    except FileNotFoundError:
+        return open(os.path.join(directory, file_name), "rb")
+
+
+def file_crc32(file: BinaryIO, chunk_size: int = 1024 * 1024) -> int:
+    """
+    CRC-32 of an opened file, read from the start in chunks. It blocks, run it in a thread.
+    """
+    file.seek(0)
+    crc32 = 0
+    while chunk := file.read(chunk_size):
+        crc32 = zlib.crc32(chunk, crc32)
+    return crc32
@@ -0,0 +1,412 @@
+import contextlib
+import glob
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from scipy import ndimage
+from sqlmodel import Session
+
+from ..commons.constants import (
+    FINGERPRINT_DIRECTORY,
+    FINGERPRINT_INDEX_DIRECTORY,
+    FINGERPRINT_MIN_MATCHES,
+)
+from ..core.jobs import JobRejected
+from ..core.process_pool import run_in_process
+from .array_builds import load_build, save_build
+from .audio_decode import AudioDecodeError, decode_audio
+from .file_utils import shard_path
+
+_SAMPLE_RATE = 11025
+_FFT_SIZE = 1024  # 93ms windows, 512 frequency bins
+_HOP = 512  # 46ms between frames
+_PEAK_NEIGHBORHOOD = (21, 15)  # (bins, frames) a peak must dominate
+_PEAK_MIN_DB = -60.0  # below the loudest bin of the song
+_PEAK_ABOVE_FLOOR_DB = 20.0  # above the median of its frame, so noise makes no peaks
+_FAN_OUT = 5  # pairs made with every anchor peak
+_MAX_DELTA = 63  # frames between paired peaks, 6 bits
+
+_INDEX_FILES = ("hashes", "song_ids", "offsets", "since")
+
+
+def spectrogram_peaks(samples: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The "constellation" of a song: local maxima of its spectrogram.
+
+    \f
+
+    :param samples: Mono samples at 11025 Hz
+    :type samples: np.ndarray
+    :return: Frames and frequency bins of the peaks, sorted by frame
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    samples = np.asarray(samples, dtype=np.float32).ravel()
+    if len(samples) < _FFT_SIZE:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    # every frame is a strided view of the samples, the FFT is done on all of them at once
+    frames = np.lib.stride_tricks.sliding_window_view(samples, _FFT_SIZE)[::_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(_FFT_SIZE), axis=1))[:, :512]
+    decibels = 20 * np.log10(spectrum.T + 1e-10)  # (bins, frames)
+
+    local_max = ndimage.maximum_filter(decibels, size=_PEAK_NEIGHBORHOOD) == decibels
+    loud = decibels > decibels.max() + _PEAK_MIN_DB
+    loud &= decibels > np.median(decibels, axis=0) + _PEAK_ABOVE_FLOOR_DB
+    bins, frame_indexes = np.nonzero(local_max & loud)
+
+    order = np.argsort(frame_indexes, kind="stable")
+    return frame_indexes[order], bins[order]
+
+
+def peak_hashes(frames: np.ndarray, bins: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hash every peak with the next ones: frequency of both and the time between them.
+
+    A hash doesn't depend on where the song starts nor on its volume, so the same
+    recording in another format, bitrate or with some silence trimmed gives the same hashes.
+
+    \f
+
+    :param frames: Frames of the peaks, sorted
+    :type frames: np.ndarray
+    :param bins: Frequency bins of the peaks
+    :type bins: np.ndarray
+    :return: The 24 bits hashes and the frame of their anchor peak
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    hashes, offsets = [], []
+    for distance in range(1, _FAN_OUT + 1):
+        deltas = frames[distance:] - frames[:-distance]
+        valid = (deltas > 0) & (deltas <= _MAX_DELTA)
+        anchors = np.nonzero(valid)[0]
+        hashes.append(
+            (bins[anchors] << 15) | (bins[anchors + distance] << 6) | deltas[anchors]
+        )
+        offsets.append(frames[anchors])
+
+    return (
+        np.concatenate(hashes).astype(np.uint32),
+        np.minimum(np.concatenate(offsets), 0xFFFF).astype(np.uint16),
+    )
+
+
+def fingerprint_path(song_id: int, version: str) -> str:
+    # versioned by the audio content, like the waveform
+    return shard_path(FINGERPRINT_DIRECTORY, song_id, f"{song_id}-{version}.fp")
+
+
+def write_fingerprint(path: str, hashes: np.ndarray, offsets: np.ndarray) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(hashes.astype("<u4").tobytes())
+        file.write(offsets.astype("<u2").tobytes())
+    os.replace(f"{path}.tmp", path)
+
+
+def read_fingerprint(path: str) -> tuple[np.ndarray, np.ndarray] | None:
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+
+    count = len(data) // 6
+    return (
+        np.frombuffer(data, dtype="<u4", count=count),
+        np.frombuffer(data, dtype="<u2", count=count, offset=4 * count),
+    )
+
+
+def compute_fingerprint(
+    audio_path: str,
+    output_path: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decode a song, fingerprint it and store the fingerprint. It runs in the process pool.
+
+    \f
+
+    :param audio_path: Path of the audio file
+    :type audio_path: str
+    :param output_path: Where the fingerprint is written
+    :type output_path: str
+    :return: The hashes and their offsets
+    :rtype: tuple[np.ndarray, np.ndarray]
+    :raises AudioDecodeError: If the file can't be decoded
+    """
+    samples, _ = decode_audio(audio_path, sample_rate=_SAMPLE_RATE, channels=1)
+    hashes, offsets = peak_hashes(*spectrogram_peaks(samples))
+    write_fingerprint(output_path, hashes, offsets)
+    return hashes, offsets
+
+
+class FingerprintIndex:
+    """
+    Inverted index of the fingerprint hashes of the catalog: hash -> (song, offset).
+
+    The bulk of the index is three sorted arrays built offline by
+    "scripts/build_fingerprint_index.py" and memory mapped, so every worker shares the
+    same pages. Songs uploaded since then are kept in a small in-memory part that is
+    searched too: each worker adds what it fingerprints, and catches up with what the
+    other workers fingerprinted from the files they stored (see "sync").
+
+    A match is a song sharing many hashes with the query at the same time shift:
+    random collisions are spread over many shifts, the same recording piles up on one.
+
+    \f
+
+    :param directory: Where the offline index is stored
+    :type directory: str
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._hashes = np.empty(0, np.uint32)
+        self._song_ids = np.empty(0, np.int32)
+        self._offsets = np.empty(0, np.uint16)
+
+        self.since = 0.0  # files uploaded since then aren't in the bulk
+
+        self._recent: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._recent_arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._versions: dict[int, str] = {}  # version of the fingerprints in the recent part
+        self._hidden: set[int] = set()  # songs whose entries in the bulk are stale
+
+    def load(self) -> None:
+        build = load_build(self.directory, _INDEX_FILES)
+        if build is None:
+            return
+        _, (self._hashes, self._song_ids, self._offsets, since) = build
+        self.since = float(since[0])
+
+    def __len__(self) -> int:
+        return len(self._hashes) + sum(len(hashes) for hashes, _ in self._recent.values())
+
+    @staticmethod
+    def build(
+        directory: str,
+        fingerprints: list[tuple[int, np.ndarray, np.ndarray]],
+        since: float,
+    ) -> None:
+        """
+        Write the offline index of (song_id, hashes, offsets) fingerprints, made from the
+        files uploaded before "since" (a UNIX timestamp): the workers catch up with the rest.
+        """
+        hashes = np.concatenate([item[1] for item in fingerprints]).astype(np.uint32)
+        song_ids = np.repeat(
+            np.array([item[0] for item in fingerprints], dtype=np.int32),
+            [len(item[1]) for item in fingerprints],
+        )
+        offsets = np.concatenate([item[2] for item in fingerprints]).astype(np.uint16)
+
+        order = np.argsort(hashes, kind="stable")
+        save_build(
+            directory,
+            {
+                name: array[order]
+                for name, array in zip(_INDEX_FILES, (hashes, song_ids, offsets))
+            }
+            | {"since": np.array([since], dtype=np.float64)},
+        )
+
+    def add(
+        self,
+        song_id: int,
+        hashes: np.ndarray,
+        offsets: np.ndarray,
+        version: str | None = None,
+    ) -> None:
+        self._recent[song_id] = (hashes, offsets)
+        self._recent_arrays = None
+        self._versions[song_id] = version
+        self._hidden.add(song_id)  # a new upload replaces the old fingerprint
+
+    def remove(self, song_id: int) -> None:
+        if self._recent.pop(song_id, None) is not None:
+            self._recent_arrays = None
+        self._versions.pop(song_id, None)
+        self._hidden.add(song_id)
+
+    def sync(self, uploads: list[tuple[int, str]]) -> None:
+        """
+        Catch up with the songs uploaded since the bulk was built, whoever fingerprinted
+        them: the fingerprints are read from the files their jobs stored. A song whose
+        fingerprint isn't there (yet) only hides its stale entries of the bulk.
+
+        \f
+
+        :param uploads: (song's ID, version) of the current original of every song
+            uploaded since the bulk was built
+        :type uploads: list[tuple[int, str]]
+        """
+        for song_id, version in uploads:
+            if self._versions.get(song_id) == version:
+                continue
+            fingerprint = read_fingerprint(fingerprint_path(song_id, version))
+            if fingerprint is None:
+                self.remove(song_id)
+            else:
+                self.add(song_id, *fingerprint, version=version)
+
+    def _recent_index(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._recent_arrays is None:
+            items = list(self._recent.items())
+            hashes = np.concatenate(
+                [np.empty(0, np.uint32)] + [hashes for _, (hashes, _) in items]
+            )
+            song_ids = np.repeat(
+                np.array([song_id for song_id, _ in items], dtype=np.int32),
+                [len(hashes) for _, (hashes, _) in items],
+            )
+            offsets = np.concatenate(
+                [np.empty(0, np.uint16)] + [offsets for _, (_, offsets) in items]
+            )
+            order = np.argsort(hashes, kind="stable")
+            self._recent_arrays = (hashes[order], song_ids[order], offsets[order])
+        return self._recent_arrays
+
+    @staticmethod
+    def _candidates(
+        index: tuple[np.ndarray, np.ndarray, np.ndarray],
+        hashes: np.ndarray,
+        offsets: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # every entry of the index sharing a hash with the query, without a Python loop
+        index_hashes, index_song_ids, index_offsets = index
+        starts = np.searchsorted(index_hashes, hashes, side="left")
+        counts = np.searchsorted(index_hashes, hashes, side="right") - starts
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, np.int32), np.empty(0, np.int64)
+
+        run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + np.arange(total) - run_starts
+        shifts = index_offsets[positions].astype(np.int64) - np.repeat(
+            offsets.astype(np.int64), counts
+        )
+        return np.asarray(index_song_ids[positions]), shifts
+
+    def match(
+        self,
+        hashes: np.ndarray,
+        offsets: np.ndarray,
+        exclude: int | None = None,
+    ) -> tuple[int, int] | None:
+        """
+        Find the song of the catalog the fingerprint most probably comes from.
+
+        \f
+
+        :param hashes: Hashes of the fingerprint
+        :type hashes: np.ndarray
+        :param offsets: Offsets of the hashes
+        :type offsets: np.ndarray
+        :param exclude: Song to ignore, usually the one being uploaded
+        :type exclude: int | None
+        :return: The song's ID and how many hashes matched at the same time shift,
+            None below FINGERPRINT_MIN_MATCHES
+        :rtype: tuple[int, int] | None
+        """
+        bulk_song_ids, bulk_shifts = self._candidates(
+            (self._hashes, self._song_ids, self._offsets), hashes, offsets
+        )
+        hidden = np.array(list(self._hidden), dtype=np.int32)
+        visible = ~np.isin(bulk_song_ids, hidden)
+
+        recent_song_ids, recent_shifts = self._candidates(
+            self._recent_index(), hashes, offsets
+        )
+        song_ids = np.concatenate([bulk_song_ids[visible], recent_song_ids])
+        shifts = np.concatenate([bulk_shifts[visible], recent_shifts])
+        if exclude is not None:
+            keep = song_ids != exclude
+            song_ids, shifts = song_ids[keep], shifts[keep]
+        if not len(song_ids):
+            return None
+
+        # votes for every (song, time shift) pair
+        keys = (song_ids.astype(np.int64) << 32) | (shifts + (1 << 31))
+        unique_keys, votes = np.unique(keys, return_counts=True)
+        best = int(np.argmax(votes))
+        if votes[best] < FINGERPRINT_MIN_MATCHES:
+            return None
+        return int(unique_keys[best] >> 32), int(votes[best])
+
+
+def get_fingerprint_index(request: Request) -> FingerprintIndex:
+    """
+    Returns the index loaded in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.fingerprint_index
+
+
+async def detect_duplicate(
+    pool: ProcessPoolExecutor,
+    index: FingerprintIndex,
+    song_id: int,
+    audio_path: str,
+    version: str,
+) -> None:
+    """
+    Fingerprint a freshly uploaded song and flag it if the catalog already has the recording.
+    It's the handler of the "fingerprint" jobs, errors are retried by the job queue, except
+    a file that can't be decoded: the song leaves the index, loses its duplicate flag and
+    the job is rejected with the decoder's error.
+    A job whose file was replaced meanwhile does nothing, the job of the new file checks it.
+    """
+    # imported here, the crud modules import the models this module doesn't need
+    from ..core.database import engine
+    from ..crud.media_assets import read_fresh_media_asset, read_media_assets_since
+    from ..crud.songs import update_song_duplicate
+
+    with Session(engine) as session:
+        original = await read_fresh_media_asset(session=session, song_id=song_id)
+    if original is None or original.path != audio_path:
+        return
+
+    path = fingerprint_path(song_id, version)
+    error = None
+    try:
+        fingerprint = await run_in_process(pool, compute_fingerprint, audio_path, path)
+    except AudioDecodeError as exc:
+        fingerprint, error = None, exc
+
+    # the file may have been replaced while it was decoded, its job has the last word
+    with Session(engine) as session:
+        original = await read_fresh_media_asset(session=session, song_id=song_id)
+        uploads = await read_media_assets_since(session=session, mtime=index.since)
+    if original is None or original.path != audio_path:
+        if original is None or original.content_hash[:16] != version:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return
+
+    for old_path in glob.glob(fingerprint_path(song_id, "*")):
+        if old_path != path:
+            os.remove(old_path)
+
+    match = None
+    if fingerprint is not None:
+        # what the other workers fingerprinted is matched too
+        await run_in_threadpool(
+            index.sync,
+            [(upload.song_id, upload.content_hash[:16]) for upload in uploads],
+        )
+        # numpy releases the GIL, a thread is enough
+        match = await run_in_threadpool(index.match, *fingerprint, song_id)
+        index.add(song_id, *fingerprint, version=version)
+    else:
+        index.remove(song_id)
+
+    with Session(engine) as session:
+        await update_song_duplicate(
+            session=session, id=song_id, duplicate_of_id=match[0] if match else None
+        )
+
+    if error is not None:
+        raise JobRejected(f"No fingerprint for song {song_id}: {error}") from error
@@ -0,0 +1,176 @@
+import math
+import struct
+import zlib
+
+from collections import OrderedDict
+
+from ..commons.constants import HLS_SEGMENT_DURATION, HLS_PLAYLIST_CACHE_SIZE
+from .seek_index import SeekIndex, get_seek_index
+
+
+class HLSPlaylist:
+    """
+    Media playlist of a song, split in segments of fixed duration.
+
+    The segments are byte ranges of the original file, cut on the frame
+    boundaries given by the seek index, so nothing is ever re-encoded.
+
+    \f
+
+    :param index: Seek index the playlist was built from
+    :type index: SeekIndex
+    :param version: Tag that changes whenever the audio file changes
+    :type version: str
+    :param ranges: (start, end) byte range of every segment, end excluded
+    :type ranges: list[tuple[int, int]]
+    :param body: The rendered m3u8 playlist
+    :type body: str
+    :param segment_duration: Duration of every segment in seconds
+    :type segment_duration: int
+    """
+
+    __slots__ = ("index", "version", "ranges", "body", "segment_duration")
+
+    def __init__(
+        self,
+        index: SeekIndex,
+        version: str,
+        ranges: list[tuple[int, int]],
+        body: str,
+        segment_duration: int = HLS_SEGMENT_DURATION,
+    ):
+        self.index = index
+        self.version = version
+        self.ranges = ranges
+        self.body = body
+        self.segment_duration = segment_duration
+
+    def segment_tag(self, segment: int) -> bytes:
+        """
+        The timestamp tag a segment must start with, see "timestamp_tag".
+        """
+        return timestamp_tag(segment * self.segment_duration)
+
+    def signed_body(self, query: str) -> str:
+        """
+        The playlist with a query string appended to every segment URL.
+        Players resolve the segments against the playlist URL, which drops its query.
+        """
+        return "\n".join(
+            f"{line}?{query}" if line and not line.startswith("#") else line
+            for line in self.body.split("\n")
+        )
+
+
+def build_hls_playlist(
+    index: SeekIndex,
+    extension: str,
+    segment_duration: int = HLS_SEGMENT_DURATION,
+) -> HLSPlaylist:
+    """
+    Build the HLS media playlist for an indexed audio file.
+
+    \f
+
+    :param index: Seek index of the audio file
+    :type index: SeekIndex
+    :param extension: Segment file extension, without the "."
+    :type extension: str
+    :param segment_duration: Duration of every segment in seconds
+    :type segment_duration: int
+    :return: The playlist
+    :rtype: HLSPlaylist
+    """
+    # segment URLs embed the version so they can be cached forever
+    version = f"{zlib.crc32(index.to_bytes()):08x}"
+    count = math.ceil(index.duration / segment_duration)
+
+    ranges = []
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{segment_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for segment in range(count):
+        start = index.offsets[segment * segment_duration]
+        end = (
+            index.offsets[(segment + 1) * segment_duration]
+            if segment + 1 < count
+            else index.data_end
+        )
+        duration = min(segment_duration, index.duration - segment * segment_duration)
+
+        ranges.append((start, end))
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"{version}/{segment}.{extension}")
+    lines.append("#EXT-X-ENDLIST")
+
+    return HLSPlaylist(
+        index, version, ranges, "\n".join(lines) + "\n", segment_duration
+    )
+
+
+# owner of the PRIV frame carrying the timestamp of a packed audio segment
+_TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp\x00"
+
+
+def timestamp_tag(start_second: float) -> bytes:
+    """
+    ID3 tag giving the timestamp of the first sample of a packed audio segment.
+
+    Packed audio segments (raw MP3 or AAC frames) carry no timestamp of their own, so
+    RFC 8216 section 3.4 requires them to start with an ID3 PRIV frame holding it:
+    a 33-bit MPEG-2 timestamp (90 kHz clock) in 8 big-endian bytes.
+
+    \f
+
+    :param start_second: Position of the segment in the song, in seconds
+    :type start_second: float
+    :return: The ID3v2.4 tag
+    :rtype: bytes
+    """
+    timestamp = round(start_second * 90_000) & (2**33 - 1)
+    payload = _TIMESTAMP_OWNER + struct.pack(">Q", timestamp)
+    frame = b"PRIV" + _syncsafe(len(payload)) + b"\x00\x00" + payload
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def _syncsafe(size: int) -> bytes:
+    # ID3v2.4 sizes: 4 bytes of 7 bits, the high bit always unset
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+# playlists are generated on the first request and kept until the file changes
+_hls_playlist_cache: OrderedDict[int, HLSPlaylist] = OrderedDict()
+
+
+def get_hls_playlist(song_id: int, extension: str) -> HLSPlaylist | None:
+    """
+    Get the HLS playlist of a song, building it lazily.
+
+    \f
+
+    :param song_id: Song's ID
+    :type song_id: int
+    :param extension: Segment file extension, without the "."
+    :type extension: str
+    :return: The playlist or None if the song has no seek index
+    :rtype: HLSPlaylist | None
+    """
+    index = get_seek_index(song_id)
+    if index is None:
+        return None
+
+    playlist = _hls_playlist_cache.get(song_id)
+    # a new upload replaces the cached seek index, that's our invalidation signal
+    if playlist is not None and playlist.index is index:
+        _hls_playlist_cache.move_to_end(song_id)
+        return playlist
+
+    playlist = build_hls_playlist(index, extension)
+    _hls_playlist_cache[song_id] = playlist
+    if len(_hls_playlist_cache) > HLS_PLAYLIST_CACHE_SIZE:
+        _hls_playlist_cache.popitem(last=False)
+    return playlist
@@ -0,0 +1,379 @@
+import asyncio
+import bisect
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+
+from collections.abc import Collection
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+from PIL import Image, ImageOps, features
+from sqlmodel import Session
+
+from ..commons.constants import (
+    IMAGE_DIRECTORY,
+    IMAGE_RESIZE_WIDTHS,
+    IMAGE_VARIANT_DIRECTORY,
+    IMAGE_VARIANT_FORMATS,
+    IMAGE_VARIANT_WIDTHS,
+)
+from ..core.process_pool import run_in_process
+from ..models.image_variant_model import ImageVariantCreate, ImageVariantPublic
+from .file_utils import shard_path
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, MIME type and encoder options of every variant format
+_ENCODERS = {
+    "avif": ("AVIF", "image/avif", {"quality": 50, "speed": 6}),
+    "webp": ("WEBP", "image/webp", {"quality": 75, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+
+
+def supported_formats() -> list[str]:
+    """
+    Variant formats this Pillow build can encode, in the configured order.
+    """
+    return [
+        format
+        for format in IMAGE_VARIANT_FORMATS
+        if format in _ENCODERS and (format == "jpeg" or features.check(format))
+    ]
+
+
+def variant_key(owner_kind: str, owner_id: int) -> str:
+    # songs, albums and playlists have their own IDs, the kind keeps their files apart,
+    # the originals' too
+    return f"{owner_kind}-{owner_id}"
+
+
+def variant_path(owner_kind: str, owner_id: int, version: str, width: int, format: str) -> str:
+    key = variant_key(owner_kind, owner_id)
+    return shard_path(IMAGE_VARIANT_DIRECTORY, key, f"{key}-{version}-{width}.{format}")
+
+
+def negotiate_format(accept: str | None, formats: set[str]) -> str:
+    """
+    The preferred format among the available ones that the client accepts.
+    JPEG is what every client decodes, AVIF and WebP are used only when announced.
+    """
+    for format in IMAGE_VARIANT_FORMATS:
+        if format in formats and f"image/{format}" in (accept or ""):
+            return format
+    return "jpeg" if "jpeg" in formats else sorted(formats)[0]
+
+
+def select_variant(
+    variants: list[ImageVariantPublic],
+    width: int | None,
+    format: str,
+) -> ImageVariantPublic | None:
+    """
+    The smallest variant at least "width" pixels wide, the biggest one if none is.
+    """
+    candidates = [variant for variant in variants if variant.format == format]
+    if not candidates:
+        return None
+
+    candidates.sort(key=lambda variant: variant.width)
+    if width is not None:
+        for variant in candidates:
+            if variant.width >= width:
+                return variant
+    return candidates[-1]
+
+
+def flatten_alpha(image: Image.Image) -> Image.Image:
+    # transparent parts become white, like the page behind them, instead of black
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def encode_image(image: Image.Image, path: str, format: str) -> int:
+    """
+    Write an image atomically in one of the variant formats, returns its size in bytes.
+    """
+    pillow_format, _, options = _ENCODERS[format]
+    if format == "jpeg" and image.mode == "RGBA":
+        image = flatten_alpha(image)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(f"{path}.tmp", pillow_format, **options)
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+
+def open_image(image_path: str, max_width: int) -> Image.Image:
+    """
+    Open an image upright, in RGB or RGBA, decoded at the lowest resolution that still
+    gives "max_width" pixels (JPEG files are decoded at 1/2, 1/4 or 1/8 scale for free).
+    """
+    image = Image.open(image_path)
+    image.draft("RGB", (max_width, max_width))
+    image = ImageOps.exif_transpose(image)  # phones store the rotation in the EXIF tags
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def build_image_variants(
+    image_path: str,
+    owner_kind: str,
+    owner_id: int,
+    version: str,
+) -> list[dict]:
+    """
+    Resize an image to every variant width and encode it in every variant format.
+    It runs in the process pool.
+
+    Images are never upscaled: widths above the original one are replaced by the original
+    width. Every width is resized from the previous, bigger, one so the full resolution
+    image is resampled only once.
+
+    \f
+
+    :param image_path: Path of the original image
+    :type image_path: str
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :param version: Version of the original image
+    :type version: str
+    :return: Width, height, format, MIME type, path and size of every variant,
+        empty if the image can't be decoded
+    :rtype: list[dict]
+    """
+    try:
+        image = open_image(image_path, max(IMAGE_VARIANT_WIDTHS))
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning(f"No variants for {image_path}: {exc}")
+        return []
+
+    widths = sorted({min(width, image.width) for width in IMAGE_VARIANT_WIDTHS}, reverse=True)
+    variants = []
+    for width in widths:
+        height = max(round(image.height * width / image.width), 1)
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        for format in supported_formats():
+            path = variant_path(owner_kind, owner_id, version, width, format)
+            variants.append(
+                {
+                    "width": width,
+                    "height": height,
+                    "format": format,
+                    "mime_type": _ENCODERS[format][1],
+                    "path": path,
+                    "size": encode_image(image, path, format),
+                }
+            )
+    return variants
+
+
+def resize_image(image_path: str, output_path: str, width: int, format: str) -> int | None:
+    """
+    Resize one image to one width and format. It runs in the process pool.
+
+    \f
+
+    :param image_path: Path of the original image
+    :type image_path: str
+    :param output_path: Where the resized image is written
+    :type output_path: str
+    :param width: Width in pixels, the original one if it's smaller
+    :type width: int
+    :param format: "avif", "webp" or "jpeg"
+    :type format: str
+    :return: Size of the resized image, None if the original can't be decoded
+    :rtype: int | None
+    """
+    try:
+        image = open_image(image_path, width)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning(f"Can't resize {image_path}: {exc}")
+        return None
+
+    width = min(width, image.width)
+    height = max(round(image.height * width / image.width), 1)
+    image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return encode_image(image, output_path, format)
+
+
+def snap_width(width: int) -> int:
+    """
+    The smallest allowed width that is at least "width", the biggest allowed one above them.
+    Any width can be asked for, but only a few are ever resized and cached.
+    """
+    index = bisect.bisect_left(IMAGE_RESIZE_WIDTHS, width)
+    return IMAGE_RESIZE_WIDTHS[min(index, len(IMAGE_RESIZE_WIDTHS) - 1)]
+
+
+def original_image_path(image_url: str) -> str | None:
+    """
+    Path on disk of an image uploaded to the public directory, from its URL.
+    """
+    url_path = unquote(urlsplit(image_url).path)
+    _, found, relative_path = url_path.partition("/public/")
+    if not found:
+        return None
+
+    path = os.path.normpath(os.path.join("public", relative_path))
+    if not path.startswith(IMAGE_DIRECTORY + os.sep):
+        return None  # not one of our images
+    return path
+
+
+def resized_name(
+    owner_kind: str,
+    owner_id: int,
+    image_path: str,
+    width: int,
+    format: str,
+) -> str | None:
+    """
+    Name of an image resized on demand, it changes when the original is replaced.
+    None if the original doesn't exist.
+    """
+    try:
+        stat = os.stat(image_path)
+    except FileNotFoundError:
+        return None
+
+    source = f"{image_path}:{stat.st_mtime_ns}:{stat.st_size}".encode()
+    version = hashlib.sha256(source).hexdigest()[:16]
+    return f"{variant_key(owner_kind, owner_id)}-{version}-{width}.{format}"
+
+
+def image_version(image_path: str) -> str | None:
+    """
+    Version of an original image, like the uploads compute it: the start of its SHA-256.
+    None if it doesn't exist.
+    """
+    content_hash = hashlib.sha256()
+    try:
+        with open(image_path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                content_hash.update(chunk)
+    except FileNotFoundError:
+        return None
+    return content_hash.hexdigest()[:16]
+
+
+def delete_image_variants(
+    owner_kind: str,
+    owner_id: int,
+    keep: Collection[str] = (),
+    older_than: int | None = None,
+) -> None:
+    """
+    Delete the variant files of an owner, but the ones to "keep" and, if "older_than" is
+    given (nanoseconds since the epoch), the ones modified since.
+    """
+    for old_path in glob.glob(variant_path(owner_kind, owner_id, "*", "*", "*")):
+        if old_path in keep:
+            continue
+        # another job may delete it meanwhile
+        with contextlib.suppress(FileNotFoundError):
+            if older_than is None or os.stat(old_path).st_mtime_ns < older_than:
+                os.remove(old_path)
+
+
+async def generate_image_variants(
+    pool: ProcessPoolExecutor,
+    owner_kind: str,
+    owner_id: int,
+    image_path: str,
+    version: str,
+    public_url: str,
+) -> None:
+    """
+    Build the variants and the placeholders of a freshly uploaded image, record them
+    and drop the previous variants.
+    It's the handler of the "image_variants" jobs, errors are retried by the job queue.
+
+    Jobs of successive uploads may run out of order, or be retried: a job whose image
+    was replaced meanwhile records nothing, the job of the new image does. And only the
+    variants older than the current image are dropped, never the ones of an upload whose
+    job is still running.
+
+    \f
+
+    :param pool: Process pool
+    :type pool: ProcessPoolExecutor
+    :param owner_kind: "song", "album" or "playlist"
+    :type owner_kind: str
+    :param owner_id: ID of the song, the album or the playlist
+    :type owner_id: int
+    :param image_path: Path of the original image
+    :type image_path: str
+    :param version: Version of the original image
+    :type version: str
+    :param public_url: URL the "public" directory is served from
+    :type public_url: str
+    """
+    # imported here, the crud modules import the models this module doesn't need
+    from ..core.database import engine
+    from ..crud.image_variants import (
+        read_image_owner,
+        replace_image_variants,
+        update_image_placeholders,
+    )
+    from .placeholders import compute_placeholders
+
+    variants, placeholders = await asyncio.gather(
+        run_in_process(
+            pool, build_image_variants, image_path, owner_kind, owner_id, version
+        ),
+        run_in_process(pool, compute_placeholders, image_path),
+    )
+
+    paths = {variant["path"] for variant in variants}
+    with Session(engine) as session:
+        db_owner = await read_image_owner(
+            session=session, owner_kind=owner_kind, owner_id=owner_id
+        )
+    current_path = original_image_path(db_owner.image_url or "") if db_owner else None
+    current_version = None
+    if current_path is not None:
+        current_version = await run_in_process(pool, image_version, current_path)
+    if current_path != image_path or current_version != version:
+        # replaced since the job was queued, by another image: its variants are useless
+        if current_version != version:
+            for path in paths:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+        return
+
+    with Session(engine) as session:
+        await update_image_placeholders(
+            session=session,
+            owner_kind=owner_kind,
+            owner_id=owner_id,
+            placeholders=placeholders or {},
+        )
+        await replace_image_variants(
+            session=session,
+            owner_kind=owner_kind,
+            owner_id=owner_id,
+            variants=[
+                ImageVariantCreate(
+                    owner_kind=owner_kind,
+                    owner_id=owner_id,
+                    version=version,
+                    url=public_url + os.path.relpath(variant["path"], "public"),
+                    **variant,
+                )
+                for variant in variants
+            ],
+        )
+
+    try:
+        uploaded_at = os.stat(image_path).st_mtime_ns
+    except FileNotFoundError:
+        return
+    delete_image_variants(owner_kind, owner_id, keep=paths, older_than=uploaded_at)
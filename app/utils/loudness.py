@@ -0,0 +1,264 @@
+import contextlib
+import glob
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scipy import signal
+from sqlmodel import Session
+
+from ..commons.constants import LOUDNESS_DIRECTORY, REPLAYGAIN_REFERENCE_LOUDNESS
+from ..core.jobs import JobRejected
+from ..core.process_pool import run_in_process
+from .audio_decode import AudioDecodeError, decode_audio
+from .file_utils import shard_path
+
+# EBU R128 / ITU-R BS.1770 gating
+_ABSOLUTE_GATE = -70.0  # LUFS
+_RELATIVE_GATE = -10.0  # LU below the absolute gated loudness
+
+# histogram of the gated blocks loudness, what album loudness is computed from:
+# 0.1 LU bins between -70 and +30 LUFS, like libebur128
+_HISTOGRAM_MIN = _ABSOLUTE_GATE
+_HISTOGRAM_STEP = 0.1
+_HISTOGRAM_BINS = 1000
+_BIN_ENERGIES = 10 ** (
+    (_HISTOGRAM_MIN + _HISTOGRAM_STEP * (np.arange(_HISTOGRAM_BINS) + 0.5) + 0.691) / 10
+)
+
+_TRUE_PEAK_CHUNK = 1 << 20  # samples oversampled at a time, to bound memory
+
+
+def k_weighting(sample_rate: int) -> np.ndarray:
+    """
+    The two biquads of the BS.1770 K-weighting filter (high shelf, then high pass),
+    as second order sections for any sample rate.
+    """
+    # high shelf, the head's acoustic effect
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh**0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0,
+        2 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        1,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    ]
+
+    # high pass, the RLB weighting
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = [1, -2, 1, 1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.array([shelf, high_pass])
+
+
+def _channel_weights(channels: int) -> np.ndarray:
+    if channels == 6:  # 5.1: L, R, C, LFE, Ls, Rs
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+def block_loudness(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Loudness of every 400ms block, 75% overlapping, of K-weighted samples.
+
+    \f
+
+    :param samples: Samples shaped (frames, channels)
+    :type samples: np.ndarray
+    :param sample_rate: Sample rate
+    :type sample_rate: int
+    :return: Loudness of every block, in LUFS
+    :rtype: np.ndarray
+    """
+    filtered = signal.sosfilt(k_weighting(sample_rate), samples, axis=0)
+
+    # mean square of every 100ms step, every block is then the sum of 4 consecutive steps
+    step = round(sample_rate * 0.1)
+    steps = len(filtered) // step
+    if steps < 4:
+        return np.empty(0)
+
+    energies = np.square(filtered[: steps * step]).reshape(steps, step, -1).sum(axis=1)
+    energies = energies @ _channel_weights(samples.shape[1])
+    cumulative = np.concatenate([[0.0], np.cumsum(energies)])
+    blocks = (cumulative[4:] - cumulative[:-4]) / (4 * step)
+
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(blocks)
+
+
+def gated_loudness(loudness: np.ndarray) -> float | None:
+    """
+    Integrated loudness of blocks, with the absolute and relative gates. None for silence.
+    """
+    loudness = loudness[loudness > _ABSOLUTE_GATE]
+    if not len(loudness):
+        return None
+
+    energies = 10 ** ((loudness + 0.691) / 10)
+    threshold = -0.691 + 10 * math.log10(energies.mean()) + _RELATIVE_GATE
+    gated = energies[loudness > threshold]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def loudness_histogram(loudness: np.ndarray) -> np.ndarray:
+    """
+    How many blocks fall in every 0.1 LU bin above the absolute gate.
+    Histograms of several tracks add up to the one of the whole album.
+    """
+    loudness = loudness[loudness > _ABSOLUTE_GATE]  # silent blocks are -inf
+    indexes = np.floor((loudness - _HISTOGRAM_MIN) / _HISTOGRAM_STEP).astype(np.int64)
+    indexes = np.minimum(indexes, _HISTOGRAM_BINS - 1)
+    return np.bincount(indexes, minlength=_HISTOGRAM_BINS).astype(np.uint32)
+
+
+def histogram_loudness(histogram: np.ndarray) -> float | None:
+    """
+    Integrated loudness from a histogram of block loudness (what "gated_loudness" does on blocks).
+    """
+    counts = histogram.astype(np.float64)
+    if not counts.sum():
+        return None
+
+    mean = (counts * _BIN_ENERGIES).sum() / counts.sum()
+    threshold = -0.691 + 10 * math.log10(mean) + _RELATIVE_GATE
+    first_bin = max(math.floor((threshold - _HISTOGRAM_MIN) / _HISTOGRAM_STEP), 0)
+    gated = counts[first_bin:]
+    if not gated.sum():
+        return None
+
+    mean = (gated * _BIN_ENERGIES[first_bin:]).sum() / gated.sum()
+    return -0.691 + 10 * math.log10(mean)
+
+
+def true_peak(samples: np.ndarray, sample_rate: int) -> float:
+    """
+    Peak of the signal between samples too, estimated by 4x oversampling (BS.1770 annex 2).
+    Returned as a linear amplitude, 1.0 is full scale.
+    """
+    factor = 4 if sample_rate < 96000 else 2 if sample_rate < 192000 else 1
+    peak = float(np.abs(samples).max(initial=0.0))
+    if factor == 1:
+        return peak
+
+    # chunks overlap a bit, so the filter has settled at every chunk edge
+    overlap = 64
+    for start in range(0, len(samples), _TRUE_PEAK_CHUNK):
+        chunk = samples[max(start - overlap, 0) : start + _TRUE_PEAK_CHUNK + overlap]
+        oversampled = signal.resample_poly(chunk, factor, 1, axis=0)
+        peak = max(peak, float(np.abs(oversampled).max(initial=0.0)))
+    return peak
+
+
+def loudness_histogram_path(song_id: int, version: str) -> str:
+    # versioned by the audio content, like the waveform
+    return shard_path(LOUDNESS_DIRECTORY, song_id, f"{song_id}-{version}.hist")
+
+
+def read_loudness_histogram(path: str) -> np.ndarray | None:
+    try:
+        with open(path, "rb") as file:
+            return np.frombuffer(file.read(), dtype="<u4")
+    except FileNotFoundError:
+        return None
+
+
+def analyze_loudness(audio_path: str, histogram_path: str) -> dict | None:
+    """
+    Measure a song: integrated loudness, true peak and ReplayGain 2.0 track values.
+    The blocks histogram is stored for album loudness. It runs in the process pool.
+
+    \f
+
+    :param audio_path: Path of the audio file
+    :type audio_path: str
+    :param histogram_path: Where the blocks histogram is written
+    :type histogram_path: str
+    :return: The measures, None if the file is silent
+    :rtype: dict | None
+    :raises AudioDecodeError: If the file can't be decoded
+    """
+    samples, sample_rate = decode_audio(audio_path)
+    blocks = block_loudness(samples.astype(np.float64), sample_rate)
+    loudness = gated_loudness(blocks)
+    if loudness is None:
+        return None
+
+    histogram = loudness_histogram(blocks)
+    os.makedirs(os.path.dirname(histogram_path), exist_ok=True)
+    with open(f"{histogram_path}.tmp", "wb") as file:
+        file.write(histogram.astype("<u4").tobytes())
+    os.replace(f"{histogram_path}.tmp", histogram_path)
+
+    peak = true_peak(samples, sample_rate)
+    return {
+        "loudness": round(loudness, 2),
+        "true_peak": round(20 * math.log10(peak), 2) if peak > 0 else None,
+        "replaygain_track_gain": round(REPLAYGAIN_REFERENCE_LOUDNESS - loudness, 2),
+        "replaygain_track_peak": round(peak, 6),
+    }
+
+
+async def measure_song_loudness(
+    pool: ProcessPoolExecutor,
+    song_id: int,
+    audio_path: str,
+    version: str,
+) -> None:
+    """
+    Measure a freshly uploaded song, store the results and update its album's gain.
+    It's the handler of the "loudness" jobs, errors are retried by the job queue, except
+    a file that can't be decoded: its song loses the measures of the previous file and
+    the job is rejected with the decoder's error.
+    A job whose file was replaced meanwhile does nothing, the job of the new file measures it.
+    """
+    # imported here, they import this module to read the histograms
+    from ..core.database import engine
+    from ..crud.albums import update_album_loudness
+    from ..crud.media_assets import read_fresh_media_asset
+    from ..crud.songs import update_song_loudness
+
+    with Session(engine) as session:
+        original = await read_fresh_media_asset(session=session, song_id=song_id)
+    if original is None or original.path != audio_path:
+        return
+
+    path = loudness_histogram_path(song_id, version)
+    error = None
+    try:
+        measures = await run_in_process(pool, analyze_loudness, audio_path, path)
+    except AudioDecodeError as exc:
+        measures, error = None, exc
+
+    # the file may have been replaced while it was decoded, its job has the last word
+    with Session(engine) as session:
+        original = await read_fresh_media_asset(session=session, song_id=song_id)
+    if original is None or original.path != audio_path:
+        if original is None or original.content_hash[:16] != version:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return
+
+    for old_path in glob.glob(loudness_histogram_path(song_id, "*")):
+        if old_path != path:
+            os.remove(old_path)
+
+    with Session(engine) as session:
+        db_song = await update_song_loudness(
+            session=session, id=song_id, measures=measures or {}
+        )
+        if db_song and db_song.album_id is not None:
+            await update_album_loudness(session=session, id=db_song.album_id)
+
+    if error is not None:
+        raise JobRejected(f"No loudness for song {song_id}: {error}") from error
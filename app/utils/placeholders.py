@@ -0,0 +1,167 @@
+import logging
+
+import numpy as np
+
+from PIL import Image
+
+from ..commons.constants import BLURHASH_COMPONENTS, IMAGE_PALETTE_SIZE
+from .image_variants import flatten_alpha, open_image
+
+logger = logging.getLogger(__name__)
+
+_BASE83 = (
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+)
+
+_BLURHASH_SIZE = 32  # pixels the image is reduced to first, a blurhash has no details anyway
+_PALETTE_SIZE = 64  # pixels the palette is computed from, 4096 points to cluster
+_KMEANS_ITERATIONS = 20
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(
+        _BASE83[(value // 83 ** (length - index)) % 83] for index in range(1, length + 1)
+    )
+
+
+def _srgb_to_linear(pixels: np.ndarray) -> np.ndarray:
+    values = pixels / 255.0
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels: np.ndarray, components: tuple[int, int] = (4, 3)) -> str:
+    """
+    Encode an image as a Blurhash (https://blurha.sh): the first cosine components of
+    its colors, a 20-30 characters string clients turn back into a blurry placeholder.
+
+    \f
+
+    :param pixels: RGB pixels shaped (height, width, 3), as uint8
+    :type pixels: np.ndarray
+    :param components: Number of horizontal and vertical components, 1 to 9 each
+    :type components: tuple[int, int]
+    :return: The Blurhash
+    :rtype: str
+    """
+    components_x, components_y = components
+    height, width, _ = pixels.shape
+    linear = _srgb_to_linear(pixels.astype(np.float64))
+
+    # every (x, y) component at once: the image projected on the products of the cosines
+    cosines_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    cosines_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    factors = np.einsum("jy,ix,yxc->jic", cosines_y, cosines_x, linear) / (width * height)
+    factors[1:, :] *= 2  # every component but the DC one is normalized by 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+
+    dc, ac = factors[0], factors[1:]
+    hash = _base83((components_x - 1) + (components_y - 1) * 9, 1)
+
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1.0
+    hash += _base83(quantised_max, 1)
+
+    r, g, b = (_linear_to_srgb(value) for value in dc)
+    hash += _base83((r << 16) + (g << 8) + b, 4)
+
+    normalized = ac / maximum
+    quantised = np.floor(np.sign(normalized) * np.sqrt(np.abs(normalized)) * 9 + 9.5)
+    quantised = np.clip(quantised, 0, 18).astype(np.int64)
+    for r, g, b in quantised:
+        hash += _base83(int(r * 19 * 19 + g * 19 + b), 2)
+    return hash
+
+
+def dominant_colors(pixels: np.ndarray, count: int, seed: int = 0) -> list[str]:
+    """
+    The main colors of an image, by k-means clustering of its pixels, most present first.
+
+    \f
+
+    :param pixels: RGB pixels shaped (..., 3), as uint8
+    :type pixels: np.ndarray
+    :param count: Number of colors
+    :type count: int
+    :param seed: Seed of the initial centers, so the same image always gives the same colors
+    :type seed: int
+    :return: The colors as "#rrggbb", fewer if the image has fewer distinct colors
+    :rtype: list[str]
+    """
+    points = pixels.reshape(-1, 3).astype(np.float32)
+    distinct = np.unique(points, axis=0)
+    count = min(count, len(distinct))
+
+    # k-means++ initialization: every next center is far from the ones picked so far
+    rng = np.random.default_rng(seed)
+    centers = [distinct[rng.integers(len(distinct))]]
+    for _ in range(1, count):
+        distances = ((distinct[:, None, :] - np.array(centers)[None]) ** 2).sum(-1).min(1)
+        centers.append(distinct[rng.choice(len(distinct), p=distances / distances.sum())])
+    centers = np.array(centers)
+
+    for _ in range(_KMEANS_ITERATIONS):
+        # (points, centers) squared distances, without a Python loop over the points
+        distances = (
+            (points**2).sum(1)[:, None] - 2 * points @ centers.T + (centers**2).sum(1)[None]
+        )
+        labels = distances.argmin(1)
+        sizes = np.bincount(labels, minlength=count)
+        sums = np.stack(
+            [
+                np.bincount(labels, weights=points[:, channel], minlength=count)
+                for channel in range(3)
+            ],
+            axis=1,
+        )
+        filled = sizes > 0  # an empty cluster keeps its center
+        new_centers = centers.copy()
+        new_centers[filled] = sums[filled] / sizes[filled, None]
+        if np.allclose(new_centers, centers, atol=0.5):
+            break
+        centers = new_centers
+
+    order = np.argsort(-sizes, kind="stable")
+    return [
+        "#{:02x}{:02x}{:02x}".format(*np.clip(np.round(centers[index]), 0, 255).astype(int))
+        for index in order
+        if sizes[index]
+    ]
+
+
+def compute_placeholders(image_path: str) -> dict | None:
+    """
+    Blurhash and dominant colors of an image. It runs in the process pool.
+
+    \f
+
+    :param image_path: Path of the image
+    :type image_path: str
+    :return: "image_blurhash" and "image_palette", None if the image can't be decoded
+    :rtype: dict | None
+    """
+    try:
+        image = open_image(image_path, _PALETTE_SIZE)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning(f"No placeholders for {image_path}: {exc}")
+        return None
+
+    if image.mode == "RGBA":
+        image = flatten_alpha(image)
+
+    small = image.resize((_BLURHASH_SIZE, _BLURHASH_SIZE), Image.Resampling.BOX)
+    palette = image.resize((_PALETTE_SIZE, _PALETTE_SIZE), Image.Resampling.BOX)
+    return {
+        "image_blurhash": blurhash(np.asarray(small), BLURHASH_COMPONENTS),
+        "image_palette": dominant_colors(np.asarray(palette), IMAGE_PALETTE_SIZE),
+    }
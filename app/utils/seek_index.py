@@ -0,0 +1,708 @@
+import math
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from ..commons.constants import SEEK_INDEX_DIRECTORY, SEEK_INDEX_CACHE_SIZE
+
+# on-disk layout: header followed by one little-endian uint32 offset per second
+SEEK_INDEX_MAGIC = b"SKIX"
+SEEK_INDEX_VERSION = 1
+_HEADER = struct.Struct("<4sB3xIIIId")
+
+# MPEG audio lookup tables, indexed by [version][layer][bitrate_index] (kbps)
+_MPEG1, _MPEG2, _MPEG25 = 3, 2, 0
+_LAYER1, _LAYER2, _LAYER3 = 3, 2, 1
+
+_MPEG_BITRATES = {
+    (_MPEG1, _LAYER1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (_MPEG1, _LAYER2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (_MPEG1, _LAYER3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (_MPEG2, _LAYER1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (_MPEG2, _LAYER2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (_MPEG2, _LAYER3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+_MPEG_SAMPLE_RATES = {
+    _MPEG1: (44100, 48000, 32000),
+    _MPEG2: (22050, 24000, 16000),
+    _MPEG25: (11025, 12000, 8000),
+}
+
+_ADTS_SAMPLE_RATES = (
+    96000, 88200, 64000, 48000, 44100, 32000, 24000,
+    22050, 16000, 12000, 11025, 8000, 7350,
+)
+
+# how far we look for the next sync word before giving up on a damaged stream
+_RESYNC_WINDOW = 64 * 1024
+
+
+class SeekIndex:
+    """
+    Compact time to byte offset map of an audio file.
+
+    ``offsets[s]`` is the byte offset of the first frame (or page, or block)
+    that contains second ``s`` of audio, so seeking is a single array lookup.
+
+    \f
+
+    :param offsets: Byte offset for every second of audio
+    :type offsets: array
+    :param duration: Audio duration in seconds
+    :type duration: float
+    :param data_start: Offset of the first audio frame
+    :type data_start: int
+    :param data_end: Offset right after the last audio frame
+    :type data_end: int
+    :param bitrate: Average bitrate in bits per second
+    :type bitrate: int
+    """
+
+    __slots__ = ("offsets", "duration", "data_start", "data_end", "bitrate")
+
+    def __init__(
+        self,
+        offsets: array,
+        duration: float,
+        data_start: int,
+        data_end: int,
+        bitrate: int,
+    ):
+        self.offsets = offsets
+        self.duration = duration
+        self.data_start = data_start
+        self.data_end = data_end
+        self.bitrate = bitrate
+
+    def byte_offset(self, t: float) -> int:
+        """
+        Map a time position to the byte offset where playback has to start.
+
+        \f
+
+        :param t: Time position in seconds
+        :type t: float
+        :return: Byte offset of the frame containing ``t``
+        :rtype: int
+        """
+        if t < 0 or t >= self.duration or not self.offsets:
+            raise ValueError("Time position out of range")
+
+        return self.offsets[min(int(t), len(self.offsets) - 1)]
+
+    def to_bytes(self) -> bytes:
+        offsets = array("I", self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+
+        header = _HEADER.pack(
+            SEEK_INDEX_MAGIC,
+            SEEK_INDEX_VERSION,
+            self.data_start,
+            self.data_end,
+            self.bitrate,
+            len(offsets),
+            self.duration,
+        )
+        return header + offsets.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SeekIndex":
+        magic, version, data_start, data_end, bitrate, count, duration = (
+            _HEADER.unpack_from(data)
+        )
+        if magic != SEEK_INDEX_MAGIC or version != SEEK_INDEX_VERSION:
+            raise ValueError("Not a seek index")
+
+        offsets = array("I")
+        offsets.frombytes(data[_HEADER.size : _HEADER.size + count * offsets.itemsize])
+        if sys.byteorder == "big":
+            offsets.byteswap()
+
+        return cls(offsets, duration, data_start, data_end, bitrate)
+
+
+def _finalize(
+    offsets: array,
+    duration: float,
+    data_start: int,
+    data_end: int,
+) -> SeekIndex | None:
+    if duration <= 0 or not offsets:
+        return None
+
+    bitrate = round((data_end - data_start) * 8 / duration)
+    return SeekIndex(offsets, duration, data_start, data_end, bitrate)
+
+
+def _skip_id3v2(mm: mmap.mmap) -> int:
+    """
+    Returns the offset right after a leading ID3v2 tag (0 if there is none).
+    """
+    if len(mm) < 10 or mm[0:3] != b"ID3":
+        return 0
+
+    # the tag size is a 28 bit syncsafe integer, it doesn't include the header
+    size = (mm[6] << 21) | (mm[7] << 14) | (mm[8] << 7) | mm[9]
+    footer = 10 if mm[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_mpeg_header(mm: mmap.mmap, pos: int) -> tuple[int, int, int, int, int] | None:
+    """
+    Parse an MPEG audio frame header.
+
+    \f
+
+    :return: (frame length, samples per frame, sample rate, version, channel mode) or None
+    :rtype: tuple[int, int, int, int, int] | None
+    """
+    if pos + 4 > len(mm):
+        return None
+
+    b1, b2, b3 = mm[pos + 1], mm[pos + 2], mm[pos + 3]
+    if mm[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None  # reserved values or free format, which we can't index
+
+    table_version = _MPEG1 if version == _MPEG1 else _MPEG2
+    bitrate = _MPEG_BITRATES[(table_version, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == _LAYER1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == _LAYER2 or version == _MPEG1:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+
+    return length, samples, sample_rate, version, b3 >> 6
+
+
+def _find_mpeg_frame(mm: mmap.mmap, pos: int, limit: int) -> int:
+    """
+    Find the next offset holding two consecutive valid MPEG frame headers.
+    """
+    end = min(len(mm), pos + limit)
+    while pos < end:
+        pos = mm.find(b"\xff", pos, end)
+        if pos < 0:
+            return -1
+
+        header = _parse_mpeg_header(mm, pos)
+        if header and _parse_mpeg_header(mm, pos + header[0]):
+            return pos
+        pos += 1
+
+    return -1
+
+
+def _parse_vbr_toc(
+    mm: mmap.mmap,
+    pos: int,
+    header: tuple[int, int, int, int, int],
+) -> tuple[int, list[tuple[float, int]]] | None:
+    """
+    Parse the Xing/Info or VBRI tag stored in the first frame of a VBR file.
+
+    \f
+
+    :return: (number of audio frames, [(fraction of duration, byte offset)]) or None
+    :rtype: tuple[int, list[tuple[float, int]]] | None
+    """
+    _, _, _, version, channel_mode = header
+    mono = channel_mode == 3
+    if version == _MPEG1:
+        xing = pos + 4 + (17 if mono else 32)
+    else:
+        xing = pos + 4 + (9 if mono else 17)
+
+    if mm[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack_from(">I", mm, xing + 4)[0]
+        cursor = xing + 8
+        frames = total_bytes = 0
+        if flags & 0x1:
+            frames = struct.unpack_from(">I", mm, cursor)[0]
+            cursor += 4
+        if flags & 0x2:
+            total_bytes = struct.unpack_from(">I", mm, cursor)[0]
+            cursor += 4
+
+        toc = []
+        if flags & 0x4 and total_bytes:
+            # 100 entries, entry i is the file position at i% of the duration (in 1/256)
+            toc = [
+                (i / 100, pos + mm[cursor + i] * total_bytes // 256) for i in range(100)
+            ]
+        return frames, toc
+
+    vbri = pos + 4 + 32
+    if mm[vbri : vbri + 4] == b"VBRI":
+        (_, _, _, total_bytes, frames, entries, scale, entry_size, entry_frames) = (
+            struct.unpack_from(">HHHIIHHHH", mm, vbri + 4)
+        )
+        cursor = vbri + 26
+        offset = pos
+        toc = [(0.0, pos)]
+        for i in range(entries):
+            raw = mm[cursor : cursor + entry_size]
+            offset += int.from_bytes(raw, "big") * scale
+            cursor += entry_size
+            if frames:
+                toc.append(((i + 1) * entry_frames / frames, offset))
+        return frames, toc
+
+    return None
+
+
+def _index_from_toc(
+    toc: list[tuple[float, int]],
+    duration: float,
+    data_start: int,
+    data_end: int,
+) -> SeekIndex | None:
+    fractions = [fraction for fraction, _ in toc]
+    offsets = array("I")
+    for second in range(math.ceil(duration)):
+        i = max(bisect_right(fractions, second / duration) - 1, 0)
+        offsets.append(max(toc[i][1], data_start))
+
+    return _finalize(offsets, duration, data_start, data_end)
+
+
+def _build_mp3_index(mm: mmap.mmap) -> SeekIndex | None:
+    pos = _find_mpeg_frame(mm, _skip_id3v2(mm), _RESYNC_WINDOW)
+    if pos < 0:
+        return None
+
+    # the first frame may be a Xing/Info/VBRI tag: it carries no audio but has a TOC
+    vbr = _parse_vbr_toc(mm, pos, _parse_mpeg_header(mm, pos))
+    if vbr:
+        pos += _parse_mpeg_header(mm, pos)[0]
+    data_start = pos
+
+    offsets = array("I")
+    samples_total = 0
+    frames = 0
+    sample_rate = 0
+    next_second = 0
+    size = len(mm)
+
+    while pos < size:
+        header = _parse_mpeg_header(mm, pos)
+        if header is None or pos + header[0] > size:
+            # lost sync (garbage, a trailing ID3v1/APE tag...): try to resync
+            resync = _find_mpeg_frame(mm, pos + 1, _RESYNC_WINDOW)
+            if resync < 0:
+                break
+            pos = resync
+            continue
+
+        length, samples, sample_rate, _, _ = header
+        samples_total += samples
+        frames += 1
+
+        # every second that ends inside this frame starts from this frame
+        while next_second * sample_rate < samples_total:
+            offsets.append(pos)
+            next_second += 1
+        pos += length
+
+    data_end = pos if pos <= size else size
+    duration = samples_total / sample_rate if sample_rate else 0.0
+
+    # a damaged file: trust the encoder's TOC over a partial frame scan
+    if vbr and vbr[0] and vbr[1] and frames < vbr[0] * 0.9:
+        header = _parse_mpeg_header(mm, data_start)
+        if header:
+            duration = vbr[0] * header[1] / header[2]
+            return _index_from_toc(vbr[1], duration, data_start, size)
+
+    return _finalize(offsets, duration, data_start, data_end)
+
+
+def _build_adts_index(mm: mmap.mmap) -> SeekIndex | None:
+    pos = _skip_id3v2(mm)
+    size = len(mm)
+    data_start = pos
+    offsets = array("I")
+    samples_total = 0
+    sample_rate = 0
+    next_second = 0
+
+    while pos + 7 <= size:
+        if mm[pos] != 0xFF or (mm[pos + 1] & 0xF6) != 0xF0:
+            break
+
+        sample_rate_index = (mm[pos + 2] >> 2) & 0x0F
+        if sample_rate_index >= len(_ADTS_SAMPLE_RATES):
+            break
+        sample_rate = _ADTS_SAMPLE_RATES[sample_rate_index]
+        length = ((mm[pos + 3] & 0x03) << 11) | (mm[pos + 4] << 3) | (mm[pos + 5] >> 5)
+        if length < 7:
+            break
+
+        samples_total += 1024 * ((mm[pos + 6] & 0x03) + 1)
+        while next_second * sample_rate < samples_total:
+            offsets.append(pos)
+            next_second += 1
+        pos += length
+
+    duration = samples_total / sample_rate if sample_rate else 0.0
+    return _finalize(offsets, duration, data_start, min(pos, size))
+
+
+def _build_pcm_index(
+    data_start: int,
+    data_size: int,
+    byte_rate: int,
+    block_align: int,
+) -> SeekIndex | None:
+    """
+    Uncompressed audio is seekable by arithmetic, we only align offsets to sample frames.
+    """
+    if byte_rate <= 0 or block_align <= 0:
+        return None
+
+    duration = data_size / byte_rate
+    offsets = array("I")
+    for second in range(math.ceil(duration)):
+        offset = second * byte_rate
+        offsets.append(data_start + offset - offset % block_align)
+
+    return _finalize(offsets, duration, data_start, data_start + data_size)
+
+
+def _build_wav_index(mm: mmap.mmap) -> SeekIndex | None:
+    pos = 12
+    byte_rate = block_align = 0
+    while pos + 8 <= len(mm):
+        chunk_id = mm[pos : pos + 4]
+        chunk_size = struct.unpack_from("<I", mm, pos + 4)[0]
+        if chunk_id == b"fmt ":
+            byte_rate, block_align = struct.unpack_from("<IH", mm, pos + 16)
+        elif chunk_id == b"data":
+            data_size = min(chunk_size, len(mm) - pos - 8)
+            return _build_pcm_index(pos + 8, data_size, byte_rate, block_align)
+        pos += 8 + chunk_size + (chunk_size & 1)  # chunks are word aligned
+
+    return None
+
+
+def _parse_extended(raw: bytes) -> float:
+    """
+    Decode the 80 bit IEEE 754 extended float used by AIFF for the sample rate.
+    """
+    exponent = ((raw[0] & 0x7F) << 8) | raw[1]
+    mantissa = int.from_bytes(raw[2:10], "big")
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    return mantissa * 2.0 ** (exponent - 16383 - 63)
+
+
+def _build_aiff_index(mm: mmap.mmap) -> SeekIndex | None:
+    pos = 12
+    channels = bits = 0
+    sample_rate = 0.0
+    while pos + 8 <= len(mm):
+        chunk_id = mm[pos : pos + 4]
+        chunk_size = struct.unpack_from(">I", mm, pos + 4)[0]
+        if chunk_id == b"COMM":
+            channels, _, bits = struct.unpack_from(">hIh", mm, pos + 8)
+            sample_rate = _parse_extended(mm[pos + 16 : pos + 26])
+        elif chunk_id == b"SSND":
+            offset = struct.unpack_from(">I", mm, pos + 8)[0]
+            data_start = pos + 16 + offset
+            data_size = min(chunk_size - 8 - offset, len(mm) - data_start)
+            block_align = channels * ((bits + 7) // 8)
+            return _build_pcm_index(
+                data_start, data_size, int(sample_rate * block_align), block_align
+            )
+        pos += 8 + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+def _crc8(data: bytes) -> int:
+    """
+    CRC-8 (polynomial 0x07) protecting FLAC frame headers.
+    """
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _parse_flac_frame_header(mm: mmap.mmap, pos: int, fixed_block_size: int) -> int | None:
+    """
+    Parse a FLAC frame header and return the number of its first sample.
+    """
+    if pos + 6 > len(mm) or mm[pos] != 0xFF or (mm[pos + 1] & 0xFE) != 0xF8:
+        return None
+
+    variable = mm[pos + 1] & 0x01
+    block_size_code = mm[pos + 2] >> 4
+    sample_rate_code = mm[pos + 2] & 0x0F
+    if block_size_code == 0 or sample_rate_code == 15:
+        return None
+
+    # frame/sample number, "UTF-8" coded
+    cursor = pos + 4
+    first = mm[cursor]
+    if first < 0x80:
+        extra, number = 0, first
+    elif 0xC0 <= first < 0xFE:
+        extra = 1
+        while first & (0x40 >> extra):
+            extra += 1
+        number = first & (0x3F >> extra)
+    else:
+        return None
+    for i in range(1, extra + 1):
+        if cursor + i >= len(mm) or mm[cursor + i] & 0xC0 != 0x80:
+            return None
+        number = (number << 6) | (mm[cursor + i] & 0x3F)
+    cursor += extra + 1
+
+    cursor += {6: 1, 7: 2}.get(block_size_code, 0)
+    cursor += {12: 1, 13: 2, 14: 2}.get(sample_rate_code, 0)
+    if cursor >= len(mm) or _crc8(mm[pos:cursor]) != mm[cursor]:
+        return None
+
+    return number if variable else number * fixed_block_size
+
+
+def _build_flac_index(mm: mmap.mmap) -> SeekIndex | None:
+    pos = 4
+    sample_rate = total_samples = block_size = 0
+    seek_points = []
+    last = False
+    while not last and pos + 4 <= len(mm):
+        last = bool(mm[pos] & 0x80)
+        block_type = mm[pos] & 0x7F
+        length = int.from_bytes(mm[pos + 1 : pos + 4], "big")
+        body = pos + 4
+        if block_type == 0:  # STREAMINFO
+            block_size = struct.unpack_from(">H", mm, body)[0]
+            packed = int.from_bytes(mm[body + 10 : body + 18], "big")
+            sample_rate = packed >> 44
+            total_samples = packed & 0xFFFFFFFFF
+        elif block_type == 3:  # SEEKTABLE
+            for i in range(length // 18):
+                sample, offset, _ = struct.unpack_from(">QQH", mm, body + i * 18)
+                if sample != 0xFFFFFFFFFFFFFFFF:  # placeholder point
+                    seek_points.append((sample, offset))
+        pos = body + length
+
+    data_start = pos
+    if not sample_rate or not total_samples:
+        return None
+    duration = total_samples / sample_rate
+    seconds = math.ceil(duration)
+
+    # without a seek table, find frames by their sync code and check the header CRC
+    if not seek_points:
+        cursor = data_start
+        while cursor < len(mm):
+            cursor = mm.find(b"\xff", cursor)
+            if cursor < 0:
+                break
+            sample = _parse_flac_frame_header(mm, cursor, block_size)
+            # frames are contiguous, anything else is a false sync inside audio data
+            previous = seek_points[-1][0] if seek_points else -1
+            if sample is not None and previous < sample <= previous + 65536:
+                seek_points.append((sample, cursor - data_start))
+            cursor += 1
+
+    seek_points.sort()
+    samples = [sample for sample, _ in seek_points]
+    offsets = array("I")
+    for second in range(seconds):
+        i = bisect_right(samples, second * sample_rate) - 1
+        offsets.append(data_start + (seek_points[i][1] if i >= 0 else 0))
+
+    return _finalize(offsets, duration, data_start, len(mm))
+
+
+def _build_ogg_index(mm: mmap.mmap) -> SeekIndex | None:
+    size = len(mm)
+    pos = 0
+    sample_rate = 0
+    pre_skip = 0
+    offsets = array("I")
+    next_second = 0
+    end_time = 0.0
+
+    while pos + 27 <= size and mm[pos : pos + 4] == b"OggS":
+        granule = struct.unpack_from("<q", mm, pos + 6)[0]
+        segments = mm[pos + 26]
+        header_size = 27 + segments
+        body_size = sum(mm[pos + 27 : pos + header_size])
+
+        if not sample_rate:
+            body = mm[pos + header_size : pos + header_size + 19]
+            if body[:7] == b"\x01vorbis":
+                sample_rate = struct.unpack_from("<I", body, 12)[0]
+            elif body[:8] == b"OpusHead":
+                sample_rate = 48000  # opus granules are always at 48 kHz
+                pre_skip = struct.unpack_from("<H", body, 10)[0]
+
+        if sample_rate and granule > 0:
+            end_time = max(granule - pre_skip, 0) / sample_rate
+            while next_second < end_time:
+                offsets.append(pos)
+                next_second += 1
+
+        pos += header_size + body_size
+
+    return _finalize(offsets, end_time, offsets[0] if offsets else 0, min(pos, size))
+
+
+def build_seek_index(path: str) -> SeekIndex | None:
+    """
+    Build the seek index of an audio file.
+    The format is detected from the file content, not from its extension.
+
+    \f
+
+    :param path: Path of the audio file
+    :type path: str
+    :return: The seek index or None if the format can't be indexed
+    :rtype: SeekIndex | None
+    """
+    if os.path.getsize(path) == 0:
+        return None
+
+    with open(path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        magic = mm[0:12]
+        if magic[0:4] == b"RIFF" and magic[8:12] == b"WAVE":
+            return _build_wav_index(mm)
+        if magic[0:4] == b"FORM" and magic[8:12] in (b"AIFF", b"AIFC"):
+            return _build_aiff_index(mm)
+        if magic[0:4] == b"fLaC":
+            return _build_flac_index(mm)
+        if magic[0:4] == b"OggS":
+            return _build_ogg_index(mm)
+
+        start = _skip_id3v2(mm)
+        if start + 2 <= len(mm) and mm[start] == 0xFF and (mm[start + 1] & 0xF6) == 0xF0:
+            return _build_adts_index(mm)  # AAC in ADTS framing
+        if magic[4:8] == b"ftyp" or magic[0:4] == b"\x30\x26\xb2\x75":
+            return None  # MP4 and ASF containers aren't indexed yet
+
+        return _build_mp3_index(mm)
+
+
+def seek_index_path(song_id: int) -> str:
+    return os.path.join(SEEK_INDEX_DIRECTORY, f"{song_id}.idx")
+
+
+def file_seek_index_path(path: str) -> str:
+    # stored next to the file, versioned with it: the renditions get theirs this way
+    return f"{path}.idx"
+
+
+def _write_seek_index(path: str, index: SeekIndex) -> None:
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(index.to_bytes())
+    os.replace(f"{path}.tmp", path)
+
+
+def save_seek_index(song_id: int, index: SeekIndex) -> None:
+    """
+    Store the seek index of a song, replacing the old one atomically.
+    """
+    os.makedirs(SEEK_INDEX_DIRECTORY, exist_ok=True)
+    _write_seek_index(seek_index_path(song_id), index)
+    invalidate_seek_index(song_id)
+
+
+def save_file_seek_index(path: str, index: SeekIndex) -> None:
+    """
+    Store the seek index of a file next to it, see file_seek_index_path.
+    """
+    _write_seek_index(file_seek_index_path(path), index)
+
+
+def delete_seek_index(song_id: int) -> None:
+    try:
+        os.remove(seek_index_path(song_id))
+    except FileNotFoundError:
+        pass
+    invalidate_seek_index(song_id)
+
+
+# the indexes are small (4 bytes per second), keep the most used in memory,
+# by song ID for the originals and by path for the files indexed next to them
+_seek_index_cache: OrderedDict[int | str, SeekIndex] = OrderedDict()
+
+
+def _get_cached_seek_index(key: int | str, path: str) -> SeekIndex | None:
+    index = _seek_index_cache.get(key)
+    if index is not None:
+        _seek_index_cache.move_to_end(key)
+        return index
+
+    try:
+        with open(path, "rb") as file:
+            index = SeekIndex.from_bytes(file.read())
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
+
+    _seek_index_cache[key] = index
+    if len(_seek_index_cache) > SEEK_INDEX_CACHE_SIZE:
+        _seek_index_cache.popitem(last=False)
+    return index
+
+
+def get_seek_index(song_id: int) -> SeekIndex | None:
+    """
+    Get the seek index of a song, reading it from disk only the first time.
+
+    \f
+
+    :param song_id: Song's ID
+    :type song_id: int
+    :return: The seek index or None if the song has none
+    :rtype: SeekIndex | None
+    """
+    return _get_cached_seek_index(song_id, seek_index_path(song_id))
+
+
+def get_file_seek_index(path: str) -> SeekIndex | None:
+    """
+    Get the seek index stored next to a file, reading it from disk only the first time.
+    The paths are versioned, a cached index never goes stale.
+
+    \f
+
+    :param path: Path of the indexed file
+    :type path: str
+    :return: The seek index or None if the file has none
+    :rtype: SeekIndex | None
+    """
+    return _get_cached_seek_index(path, file_seek_index_path(path))
+
+
+def invalidate_seek_index(song_id: int) -> None:
+    _seek_index_cache.pop(song_id, None)
@@ -0,0 +1,196 @@
+import numpy as np
+
+from fastapi import Request
+from scipy import sparse
+
+from .array_builds import load_build, save_build
+
+_MODEL_FILES = ("song_ids", "indptr", "neighbors", "scores")
+
+SIMILARITY_MEASURES = ("cosine", "pmi")
+
+
+def cooccurrence_neighbors(
+    song_ids: np.ndarray,
+    playlist_ids: np.ndarray,
+    top_k: int,
+    measure: str = "cosine",
+    min_count: int = 1,
+    block_entries: int = 5_000_000,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The "top_k" songs most often found in the same playlists as every song.
+
+    The playlists make a sparse songs x playlists matrix A, A @ A.T counts the playlists
+    every pair of songs shares. The counts are normalized, so a song found everywhere isn't
+    everyone's neighbour:
+
+    - "cosine": count / sqrt(playlists of the first * playlists of the second)
+    - "pmi": log(count * playlists / (playlists of the first * playlists of the second)),
+      how much more often than by chance they're together, only the positive ones are kept
+
+    The product is computed and pruned a block of songs at a time, each block holding about
+    "block_entries" pairs, so the memory doesn't grow with the square of the popular songs.
+
+    \f
+
+    :param song_ids: Song of every link
+    :type song_ids: np.ndarray
+    :param playlist_ids: Playlist of every link
+    :type playlist_ids: np.ndarray
+    :param top_k: Neighbours kept per song
+    :type top_k: int
+    :param measure: "cosine" or "pmi"
+    :type measure: str
+    :param min_count: Playlists a pair must share at least
+    :type min_count: int
+    :param block_entries: Pairs computed at once, about
+    :type block_entries: int
+    :return: (song_ids, indptr, neighbors, scores): the neighbours of song_ids[i] are
+        neighbors[indptr[i]:indptr[i + 1]], best first
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    """
+    if measure not in SIMILARITY_MEASURES:
+        raise ValueError(f"Unknown similarity measure: {measure}")
+
+    songs, rows = np.unique(song_ids, return_inverse=True)
+    playlists, columns = np.unique(playlist_ids, return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows.ravel(), columns.ravel())),
+        shape=(len(songs), len(playlists)),
+    )
+    incidence.sum_duplicates()
+    incidence.data[:] = 1.0  # a song twice in a playlist counts once
+    transposed = incidence.T.tocsr()
+
+    counts = np.diff(incidence.indptr).astype(np.float64)  # playlists per song
+    lengths = np.diff(transposed.indptr).astype(np.float64)  # songs per playlist
+
+    # pairs every song makes, to cut the songs into blocks of about "block_entries" pairs
+    pairs = np.cumsum(incidence @ lengths)
+    bounds = [0]
+    while bounds[-1] < len(songs):
+        limit = (pairs[bounds[-1] - 1] if bounds[-1] else 0) + block_entries
+        bounds.append(max(int(np.searchsorted(pairs, limit, side="right")), bounds[-1] + 1))
+
+    indptr = [np.zeros(1, dtype=np.int64)]
+    neighbors, scores = [], []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        block = (incidence[start:end] @ transposed).tocsr()
+        block.sort_indices()  # equal scores in the order of the songs, whatever the blocks
+        block_rows = np.repeat(np.arange(end - start, dtype=np.int32), np.diff(block.indptr))
+        # a song isn't its own neighbour
+        keep = (block.indices != block_rows + start) & (block.data >= min_count)
+        block_rows, block_columns = block_rows[keep], block.indices[keep]
+        shared = block.data[keep].astype(np.float64)
+
+        expected = counts[block_rows + start] * counts[block_columns]
+        if measure == "cosine":
+            block_scores = shared / np.sqrt(expected)
+        else:
+            block_scores = np.log(shared * len(playlists) / expected)
+            keep = block_scores > 0
+            block_rows, block_columns = block_rows[keep], block_columns[keep]
+            block_scores = block_scores[keep]
+
+        # best first in every song, then the first "top_k" of each: one sort of a single key,
+        # the row plus a decreasing function of the score in [0, 0.5), many times faster than
+        # sorting on both. The scores are rounded to the float32 they're saved as first, so
+        # the rounding of the key never splits equal ones
+        block_scores = block_scores.astype(np.float32)
+        keys = block_rows + 0.5 / (1.0 + block_scores.astype(np.float64))
+        order = np.argsort(keys, kind="stable")
+        block_rows = block_rows[order]
+        row_counts = np.bincount(block_rows, minlength=end - start)
+        row_starts = np.cumsum(row_counts) - row_counts
+        ranks = np.arange(len(order)) - row_starts[block_rows]
+        kept = order[ranks < top_k]
+
+        indptr.append(indptr[-1][-1] + np.cumsum(np.minimum(row_counts, top_k)))
+        neighbors.append(songs[block_columns[kept]].astype(np.int32))
+        scores.append(block_scores[kept])
+
+    return (
+        songs.astype(np.int64),
+        np.concatenate(indptr),
+        np.concatenate(neighbors) if neighbors else np.empty(0, np.int32),
+        np.concatenate(scores) if scores else np.empty(0, np.float32),
+    )
+
+
+class SimilarSongs:
+    """
+    Item to item model of the songs found in the same playlists, see cooccurrence_neighbors.
+
+    It's built offline by "scripts/build_similar_songs.py" into four arrays, memory mapped
+    so every worker shares the same pages: looking a song up is a binary search and a slice.
+    Workers pick a new model up at their next start.
+
+    \f
+
+    :param directory: Where the model is stored
+    :type directory: str
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._song_ids = np.empty(0, np.int64)
+        self._indptr = np.zeros(1, np.int64)
+        self._neighbors = np.empty(0, np.int32)
+        self._scores = np.empty(0, np.float32)
+
+    def load(self) -> None:
+        build = load_build(self.directory, _MODEL_FILES)
+        if build is None:
+            return
+        _, arrays = build
+        # plain arrays over the same mapping, a memmap costs microseconds per operation
+        self._song_ids, self._indptr, self._neighbors, self._scores = (
+            array.view(np.ndarray) for array in arrays
+        )
+
+    def __len__(self) -> int:
+        return len(self._song_ids)
+
+    @staticmethod
+    def build(
+        directory: str,
+        song_ids: np.ndarray,
+        playlist_ids: np.ndarray,
+        top_k: int,
+        measure: str = "cosine",
+        min_count: int = 1,
+    ) -> dict:
+        """
+        Write the model of the (song_id, playlist_id) links, see cooccurrence_neighbors.
+        """
+        arrays = cooccurrence_neighbors(song_ids, playlist_ids, top_k, measure, min_count)
+        save_build(directory, dict(zip(_MODEL_FILES, arrays)))
+        return {
+            "songs": len(arrays[0]),
+            "neighbors": len(arrays[2]),
+            "bytes": sum(array.nbytes for array in arrays),
+        }
+
+    def similar(self, song_id: int, limit: int | None = None) -> list[tuple[int, float]]:
+        """
+        The (song_id, score) of the songs most similar to a song, best first.
+        """
+        # the ID and the array are both int64, nothing is converted: a binary search only
+        index = int(self._song_ids.searchsorted(song_id))
+        if index == len(self._song_ids) or self._song_ids[index] != song_id:
+            return []
+
+        start, end = int(self._indptr[index]), int(self._indptr[index + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+        return list(
+            zip(self._neighbors[start:end].tolist(), self._scores[start:end].tolist())
+        )
+
+
+def get_similar_songs(request: Request) -> SimilarSongs:
+    """
+    Returns the model loaded in the lifespan, usefull for dependencies in a route.
+    """
+    return request.app.state.similar_songs
@@ -0,0 +1,115 @@
+import mmap
+import os
+
+from typing import BinaryIO
+
+import anyio
+
+from fastapi import HTTPException
+
+
+def parse_range_header(range_header: str | None, file_size: int) -> tuple[int, int] | None:
+    """
+    Parse a single range "Range" header: "bytes=start-end", "bytes=start-" or "bytes=-suffix".
+
+    \f
+
+    :param range_header: The Range header, if any
+    :type range_header: str | None
+    :param file_size: Size of the requested file
+    :type file_size: int
+    :return: The (start, end) range, end included, or None to send the whole file
+    :rtype: tuple[int, int] | None
+    """
+    if not range_header:
+        return None
+
+    try:
+        unit, ranges = range_header.split("=", 1)
+        if unit.strip() != "bytes" or "," in ranges:
+            raise ValueError  # multiple ranges aren't supported
+
+        range_start, range_end = (value.strip() for value in ranges.split("-", 1))
+        if not range_start:
+            # suffix range, the last N bytes
+            suffix = int(range_end)
+            range_start, range_end = max(file_size - suffix, 0), file_size - 1
+        else:
+            range_start = int(range_start)
+            range_end = min(int(range_end), file_size - 1) if range_end else file_size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested Range Not Satisfiable")
+
+    if range_start >= file_size or range_start > range_end or range_start < 0:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested Range Not Satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+
+    return range_start, range_end
+
+
+async def iter_file_range(
+    path: str | BinaryIO,
+    start: int,
+    end: int,
+    chunk_size: int,
+):
+    """
+    Yield the bytes between "start" and "end" (included) of a file, "chunk_size" at a time.
+
+    The file is memory mapped and every chunk is copied out of the mapping in a worker
+    thread, so page faults on a cold file never block the event loop.
+
+    \f
+
+    :param path: Path of the file, or the file already opened in binary mode (it gets closed)
+    :type path: str | BinaryIO
+    :param start: First byte
+    :type start: int
+    :param end: Last byte
+    :type end: int
+    :param chunk_size: Size of every yielded chunk
+    :type chunk_size: int
+    """
+    file = open(path, "rb") if isinstance(path, str) else path
+    with file:
+        if end < start:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            if hasattr(mapping, "madvise"):
+                # let the kernel read ahead aggressively, we go through it only once
+                mapping.madvise(mmap.MADV_SEQUENTIAL, 0, len(mapping))
+
+            position = start
+            while position <= end:
+                stop = min(position + chunk_size, end + 1)
+                yield await anyio.to_thread.run_sync(
+                    mapping.__getitem__, slice(position, stop)
+                )
+                position = stop
+
+
+def range_headers(start: int, end: int, file_size: int, media_type: str) -> dict:
+    """
+    Headers of a 206 Partial Content response.
+    """
+    return {
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        "Content-Type": media_type,
+    }
+
+
+def is_safe_filename(filename: str) -> bool:
+    """
+    Whether "filename" is a plain file name that can't escape its directory.
+    """
+    return (
+        filename == os.path.basename(filename)
+        and filename not in ("", ".", "..")
+        and not filename.startswith(".")
+    )
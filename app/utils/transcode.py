@@ -0,0 +1,273 @@
+import contextlib
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import zlib
+
+from collections.abc import Collection, Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlmodel import Session
+
+from ..commons.constants import (
+    AUDIO_DIRECTORY,
+    JOB_TIMEOUT,
+    TRANSCODE_BANDWIDTH_SHARE,
+    TRANSCODE_BITRATES,
+    TRANSCODE_SAMPLE_RATE,
+)
+from ..core.jobs import JobRejected
+from ..core.process_pool import run_in_process
+from ..models.media_asset_model import MediaAssetCreate
+from .file_utils import shard_path
+from .seek_index import build_seek_index, file_seek_index_path, save_file_seek_index
+
+# formats without loss, every rendition is worth making out of them
+_LOSSLESS_EXTENSIONS = {".wav", ".flac", ".alac", ".aiff", ".aif"}
+
+# kbit/s a client announcing only its "effective connection type" can sustain
+_ECT_BANDWIDTHS = {"slow-2g": 50, "2g": 70, "3g": 700}
+
+
+class TranscodeError(Exception):
+    """
+    ffmpeg couldn't transcode the file.
+    """
+
+
+def rendition_kind(kbps: int) -> str:
+    # the kind of the media asset, also what the "quality" query parameter takes
+    return f"{kbps}k"
+
+
+def rendition_path(song_id: int, version: str, kbps: int | str) -> str:
+    # versioned by the original content, like the original file itself
+    return shard_path(AUDIO_DIRECTORY, song_id, f"{song_id}-{version}-{kbps}k.mp3")
+
+
+def rendition_bitrates(extension: str, bitrate: int | None) -> list[int]:
+    """
+    The renditions worth making of an original: a lossy one only gets the lower bitrates,
+    transcoding it up would cost bytes without adding anything.
+
+    \f
+
+    :param extension: Extension of the original, with the "."
+    :type extension: str
+    :param bitrate: Bitrate of the original in bits per second, None if unknown
+    :type bitrate: int | None
+    :return: Bitrates of the renditions in kbit/s, lowest first
+    :rtype: list[int]
+    """
+    bitrates = sorted(TRANSCODE_BITRATES)
+    if extension in _LOSSLESS_EXTENSIONS or bitrate is None:
+        return bitrates
+    return [kbps for kbps in bitrates if kbps * 1000 < bitrate]
+
+
+def select_rendition(
+    quality: str | None,
+    extension: str,
+    bitrate: int | None,
+    headers: Mapping[str, str],
+) -> str:
+    """
+    Pick the file to stream for the "quality" a client asks for.
+
+    "original" (the default) and the rendition kinds, e.g. "160k", are taken as is;
+    a rendition the original doesn't get falls back to the original.
+    "auto" picks the best file fitting in the bandwidth the client declares
+    through the "Downlink" (Mbit/s) or "ECT" client hints, keeping some headroom,
+    and the smallest one if it asks to "Save-Data". Without hints it's the original.
+
+    \f
+
+    :param quality: Requested quality
+    :type quality: str | None
+    :param extension: Extension of the original, with the "."
+    :type extension: str
+    :param bitrate: Bitrate of the original in bits per second, None if unknown
+    :type bitrate: int | None
+    :param headers: Request headers
+    :type headers: Mapping[str, str]
+    :return: Kind of the media asset to stream
+    :rtype: str
+    """
+    bitrates = rendition_bitrates(extension, bitrate)
+    if quality is None or quality == "original":
+        return "original"
+    if quality != "auto":
+        kbps = int(quality.removesuffix("k"))
+        return rendition_kind(kbps) if kbps in bitrates else "original"
+
+    if not bitrates:
+        return "original"
+    if headers.get("save-data", "").strip().lower() == "on":
+        return rendition_kind(bitrates[0])
+
+    try:
+        budget = float(headers.get("downlink", "")) * 1000 * TRANSCODE_BANDWIDTH_SHARE
+    except ValueError:
+        budget = _ECT_BANDWIDTHS.get(headers.get("ect", "").strip().lower())
+        if budget is None:
+            return "original"
+        budget *= TRANSCODE_BANDWIDTH_SHARE
+
+    if bitrate is not None and bitrate <= budget * 1000:
+        return "original"
+    fitting = [kbps for kbps in bitrates if kbps <= budget]
+    return rendition_kind(fitting[-1] if fitting else bitrates[0])
+
+
+def transcode_audio(audio_path: str, renditions: dict[int, str]) -> list[dict]:
+    """
+    Encode the renditions of an audio file, in a single ffmpeg run that decodes it once.
+    The files are written next to their final path and moved in place once complete,
+    each with its seek index stored next to it: lame pads the frames one byte at a time
+    to keep the bitrate, the frame boundaries can't be computed from it.
+    It runs in the process pool, which bounds how many ffmpeg run at once.
+
+    \f
+
+    :param audio_path: Path of the original
+    :type audio_path: str
+    :param renditions: Path of every rendition, by bitrate in kbit/s
+    :type renditions: dict[int, str]
+    :return: What the media asset of every rendition records
+    :rtype: list[dict]
+    """
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-y", "-i", audio_path]
+    for kbps, path in renditions.items():
+        command += [
+            "-map", "0:a:0", "-map_metadata", "-1",
+            "-ar", str(TRANSCODE_SAMPLE_RATE),
+            "-c:a", "libmp3lame", "-b:a", f"{kbps}k",
+            # no ID3 tag nor Xing frame: the audio frames start at the first byte
+            "-id3v2_version", "0", "-write_xing", "0",
+            "-f", "mp3", f"{path}.tmp",
+        ]
+
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=JOB_TIMEOUT)
+        if result.returncode != 0:
+            raise TranscodeError(
+                f"Can't transcode {audio_path}: {result.stderr.decode().strip()}"
+            )
+    except BaseException:
+        for path in renditions.values():
+            if os.path.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+        raise
+
+    results = []
+    for kbps, path in renditions.items():
+        os.replace(f"{path}.tmp", path)
+
+        content_hash = hashlib.sha256()
+        crc32 = 0
+        with open(path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                content_hash.update(chunk)
+                crc32 = zlib.crc32(chunk, crc32)
+
+        seek_index = build_seek_index(path)
+        if seek_index:
+            save_file_seek_index(path, seek_index)
+        results.append(
+            {
+                "kbps": kbps,
+                "path": path,
+                "size": os.path.getsize(path),
+                "mtime": os.path.getmtime(path),
+                "content_hash": content_hash.hexdigest(),
+                "crc32": crc32,
+                "duration": seek_index.duration if seek_index else None,
+                "bitrate": kbps * 1000,
+            }
+        )
+    return results
+
+
+def delete_renditions(song_id: int, keep: Collection[str] = ()) -> None:
+    # renditions have two dashes in their name, the original only one
+    for old_path in glob.glob(rendition_path(song_id, "*", "*")):
+        if old_path not in keep:
+            os.remove(old_path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(file_seek_index_path(old_path))
+
+
+async def transcode_song(
+    pool: ProcessPoolExecutor,
+    song_id: int,
+    audio_path: str,
+    version: str,
+) -> None:
+    """
+    Make the lower bitrate renditions of a freshly uploaded song, record them as media
+    assets and drop the previous ones.
+    It's the handler of the "transcode" jobs, errors are retried by the job queue, except
+    when ffmpeg is missing or rejects the file: retrying can't help, the job is rejected.
+
+    \f
+
+    :param pool: Process pool
+    :type pool: ProcessPoolExecutor
+    :param song_id: Song's ID
+    :type song_id: int
+    :param audio_path: Path of the original
+    :type audio_path: str
+    :param version: Version of the original
+    :type version: str
+    """
+    if shutil.which("ffmpeg") is None:
+        raise JobRejected(f"No renditions for song {song_id}: ffmpeg isn't installed")
+
+    # imported here, the crud modules import the models this module doesn't need
+    from ..core.database import engine
+    from ..crud.media_assets import (
+        delete_media_assets,
+        invalidate_media_asset,
+        read_media_asset,
+        upsert_media_asset,
+    )
+
+    with Session(engine) as session:
+        invalidate_media_asset(song_id)  # the cached row may be stale, ask the database
+        original = await read_media_asset(session=session, song_id=song_id)
+    if original is None or original.path != audio_path:
+        return  # replaced meanwhile, the job of the new file makes its renditions
+
+    renditions = {
+        kbps: rendition_path(song_id, version, kbps)
+        for kbps in rendition_bitrates(original.extension, original.bitrate)
+    }
+    results = []
+    if renditions:
+        try:
+            results = await run_in_process(pool, transcode_audio, audio_path, renditions)
+        except TranscodeError as exc:
+            raise JobRejected(f"No renditions for song {song_id}: {exc}") from exc
+
+    with Session(engine) as session:
+        for result in results:
+            kbps = result.pop("kbps")
+            await upsert_media_asset(
+                session=session,
+                asset=MediaAssetCreate(
+                    song_id=song_id,
+                    kind=rendition_kind(kbps),
+                    extension=".mp3",
+                    mime_type="audio/mpeg",
+                    **result,
+                ),
+            )
+        await delete_media_assets(
+            session=session,
+            song_id=song_id,
+            keep=["original", *(rendition_kind(kbps) for kbps in renditions)],
+        )
+
+    delete_renditions(song_id, keep=renditions.values())
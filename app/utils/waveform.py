@@ -0,0 +1,179 @@
+import glob
+import os
+import struct
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..commons.constants import (
+    WAVEFORM_BITS,
+    WAVEFORM_DIRECTORY,
+    WAVEFORM_LEVELS,
+    WAVEFORM_SAMPLE_RATE,
+    WAVEFORM_SAMPLES_PER_PEAK,
+)
+from ..core.jobs import JobRejected
+from ..core.process_pool import run_in_process
+from .audio_decode import AudioDecodeError, decode_audio
+from .file_utils import shard_path
+
+# magic, version, bits per peak, number of levels, sample rate, samples per peak of level 0
+_HEADER = struct.Struct("<4sBBBxII")
+_MAGIC = b"WAVF"
+_VERSION = 1
+
+# every level groups this many peaks of the previous one
+_LEVEL_FACTOR = 4
+
+
+def compute_peaks(
+    samples: np.ndarray,
+    samples_per_peak: int,
+    levels: int,
+    bits: int = 8,
+) -> list[np.ndarray]:
+    """
+    Min/max peaks of mono samples, at "levels" zoom levels.
+
+    Level 0 has a (min, max) pair every "samples_per_peak" samples, every next level has
+    4 times fewer pairs. Each level is computed from the previous one, so the samples
+    are read only once.
+
+    \f
+
+    :param samples: Mono samples in [-1, 1]
+    :type samples: np.ndarray
+    :param samples_per_peak: Samples summarized by every peak of level 0
+    :type samples_per_peak: int
+    :param levels: Number of zoom levels
+    :type levels: int
+    :param bits: 8 or 16, the size of every quantized value
+    :type bits: int
+    :return: For every level, the interleaved min and max values
+    :rtype: list[np.ndarray]
+    """
+    samples = np.asarray(samples, dtype=np.float32).ravel()
+    if len(samples) == 0:
+        samples = np.zeros(1, dtype=np.float32)
+
+    # the last block is padded with its own last sample, it doesn't change its peaks
+    padding = -len(samples) % samples_per_peak
+    blocks = np.pad(samples, (0, padding), mode="edge").reshape(-1, samples_per_peak)
+    minimums, maximums = blocks.min(axis=1), blocks.max(axis=1)
+
+    scale = 2 ** (bits - 1) - 1
+    dtype = np.int8 if bits == 8 else np.dtype("<i2")
+
+    peaks = []
+    for level in range(levels):
+        if level:
+            padding = -len(minimums) % _LEVEL_FACTOR
+            minimums = np.pad(minimums, (0, padding), mode="edge")
+            maximums = np.pad(maximums, (0, padding), mode="edge")
+            minimums = minimums.reshape(-1, _LEVEL_FACTOR).min(axis=1)
+            maximums = maximums.reshape(-1, _LEVEL_FACTOR).max(axis=1)
+
+        pairs = np.stack([minimums, maximums], axis=1).ravel()
+        peaks.append(
+            np.clip(np.round(pairs * scale), -scale - 1, scale).astype(dtype)
+        )
+    return peaks
+
+
+def encode_waveform(
+    peaks: list[np.ndarray],
+    sample_rate: int,
+    samples_per_peak: int,
+    bits: int,
+) -> bytes:
+    """
+    Binary representation served to the player, little endian:
+
+    - header: b"WAVF", version (u8), bits per value (u8), levels (u8), padding (u8),
+      sample rate (u32), samples per peak of level 0 (u32)
+    - number of (min, max) pairs of every level (u32 each)
+    - the values of every level, from the most detailed one, as int8 or int16
+    """
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, bits, len(peaks), sample_rate, samples_per_peak
+    )
+    counts = struct.pack(f"<{len(peaks)}I", *(len(level) // 2 for level in peaks))
+    return header + counts + b"".join(level.tobytes() for level in peaks)
+
+
+def decode_waveform(data: bytes) -> tuple[dict, list[np.ndarray]]:
+    """
+    Read back what "encode_waveform" wrote: the header fields and the peaks of every level.
+    """
+    magic, version, bits, levels, sample_rate, samples_per_peak = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a waveform file")
+
+    counts = struct.unpack_from(f"<{levels}I", data, _HEADER.size)
+    dtype = np.int8 if bits == 8 else np.dtype("<i2")
+    offset = _HEADER.size + 4 * levels
+    peaks = []
+    for count in counts:
+        peaks.append(np.frombuffer(data, dtype=dtype, count=2 * count, offset=offset))
+        offset += 2 * count * peaks[-1].itemsize
+
+    header = {
+        "bits": bits,
+        "sample_rate": sample_rate,
+        "samples_per_peak": samples_per_peak,
+    }
+    return header, peaks
+
+
+def waveform_path(song_id: int, version: str) -> str:
+    # versioned by the audio content, so a file never changes once written
+    return shard_path(WAVEFORM_DIRECTORY, song_id, f"{song_id}-{version}.bin")
+
+
+def build_waveform(audio_path: str, output_path: str) -> None:
+    """
+    Decode an audio file and store its waveform peaks. It runs in the process pool.
+
+    \f
+
+    :param audio_path: Path of the audio file
+    :type audio_path: str
+    :param output_path: Where the peaks are written
+    :type output_path: str
+    :raises AudioDecodeError: If the file can't be decoded
+    """
+    samples, sample_rate = decode_audio(
+        audio_path, sample_rate=WAVEFORM_SAMPLE_RATE, channels=1
+    )
+    peaks = compute_peaks(
+        samples, WAVEFORM_SAMPLES_PER_PEAK, WAVEFORM_LEVELS, WAVEFORM_BITS
+    )
+    data = encode_waveform(peaks, sample_rate, WAVEFORM_SAMPLES_PER_PEAK, WAVEFORM_BITS)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(f"{output_path}.tmp", "wb") as file:
+        file.write(data)
+    os.replace(f"{output_path}.tmp", output_path)
+
+
+async def generate_waveform(
+    pool: ProcessPoolExecutor,
+    song_id: int,
+    audio_path: str,
+    version: str,
+) -> None:
+    """
+    Build the waveform of a freshly uploaded song, then drop the ones of its previous files.
+    It's the handler of the "waveform" jobs, errors are retried by the job queue, except
+    a file that can't be decoded: the job is rejected with the decoder's error.
+    """
+    path = waveform_path(song_id, version)
+    try:
+        await run_in_process(pool, build_waveform, audio_path, path)
+    except AudioDecodeError as exc:
+        raise JobRejected(f"No waveform for song {song_id}: {exc}") from exc
+
+    for old_path in glob.glob(waveform_path(song_id, "*")):
+        if old_path != path:
+            os.remove(old_path)
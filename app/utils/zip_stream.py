@@ -0,0 +1,239 @@
+import hashlib
+import struct
+import time
+
+from typing import BinaryIO, Callable, NamedTuple
+
+from .stream_utils import iter_file_range
+
+# sizes and offsets above these need the ZIP64 extensions
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+
+_FLAG_UTF8 = 0x0800  # file names are UTF-8 encoded
+_METHOD_STORE = 0
+
+
+class ZipMember(NamedTuple):
+    """
+    A file of the archive, everything about it must be known before streaming starts.
+
+    \f
+
+    :param name: Name of the file inside the archive
+    :type name: str
+    :param path: Path of the file on disk
+    :type path: str
+    :param size: Size in bytes
+    :type size: int
+    :param crc32: CRC-32 of the content
+    :type crc32: int
+    :param mtime: Last modification time, as a UNIX timestamp
+    :type mtime: float
+    """
+
+    name: str
+    path: str
+    size: int
+    crc32: int
+    mtime: float
+
+
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    # UTC, so every worker generates the very same bytes whatever its time zone
+    moment = time.gmtime(max(mtime, 315532800))  # DOS dates start in 1980
+    dos_time = (moment.tm_hour << 11) | (moment.tm_min << 5) | (moment.tm_sec // 2)
+    dos_date = ((moment.tm_year - 1980) << 9) | (moment.tm_mon << 5) | moment.tm_mday
+    return dos_time, dos_date
+
+
+def _local_header(member: ZipMember, name: bytes) -> bytes:
+    dos_time, dos_date = _dos_datetime(member.mtime)
+    size, extra, version = member.size, b"", 20
+    if member.size >= _ZIP64_LIMIT:
+        size, version = _ZIP64_LIMIT, 45
+        extra = struct.pack("<HHQQ", 0x0001, 16, member.size, member.size)
+
+    return (
+        struct.pack(
+            "<4sHHHHHIIIHH",
+            b"PK\x03\x04",
+            version,
+            _FLAG_UTF8,
+            _METHOD_STORE,
+            dos_time,
+            dos_date,
+            member.crc32,
+            size,
+            size,
+            len(name),
+            len(extra),
+        )
+        + name
+        + extra
+    )
+
+
+def _central_header(member: ZipMember, name: bytes, offset: int) -> bytes:
+    dos_time, dos_date = _dos_datetime(member.mtime)
+    size, extra_fields = member.size, []
+    if member.size >= _ZIP64_LIMIT:
+        size = _ZIP64_LIMIT
+        extra_fields += [member.size, member.size]
+    if offset >= _ZIP64_LIMIT:
+        extra_fields.append(offset)
+        offset = _ZIP64_LIMIT
+
+    extra, version = b"", 20
+    if extra_fields:
+        version = 45
+        extra = struct.pack(
+            f"<HH{len(extra_fields)}Q", 0x0001, 8 * len(extra_fields), *extra_fields
+        )
+
+    return (
+        struct.pack(
+            "<4sHHHHHHIIIHHHHHII",
+            b"PK\x01\x02",
+            version,  # made by
+            version,  # needed to extract
+            _FLAG_UTF8,
+            _METHOD_STORE,
+            dos_time,
+            dos_date,
+            member.crc32,
+            size,
+            size,
+            len(name),
+            len(extra),
+            0,  # comment length
+            0,  # disk number
+            0,  # internal attributes
+            0,  # external attributes
+            offset,
+        )
+        + name
+        + extra
+    )
+
+
+def _end_records(count: int, directory_offset: int, directory_size: int) -> bytes:
+    records = b""
+    if (
+        count >= _ZIP64_COUNT_LIMIT
+        or directory_offset >= _ZIP64_LIMIT
+        or directory_size >= _ZIP64_LIMIT
+    ):
+        zip64_offset = directory_offset + directory_size
+        records += struct.pack(
+            "<4sQHHIIQQQQ",
+            b"PK\x06\x06",
+            44,  # size of the rest of the record
+            45,
+            45,
+            0,
+            0,
+            count,
+            count,
+            directory_size,
+            directory_offset,
+        )
+        records += struct.pack("<4sIQI", b"PK\x06\x07", 0, zip64_offset, 1)
+        count = min(count, _ZIP64_COUNT_LIMIT)
+        directory_offset = min(directory_offset, _ZIP64_LIMIT)
+        directory_size = min(directory_size, _ZIP64_LIMIT)
+
+    records += struct.pack(
+        "<4sHHHHIIH",
+        b"PK\x05\x06",
+        0,
+        0,
+        count,
+        count,
+        directory_size,
+        directory_offset,
+        0,  # comment length
+    )
+    return records
+
+
+class ZipStream:
+    """
+    An uncompressed (STORE) ZIP archive generated on the fly.
+
+    The layout of the whole archive is computed upfront from the members' sizes and CRCs,
+    so its size is known before the first byte is sent and any byte range can be served
+    without generating what comes before it. Only the headers are kept in memory,
+    the files are streamed from disk one chunk at a time.
+
+    \f
+
+    :param members: Files of the archive, in order
+    :type members: list[ZipMember]
+    :param opener: Opens the file of a member, by default its path
+    :type opener: Callable[[ZipMember], BinaryIO] | None
+    """
+
+    def __init__(
+        self,
+        members: list[ZipMember],
+        opener: Callable[[ZipMember], BinaryIO] | None = None,
+    ):
+        self._opener = opener or (lambda member: open(member.path, "rb"))
+        self._parts: list[tuple[int, bytes | ZipMember]] = []  # (offset, part)
+
+        offset = 0
+        central_directory = []
+        for member in members:
+            name = member.name.encode()
+            local_header = _local_header(member, name)
+            central_directory.append(_central_header(member, name, offset))
+
+            self._parts.append((offset, local_header))
+            offset += len(local_header)
+            if member.size:
+                self._parts.append((offset, member))
+                offset += member.size
+
+        directory = b"".join(central_directory)
+        self._parts.append(
+            (offset, directory + _end_records(len(members), offset, len(directory)))
+        )
+        self.size = offset + len(self._parts[-1][1])
+
+        # the archive only depends on what went in it, so is its tag
+        digest = hashlib.sha256()
+        for member in members:
+            digest.update(member.name.encode())
+            digest.update(struct.pack("<QId", member.size, member.crc32, member.mtime))
+        self.etag = digest.hexdigest()[:32]
+
+    async def iter_range(self, start: int, end: int, chunk_size: int):
+        """
+        Yield the bytes of the archive between "start" and "end" (included).
+
+        \f
+
+        :param start: First byte
+        :type start: int
+        :param end: Last byte
+        :type end: int
+        :param chunk_size: Size of the chunks read from the files
+        :type chunk_size: int
+        """
+        for offset, part in self._parts:
+            part_size = part.size if isinstance(part, ZipMember) else len(part)
+            if offset + part_size <= start:
+                continue
+            if offset > end:
+                break
+
+            part_start = max(start - offset, 0)
+            part_end = min(end - offset, part_size - 1)
+            if isinstance(part, ZipMember):
+                async for chunk in iter_file_range(
+                    self._opener(part), part_start, part_end, chunk_size
+                ):
+                    yield chunk
+            else:
+                yield part[part_start : part_end + 1]
@@ -0,0 +1,91 @@
+"""
+Time to match an upload against the fingerprint index of a large catalog.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_fingerprint_match --tracks 100000
+
+The catalog is synthetic: every track gets random hashes at random offsets, 1,000 by
+default (about 30 seconds of music). Queries are tracks of the catalog re-encoded badly
+(only part of their hashes survive, shifted in time, mixed with hashes of noise) and
+songs that aren't in the catalog, which must not match anything.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app.utils.fingerprint import FingerprintIndex
+
+
+def _query(rng, hashes, offsets, kept: float, noise: int):
+    keep = rng.random(len(hashes)) < kept
+    shift = int(rng.integers(0, 500))
+    return (
+        np.concatenate([hashes[keep], rng.integers(0, 1 << 24, noise, dtype=np.uint32)]),
+        np.concatenate(
+            [offsets[keep] + shift, rng.integers(0, 6000, noise)]
+        ).astype(np.uint16),
+    )
+
+
+def _percentiles(timings: list[float]) -> str:
+    p50, p99 = np.percentile(np.array(timings) * 1000, [50, 99])
+    return f"p50 {p50:7.2f} ms   p99 {p99:7.2f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--hashes", type=int, default=1000, help="per track")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--kept", type=float, default=0.3, help="hashes surviving")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    all_hashes = rng.integers(0, 1 << 24, (args.tracks, args.hashes), dtype=np.uint32)
+    all_offsets = np.sort(
+        rng.integers(0, 5000, (args.tracks, args.hashes), dtype=np.uint16), axis=1
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        FingerprintIndex.build(
+            directory,
+            [
+                (track, all_hashes[track], all_offsets[track])
+                for track in range(args.tracks)
+            ],
+            time.time(),
+        )
+        print(f"build: {time.perf_counter() - started:.1f}s for {all_hashes.size} hashes")
+
+        index = FingerprintIndex(directory)
+        index.load()
+
+        found, timings = 0, []
+        for _ in range(args.queries):
+            track = int(rng.integers(0, args.tracks))
+            query = _query(rng, all_hashes[track], all_offsets[track], args.kept, 700)
+            started = time.perf_counter()
+            match = index.match(*query)
+            timings.append(time.perf_counter() - started)
+            found += match is not None and match[0] == track
+        print(f"duplicates: {_percentiles(timings)}   found {found}/{args.queries}")
+
+        false_positives, timings = 0, []
+        for _ in range(args.queries):
+            query = _query(rng, all_hashes[0], all_offsets[0], 0.0, args.hashes)
+            started = time.perf_counter()
+            false_positives += index.match(*query) is not None
+            timings.append(time.perf_counter() - started)
+        print(
+            f"new songs:  {_percentiles(timings)}   "
+            f"false positives {false_positives}/{args.queries}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Play events a single worker can record and write per second.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_play_events --rate 50000 --seconds 60
+
+Events are recorded at the offered rate, every 10 ms, in the same event loop as the
+recorder writing them in batches to a database: a SQLite file by default, or the
+database of --url (e.g. postgresql+psycopg://... to measure COPY).
+
+"written" is what was written while recording, the final flush left out, and "queued"
+what was still waiting at the end: a rate is only sustained if the queue stays small,
+otherwise it's absorbing the deficit until it's full and starts dropping events.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlmodel import SQLModel, create_engine
+
+from app.commons.constants import PLAY_EVENT_BATCH_SIZE, PLAY_EVENT_QUEUE_SIZE
+from app.core.play_events import PlayEventRecorder
+from app.models.play_event_model import PlayEvent
+
+
+async def _run(engine, rate: int, seconds: float, batch_size: int, max_queue: int) -> dict:
+    recorder = PlayEventRecorder(engine, max_queue, batch_size, flush_interval=0.1)
+    await recorder.start()
+
+    events, recording = 0, 0.0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < seconds:
+        # a tick of 10 ms worth of events, then the loop serves the rest (the flusher here)
+        due = int(elapsed * rate) + rate // 100 - events
+        tick = time.perf_counter()
+        for event in range(events, events + due):
+            recorder.record(event % 50_000, event % 10_000)
+        recording += time.perf_counter() - tick
+        events += due
+        await asyncio.sleep(max(0.0, events / rate - (time.perf_counter() - started)))
+
+    stats = recorder.stats()  # before the final flush
+    elapsed = time.perf_counter() - started
+    await recorder.stop()
+    return {
+        "events": events,
+        "record_us": recording / max(events, 1) * 1e6,
+        "elapsed": elapsed,
+        **stats,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=int, default=50_000, help="events per second")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--batch-size", type=int, default=PLAY_EVENT_BATCH_SIZE)
+    parser.add_argument("--max-queue", type=int, default=PLAY_EVENT_QUEUE_SIZE)
+    parser.add_argument("--url", help="database URL, a temporary SQLite file if omitted")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'plays.db')}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine, tables=[PlayEvent.__table__])
+
+        stats = asyncio.run(
+            _run(engine, args.rate, args.seconds, args.batch_size, args.max_queue)
+        )
+        print(
+            f"offered: {args.rate:,} events/s   "
+            f"record: {stats['record_us']:.2f} us per event   "
+            f"written: {stats['written'] / stats['elapsed']:,.0f} events/s   "
+            f"queued at the end: {stats['queued']:,}   "
+            f"dropped: {stats['dropped']:,}/{stats['events']:,}"
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
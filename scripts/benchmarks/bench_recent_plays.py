@@ -0,0 +1,95 @@
+"""
+Memory and speed of the in-memory store of the recent plays.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_recent_plays --users 200000 --size 20
+
+Fills the store with --users users of --size songs each, measures the memory they take
+once written (tracemalloc, so the Python objects and their arrays, not the allocator's
+slack), then the time of --operations record() and recent() of random users, and of the
+flush writing them behind to a SQLite file, or to the database of --url.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from sqlmodel import SQLModel, create_engine
+
+from app.core.recent_plays import RecentPlayStore
+from app.models.recent_play_model import RecentPlay
+
+
+async def _run(engine, users: int, size: int, operations: int) -> dict:
+    store = RecentPlayStore(engine, size, max_users=users)
+    now = time.time()
+
+    # what the store keeps once written, the changes waiting for the flush aside
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        for slot in range(size):
+            store.record(user_id, slot, played_at=now + slot)
+    await store.flush()
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    for plays in store._users.values():
+        plays.loaded = True  # as after their first read, the reads are only measured in memory
+
+    rng = random.Random(0)
+    user_ids = [rng.randrange(users) for _ in range(operations)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        store.record(user_id, rng.randrange(1000), position=rng.random() * 300)
+    record = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for user_id in user_ids:
+        await store.recent(user_id)
+    recent = time.perf_counter() - started
+
+    started = time.perf_counter()
+    written = await store.flush()
+    flush = time.perf_counter() - started
+
+    return {
+        "memory_per_user": memory / users,
+        "record_us": record / operations * 1e6,
+        "recent_us": recent / operations * 1e6,
+        "flush_rows_per_s": written / flush,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--size", type=int, default=20, help="songs kept per user")
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--url", help="database URL, a temporary SQLite file if omitted")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'recent.db')}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine, tables=[RecentPlay.__table__])
+
+        stats = asyncio.run(_run(engine, args.users, args.size, args.operations))
+        print(
+            f"users: {args.users:,} x {args.size} songs   "
+            f"memory: {stats['memory_per_user']:.0f} B per user, "
+            f"{stats['memory_per_user'] * 1e6 / 2**20:,.0f} MiB per million   "
+            f"record: {stats['record_us']:.2f} us   "
+            f"recent: {stats['recent_us']:.2f} us   "
+            f"flush: {stats['flush_rows_per_s']:,.0f} rows/s"
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
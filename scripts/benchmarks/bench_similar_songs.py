@@ -0,0 +1,84 @@
+"""
+Build time, memory and lookup latency of the co-occurrence model of the similar songs.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_similar_songs --links 10000000 --songs 1000000
+
+Synthetic playlists: their lengths are log-normal (median --playlist-length) and their
+songs are drawn with a Zipf-like popularity, so a few songs are in a lot of playlists,
+like in a real catalog. The model is built in a temporary directory and memory mapped
+back, as the workers do, then random songs are looked up.
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from app.utils.similar_songs import SimilarSongs
+
+
+def synthetic_links(
+    links: int, songs: int, playlist_length: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    lengths = np.maximum(1, rng.lognormal(np.log(playlist_length), 0.7, links // playlist_length))
+    lengths = lengths.astype(np.int64)
+    lengths = lengths[np.cumsum(lengths) <= links]
+    playlist_ids = np.repeat(np.arange(len(lengths)), lengths)
+
+    # popularity of the rank r proportional to 1 / (r + 10) ** 0.9
+    weights = 1.0 / (np.arange(songs) + 10.0) ** 0.9
+    song_ids = rng.choice(songs, size=len(playlist_ids), p=weights / weights.sum())
+    return song_ids, playlist_ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--links", type=int, default=10_000_000)
+    parser.add_argument("--songs", type=int, default=1_000_000)
+    parser.add_argument("--playlist-length", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--measure", choices=("cosine", "pmi"), default="cosine")
+    parser.add_argument("--min-count", type=int, default=1)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    song_ids, playlist_ids = synthetic_links(args.links, args.songs, args.playlist_length)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        result = SimilarSongs.build(
+            directory, song_ids, playlist_ids, args.top_k, args.measure, args.min_count
+        )
+        build = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        model = SimilarSongs(directory)
+        model.load()
+        rng = np.random.default_rng(1)
+        queries = rng.choice(np.unique(song_ids), args.lookups).tolist()
+        timings = np.empty(len(queries))
+        for index, song_id in enumerate(queries):
+            started = time.perf_counter()
+            model.similar(song_id, 20)
+            timings[index] = time.perf_counter() - started
+
+        print(
+            f"links: {len(song_ids):,}   playlists: {playlist_ids[-1] + 1:,}   "
+            f"songs: {result['songs']:,}   neighbours: {result['neighbors']:,}\n"
+            f"build: {build:.1f}s   peak memory: +{peak - baseline:,.0f} MiB   "
+            f"model: {result['bytes'] / 2**20:,.0f} MiB on disk   "
+            f"lookup (20 songs): p50 {np.percentile(timings, 50) * 1e6:.1f} us, "
+            f"p99 {np.percentile(timings, 99) * 1e6:.1f} us"
+        )
+        print(f"files: {sorted(os.listdir(directory))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Recall and latency of the inverted file index of the song embeddings, against brute force.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_song_embeddings --songs 1000000 --dimensions 64
+
+Synthetic embeddings: a mixture of --clusters Gaussian blobs of uneven sizes, like genres
+and scenes of a real catalog, and queries close to random songs. The index is built in a
+temporary directory and memory mapped back, as the workers do. The recall@k is the share
+of the exact k nearest songs (brute force) the index finds, for every number of cells
+probed; the queries are timed alone, then in one batch.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app.utils.embeddings import SongEmbeddings, normalize
+
+
+def synthetic_embeddings(
+    songs: int, dimensions: int, clusters: int, spread: float, seed: int = 0
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((clusters, dimensions)))
+    sizes = rng.dirichlet(np.full(clusters, 0.5))  # a few big clusters, many small ones
+    labels = rng.choice(clusters, songs, p=sizes)
+    vectors = np.empty((songs, dimensions), np.float32)
+    for start in range(0, songs, 100_000):
+        chunk = labels[start : start + 100_000]
+        noise = rng.standard_normal((len(chunk), dimensions), dtype=np.float32)
+        vectors[start : start + len(chunk)] = centers[chunk] + noise * spread / np.sqrt(dimensions)
+    return vectors
+
+
+def recall(found: list, exact: list, k: int) -> float:
+    return float(
+        np.mean(
+            [
+                len({song_id for song_id, _ in a} & {song_id for song_id, _ in b}) / k
+                for a, b in zip(found, exact)
+            ]
+        )
+    )
+
+
+def per_query(function, queries: np.ndarray) -> tuple[list, float, float]:
+    """The results, the p50 of the queries alone and the time per query of one batch, in ms."""
+    timings = np.empty(len(queries))
+    for index, query in enumerate(queries):
+        started = time.perf_counter()
+        function(query)
+        timings[index] = time.perf_counter() - started
+    started = time.perf_counter()
+    results = function(queries)
+    batch = (time.perf_counter() - started) / len(queries)
+    return results, np.percentile(timings, 50) * 1e3, batch * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--songs", type=int, default=1_000_000)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=2_000)
+    parser.add_argument("--spread", type=float, default=0.6, help="noise around the clusters")
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.songs, args.dimensions, args.clusters, args.spread)
+    rng = np.random.default_rng(1)
+    picked = vectors[rng.choice(args.songs, args.queries, replace=False)]
+    noise = rng.standard_normal(picked.shape, dtype=np.float32) * 0.2 / np.sqrt(args.dimensions)
+    queries = normalize(picked + noise)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        result = SongEmbeddings.build(
+            directory, np.arange(args.songs), vectors, args.lists
+        )
+        build = time.perf_counter() - started
+        del vectors
+
+        embeddings = SongEmbeddings(directory)
+        embeddings.load()
+        print(
+            f"songs: {result['songs']:,}   dimensions: {result['dimensions']}   "
+            f"lists: {result['lists']:,} (largest: {result['largest_list']:,} songs)\n"
+            f"build: {build:.1f}s   index: {result['bytes'] / 2**20:,.0f} MiB on disk\n"
+        )
+
+        exact, alone, batch = per_query(
+            lambda query: embeddings.brute_force(query, args.k), queries
+        )
+        print(f"{'':>12} recall@{args.k}   alone p50   batch/query")
+        print(f"{'brute force':>12} {1.0:>9.3f} {alone:>8.2f} ms {batch:>8.2f} ms")
+        for nprobe in args.nprobe:
+            found, alone, batch = per_query(
+                lambda query: embeddings.search(query, args.k, nprobe), queries
+            )
+            print(
+                f"{f'nprobe {nprobe}':>12} {recall(found, exact, args.k):>9.3f} "
+                f"{alone:>8.2f} ms {batch:>8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
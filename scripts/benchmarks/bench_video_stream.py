@@ -0,0 +1,77 @@
+"""
+Throughput of the chunked video streaming path.
+
+Run from the project root:
+
+    python -m scripts.benchmarks.bench_video_stream --size-mb 512
+
+"MB/s per core" divides the bytes streamed by the CPU time of the whole process
+(event loop plus worker threads), so it stays comparable across machines with a
+different number of cores.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import anyio
+
+from app.utils.stream_utils import iter_file_range
+
+
+async def _drain(path: str, size: int, chunk_size: int) -> int:
+    total = 0
+    async for chunk in iter_file_range(path, 0, size - 1, chunk_size):
+        total += len(chunk)
+    return total
+
+
+def _measure(function, *args) -> tuple[int, float, float]:
+    wall, cpu = time.perf_counter(), time.process_time()
+    total = function(*args)
+    return total, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def _legacy(path: str) -> int:
+    # what the old endpoint did: read everything, then iterate a bytes object (one int per byte)
+    with open(path, "rb") as file:
+        data = file.read()
+    return sum(1 for _ in data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--legacy-size-mb", type=int, default=16)
+    parser.add_argument(
+        "--chunk-sizes", type=int, nargs="+", default=[64, 256, 1024, 4096], help="KiB"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "video.mp4")
+        with open(path, "wb") as file:
+            for _ in range(args.size_mb):
+                file.write(os.urandom(1024 * 1024))
+        size = os.path.getsize(path)
+
+        print(f"{'chunk':>10} {'MB/s':>10} {'MB/s/core':>10}")
+        anyio.run(_drain, path, size, 1024 * 1024)  # warm the page cache
+        for chunk_kib in args.chunk_sizes:
+            total, wall, cpu = _measure(anyio.run, _drain, path, size, chunk_kib * 1024)
+            megabytes = total / 1024**2
+            print(
+                f"{chunk_kib:>7}KiB {megabytes / wall:>10.0f} {megabytes / max(cpu, 1e-9):>10.0f}"
+            )
+
+        legacy_path = os.path.join(directory, "legacy.mp4")
+        with open(legacy_path, "wb") as file:
+            file.write(os.urandom(args.legacy_size_mb * 1024 * 1024))
+        total, wall, cpu = _measure(_legacy, legacy_path)
+        megabytes = total / 1024**2
+        print(f"{'legacy':>10} {megabytes / wall:>10.1f} {megabytes / max(cpu, 1e-9):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Build the fingerprint index the app matches uploads against, from the whole catalog.
+
+Run from the project root, with the same environment as the app (for the database):
+
+    python -m scripts.build_fingerprint_index --workers 4
+
+Every song is read from its original media asset. The fingerprint stored at upload is
+reused, songs without one (uploaded before fingerprinting, or whose job hasn't run
+yet) are fingerprinted in a process pool. The index is written in a new build
+directory and switched to at once: workers pick it up at their next start,
+until then they keep matching against the old one plus every song uploaded since.
+"""
+
+import argparse
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from app.commons.constants import FINGERPRINT_INDEX_DIRECTORY
+from app.models.media_asset_model import MediaAsset
+from app.utils.audio_decode import AudioDecodeError
+from app.utils.fingerprint import (
+    FingerprintIndex,
+    compute_fingerprint,
+    fingerprint_path,
+    read_fingerprint,
+)
+
+
+def catalog(engine: Engine) -> list[tuple[int, str, str]]:
+    """
+    (song ID, audio path, fingerprint path) of every song with an original file.
+    """
+    with Session(engine) as session:
+        assets = session.exec(
+            select(MediaAsset)
+            .where(MediaAsset.kind == "original")
+            .order_by(MediaAsset.song_id)
+        ).all()
+
+    return [
+        (
+            asset.song_id,
+            asset.path,
+            fingerprint_path(asset.song_id, asset.content_hash[:16]),
+        )
+        for asset in assets
+    ]
+
+
+def build(engine: Engine, directory: str, workers: int) -> dict:
+    """
+    Fingerprint what needs to be, then write the index.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param directory: Where the index is written
+    :type directory: str
+    :param workers: Number of processes fingerprinting songs
+    :type workers: int
+    :return: What has been done
+    :rtype: dict
+    """
+    since = time.time()  # uploads from now on are caught up with by the workers
+    songs = catalog(engine)
+    fingerprints = []
+    missing = []
+    for song_id, audio_path, path in songs:
+        fingerprint = read_fingerprint(path)
+        if fingerprint is None:
+            missing.append((song_id, audio_path, path))
+        else:
+            fingerprints.append((song_id, *fingerprint))
+
+    skipped = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(compute_fingerprint, audio_path, path)
+            for _, audio_path, path in missing
+        ]
+        for (song_id, _, _), future in zip(missing, futures):
+            try:
+                fingerprints.append((song_id, *future.result()))
+            except AudioDecodeError as exc:
+                skipped += 1
+                print(f"Song {song_id} skipped: {exc}")
+
+    if fingerprints:
+        FingerprintIndex.build(directory, fingerprints, since)
+    return {
+        "songs": len(fingerprints),
+        "computed": len(missing) - skipped,
+        "skipped": skipped,
+        "hashes": sum(len(hashes) for _, hashes, _ in fingerprints),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--directory", default=FINGERPRINT_INDEX_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    from app.core.database import engine
+
+    started = time.perf_counter()
+    result = build(engine, args.directory, args.workers)
+    print(
+        f"{result['songs']} songs indexed ({result['computed']} fingerprinted, "
+        f"{result['skipped']} not decodable), "
+        f"{result['hashes']} hashes in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Build the model of the similar songs the app serves, from the songs of every playlist.
+
+Run from the project root, with the same environment as the app (for the database):
+
+    python -m scripts.build_similar_songs --top-k 50 --measure cosine
+
+The (song, playlist) links are read in one pass, straight into arrays, then the
+co-occurrence matrix is computed, normalized and pruned to the best neighbours of every
+song (see app/utils/similar_songs.py). The model is written in a new build directory and
+switched to at once: workers pick it up at their next start.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from sqlalchemy import Engine, select
+
+from app.commons.constants import SIMILAR_SONGS_DIRECTORY, SIMILAR_SONGS_TOP_K
+from app.models.relationship_song_playlist import SongPlaylistLink
+from app.utils.similar_songs import SIMILARITY_MEASURES, SimilarSongs
+
+
+def playlist_links(engine: Engine, batch_size: int = 100_000) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (song IDs, playlist IDs) of every link, without an object per row.
+    """
+    song_ids, playlist_ids = [], []
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            select(SongPlaylistLink.song_id, SongPlaylistLink.playlist_id)
+        )
+        for rows in result.partitions(batch_size):
+            links = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            song_ids.append(links[:, 0])
+            playlist_ids.append(links[:, 1])
+
+    if not song_ids:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(song_ids), np.concatenate(playlist_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--directory", default=SIMILAR_SONGS_DIRECTORY)
+    parser.add_argument("--top-k", type=int, default=SIMILAR_SONGS_TOP_K)
+    parser.add_argument("--measure", choices=SIMILARITY_MEASURES, default="cosine")
+    parser.add_argument(
+        "--min-count", type=int, default=1, help="playlists a pair must share at least"
+    )
+    args = parser.parse_args()
+
+    from app.core.database import engine
+
+    started = time.perf_counter()
+    song_ids, playlist_ids = playlist_links(engine)
+    read = time.perf_counter() - started
+    if not len(song_ids):
+        print("No songs in playlists, nothing to build")
+        return
+
+    result = SimilarSongs.build(
+        args.directory, song_ids, playlist_ids, args.top_k, args.measure, args.min_count
+    )
+    print(
+        f"{len(song_ids)} links read in {read:.1f}s, "
+        f"{result['songs']} songs with {result['neighbors']} neighbours "
+        f"({result['bytes'] / 2**20:.0f} MiB) in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Build the song embeddings and their nearest neighbour index, from the plays of the users.
+
+Run from the project root, with the same environment as the app (for the database):
+
+    python -m scripts.build_song_embeddings --days 90 --dimensions 64
+
+The plays of the last days are counted per (user, song) in the database, then the
+users x songs matrix of log(1 + plays) is factorized by a truncated SVD: two songs played
+by the same users get close vectors. The vectors are indexed by an inverted file (see
+app/utils/embeddings.py), written in a new build directory and switched to at once:
+workers pick it up at their next start.
+"""
+
+import argparse
+import time
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from scipy import sparse
+from scipy.sparse.linalg import svds
+from sqlalchemy import Engine, func, select, union_all
+
+from app.commons.constants import EMBEDDING_DIMENSIONS, EMBEDDINGS_DIRECTORY
+from app.core.play_history import history_tables
+from app.models.play_event_model import PlayEvent
+from app.utils.embeddings import SongEmbeddings
+
+
+def play_counts(
+    engine: Engine, since: datetime, until: datetime, batch_size: int = 100_000
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (user IDs, song IDs, plays) of every song a user played between two dates, counted
+    by the database. The events are read like the play history (see read_play_history):
+    from the partitioned table on Postgres, from the tables of these months on SQLite.
+    """
+    if engine.dialect.name == "postgresql":
+        plays = PlayEvent.__table__
+    else:
+        tables = history_tables(engine, since, until)
+        if not tables:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        plays = union_all(
+            *(
+                select(table.c.user_id, table.c.song_id, table.c.played_at)
+                for table in tables
+            )
+        ).subquery()
+
+    parts = []
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            select(plays.c.user_id, plays.c.song_id, func.count())
+            .where(plays.c.played_at >= since, plays.c.played_at < until)
+            .group_by(plays.c.user_id, plays.c.song_id)
+        )
+        for rows in result.partitions(batch_size):
+            parts.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+
+    counts = np.concatenate(parts) if parts else np.empty((0, 3), np.int64)
+    return counts[:, 0], counts[:, 1], counts[:, 2]
+
+
+def play_embeddings(
+    user_ids: np.ndarray,
+    song_ids: np.ndarray,
+    plays: np.ndarray,
+    dimensions: int,
+    min_users: int = 2,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (song IDs, vectors) of the songs played by "min_users" users at least, by a truncated
+    SVD of the users x songs matrix of log(1 + plays): the songs are V * sqrt(S).
+    """
+    songs, columns = np.unique(song_ids, return_inverse=True)
+    listeners = np.bincount(columns, minlength=len(songs))
+    keep = listeners[columns] >= min_users  # too few listeners to place a song
+    songs, columns = np.unique(song_ids[keep], return_inverse=True)
+    users, rows = np.unique(user_ids[keep], return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (np.log1p(plays[keep]).astype(np.float32), (rows.ravel(), columns.ravel())),
+        shape=(len(users), len(songs)),
+    )
+    dimensions = min(dimensions, min(matrix.shape) - 1)
+    if dimensions < 1:
+        return np.empty(0, np.int64), np.empty((0, 0), np.float32)
+    _, singular_values, song_factors = svds(matrix, k=dimensions, random_state=0)
+    vectors = song_factors.T * np.sqrt(singular_values)
+    return songs, vectors.astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--directory", default=EMBEDDINGS_DIRECTORY)
+    parser.add_argument("--days", type=int, default=90, help="plays of the last days")
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument(
+        "--min-users", type=int, default=2, help="users a song must be played by at least"
+    )
+    parser.add_argument(
+        "--lists", type=int, default=None, help="cells of the index, sqrt(songs) by default"
+    )
+    args = parser.parse_args()
+
+    from app.core.database import engine
+
+    started = time.perf_counter()
+    now = datetime.now()
+    user_ids, song_ids, plays = play_counts(engine, now - timedelta(days=args.days), now)
+    read = time.perf_counter() - started
+    song_ids, vectors = play_embeddings(
+        user_ids, song_ids, plays, args.dimensions, args.min_users
+    )
+    if not len(song_ids):
+        print("Not enough plays, nothing to build")
+        return
+    factorized = time.perf_counter() - started
+
+    result = SongEmbeddings.build(args.directory, song_ids, vectors, args.lists)
+    print(
+        f"{len(user_ids)} (user, song) pairs read in {read:.1f}s, "
+        f"{result['songs']} songs x {result['dimensions']} dimensions in {factorized:.1f}s, "
+        f"{result['lists']} lists ({result['bytes'] / 2**20:.0f} MiB) "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
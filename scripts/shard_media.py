@@ -0,0 +1,240 @@
+"""
+Move the files of public/audio and public/image to the sharded layout ("ab/cd/<name>").
+
+Run from the project root, with the same environment as the app (for the database):
+
+    python -m scripts.shard_media --workers 16
+
+The migration can run while the app is serving and can be interrupted at any time:
+run it again and it picks up where it stopped. Every file goes through three steps:
+
+1. it's hard linked into its shard, so both paths serve the same file
+2. the rows pointing to the flat path (media assets, song and album URLs) are updated
+3. the flat path is removed
+
+Streams and downloads resolve both layouts, so they keep working whatever the step.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from app.commons.constants import AUDIO_DIRECTORY, IMAGE_DIRECTORY
+from app.utils.file_utils import shard_directory, shard_path
+
+# URL segment under "/public" for every directory
+_URL_PREFIXES = {AUDIO_DIRECTORY: "audio", IMAGE_DIRECTORY: "image"}
+
+_BATCH_SIZE = 1000
+
+
+def file_key(file_name: str) -> str:
+    """
+    What a file belongs to, the ID its name starts with ("12-ab34.mp3", "12.png" -> "12").
+    """
+    match = re.match(r"\d+", file_name)
+    return match.group() if match else os.path.splitext(file_name)[0]
+
+
+def flat_files(directory: str) -> list[str]:
+    """
+    Names of the files still stored directly in "directory".
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+
+    return [
+        entry.name
+        for entry in entries
+        if entry.is_file(follow_symlinks=False) and not entry.name.endswith(".part")
+    ]
+
+
+def link_file(directory: str, file_name: str) -> str:
+    """
+    Make "file_name" available in its shard too, without copying it if possible.
+    """
+    source = os.path.join(directory, file_name)
+    target = shard_path(directory, file_key(file_name), file_name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass  # linked by a previous run, or uploaded again since: the shard wins
+    except OSError:
+        # no hard links on this file system, copy it and swap it in atomically
+        shutil.copy2(source, f"{target}.part")
+        os.replace(f"{target}.part", target)
+    return file_name
+
+
+def unlink_file(directory: str, file_name: str) -> str:
+    try:
+        os.remove(os.path.join(directory, file_name))
+    except FileNotFoundError:
+        pass
+    return file_name
+
+
+def _sharded_url(url: str | None, prefix: str, moved: set[str]) -> str | None:
+    """
+    The URL of the file in its shard, None if "url" doesn't point to a moved flat file.
+    """
+    if not url:
+        return None
+
+    head, _, file_name = url.rpartition("/")
+    if file_name not in moved or not head.endswith(f"/{prefix}"):
+        return None
+    return f"{head}/{shard_directory(file_key(file_name))}/{file_name}"
+
+
+def update_rows(engine: Engine, directory: str, moved: set[str]) -> int:
+    """
+    Point every row that references a moved file to its new path.
+
+    Every table is read once in batches, whatever the number of moved files.
+
+    \f
+
+    :param engine: Database engine
+    :type engine: Engine
+    :param directory: Base directory of the moved files
+    :type directory: str
+    :param moved: Names of the files now available in their shard
+    :type moved: set[str]
+    :return: Number of updated rows
+    :rtype: int
+    """
+    # imported here, so the tables are registered only when the database is used
+    from app.models.album_model import Album
+    from app.models.media_asset_model import MediaAsset
+    from app.models.song_model import Song
+
+    prefix = _URL_PREFIXES[directory]
+    flat_directory = os.path.normpath(directory)
+
+    columns = [(Song, "image_url"), (Album, "image_url")]
+    if directory == AUDIO_DIRECTORY:
+        columns = [(Song, "song_url"), (MediaAsset, "path")]
+
+    updated = 0
+    with Session(engine) as session:
+        for model, column in columns:
+            last_id = 0
+            while True:
+                rows = session.exec(
+                    select(model)
+                    .where(model.id > last_id)
+                    .order_by(model.id)
+                    .limit(_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                for row in rows:
+                    value = getattr(row, column)
+                    if column == "path":
+                        file_name = os.path.basename(value)
+                        new_value = None
+                        if (
+                            file_name in moved
+                            and os.path.normpath(os.path.dirname(value)) == flat_directory
+                        ):
+                            new_value = shard_path(
+                                directory, file_key(file_name), file_name
+                            )
+                    else:
+                        new_value = _sharded_url(value, prefix, moved)
+
+                    if new_value:
+                        setattr(row, column, new_value)
+                        session.add(row)
+                        updated += 1
+
+                session.commit()
+    return updated
+
+
+def migrate(
+    directory: str,
+    workers: int,
+    engine: Engine | None = None,
+) -> dict:
+    """
+    Move every flat file of "directory" to the sharded layout.
+
+    \f
+
+    :param directory: AUDIO_DIRECTORY or IMAGE_DIRECTORY
+    :type directory: str
+    :param workers: Number of files moved in parallel
+    :type workers: int
+    :param engine: Database engine, None to leave the database alone
+    :type engine: Engine | None
+    :return: What has been done
+    :rtype: dict
+    """
+    file_names = flat_files(directory)
+    moved: set[str] = set()
+    updated = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # the database is updated between linking and unlinking every batch,
+        # so no row ever points to a path that doesn't exist
+        for start in range(0, len(file_names), _BATCH_SIZE * workers):
+            batch = file_names[start : start + _BATCH_SIZE * workers]
+            linked = set(
+                executor.map(lambda name: link_file(directory, name), batch)
+            )
+            if engine is not None:
+                updated += update_rows(engine, directory, linked)
+            list(executor.map(lambda name: unlink_file(directory, name), linked))
+            moved |= linked
+            print(f"{directory}: {len(moved)}/{len(file_names)} files moved")
+
+    return {"directory": directory, "files": len(moved), "rows": updated}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--directories",
+        nargs="+",
+        default=[AUDIO_DIRECTORY, IMAGE_DIRECTORY],
+        choices=[AUDIO_DIRECTORY, IMAGE_DIRECTORY],
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--skip-database",
+        action="store_true",
+        help="only move files, for trees without rows pointing to them",
+    )
+    args = parser.parse_args()
+
+    engine = None
+    if not args.skip_database:
+        from app.core.database import engine
+
+    for directory in args.directories:
+        started = time.perf_counter()
+        result = migrate(directory, args.workers, engine)
+        print(
+            f"{directory}: {result['files']} files moved, {result['rows']} rows updated "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
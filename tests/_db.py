@@ -0,0 +1,15 @@
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+
+
+def sqlite_engine(*models: type[SQLModel]) -> Engine:
+    """
+    A fresh in-memory SQLite database, with the tables of "models" only.
+    Every connection gets the same database (StaticPool), like the one of conftest.py.
+    """
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine, tables=[model.__table__ for model in models])
+    return engine
@@ -0,0 +1,86 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.commons.enums import Priority
+from app.core.admission import (
+    AdaptiveConcurrencyLimiter,
+    AdmissionControlMiddleware,
+    request_priority,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_request_priority():
+    assert request_priority("GET", "/streams/1", {"range": "bytes=65536-"}) == Priority.HIGH
+    assert request_priority("GET", "/streams/1/hls/abcd/3.mp3", {}) == Priority.HIGH
+    assert request_priority("GET", "/streams/1", {"range": "bytes=0-"}) == Priority.MEDIUM
+    assert request_priority("GET", "/streams/1/hls/playlist.m3u8", {}) == Priority.MEDIUM
+    assert request_priority("GET", "/songs/", {}) == Priority.MEDIUM
+    assert request_priority("GET", "/downloads/album/1", {}) == Priority.LOW
+    assert request_priority("POST", "/uploads/audio/song/1", {}) == Priority.LOW
+
+
+def test_lower_priorities_are_shed_first():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=1, max_limit=10)
+
+    admitted = [limiter.try_acquire(Priority.LOW) for _ in range(10)]
+    assert admitted.count(True) == 5
+    assert [limiter.try_acquire(Priority.MEDIUM) for _ in range(4)] == [True, True, True, False]
+    assert [limiter.try_acquire(Priority.HIGH) for _ in range(3)] == [True, True, False]
+    assert limiter.stats()["shed"] == {"HIGH": 1, "MEDIUM": 1, "LOW": 5}
+
+
+def test_limit_backs_off_on_latency_and_recovers():
+    clock = _Clock()
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=50, min_limit=5, max_limit=100, clock=clock
+    )
+
+    def request(latency):
+        started = clock.now
+        assert limiter.try_acquire(Priority.MEDIUM)
+        limiter.in_flight = int(limiter.limit)  # a busy server
+        clock.now += latency
+        limiter.release(started)
+        limiter.in_flight = 0
+
+    for _ in range(50):
+        request(0.010)
+    assert limiter.limit > 50
+
+    peak = limiter.limit
+    for _ in range(50):
+        request(0.200)  # the server is queuing
+    assert limiter.limit < peak * 0.9**10
+
+    for _ in range(2000):
+        request(0.010)
+    assert limiter.limit > limiter.min_limit * 2
+
+
+def test_middleware_sheds_with_retry_after():
+    app = FastAPI()
+    app.add_middleware(AdmissionControlMiddleware)
+    app.state.admission = AdaptiveConcurrencyLimiter(
+        initial_limit=2, min_limit=1, max_limit=2
+    )
+
+    @app.get("/songs/")
+    async def songs():
+        return []
+
+    with TestClient(app) as client:
+        assert client.get("/songs/").status_code == 200
+        assert app.state.admission.in_flight == 0
+
+        app.state.admission.in_flight = 2  # saturated
+        response = client.get("/songs/")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "2"
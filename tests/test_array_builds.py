@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from app.utils.array_builds import load_build, save_build
+
+
+def test_builds_are_switched_at_once(tmp_path):
+    directory = str(tmp_path)
+    assert load_build(directory, ("a", "b")) is None  # nothing built yet
+
+    first = save_build(directory, {"a": np.arange(3), "b": np.ones(2)})
+    build_id, (a, b) = load_build(directory, ("a", "b"))
+    assert build_id == first
+    assert a.tolist() == [0, 1, 2] and b.tolist() == [1.0, 1.0]
+
+    second = save_build(directory, {"a": np.arange(5), "b": np.zeros(4)})
+    build_id, (new_a, new_b) = load_build(directory, ("a", "b"))
+    assert build_id == second and len(new_a) == 5 and len(new_b) == 4
+    assert a.tolist() == [0, 1, 2]  # what was mapped before stays the same
+
+    # only the current build and the previous one are kept
+    third = save_build(directory, {"a": np.arange(1), "b": np.zeros(1)})
+    assert sorted(os.listdir(tmp_path / "builds")) == sorted([second, third])
+    assert a.tolist() == [0, 1, 2]
+    assert set(os.listdir(tmp_path)) == {"builds", "current"}  # no link left behind
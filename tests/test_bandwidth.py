@@ -0,0 +1,86 @@
+import asyncio
+
+from app.core.bandwidth import BandwidthScheduler, TokenBucket
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=1000, burst=5000, now=0)
+
+    assert bucket.reserve(5000, now=0) == 0  # the burst goes at full speed
+    assert bucket.reserve(2000, now=0) == 2.0  # then the debt is paid at 1000 bytes/s
+    assert bucket.reserve(1000, now=2.0) == 1.0
+    assert bucket.reserve(500, now=60) == 0  # refilled, but not past the burst
+    assert bucket.tokens == 4500
+
+
+def test_connection_and_user_rates():
+    clock = _Clock()
+    scheduler = BandwidthScheduler(
+        connection_rate=1000, user_rate=1500, total_rate=0, burst=0, clock=clock
+    )
+    first = scheduler.open("user:1")
+    second = scheduler.open("user:1")
+    other = scheduler.open("user:2")
+
+    assert scheduler.reserve(first, 1000) == 1.0  # its own connection cap
+    assert scheduler.reserve(second, 1000) == 2000 / 1500  # the user shares 1500 bytes/s
+    assert scheduler.reserve(other, 1000) == 1.0  # other users aren't affected
+
+    scheduler.close(first)
+    scheduler.close(second)
+    assert scheduler.stats()["users"] == 1
+
+
+def test_fair_share_water_filling():
+    clock = _Clock()
+    scheduler = BandwidthScheduler(
+        connection_rate=0, user_rate=1000, total_rate=9000, burst=0, clock=clock
+    )
+    # one user with a single stream, capped lower than its share
+    capped = scheduler.open("user:1")
+    greedy = [scheduler.open("user:2") for _ in range(2)]
+    assert capped.rate == 1000
+    assert [stream.rate for stream in greedy] == [500, 500]  # the user cap, split
+
+    scheduler.close(capped)
+    assert [stream.rate for stream in greedy] == [500, 500]
+
+    scheduler = BandwidthScheduler(
+        connection_rate=0, user_rate=0, total_rate=9000, burst=0, clock=clock
+    )
+    capped = scheduler.open("user:1")
+    greedy = [scheduler.open("user:2") for _ in range(2)]
+    assert [stream.rate for stream in [capped, *greedy]] == [3000, 3000, 3000]
+
+    scheduler.close(capped)
+    assert [stream.rate for stream in greedy] == [4500, 4500]
+    allocations = scheduler.stats()["allocations"]
+    assert [allocation["rate"] for allocation in allocations] == [4500, 4500]
+
+
+def test_shape_registers_the_stream_while_it_lasts():
+    scheduler = BandwidthScheduler(
+        connection_rate=0, user_rate=0, total_rate=0, burst=0
+    )
+
+    async def chunks():
+        for _ in range(3):
+            yield b"x" * 10
+
+    async def consume():
+        seen = []
+        async for chunk in scheduler.shape(chunks(), "ip:127.0.0.1"):
+            seen.append(scheduler.stats()["streams"])
+        return seen
+
+    assert asyncio.run(consume()) == [1, 1, 1]
+    stats = scheduler.stats()
+    assert (stats["streams"], stats["sent"], stats["throttled"]) == (0, 30, 0)
@@ -0,0 +1,108 @@
+import asyncio
+import random
+
+from datetime import datetime
+
+from app.core.charts import ChartEngine, SpaceSaving
+from app.core.play_events import PlayEventRecorder
+
+from ._db import sqlite_engine
+
+NOW = 1_750_000_000.0
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _charts(directory, clock, genres=None) -> ChartEngine:
+    charts = ChartEngine(sqlite_engine(), str(directory), capacity=20, top=5, clock=clock)
+    charts._genres = genres or {}
+    return charts
+
+
+def test_space_saving_keeps_the_heavy_hitters():
+    counter = SpaceSaving(50)
+    rng = random.Random(7)
+    stream = [1] * 3000 + [2] * 2000 + [3] * 1000 + [rng.randrange(10, 5000) for _ in range(10000)]
+    rng.shuffle(stream)
+    for song_id in stream:
+        counter.add(song_id)
+
+    assert len(counter) == 50
+    top = sorted(counter.counts, key=counter.counts.get, reverse=True)[:3]
+    assert top == [1, 2, 3]
+    # overestimated by the smallest count at most
+    assert 3000 <= counter.counts[1] <= 3000 + min(counter.counts.values())
+
+
+def test_charts_per_window_and_genre(tmp_path):
+    clock = Clock(NOW)
+    charts = _charts(tmp_path, clock, genres={1: (7,), 2: (7, 8), 3: (8,)})
+    for song_id, plays, seconds_ago in [(1, 5, 60), (2, 3, 60), (3, 4, 7200), (1, 2, 3 * 86400)]:
+        for _ in range(plays):
+            charts.add(song_id, NOW - seconds_ago)
+    charts.refresh()
+
+    assert charts.chart("hour") == [(1, 5), (2, 3)]
+    assert charts.chart("day") == [(1, 5), (3, 4), (2, 3)]
+    assert charts.chart("week") == [(1, 7), (3, 4), (2, 3)]
+    assert charts.chart("week", 8) == [(3, 4), (2, 3)]
+    assert charts.chart("day", 7, limit=1) == [(1, 5)]
+    assert charts.chart("day", 99) == []
+
+    # an hour later the plays of the last hour left it, not the day
+    clock.now += 3600
+    charts.refresh()
+    assert charts.chart("hour") == []
+    assert charts.chart("day")[0] == (1, 5)
+
+
+def test_buckets_are_reused_once_expired(tmp_path):
+    charts = _charts(tmp_path, Clock(NOW))
+    charts.add(1, NOW - 3600)  # same slot of the hourly ring as now, an hour ago
+    charts.add(2, NOW)
+    charts.add(1, NOW - 3600)  # older than the window now
+    charts.refresh()
+
+    assert charts.chart("hour") == [(2, 1)]
+    assert charts.stats()["late"] == 1
+
+
+def test_workers_and_restarts_are_merged(tmp_path):
+    clock = Clock(NOW)
+    first, second = _charts(tmp_path, clock), _charts(tmp_path, clock)
+    second.path = f"{first.path}.second.npy"
+    for _ in range(3):
+        first.add(1, NOW)
+    second.add(1, NOW)
+    second.add(2, NOW)
+    first.snapshot()
+    second.snapshot()
+
+    first.refresh()
+    assert first.chart("day") == [(1, 4), (2, 1)]
+
+    # a new process starts empty and merges what the previous ones saved
+    restarted = _charts(tmp_path, clock)
+    restarted.path = f"{first.path}.restarted.npy"
+    restarted.add(2, NOW)
+    restarted.refresh()
+    assert restarted.chart("week") == [(1, 4), (2, 2)]
+
+
+def test_recorder_feeds_the_charts(tmp_path):
+    charts = _charts(tmp_path, Clock(datetime.now().timestamp()))
+    recorder = PlayEventRecorder(
+        sqlite_engine(), max_queue=100, batch_size=10, on_written=charts.add_batch
+    )
+    for user_id in range(3):
+        recorder.record(42, user_id)
+    asyncio.run(recorder.flush())
+    charts.refresh()
+
+    assert charts.chart("hour") == [(42, 3)]
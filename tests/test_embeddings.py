@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.play_history import write_play_events
+from app.utils.embeddings import SongEmbeddings, normalize, train_centroids
+from scripts.build_song_embeddings import play_counts
+
+from ._db import sqlite_engine
+
+
+def _clustered(songs: int, dimensions: int = 16, clusters: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((clusters, dimensions)))
+    noise = rng.standard_normal((songs, dimensions)) * 0.3 / np.sqrt(dimensions)
+    vectors = centers[rng.integers(0, clusters, songs)] + noise
+    song_ids = rng.permutation(songs * 2)[:songs] + 1  # sparse, unordered IDs
+    return song_ids, vectors.astype(np.float32)
+
+
+@pytest.fixture
+def embeddings(tmp_path) -> SongEmbeddings:
+    song_ids, vectors = _clustered(2000)
+    result = SongEmbeddings.build(str(tmp_path), song_ids, vectors, lists=20)
+    assert result["songs"] == 2000 and result["lists"] == 20 and result["dimensions"] == 16
+
+    embeddings = SongEmbeddings(str(tmp_path))
+    embeddings.load()
+    return embeddings
+
+
+def test_centroids_are_unit_vectors():
+    _, vectors = _clustered(500)
+    centroids = train_centroids(normalize(vectors), 10, iterations=5)
+    assert centroids.shape == (10, 16)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+
+def test_search_recall_against_brute_force(embeddings):
+    song_ids, vectors = _clustered(2000)
+    queries = normalize(vectors[:50])
+
+    exact = embeddings.brute_force(queries, 10)
+    assert [song_id for song_id, _ in exact[0]][0] == song_ids[0]  # itself
+    assert all(len(results) == 10 for results in exact)
+    assert exact[0][0][1] >= exact[0][-1][1]  # best first
+
+    def recall(nprobe: int) -> float:
+        found = embeddings.search(queries, 10, nprobe=nprobe)
+        return np.mean(
+            [
+                len({song_id for song_id, _ in a} & {song_id for song_id, _ in b}) / 10
+                for a, b in zip(found, exact)
+            ]
+        )
+
+    assert recall(embeddings.lists) == 1.0  # every cell probed, exact
+    assert recall(4) >= 0.9
+    # a batch gives what every query alone gives, to the rounding of the products
+    alone = embeddings.search(queries[3], 10, nprobe=4)[0]
+    batched = embeddings.search(queries, 10, nprobe=4)[3]
+    assert [song_id for song_id, _ in alone] == [song_id for song_id, _ in batched]
+    assert [score for _, score in alone] == pytest.approx([score for _, score in batched])
+
+
+def test_similar_and_recommend(embeddings):
+    song_ids, _ = _clustered(2000)
+    first, second = int(song_ids[0]), int(song_ids[1])
+
+    similar = embeddings.similar([first, second, 0], 5)
+    assert sorted(similar) == sorted([first, second])  # 0 has no vector
+    assert len(similar[first]) == 5
+    assert first not in [song_id for song_id, _ in similar[first]]
+
+    playlist = song_ids[:10].tolist()
+    recommended = embeddings.recommend(playlist + [0], 10)
+    assert len(recommended) == 10
+    assert not set(playlist) & {song_id for song_id, _ in recommended}
+    assert embeddings.recommend([0], 10) == []
+
+
+def test_index_is_served_memory_mapped(tmp_path):
+    embeddings = SongEmbeddings(str(tmp_path))
+    embeddings.load()  # not built yet
+    assert len(embeddings) == 0
+    assert embeddings.similar([1], 5) == {}
+    assert embeddings.search(np.ones((2, 16)), 5) == [[], []]
+
+    SongEmbeddings.build(str(tmp_path), [3, 1, 2], np.eye(3, dtype=np.float32) + 0.1)
+    embeddings.load()
+    assert len(embeddings) == 3 and embeddings.lists == 1
+    assert [song_id for song_id, _ in embeddings.similar([1], 5)[1]] in ([2, 3], [3, 2])
+
+
+def test_plays_are_counted_from_the_history():
+    # on SQLite the events are in monthly tables, the parent table stays empty
+    engine = sqlite_engine()
+    now = datetime(2025, 6, 10, 12)
+    events = [
+        (song_id, user_id, now - timedelta(days=song_id * 5), "stream", "original")
+        for user_id in (1, 2)
+        for song_id in (1, 2, 3, 8)  # song 8 was played 40 days ago
+        for _ in range(song_id)
+    ]
+    write_play_events(engine, events)
+
+    user_ids, song_ids, plays = play_counts(engine, now - timedelta(days=30), now)
+
+    counts = sorted(zip(user_ids.tolist(), song_ids.tolist(), plays.tolist()))
+    assert counts == [(1, 1, 1), (1, 2, 2), (1, 3, 3), (2, 1, 1), (2, 2, 2), (2, 3, 3)]
+    assert all(len(array) == 0 for array in play_counts(engine, now, now + timedelta(days=1)))
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import sys
+import time
+import wave
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from sqlmodel import Session, select
+
+from app.models.media_asset_model import MediaAsset
+from app.models.song_model import Song
+from app.utils.audio_decode import AudioDecodeError
+from app.utils.fingerprint import (
+    FingerprintIndex,
+    compute_fingerprint,
+    detect_duplicate,
+    fingerprint_path,
+    peak_hashes,
+    read_fingerprint,
+    spectrogram_peaks,
+)
+
+from ._db import sqlite_engine
+
+RATE = 11025
+
+
+def _melody(seed: int, seconds: float = 30) -> np.ndarray:
+    # a quarter note of two random partials every 250ms, like a (very) simple song
+    rng = np.random.default_rng(seed)
+    note = int(RATE * 0.25)
+    time = np.arange(note) / RATE
+    notes = [
+        np.sin(2 * np.pi * rng.uniform(100, 4000) * time)
+        + 0.5 * np.sin(2 * np.pi * rng.uniform(100, 4000) * time)
+        for _ in range(int(seconds * 4))
+    ]
+    return 0.3 * np.concatenate(notes)
+
+
+def _fingerprint(samples: np.ndarray):
+    return peak_hashes(*spectrogram_peaks(samples))
+
+
+def _index(tmp_path, songs: dict[int, np.ndarray]) -> FingerprintIndex:
+    FingerprintIndex.build(
+        str(tmp_path),
+        [(song_id, *_fingerprint(s)) for song_id, s in songs.items()],
+        since=time.time(),
+    )
+    index = FingerprintIndex(str(tmp_path))
+    index.load()
+    return index
+
+
+def test_trimmed_noisy_copy_matches(tmp_path):
+    index = _index(tmp_path, {1: _melody(1), 2: _melody(2), 3: _melody(3)})
+
+    # 3.3s cut at the start, 20s long, quieter and with some noise
+    copy = 0.5 * _melody(2)[int(3.3 * RATE) : int(23.3 * RATE)]
+    copy += np.random.default_rng(0).normal(0, 0.01, len(copy))
+    song_id, votes = index.match(*_fingerprint(copy))
+    assert song_id == 2
+    assert votes >= 50
+
+
+def test_new_song_does_not_match(tmp_path):
+    index = _index(tmp_path, {1: _melody(1), 2: _melody(2)})
+    assert index.match(*_fingerprint(_melody(4))) is None
+
+
+def test_recent_songs_and_exclusion(tmp_path):
+    index = _index(tmp_path, {1: _melody(1)})
+    index.add(5, *_fingerprint(_melody(5)))
+
+    assert index.match(*_fingerprint(_melody(5)))[0] == 5
+    assert index.match(*_fingerprint(_melody(5)), exclude=5) is None
+
+    # replaced by another upload: the stale entries of the bulk index are ignored
+    index.add(1, *_fingerprint(_melody(6)))
+    assert index.match(*_fingerprint(_melody(1))) is None
+    assert index.match(*_fingerprint(_melody(6)))[0] == 1
+
+
+def _write_wav(path, samples: np.ndarray) -> None:
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(RATE)
+        wav_file.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def test_compute_fingerprint_from_wav(tmp_path):
+    audio_path = tmp_path / "song.wav"
+    _write_wav(audio_path, _melody(7, 10))
+
+    fingerprint_path = tmp_path / "7.fp"
+    hashes, offsets = compute_fingerprint(str(audio_path), str(fingerprint_path))
+    stored_hashes, stored_offsets = read_fingerprint(str(fingerprint_path))
+
+    assert len(hashes) > 100
+    assert np.array_equal(hashes, stored_hashes)
+    assert np.array_equal(offsets, stored_offsets)
+
+
+def test_undecodable_file(tmp_path):
+    audio_path = tmp_path / "broken.wav"
+    audio_path.write_bytes(b"not audio")
+    with pytest.raises(AudioDecodeError):
+        compute_fingerprint(str(audio_path), str(tmp_path / "1.fp"))
+
+
+def test_stale_job_leaves_the_new_file_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = sqlite_engine(Song, MediaAsset)
+    monkeypatch.setitem(sys.modules, "app.core.database", SimpleNamespace(engine=engine))
+    old, new = "a" * 16, "b" * 16
+    with Session(engine) as session:
+        session.add(Song(id=1, title="a"))
+        session.add(Song(id=2, title="b"))
+        session.add(
+            MediaAsset(
+                song_id=1,
+                path="new.wav",
+                extension=".wav",
+                mime_type="audio/wav",
+                size=0,
+                mtime=0,
+                content_hash=new * 4,
+            )
+        )
+        session.commit()
+
+    index = _index(tmp_path / "index", {2: _melody(7, 10)})
+    _write_wav("new.wav", _melody(7, 10))
+    asyncio.run(detect_duplicate(None, index, 1, "new.wav", new))
+
+    def duplicate_of() -> int | None:
+        with Session(engine) as session:
+            return session.get(Song, 1).duplicate_of_id
+
+    assert duplicate_of() == 2
+    assert os.path.exists(fingerprint_path(1, new))
+
+    # the job of the replaced file runs late (queued, retried...): it changes nothing
+    asyncio.run(detect_duplicate(None, index, 1, "old.wav", old))
+    assert duplicate_of() == 2
+    assert os.path.exists(fingerprint_path(1, new))
+    assert index.match(*_fingerprint(_melody(7, 10)), exclude=2)[0] == 1
+
+
+def test_workers_see_each_others_uploads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = sqlite_engine(Song, MediaAsset)
+    monkeypatch.setitem(sys.modules, "app.core.database", SimpleNamespace(engine=engine))
+    _index(tmp_path / "index", {3: _melody(9, 10)})  # built before the uploads
+
+    def upload(song_id: int, melody: int) -> tuple[str, str]:
+        path, version = f"{song_id}-{melody}.wav", f"{melody:016x}"
+        _write_wav(path, _melody(melody, 10))
+        with Session(engine) as session:
+            session.merge(Song(id=song_id, title=str(song_id)))
+            asset = session.exec(
+                select(MediaAsset).where(MediaAsset.song_id == song_id)
+            ).first() or MediaAsset(
+                song_id=song_id, extension=".wav", mime_type="audio/wav", size=0
+            )
+            asset.path, asset.content_hash = path, version * 4
+            asset.mtime = os.path.getmtime(path)
+            session.add(asset)
+            session.commit()
+        return path, version
+
+    def duplicate_of(song_id: int) -> int | None:
+        with Session(engine) as session:
+            return session.get(Song, song_id).duplicate_of_id
+
+    first, second = FingerprintIndex("index"), FingerprintIndex("index")
+    first.load()
+    second.load()
+
+    # fingerprinted by the first worker, matched by the second
+    asyncio.run(detect_duplicate(None, first, 1, *upload(1, 8)))
+    asyncio.run(detect_duplicate(None, second, 2, *upload(2, 8)))
+    assert duplicate_of(1) is None and duplicate_of(2) == 1
+
+    # replaced through the first worker: the second stops matching its old recording
+    asyncio.run(detect_duplicate(None, first, 3, *upload(3, 10)))
+    asyncio.run(detect_duplicate(None, second, 4, *upload(4, 9)))
+    assert duplicate_of(4) is None
+    asyncio.run(detect_duplicate(None, second, 5, *upload(5, 10)))
+    assert duplicate_of(5) == 3
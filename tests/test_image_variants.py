@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app.core.image_cache import ImageResizeCache
+from app.models.image_variant_model import ImageVariantPublic
+from app.utils.image_variants import (
+    build_image_variants,
+    delete_image_variants,
+    image_version,
+    negotiate_format,
+    original_image_path,
+    resized_name,
+    select_variant,
+    snap_width,
+    supported_formats,
+    variant_path,
+)
+
+
+def _variant(width: int, format: str) -> ImageVariantPublic:
+    return ImageVariantPublic(
+        id=1,
+        owner_kind="album",
+        owner_id=1,
+        width=width,
+        height=width,
+        format=format,
+        mime_type=f"image/{format}",
+        path="",
+        url=f"{width}.{format}",
+        size=1,
+        version="0123456789abcdef",
+    )
+
+
+def test_variants_keep_aspect_ratio_and_alpha(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Image.new("RGBA", (1000, 500), (255, 0, 0, 0)).save("cover.png")
+
+    variants = build_image_variants("cover.png", "album", 1, "0123456789abcdef")
+
+    assert {variant["width"] for variant in variants} == {64, 300, 640}
+    assert {variant["format"] for variant in variants} == set(supported_formats())
+    for variant in variants:
+        with Image.open(variant["path"]) as image:
+            assert image.size == (variant["width"], variant["height"])
+            assert variant["height"] == round(variant["width"] / 2)
+            if variant["format"] == "jpeg":  # transparent becomes white, not black
+                assert image.convert("RGB").getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_small_images_are_not_upscaled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Image.new("RGB", (100, 100)).save("cover.jpg")
+
+    variants = build_image_variants("cover.jpg", "song", 2, "0123456789abcdef")
+    assert {variant["width"] for variant in variants} == {64, 100}
+
+
+def test_not_an_image(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "cover.png").write_bytes(b"not an image")
+    assert build_image_variants("cover.png", "song", 3, "0123456789abcdef") == []
+
+
+def test_variant_selection():
+    variants = [_variant(width, "webp") for width in (640, 64, 300)]
+    variants += [_variant(width, "jpeg") for width in (64, 300, 640)]
+
+    assert negotiate_format("image/avif,image/webp,*/*", {"webp", "jpeg"}) == "webp"
+    assert negotiate_format("*/*", {"webp", "jpeg"}) == "jpeg"
+    assert negotiate_format(None, {"webp"}) == "webp"
+
+    assert select_variant(variants, 48, "webp").width == 64
+    assert select_variant(variants, 200, "jpeg").width == 300
+    assert select_variant(variants, 2000, "jpeg").width == 640
+    assert select_variant(variants, None, "webp").width == 640
+    assert select_variant(variants, 64, "avif") is None
+
+
+def test_widths_are_snapped_to_the_allowlist():
+    assert snap_width(1) == 32
+    assert snap_width(300) == 300
+    assert snap_width(301) == 384
+    assert snap_width(10**6) == 2048
+
+
+def test_original_image_path():
+    url = "http://localhost:8000/public/image/c4/ca/1.png"
+    assert original_image_path(url) == "public/image/c4/ca/1.png"
+    assert original_image_path("http://localhost:8000/public/audio/1.mp3") is None
+    assert original_image_path("http://localhost:8000/public/image/../../.env") is None
+    assert original_image_path("http://example.com/cover.png") is None
+
+
+def test_resize_cache_coalesces_and_evicts(tmp_path):
+    Image.new("RGB", (800, 800), (0, 0, 255)).save(tmp_path / "cover.jpg")
+    image_path = str(tmp_path / "cover.jpg")
+
+    async def scenario():
+        cache = ImageResizeCache(str(tmp_path / "cache"), max_bytes=10**9)
+        with ThreadPoolExecutor() as pool:
+            name = resized_name("album", 1, image_path, 128, "jpeg")
+            paths = await asyncio.gather(
+                *(cache.resize(name, pool, image_path, 128, "jpeg") for _ in range(5))
+            )
+            assert len(set(paths)) == 1
+            assert cache.stats()["misses"] == 5 and cache.stats()["coalesced"] == 4
+
+            await cache.resize(name, pool, image_path, 128, "jpeg")
+            assert cache.hits == 1
+
+            # the least recently used resize goes first
+            cache.max_bytes = cache.stats()["size"] + 1
+            other = resized_name("album", 1, image_path, 256, "jpeg")
+            await cache.resize(other, pool, image_path, 256, "jpeg")
+            assert cache.stats()["entries"] == 1
+        return paths[0]
+
+    evicted_path = asyncio.run(scenario())
+    kept_name = resized_name("album", 1, image_path, 256, "jpeg")
+    with Image.open(tmp_path / "cache" / kept_name) as image:
+        assert image.size == (256, 256)
+    assert not os.path.exists(evicted_path)
+
+
+def test_only_older_variants_are_deleted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = {
+        version: variant_path("album", 1, version, 64, "jpeg")
+        for version in ("old", "current", "newer")
+    }
+    os.makedirs(os.path.dirname(paths["old"]))
+    for mtime, version in enumerate(("old", "current", "newer"), start=1):
+        with open(paths[version], "wb"):
+            pass
+        os.utime(paths[version], ns=(mtime * 10**9, mtime * 10**9))
+
+    # an image uploaded after the current one may have its variants in the making
+    delete_image_variants("album", 1, keep={paths["current"]}, older_than=2 * 10**9)
+    assert sorted(os.listdir(os.path.dirname(paths["old"]))) == sorted(
+        os.path.basename(paths[version]) for version in ("current", "newer")
+    )
+
+    delete_image_variants("album", 1)
+    assert os.listdir(os.path.dirname(paths["old"])) == []
+
+
+def test_image_version(tmp_path):
+    (tmp_path / "cover.png").write_bytes(b"cover")
+    # what the uploads version the variants with
+    assert image_version(str(tmp_path / "cover.png")) == hashlib.sha256(b"cover").hexdigest()[:16]
+    assert image_version(str(tmp_path / "missing.png")) is None
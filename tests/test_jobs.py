@@ -0,0 +1,112 @@
+import asyncio
+
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app.commons.enums import Priority, Status
+from app.core.jobs import JobQueue, JobRejected
+from app.crud.jobs import claim_jobs, create_job, fail_job, requeue_jobs
+from app.models.job_model import Job, JobCreate
+
+from ._db import sqlite_engine
+
+
+def test_claim_by_priority_once():
+    engine = sqlite_engine(Job)
+    with Session(engine) as session:
+        for kind, priority in (("a", Priority.LOW), ("b", Priority.HIGH), ("c", Priority.MEDIUM)):
+            asyncio.run(create_job(session, JobCreate(kind=kind, priority=priority)))
+
+        claimed = asyncio.run(claim_jobs(session, "worker-1", limit=2))
+        assert [job.kind for job in claimed] == ["b", "c"]
+        assert all(job.status == Status.WORK_IN_PROGRESS for job in claimed)
+        assert all(job.attempts == 1 for job in claimed)
+
+        assert [job.kind for job in asyncio.run(claim_jobs(session, "worker-2", limit=5))] == ["a"]
+        assert asyncio.run(claim_jobs(session, "worker-3")) == []
+
+
+def test_failed_job_backs_off_then_is_rejected():
+    engine = sqlite_engine(Job)
+    with Session(engine) as session:
+        job = asyncio.run(create_job(session, JobCreate(kind="a", max_attempts=2)))
+        asyncio.run(claim_jobs(session, "worker"))
+
+        asyncio.run(fail_job(session, job.id, "boom", retry_in=timedelta(minutes=1)))
+        assert session.get(Job, job.id).status == Status.OPEN
+        assert asyncio.run(claim_jobs(session, "worker")) == []  # not due yet
+
+        asyncio.run(fail_job(session, job.id, "boom", retry_in=None))
+        assert session.get(Job, job.id).status == Status.REJECTED
+        assert session.get(Job, job.id).error == "boom"
+
+
+def test_requeue_stale_jobs():
+    engine = sqlite_engine(Job)
+    with Session(engine) as session:
+        asyncio.run(create_job(session, JobCreate(kind="a")))
+        asyncio.run(claim_jobs(session, "host:1:job-worker-0"))
+
+        assert asyncio.run(requeue_jobs(session, worker_prefix="host:2:")) == 0
+        assert asyncio.run(requeue_jobs(session, locked_before=datetime.now() - timedelta(hours=1))) == 0
+        assert asyncio.run(requeue_jobs(session, worker_prefix="host:1:")) == 1
+        assert len(asyncio.run(claim_jobs(session, "host:2:job-worker-0"))) == 1
+
+
+def test_queue_runs_and_retries_jobs():
+    engine = sqlite_engine(Job)
+    calls = []
+
+    async def flaky(pool, value):
+        calls.append(value)
+        if len(calls) == 1:
+            raise RuntimeError("first attempt fails")
+
+    async def scenario():
+        queue = JobQueue(engine, None, {"flaky": flaky}, concurrency=2, retry_delay=0)
+        await queue.start()
+        with Session(engine) as session:
+            job = await queue.enqueue(session, "flaky", {"value": 42})
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            with Session(engine) as session:
+                if session.get(Job, job.id).status == Status.CLOSED:
+                    break
+        await queue.stop()
+        return job.id, queue.stats()
+
+    job_id, stats = asyncio.run(scenario())
+    assert calls == [42, 42]
+    assert (stats["done"], stats["failed"]) == (1, 1)
+    with Session(engine) as session:
+        assert session.get(Job, job_id).attempts == 2
+
+
+def test_queue_rejects_jobs_that_cant_succeed():
+    engine = sqlite_engine(Job)
+    calls = []
+
+    async def undecodable(pool, value):
+        calls.append(value)
+        raise JobRejected("Can't decode the file")
+
+    async def scenario():
+        queue = JobQueue(engine, None, {"undecodable": undecodable}, concurrency=1)
+        await queue.start()
+        with Session(engine) as session:
+            job = await queue.enqueue(session, "undecodable", {"value": 1})
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            with Session(engine) as session:
+                if session.get(Job, job.id).status == Status.REJECTED:
+                    break
+        await queue.stop()
+        return job.id, queue.stats()
+
+    job_id, stats = asyncio.run(scenario())
+    assert calls == [1]  # not retried
+    assert (stats["done"], stats["failed"]) == (0, 1)
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        assert job.error == "Can't decode the file" and job.finished_at is not None
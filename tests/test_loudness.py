@@ -0,0 +1,146 @@
+import asyncio
+import os
+import sys
+import wave
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from sqlmodel import Session
+
+import app.utils.loudness as loudness
+
+from app.models.media_asset_model import MediaAsset
+from app.models.song_model import Song
+from app.utils.audio_decode import AudioDecodeError
+from app.utils.loudness import (
+    analyze_loudness,
+    block_loudness,
+    gated_loudness,
+    histogram_loudness,
+    loudness_histogram,
+    loudness_histogram_path,
+    measure_song_loudness,
+    read_loudness_histogram,
+    true_peak,
+)
+
+from ._db import sqlite_engine
+
+RATE = 48000
+
+
+def _sine(amplitude: float, seconds: float, frequency: float = 997) -> np.ndarray:
+    time = np.arange(int(RATE * seconds)) / RATE
+    tone = amplitude * np.sin(2 * np.pi * frequency * time)
+    return np.stack([tone, tone], axis=1)
+
+
+def test_reference_tone():
+    # BS.1770: a 997 Hz sine at -20 dBFS on both channels measures -20 LUFS
+    loudness = gated_loudness(block_loudness(_sine(0.1, 10), RATE))
+    assert abs(loudness - -20.0) < 0.05
+
+
+def test_relative_gate_ignores_quiet_passages():
+    loud, quiet = _sine(0.1, 10), _sine(0.001, 10)
+    loudness = gated_loudness(block_loudness(np.concatenate([loud, quiet]), RATE))
+    assert abs(loudness - -20.0) < 0.1
+
+
+def test_album_loudness_from_histograms():
+    tracks = [_sine(0.1, 10), _sine(0.05, 20), _sine(0.2, 5)]
+    blocks = [block_loudness(track, RATE) for track in tracks]
+
+    album = histogram_loudness(np.sum([loudness_histogram(b) for b in blocks], axis=0))
+    assert abs(album - gated_loudness(np.concatenate(blocks))) < 0.05
+
+
+def test_true_peak_between_samples():
+    # a sine at a quarter of the sample rate, sampled 45 degrees off its peaks
+    time = np.arange(RATE) / RATE
+    tone = 0.5 * np.sin(2 * np.pi * RATE / 4 * time + np.pi / 4)[:, None]
+    assert abs(np.abs(tone).max() - 0.5 * np.sqrt(0.5)) < 1e-6
+    assert abs(true_peak(tone, RATE) - 0.5) < 0.01
+
+
+def _write_wav(path, amplitude: float, seconds: float = 5) -> None:
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(RATE)
+        wav_file.writeframes((_sine(amplitude, seconds) * 32767).astype("<i2").tobytes())
+
+
+def test_analyze_wav(tmp_path):
+    audio_path = tmp_path / "tone.wav"
+    _write_wav(audio_path, 0.1)
+
+    histogram_path = tmp_path / "1.hist"
+    measures = analyze_loudness(str(audio_path), str(histogram_path))
+
+    assert abs(measures["loudness"] - -20.0) < 0.05
+    assert abs(measures["replaygain_track_gain"] - 2.0) < 0.05
+    assert abs(measures["true_peak"] - -20.0) < 0.1
+    assert read_loudness_histogram(str(histogram_path)).sum() == 47
+
+
+def test_undecodable_file(tmp_path):
+    audio_path = tmp_path / "broken.wav"
+    audio_path.write_bytes(b"not audio")
+    with pytest.raises(AudioDecodeError):
+        analyze_loudness(str(audio_path), str(tmp_path / "1.hist"))
+
+
+def _set_original(engine, path: str, version: str) -> None:
+    with Session(engine) as session:
+        asset = session.get(MediaAsset, 1) or MediaAsset(
+            id=1, song_id=1, extension=".wav", mime_type="audio/wav", size=0, mtime=0
+        )
+        asset.path, asset.content_hash = path, version * 4
+        session.add(asset)
+        session.commit()
+
+
+def test_stale_jobs_leave_the_new_file_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = sqlite_engine(Song, MediaAsset)
+    monkeypatch.setitem(sys.modules, "app.core.database", SimpleNamespace(engine=engine))
+    with Session(engine) as session:
+        session.add(Song(id=1, title="a"))
+        session.commit()
+
+    old, new = "a" * 16, "b" * 16
+    _write_wav("old.wav", 0.5)
+    _write_wav("new.wav", 0.1)
+    _set_original(engine, "new.wav", new)
+    asyncio.run(measure_song_loudness(None, 1, "new.wav", new))
+
+    def measured() -> float:
+        with Session(engine) as session:
+            return session.get(Song, 1).loudness
+
+    assert abs(measured() - -20.0) < 0.05
+    # the job of the replaced file runs late (queued, retried...): it changes nothing
+    os.remove("old.wav")
+    asyncio.run(measure_song_loudness(None, 1, "old.wav", old))
+    assert abs(measured() - -20.0) < 0.05
+    assert os.path.exists(loudness_histogram_path(1, new))
+
+    # or the file is replaced while the old one is decoded
+    _write_wav("old.wav", 0.5)
+    _set_original(engine, "old.wav", old)
+    run_in_process = loudness.run_in_process
+
+    async def replaced_meanwhile(*args):
+        result = await run_in_process(*args)
+        _set_original(engine, "new.wav", new)
+        return result
+
+    monkeypatch.setattr(loudness, "run_in_process", replaced_meanwhile)
+    asyncio.run(measure_song_loudness(None, 1, "old.wav", old))
+    assert abs(measured() - -20.0) < 0.05
+    assert os.path.exists(loudness_histogram_path(1, new))
+    assert not os.path.exists(loudness_histogram_path(1, old))
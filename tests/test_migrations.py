@@ -0,0 +1,47 @@
+import shutil
+
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect
+from sqlmodel import Session, SQLModel, select
+
+from app.core.migrations import ADDED_COLUMNS, add_missing_columns
+from app.models.album_model import Album
+from app.models.playlist_model import Playlist
+from app.models.song_model import Song
+from app.models.user_model import User  # noqa: F401, the playlists reference it
+
+
+def test_columns_are_added_to_an_existing_database(tmp_path):
+    # the committed database predates the added columns
+    shutil.copy(Path(__file__).parents[1] / "database.db", tmp_path / "database.db")
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    added = add_missing_columns(engine)
+
+    assert added == [f"{table}.{column}" for table, column in ADDED_COLUMNS]
+    inspector = inspect(engine)
+    for table, column in ADDED_COLUMNS:
+        assert column in {c["name"] for c in inspector.get_columns(table)}
+    assert any(
+        index["column_names"] == ["duplicate_of_id"] for index in inspector.get_indexes("song")
+    )
+    assert add_missing_columns(engine) == []  # nothing left to do
+
+    with Session(engine) as session:
+        for model in (Song, Album, Playlist):
+            session.exec(select(model)).all()  # no "no such column"
+        song = session.exec(select(Song)).first()
+        song.image_palette = ["#102030"]
+        session.add(song)
+        session.commit()
+        session.refresh(song)
+        assert song.image_palette == ["#102030"] and song.duplicate_of_id is None
+
+
+def test_new_database_has_them_all(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    assert add_missing_columns(engine) == []
@@ -0,0 +1,58 @@
+import numpy as np
+
+from PIL import Image
+
+from app.utils.placeholders import blurhash, compute_placeholders, dominant_colors
+
+_BASE83 = (
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+)
+
+
+def _decode83(text: str) -> int:
+    value = 0
+    for character in text:
+        value = value * 83 + _BASE83.index(character)
+    return value
+
+
+def test_blurhash_of_a_solid_color():
+    pixels = np.full((32, 32, 3), (200, 30, 90), dtype=np.uint8)
+    hash = blurhash(pixels, (4, 3))
+
+    assert len(hash) == 4 + 2 * (4 * 3 - 1) + 2
+    assert hash[0] == "L"  # 4x3 components
+    assert _decode83(hash[2:6]) == (200 << 16) + (30 << 8) + 90  # the average color
+
+
+def test_blurhash_of_a_gradient():
+    pixels = np.zeros((32, 32, 3), dtype=np.uint8)
+    pixels[:, :, 0] = np.linspace(0, 255, 32).astype(np.uint8)[None, :]
+    hash = blurhash(pixels, (4, 3))
+    mirrored = blurhash(pixels[:, ::-1], (4, 3))
+
+    # same colors, so the same average, but not at the same place
+    assert hash[2:6] == mirrored[2:6]
+    assert hash[6:8] != mirrored[6:8]
+    assert blurhash(pixels, (4, 3)) == hash
+
+
+def test_dominant_colors_most_present_first():
+    pixels = np.zeros((64, 64, 3), dtype=np.uint8)
+    pixels[:] = (20, 20, 220)
+    pixels[:40] = (200, 30, 30)
+    pixels[60:, 60:] = (250, 250, 0)
+
+    assert dominant_colors(pixels, 3) == ["#c81e1e", "#1414dc", "#fafa00"]
+    assert dominant_colors(pixels[:40], 5) == ["#c81e1e"]  # a single color
+
+
+def test_placeholders_of_a_transparent_png(tmp_path):
+    Image.new("RGBA", (300, 200), (0, 0, 0, 0)).save(tmp_path / "cover.png")
+
+    placeholders = compute_placeholders(str(tmp_path / "cover.png"))
+    assert placeholders["image_palette"] == ["#ffffff"]  # like the page behind it
+    assert _decode83(placeholders["image_blurhash"][2:6]) == 0xFFFFFF
+
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    assert compute_placeholders(str(tmp_path / "broken.png")) is None
@@ -0,0 +1,97 @@
+import asyncio
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from app.commons.common_query_params import CommonQueryParams
+from app.core.play_events import PlayEventRecorder
+from app.core.play_history import month_table
+from app.crud.play_events import read_play_history
+
+from ._db import sqlite_engine
+
+
+def _plays(engine, user_id: int) -> list:
+    with Session(engine) as session:
+        return asyncio.run(
+            read_play_history(
+                session,
+                user_id,
+                datetime.now() - timedelta(days=1),
+                datetime.now() + timedelta(days=1),
+                CommonQueryParams(),
+            )
+        )
+
+
+def _count(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(
+            text(f"SELECT count(*) FROM {month_table(date.today())}")
+        ).scalar()
+
+
+def test_flush_writes_a_batch():
+    engine = sqlite_engine()
+    recorder = PlayEventRecorder(engine, max_queue=100, batch_size=3)
+    for user_id in range(5):
+        assert recorder.record(1, user_id, quality="160k")
+
+    assert asyncio.run(recorder.flush()) == 3
+    assert asyncio.run(recorder.flush()) == 2
+    assert asyncio.run(recorder.flush()) == 0
+    assert _count(engine) == 5
+    [event] = _plays(engine, 4)
+    assert (event.song_id, event.source, event.quality) == (1, "stream", "160k")
+
+
+def test_full_queue_drops_events():
+    recorder = PlayEventRecorder(sqlite_engine(), max_queue=2, batch_size=10)
+    assert recorder.record(1, 1) and recorder.record(1, 2)
+    assert not recorder.record(1, 3)
+    assert recorder.stats()["dropped"] == 1
+    assert recorder.stats()["queued"] == 2
+
+
+def test_failed_batch_is_put_back():
+    engine = sqlite_engine()
+    with engine.begin() as connection:  # a table the events don't fit in
+        connection.execute(text(f"CREATE TABLE {month_table(date.today())} (id INTEGER)"))
+    recorder = PlayEventRecorder(engine, max_queue=100, batch_size=10)
+    for user_id in range(3):
+        recorder.record(1, user_id)
+
+    with pytest.raises(OperationalError):
+        asyncio.run(recorder.flush())
+    assert recorder.stats()["queued"] == 3
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE {month_table(date.today())}"))
+    assert asyncio.run(recorder.flush()) == 3
+    with engine.connect() as connection:
+        users = connection.execute(
+            text(f"SELECT user_id FROM {month_table(date.today())} ORDER BY id")
+        ).scalars()
+        assert list(users) == [0, 1, 2]  # in order
+
+
+def test_stop_writes_everything():
+    engine = sqlite_engine()
+
+    async def run():
+        recorder = PlayEventRecorder(engine, max_queue=100_000, batch_size=500, flush_interval=60)
+        await recorder.start()
+        for user_id in range(1234):
+            recorder.record(1, user_id)
+        await asyncio.sleep(0)
+        await recorder.stop()
+        return recorder.stats()
+
+    stats = asyncio.run(run())
+    assert stats["written"] == 1234 and stats["queued"] == 0
+    assert _count(engine) == 1234
@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import gzip
+
+from datetime import date, datetime
+
+from sqlmodel import Session
+
+from app.commons.common_query_params import CommonQueryParams
+from app.core.play_history import (
+    PlayHistoryMaintainer,
+    day_partition,
+    history_tables,
+    play_event_partitions,
+    write_play_events,
+)
+from app.crud.play_events import read_play_history
+
+from ._db import sqlite_engine
+
+
+def _event(user_id: int, played_at: datetime) -> tuple:
+    return (1, user_id, played_at, "stream", "original")
+
+
+def test_partitions_are_created_ahead():
+    engine = sqlite_engine()
+    maintainer = PlayHistoryMaintainer(engine, retention_days=0, ahead=7)
+
+    assert maintainer.run(date(2025, 5, 28))["created"] == [
+        "playevent_m202505",
+        "playevent_m202506",
+    ]
+    assert maintainer.run(date(2025, 5, 29))["created"] == []
+    assert play_event_partitions(engine)["playevent_m202506"] == (
+        date(2025, 6, 1),
+        date(2025, 7, 1),
+    )
+    assert day_partition(date(2025, 5, 28)) == "playevent_p20250528"
+
+
+def test_history_reads_only_the_months_asked():
+    engine = sqlite_engine()
+    write_play_events(
+        engine,
+        [
+            _event(1, datetime(2025, 3, 31, 23)),
+            _event(1, datetime(2025, 4, 15)),
+            _event(2, datetime(2025, 4, 16)),
+            _event(1, datetime(2025, 5, 2)),
+        ],
+    )
+    since, until = datetime(2025, 4, 1), datetime(2025, 5, 1)
+    assert [table.name for table in history_tables(engine, since, until)] == [
+        "playevent_m202504"
+    ]
+
+    with Session(engine) as session:
+        plays = asyncio.run(
+            read_play_history(session, 1, since, until, CommonQueryParams())
+        )
+        assert [play.played_at for play in plays] == [datetime(2025, 4, 15)]
+
+        plays = asyncio.run(
+            read_play_history(
+                session, 1, datetime(2025, 1, 1), datetime(2026, 1, 1), CommonQueryParams()
+            )
+        )
+        assert [play.played_at.month for play in plays] == [5, 4, 3]  # newest first
+
+        # the bounds compare with the stored text: "since" is included, "until" isn't
+        plays = asyncio.run(
+            read_play_history(
+                session, 1, datetime(2025, 4, 15), datetime(2025, 5, 2), CommonQueryParams()
+            )
+        )
+        assert [play.played_at for play in plays] == [datetime(2025, 4, 15)]
+
+
+def test_expired_partitions_are_archived_then_dropped(tmp_path):
+    engine = sqlite_engine()
+    write_play_events(
+        engine,
+        [_event(1, datetime(2025, 1, 10)), _event(2, datetime(2025, 2, 10))]
+        + [_event(3, datetime(2025, 3, 10))],
+    )
+    maintainer = PlayHistoryMaintainer(
+        engine, retention_days=40, ahead=0, archive_directory=str(tmp_path)
+    )
+
+    # February 20 and later are kept, so February is too
+    assert maintainer.run(date(2025, 3, 31))["dropped"] == ["playevent_m202501"]
+    assert list(play_event_partitions(engine)) == [
+        "playevent_m202502",
+        "playevent_m202503",
+    ]
+
+    with gzip.open(tmp_path / "playevent_m202501.csv.gz", "rt") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["user_id"], row["played_at"][:10]) for row in rows] == [("1", "2025-01-10")]
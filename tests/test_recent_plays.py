@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core.recent_plays import RecentPlays, RecentPlayStore
+from app.models.recent_play_model import RecentPlay
+
+from ._db import sqlite_engine
+
+
+def _songs(entries: list[dict]) -> list[tuple[int, float]]:
+    return [(entry["song_id"], entry["position"]) for entry in entries]
+
+
+def test_least_recently_played_slot_is_reused():
+    plays = RecentPlays(3)
+    for song_id, played_at in [(1, 10.0), (2, 20.0), (3, 30.0)]:
+        assert plays.put(song_id, None, played_at) is None
+    assert plays.put(1, 42.0, 40.0) is None  # played again, same slot
+    assert plays.put(4, None, 50.0) == 2
+    assert plays.put(5, None, 5.0) == 5  # older than all of them
+
+    assert plays.items() == [(4, 0.0, 50.0), (1, 42.0, 40.0), (3, 0.0, 30.0)]
+    assert plays.put(1, None, 60.0) is None
+    assert plays.get(1) == (42.0, 60.0)  # the position is kept
+
+
+def test_flush_then_load_in_another_process():
+    engine = sqlite_engine(RecentPlay)
+    store = RecentPlayStore(engine, capacity=3, max_users=10)
+    now = time.time()
+    for offset, song_id in enumerate([1, 2, 3, 4]):
+        store.record(7, song_id, played_at=now + offset)
+    store.record(7, 3, position=12.5, played_at=now + 10)
+    assert asyncio.run(store.flush()) == 3
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT song_id FROM recentplay ORDER BY song_id"))
+        assert list(rows.scalars()) == [2, 3, 4]
+
+    restarted = RecentPlayStore(engine, capacity=3, max_users=10)
+    assert _songs(asyncio.run(restarted.recent(7))) == [(3, 12.5), (4, 0.0), (2, 0.0)]
+    assert asyncio.run(restarted.resume(7, 1)) is None
+    assert restarted.stats()["loads"] == 1
+
+    asyncio.run(restarted.recent(7, limit=1))
+    assert restarted.stats()["hits"] == 2  # from memory now
+
+
+def test_evicted_songs_are_deleted():
+    engine = sqlite_engine(RecentPlay)
+    store = RecentPlayStore(engine, capacity=2, max_users=10)
+    now = time.time()
+    store.record(1, 10, played_at=now)
+    asyncio.run(store.flush())
+    store.record(1, 11, played_at=now + 1)
+    store.record(1, 12, played_at=now + 2)  # 10 leaves, 11 never reaches the database
+    store.record(1, 13, played_at=now + 3)
+    asyncio.run(store.flush())
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT song_id FROM recentplay ORDER BY song_id"))
+        assert list(rows.scalars()) == [12, 13]
+
+
+def test_workers_sync_through_the_database():
+    engine = sqlite_engine(RecentPlay)
+    first = RecentPlayStore(engine, capacity=5, max_users=10)
+    second = RecentPlayStore(engine, capacity=5, max_users=10)
+
+    async def run():
+        await first.start()
+        await second.start()
+        first.record(1, 5)
+        assert _songs(await second.recent(1)) == []  # loaded, nothing written yet
+
+        first.record(1, 5, position=30.0)
+        await first.flush()
+        assert await second.sync() == 1
+        await first.stop()
+        await second.stop()
+        return await second.recent(1)
+
+    assert _songs(asyncio.run(run())) == [(5, 30.0)]
+
+
+def test_users_with_pending_changes_are_not_evicted():
+    store = RecentPlayStore(sqlite_engine(RecentPlay), capacity=2, max_users=2)
+    for user_id in range(4):
+        store.record(user_id, 1)
+    assert store.stats()["users"] == 4
+
+    asyncio.run(store.flush())
+    assert store.stats()["users"] == 2
+    store.record(9, 1)
+    assert list(store._users) == [3, 9]  # least recently used out first
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.core.remote_cache import RemoteAudioCache, RemoteFetchError
+
+AUDIO = {f"/{i}.mp3": os.urandom(300_000 + i) for i in range(4)}
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for the remote origin, it sends files slowly to make fetches overlap.
+    """
+
+    requests: list[str] = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        data = AUDIO.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        for i in range(0, len(data), 64 * 1024):
+            self.wfile.write(data[i : i + 64 * 1024])
+            self.wfile.flush()
+            time.sleep(0.01)
+
+
+@pytest.fixture(scope="module")
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def clear_requests():
+    OriginHandler.requests.clear()
+
+
+async def _read(cache, client, name, url, start=0, end=None):
+    audio = await cache.open(name, url, client)
+    return b"".join([chunk async for chunk in cache.iter_range(audio, start, end)])
+
+
+def test_concurrent_misses_share_one_fetch(origin, tmp_path):
+    async def main():
+        cache = RemoteAudioCache(str(tmp_path), 10 * 1024**2)
+        cache.load()
+        async with httpx.AsyncClient() as client:
+            bodies = await asyncio.gather(
+                *(_read(cache, client, "0.mp3", f"{origin}/0.mp3") for _ in range(5))
+            )
+            ranged = await _read(cache, client, "0.mp3", f"{origin}/0.mp3", 1000, 1999)
+        return cache, bodies, ranged
+
+    cache, bodies, ranged = asyncio.run(main())
+
+    assert all(body == AUDIO["/0.mp3"] for body in bodies)
+    assert ranged == AUDIO["/0.mp3"][1000:2000]
+    assert OriginHandler.requests == ["/0.mp3"]
+    assert (tmp_path / "0.mp3").read_bytes() == AUDIO["/0.mp3"]
+
+    stats = cache.stats()
+    assert stats["misses"] == 5 and stats["coalesced"] == 4 and stats["hits"] == 1
+    assert stats["bytes_saved"] == 4 * len(AUDIO["/0.mp3"]) + 1000
+    assert stats["bytes_fetched"] == len(AUDIO["/0.mp3"])
+
+
+def test_lru_eviction_keeps_the_size_bounded(origin, tmp_path):
+    async def main():
+        cache = RemoteAudioCache(str(tmp_path), 700_000)
+        async with httpx.AsyncClient() as client:
+            await _read(cache, client, "1.mp3", f"{origin}/1.mp3")
+            await _read(cache, client, "2.mp3", f"{origin}/2.mp3")
+            await _read(cache, client, "1.mp3", f"{origin}/1.mp3")  # 2 is now the LRU
+            await _read(cache, client, "3.mp3", f"{origin}/3.mp3")
+        return cache
+
+    cache = asyncio.run(main())
+
+    assert sorted(os.listdir(tmp_path)) == ["1.mp3", "3.mp3"]
+    assert cache.stats()["size"] <= 700_000
+    assert OriginHandler.requests == ["/1.mp3", "/2.mp3", "/3.mp3"]
+
+
+def test_missing_file(origin, tmp_path):
+    async def main():
+        cache = RemoteAudioCache(str(tmp_path), 10 * 1024**2)
+        async with httpx.AsyncClient() as client:
+            await cache.open("9.mp3", f"{origin}/9.mp3", client)
+
+    with pytest.raises(RemoteFetchError) as exc:
+        asyncio.run(main())
+
+    assert exc.value.status_code == 404
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,99 @@
+import wave
+
+from array import array
+
+from app.utils.hls import build_hls_playlist, timestamp_tag
+from app.utils.seek_index import SeekIndex, build_seek_index
+
+# MPEG-1 Layer III, 44.1 kHz, joint stereo: only the bitrate index changes
+_BITRATE_INDEXES = {128: 0x9, 320: 0xE}
+
+
+def _mp3_frame(kbps: int) -> bytes:
+    header = bytes([0xFF, 0xFB, _BITRATE_INDEXES[kbps] << 4, 0x40])
+    length = 144 * kbps * 1000 // 44100
+    return header + bytes(length - 4)
+
+
+def test_mp3_vbr_offsets(tmp_path):
+    frames = [_mp3_frame(128 if i % 3 else 320) for i in range(200)]
+    path = tmp_path / "song.mp3"
+    path.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10) + b"".join(frames))
+
+    index = build_seek_index(str(path))
+
+    assert index is not None
+    assert abs(index.duration - 200 * 1152 / 44100) < 1e-9
+    assert len(index.offsets) == 6  # 5.22 seconds of audio
+    assert index.data_start == 20
+
+    # every offset is the start of the frame playing at that second
+    starts = [20]
+    for frame in frames:
+        starts.append(starts[-1] + len(frame))
+    for second, offset in enumerate(index.offsets):
+        frame = int(second * 44100 / 1152)
+        assert offset == starts[frame]
+
+
+def test_wav_offsets_are_sample_aligned(tmp_path):
+    path = tmp_path / "song.wav"
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(8000)
+        out.writeframes(bytes(4 * 8000 * 3 + 400))
+
+    index = build_seek_index(str(path))
+
+    assert index is not None
+    assert len(index.offsets) == 4
+    assert index.byte_offset(2.5) == 44 + 2 * 32000
+    assert index.bitrate == 8000 * 4 * 8
+
+
+def test_round_trip():
+    index = SeekIndex(array("I", [10, 20, 30]), 2.5, 10, 40, 96)
+
+    loaded = SeekIndex.from_bytes(index.to_bytes())
+
+    assert list(loaded.offsets) == [10, 20, 30]
+    assert (loaded.duration, loaded.data_start, loaded.data_end) == (2.5, 10, 40)
+    assert loaded.byte_offset(1.9) == 20
+
+
+def test_hls_segments_cover_the_file(tmp_path):
+    path = tmp_path / "song.mp3"
+    path.write_bytes(b"".join(_mp3_frame(128) for _ in range(1000)))  # ~26 seconds
+    index = build_seek_index(str(path))
+
+    playlist = build_hls_playlist(index, "mp3", segment_duration=6)
+
+    assert len(playlist.ranges) == 5
+    assert playlist.ranges[0][0] == 0
+    assert playlist.ranges[-1][1] == path.stat().st_size
+    for (_, end), (start, _) in zip(playlist.ranges, playlist.ranges[1:]):
+        assert end == start
+    assert playlist.body.count("#EXTINF:") == 5
+    assert playlist.body.rstrip().endswith("#EXT-X-ENDLIST")
+
+    signed = playlist.signed_body("user=1&expires=2&signature=abc")
+    segment_urls = [line for line in signed.split("\n") if line and not line.startswith("#")]
+    assert len(segment_urls) == 5
+    assert all(url.endswith(".mp3?user=1&expires=2&signature=abc") for url in segment_urls)
+
+
+def test_segments_start_with_their_timestamp():
+    tag = timestamp_tag(12)
+
+    assert tag[:6] == b"ID3\x04\x00\x00"
+    assert int.from_bytes(tag[6:10], "big") == len(tag) - 10  # < 128, syncsafe is plain
+    assert tag[10:14] == b"PRIV"
+    assert tag.index(b"com.apple.streaming.transportStreamTimestamp\x00") == 20
+    assert int.from_bytes(tag[-8:], "big") == 12 * 90_000
+    assert int.from_bytes(timestamp_tag(2**33 / 90_000 + 1)[-8:], "big") == 90_000  # wraps
+
+    index = SeekIndex(array("I", range(0, 1300, 100)), 12.5, 0, 1300, 96)
+    playlist = build_hls_playlist(index, "mp3", segment_duration=6)
+    assert playlist.segment_tag(0) == timestamp_tag(0)
+    assert playlist.segment_tag(2) == timestamp_tag(12)
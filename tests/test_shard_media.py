@@ -0,0 +1,56 @@
+import os
+
+from sqlmodel import Session
+
+from app.commons.constants import AUDIO_DIRECTORY
+from app.models.media_asset_model import MediaAsset
+from app.models.song_model import Song
+from app.utils.file_utils import open_sharded, shard_directory, shard_path
+from scripts.shard_media import migrate
+
+from ._db import sqlite_engine
+
+
+def test_migration_moves_files_and_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(AUDIO_DIRECTORY)
+    for name in ("1-abcd.mp3", "2.mp3", "3.part"):
+        with open(os.path.join(AUDIO_DIRECTORY, name), "wb") as file:
+            file.write(name.encode())
+
+    engine = sqlite_engine(Song, MediaAsset)
+    with Session(engine) as session:
+        session.add(Song(id=1, title="a", song_url="http://x/public/audio/1-abcd.mp3"))
+        session.add(Song(id=2, title="b", song_url="http://x/public/audio/2.mp3"))
+        session.add(
+            MediaAsset(
+                song_id=1,
+                path=f"{AUDIO_DIRECTORY}/1-abcd.mp3",
+                extension=".mp3",
+                mime_type="audio/mpeg",
+                size=10,
+                mtime=0,
+                content_hash="abcd",
+            )
+        )
+        session.commit()
+
+    result = migrate(AUDIO_DIRECTORY, workers=4, engine=engine)
+
+    assert result == {"directory": AUDIO_DIRECTORY, "files": 2, "rows": 3}
+    assert sorted(os.listdir(AUDIO_DIRECTORY)) == sorted(
+        {"3.part", shard_directory(1)[:2], shard_directory(2)[:2]}
+    )
+    with open_sharded(AUDIO_DIRECTORY, 2, "2.mp3") as file:
+        assert file.read() == b"2.mp3"
+
+    with Session(engine) as session:
+        assert session.get(Song, 1).song_url == (
+            f"http://x/public/audio/{shard_directory(1)}/1-abcd.mp3"
+        )
+        assert session.get(MediaAsset, 1).path == shard_path(
+            AUDIO_DIRECTORY, 1, "1-abcd.mp3"
+        )
+
+    # running it again has nothing left to do
+    assert migrate(AUDIO_DIRECTORY, workers=4, engine=engine)["files"] == 0
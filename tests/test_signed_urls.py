@@ -0,0 +1,46 @@
+import pytest
+
+from app.commons.constants import STREAM_URL_EXPIRY_STEP, STREAM_URL_TTL
+from app.utils.signed_urls import _stream_url_key, sign_stream, verify_stream
+
+
+def test_signed_stream_is_bound_to_song_and_user():
+    signed = sign_stream(song_id=7, user_id=3, now=1_000_000)
+
+    assert verify_stream(7, 3, signed["expires"], signed["signature"], now=1_000_000)
+    assert not verify_stream(8, 3, signed["expires"], signed["signature"], now=1_000_000)
+    assert not verify_stream(7, 4, signed["expires"], signed["signature"], now=1_000_000)
+    assert not verify_stream(7, 3, signed["expires"] + 1, signed["signature"], now=1_000_000)
+    assert not verify_stream(7, 3, signed["expires"], "x" * 22, now=1_000_000)
+
+
+def test_signed_stream_expires():
+    signed = sign_stream(song_id=7, user_id=3, now=1_000_000)
+
+    assert signed["expires"] >= 1_000_000 + STREAM_URL_TTL
+    assert signed["expires"] % STREAM_URL_EXPIRY_STEP == 0
+    assert verify_stream(7, 3, signed["expires"], signed["signature"], now=signed["expires"])
+    assert not verify_stream(
+        7, 3, signed["expires"], signed["signature"], now=signed["expires"] + 1
+    )
+
+
+def test_signed_stream_is_stable_within_a_step():
+    # the same URL for repeated plays, so a CDN caches it once
+    first = sign_stream(song_id=7, user_id=3, now=STREAM_URL_EXPIRY_STEP * 1000 + 1)
+    second = sign_stream(song_id=7, user_id=3, now=STREAM_URL_EXPIRY_STEP * 1001 - 1)
+    assert first == second
+
+
+def test_missing_secret(monkeypatch):
+    assert _stream_url_key("0123") == b"0123"
+
+    monkeypatch.setenv("ENVIRONMENT", "local")
+    with pytest.warns(UserWarning, match="STREAM_URL_SECRET"):
+        first = _stream_url_key(None)
+    with pytest.warns(UserWarning):
+        assert _stream_url_key(None) != first  # random, never a key from the repository
+
+    monkeypatch.setenv("ENVIRONMENT", "production")
+    with pytest.raises(ValueError, match="STREAM_URL_SECRET"):
+        _stream_url_key(None)
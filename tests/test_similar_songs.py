@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.utils.similar_songs import SimilarSongs, cooccurrence_neighbors
+
+# playlist -> songs, song 1 and 2 are together twice
+PLAYLISTS = {10: [1, 2, 3], 11: [1, 2, 2], 12: [2, 4], 13: [5]}
+
+
+def _links() -> tuple[np.ndarray, np.ndarray]:
+    links = [(song_id, playlist_id) for playlist_id, songs in PLAYLISTS.items() for song_id in songs]
+    return np.array([link[0] for link in links]), np.array([link[1] for link in links])
+
+
+def _neighbors(arrays, song_id: int) -> list[tuple[int, float]]:
+    song_ids, indptr, neighbors, scores = arrays
+    index = int(np.searchsorted(song_ids, song_id))
+    start, end = indptr[index], indptr[index + 1]
+    return list(zip(neighbors[start:end].tolist(), scores[start:end].tolist()))
+
+
+def test_cosine_neighbours():
+    arrays = cooccurrence_neighbors(*_links(), top_k=5)
+
+    assert arrays[0].tolist() == [1, 2, 3, 4, 5]
+    [(first, first_score), (second, second_score)] = _neighbors(arrays, 1)
+    assert (first, second) == (2, 3)
+    assert first_score == pytest.approx(2 / math.sqrt(2 * 3))
+    assert second_score == pytest.approx(1 / math.sqrt(2))
+    assert sorted(song_id for song_id, _ in _neighbors(arrays, 2)[1:]) == [3, 4]
+    assert _neighbors(arrays, 5) == []  # alone in its playlist
+
+
+def test_pmi_favours_the_rare_pairs():
+    arrays = cooccurrence_neighbors(*_links(), top_k=5, measure="pmi")
+
+    # 3 is only with 1, 2 is everywhere
+    assert [song_id for song_id, _ in _neighbors(arrays, 1)] == [3, 2]
+    assert _neighbors(arrays, 1)[0][1] == pytest.approx(math.log(4 / 2))
+
+
+def test_pruning_and_blocks():
+    rng = np.random.default_rng(0)
+    song_ids = rng.integers(0, 300, 5000)
+    playlist_ids = rng.integers(0, 200, 5000)
+
+    whole = cooccurrence_neighbors(song_ids, playlist_ids, top_k=10)
+    blocks = cooccurrence_neighbors(song_ids, playlist_ids, top_k=10, block_entries=1000)
+    assert np.diff(whole[1]).max() == 10
+    for expected, actual in zip(whole, blocks):
+        assert np.array_equal(expected, actual)
+
+    with pytest.raises(ValueError):
+        cooccurrence_neighbors(song_ids, playlist_ids, top_k=10, measure="jaccard")
+
+
+def test_model_is_served_memory_mapped(tmp_path):
+    result = SimilarSongs.build(str(tmp_path), *_links(), top_k=1)
+    assert result["songs"] == 5 and result["neighbors"] == 4
+
+    model = SimilarSongs(str(tmp_path))
+    assert model.similar(1) == []  # not loaded yet
+    model.load()
+    assert len(model) == 5
+    assert [song_id for song_id, _ in model.similar(1)] == [2]
+    assert model.similar(1, limit=0) == []
+    assert model.similar(6) == [] and model.similar(0) == []
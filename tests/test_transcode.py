@@ -0,0 +1,121 @@
+import asyncio
+import os
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from app.core.jobs import JobRejected
+from app.utils import transcode
+from app.utils.seek_index import (
+    build_seek_index,
+    get_file_seek_index,
+    save_file_seek_index,
+)
+from app.utils.transcode import (
+    delete_renditions,
+    rendition_bitrates,
+    rendition_path,
+    select_rendition,
+    transcode_audio,
+    transcode_song,
+)
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg isn't installed"
+)
+
+
+def _write_wav(path, seconds: float, rate: int = 48000) -> None:
+    time = np.arange(int(rate * seconds)) / rate
+    tone = (0.3 * np.sin(2 * np.pi * 440 * time) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(np.repeat(tone, 2).tobytes())
+
+
+def test_lossy_originals_are_not_transcoded_up():
+    assert rendition_bitrates(".flac", 900_000) == [96, 160, 320]
+    assert rendition_bitrates(".mp3", 192_000) == [96, 160]
+    assert rendition_bitrates(".mp3", 320_000) == [96, 160]
+    assert rendition_bitrates(".ogg", None) == [96, 160, 320]
+
+
+def test_explicit_quality():
+    assert select_rendition(None, ".flac", 900_000, {}) == "original"
+    assert select_rendition("160k", ".flac", 900_000, {}) == "160k"
+    # there is no 320k rendition of a 192k mp3, the original is as good
+    assert select_rendition("320k", ".mp3", 192_000, {}) == "original"
+    assert select_rendition("64k", ".flac", 900_000, {}) == "original"
+
+
+def test_auto_quality_from_client_hints():
+    flac = (".flac", 900_000)
+    assert select_rendition("auto", *flac, {}) == "original"
+    assert select_rendition("auto", *flac, {"downlink": "10"}) == "original"
+    assert select_rendition("auto", *flac, {"downlink": "0.45"}) == "320k"
+    assert select_rendition("auto", *flac, {"downlink": "0.25"}) == "160k"
+    assert select_rendition("auto", *flac, {"downlink": "0.05"}) == "96k"
+    assert select_rendition("auto", *flac, {"ect": "3g"}) == "320k"
+    assert select_rendition("auto", *flac, {"ect": "2g"}) == "96k"
+    assert select_rendition("auto", *flac, {"downlink": "10", "save-data": "on"}) == "96k"
+    # nothing lower than a 96k original
+    assert select_rendition("auto", ".mp3", 96_000, {"downlink": "0.05"}) == "original"
+
+
+def test_rendition_seek_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcode, "AUDIO_DIRECTORY", str(tmp_path))
+    path = rendition_path(7, "0123456789abcdef", 128)
+    os.makedirs(os.path.dirname(path))
+    # 128 kbit/s at 44.1 kHz, some frames padded with one byte
+    frames = []
+    for n in range(200):
+        padding = n % 3 == 0
+        header = bytes([0xFF, 0xFB, 0x90 | (0x02 if padding else 0), 0x40])
+        frames.append(header + bytes(417 + padding - 4))
+    with open(path, "wb") as file:
+        file.write(b"".join(frames))
+    save_file_seek_index(path, build_seek_index(path))
+
+    index = get_file_seek_index(path)
+    with open(path, "rb") as file:
+        data = file.read()
+    for t in (1, 2.5, 5):
+        offset = index.byte_offset(t)
+        assert data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0
+
+    # the index goes with its rendition
+    delete_renditions(7)
+    assert os.listdir(os.path.dirname(path)) == []
+
+
+@needs_ffmpeg
+def test_transcode_ladder(tmp_path):
+    source = tmp_path / "song.wav"
+    _write_wav(source, 3)
+    renditions = {kbps: str(tmp_path / f"song-{kbps}k.mp3") for kbps in (96, 160)}
+
+    results = transcode_audio(str(source), renditions)
+
+    assert [result["kbps"] for result in results] == [96, 160]
+    for result in results:
+        assert result["duration"] == pytest.approx(3, abs=0.1)
+        assert result["size"] == pytest.approx(result["bitrate"] / 8 * 3, rel=0.05)
+        assert not (tmp_path / f"song-{result['kbps']}k.mp3.tmp").exists()
+
+        # the offsets of the index stored next to it land on a frame header
+        index = get_file_seek_index(result["path"])
+        with open(result["path"], "rb") as file:
+            data = file.read()
+        for t in (0.5, 1.0, 2.5):
+            offset = index.byte_offset(t)
+            assert data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0
+
+
+def test_missing_ffmpeg_rejects_the_job(monkeypatch):
+    monkeypatch.setattr(shutil, "which", lambda name: None)
+    with pytest.raises(JobRejected, match="ffmpeg isn't installed"):
+        asyncio.run(transcode_song(None, 1, "public/audio/1.wav", "0123456789abcdef"))
@@ -0,0 +1,53 @@
+import wave
+
+import numpy as np
+import pytest
+
+from app.utils.audio_decode import AudioDecodeError
+from app.utils.waveform import build_waveform, compute_peaks, decode_waveform
+
+
+def test_peaks_match_a_naive_computation():
+    samples = np.random.default_rng(0).uniform(-1, 1, 10_001).astype(np.float32)
+    peaks = compute_peaks(samples, 80, 3, bits=16)
+
+    level_0 = peaks[0].reshape(-1, 2)
+    assert len(level_0) == 126  # the last, partial block counts too
+    for i in (0, 50, 125):
+        block = samples[i * 80 : (i + 1) * 80]
+        assert level_0[i, 0] == round(block.min() * 32767)
+        assert level_0[i, 1] == round(block.max() * 32767)
+
+    level_2 = peaks[2].reshape(-1, 2)
+    assert len(level_2) == 8
+    assert level_2[0, 0] == round(samples[: 80 * 16].min() * 32767)
+    assert level_2[:, 1].max() == level_0[:, 1].max()
+
+
+def test_build_waveform_from_wav(tmp_path):
+    rate = 44100
+    time = np.arange(rate * 2) / rate
+    tone = (0.5 * np.sin(2 * np.pi * 440 * time) * 32767).astype("<i2")
+    audio_path = tmp_path / "tone.wav"
+    with wave.open(str(audio_path), "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(np.repeat(tone, 2).tobytes())
+
+    output_path = tmp_path / "out" / "1.bin"
+    build_waveform(str(audio_path), str(output_path))
+
+    header, peaks = decode_waveform(output_path.read_bytes())
+    assert header == {"bits": 8, "sample_rate": 8000, "samples_per_peak": 80}
+    assert [len(level) // 2 for level in peaks] == [200, 50, 13, 4]
+    assert peaks[0].dtype == np.int8
+    assert abs(peaks[0][3] - 63) <= 2 and abs(peaks[0][2] + 63) <= 2
+
+
+def test_undecodable_file(tmp_path):
+    audio_path = tmp_path / "broken.wav"
+    audio_path.write_bytes(b"not audio")
+    with pytest.raises(AudioDecodeError):
+        build_waveform(str(audio_path), str(tmp_path / "1.bin"))
+    assert not (tmp_path / "1.bin").exists()
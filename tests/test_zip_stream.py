@@ -0,0 +1,71 @@
+import io
+import os
+import zipfile
+import zlib
+
+import anyio
+
+from app.utils.zip_stream import ZipMember, ZipStream
+
+
+def _read(archive: ZipStream, start: int, end: int, chunk_size: int = 1000) -> bytes:
+    async def main():
+        return b"".join(
+            [chunk async for chunk in archive.iter_range(start, end, chunk_size)]
+        )
+
+    return anyio.run(main)
+
+
+def _members(tmp_path, contents: dict[str, bytes]) -> list[ZipMember]:
+    members = []
+    for name, data in contents.items():
+        path = tmp_path / name.replace("/", "_")
+        path.write_bytes(data)
+        members.append(
+            ZipMember(name, str(path), len(data), zlib.crc32(data), 1746000000.0)
+        )
+    return members
+
+
+def test_archive_is_valid_and_ranges_match(tmp_path):
+    contents = {
+        "01 - Intro.mp3": os.urandom(12345),
+        "02 - Città.flac": os.urandom(54321),
+        "03 - Empty.mp3": b"",
+    }
+    archive = ZipStream(_members(tmp_path, contents))
+
+    data = _read(archive, 0, archive.size - 1)
+    assert len(data) == archive.size
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == list(contents)
+        for name, content in contents.items():
+            assert zip_file.read(name) == content
+            assert zip_file.getinfo(name).compress_type == zipfile.ZIP_STORED
+
+    # a resumed download gets exactly the missing bytes, wherever it stopped
+    for start in (0, 1, 29, 12400, archive.size - 30, archive.size - 1):
+        assert _read(archive, start, archive.size - 1, 777) == data[start:]
+    assert _read(archive, 100, 199) == data[100:200]
+
+
+def test_zip64_end_records_for_many_members(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    members = [
+        ZipMember(f"{i}.mp3", str(path), 0, 0, 1746000000.0) for i in range(70000)
+    ]
+    archive = ZipStream(members)
+
+    with zipfile.ZipFile(io.BytesIO(_read(archive, 0, archive.size - 1))) as zip_file:
+        assert len(zip_file.infolist()) == 70000
+
+
+def test_etag_changes_with_content(tmp_path):
+    first = ZipStream(_members(tmp_path, {"a.mp3": b"a"}))
+    second = ZipStream(_members(tmp_path, {"a.mp3": b"b"}))
+    assert first.etag != second.etag
+    assert first.etag == ZipStream(_members(tmp_path, {"a.mp3": b"a"})).etag